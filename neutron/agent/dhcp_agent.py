@@ -25,7 +25,9 @@ from neutron.agent.common import config
 from neutron.agent.linux import dhcp
 from neutron.agent.linux import external_process
 from neutron.agent.linux import interface
+from neutron.agent.linux import ip_lib
 from neutron.agent.linux import ovs_lib  # noqa
+from neutron.agent.metadata import namespace_proxy
 from neutron.agent import rpc as agent_rpc
 from neutron.common import constants
 from neutron.common import exceptions
@@ -43,9 +45,30 @@ from neutron.openstack.common import service
 from neutron import service as neutron_service
 
 LOG = logging.getLogger(__name__)
+# Version of the plugin side RPC API which added get_networks_info
+NETWORKS_INFO_RPC_VERSION = '1.3'
 
 
 class DhcpAgent(manager.Manager):
+    """DHCP agent service manager.
+
+    API version history:
+        1.0 - Initial version.
+        1.1 - Added batched_notifications.
+    """
+
+    RPC_API_VERSION = '1.1'
+    # Notifications which may be sent in a batch
+    BATCHED_METHODS = frozenset(['network_create_end',
+                                 'network_update_end',
+                                 'network_delete_end',
+                                 'subnet_create_end',
+                                 'subnet_update_end',
+                                 'subnet_delete_end',
+                                 'port_create_end',
+                                 'port_update_end',
+                                 'port_delete_end'])
+
     OPTS = [
         cfg.IntOpt('resync_interval', default=5,
                    help=_("Interval to resync.")),
@@ -60,10 +83,23 @@ class DhcpAgent(manager.Manager):
                            "enable_isolated_metadata = True")),
         cfg.IntOpt('num_sync_threads', default=4,
                    help=_('Number of threads to use during sync process.')),
+        cfg.IntOpt('sync_networks_batch_size', default=20,
+                   help=_('Number of networks whose information is '
+                          'retrieved with a single call during sync '
+                          'process.')),
         cfg.StrOpt('metadata_proxy_socket',
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
                           'socket')),
+        cfg.BoolOpt('single_metadata_proxy', default=False,
+                    help=_("Serve metadata in all the isolated network "
+                           "namespaces from a single proxy process instead "
+                           "of spawning one in each namespace.")),
+        cfg.FloatOpt('port_event_delay', default=0.5,
+                     help=_('Seconds to wait after a port event before '
+                            'reloading the DHCP server of its network, so '
+                            'that a burst of port events causes a single '
+                            'reload. 0 reloads on every event.')),
     ]
 
     def __init__(self, host=None):
@@ -71,7 +107,17 @@ class DhcpAgent(manager.Manager):
         self.needs_resync = False
         self.conf = cfg.CONF
         self.cache = NetworkCache()
+        self.pending_reloads = set()
+        self.sync_progress = {'networks_total': 0, 'networks_synced': 0}
+        # Whether the server supports get_networks_info, None until the
+        # first call tells
+        self.use_networks_info_rpc = None
         self.root_helper = config.get_root_helper(self.conf)
+        self.metadata_proxy = None
+        if self.conf.single_metadata_proxy:
+            self.metadata_proxy = namespace_proxy.MultiplexedProxyManager(
+                self.conf, 'dhcp-agent-metadata-proxy', self.root_helper,
+                dhcp.METADATA_PORT)
         self.dhcp_driver_cls = importutils.import_class(self.conf.dhcp_driver)
         ctx = context.get_admin_context_without_session()
         self.plugin_rpc = DhcpPluginApi(topics.PLUGIN,
@@ -151,9 +197,17 @@ class DhcpAgent(manager.Manager):
         known_network_ids = set(self.cache.get_network_ids())
 
         try:
-            active_networks = self.plugin_rpc.get_active_networks_info()
-            active_network_ids = set(network.id for network in active_networks)
-            for deleted_id in known_network_ids - active_network_ids:
+            if self.use_networks_info_rpc is None:
+                self._check_networks_info_rpc()
+            if self.use_networks_info_rpc:
+                active_network_ids = self.plugin_rpc.get_active_networks()
+            else:
+                active_networks = self.plugin_rpc.get_active_networks_info()
+                active_network_ids = [network.id
+                                      for network in active_networks]
+            self.sync_progress = {'networks_total': len(active_network_ids),
+                                  'networks_synced': 0}
+            for deleted_id in known_network_ids - set(active_network_ids):
                 try:
                     self.disable_dhcp_helper(deleted_id)
                 except Exception:
@@ -161,8 +215,16 @@ class DhcpAgent(manager.Manager):
                     LOG.exception(_('Unable to sync network state on deleted '
                                     'network %s'), deleted_id)
 
-            for network in active_networks:
-                pool.spawn(self.safe_configure_dhcp_for_network, network)
+            if self.use_networks_info_rpc:
+                # Retrieve the networks in batches, so that the first ones
+                # are configured while the others are still being retrieved
+                batch_size = max(self.conf.sync_networks_batch_size, 1)
+                for i in range(0, len(active_network_ids), batch_size):
+                    pool.spawn(self._sync_networks_batch,
+                               active_network_ids[i:i + batch_size])
+            else:
+                for network in active_networks:
+                    pool.spawn(self._sync_network, network)
             pool.waitall()
             LOG.info(_('Synchronizing state complete'))
 
@@ -170,6 +232,35 @@ class DhcpAgent(manager.Manager):
             self.needs_resync = True
             LOG.exception(_('Unable to sync network state.'))
 
+    def _check_networks_info_rpc(self):
+        """Check whether the server supports get_networks_info."""
+        try:
+            self.plugin_rpc.get_networks_info([])
+        except (common.RemoteError, common.UnsupportedRpcVersion) as e:
+            if (isinstance(e, common.RemoteError) and
+                    e.exc_type not in ('UnsupportedRpcVersion',
+                                       'AttributeError')):
+                raise
+            LOG.warning(_("get_networks_info is not supported by the "
+                          "server, falling back to get_active_networks_info"))
+            self.use_networks_info_rpc = False
+        else:
+            self.use_networks_info_rpc = True
+
+    def _sync_networks_batch(self, network_ids):
+        try:
+            networks = self.plugin_rpc.get_networks_info(network_ids)
+        except Exception:
+            self.needs_resync = True
+            LOG.exception(_('Unable to retrieve networks %s.'), network_ids)
+            return
+        for network in networks:
+            self._sync_network(network)
+
+    def _sync_network(self, network):
+        self.safe_configure_dhcp_for_network(network)
+        self.sync_progress['networks_synced'] += 1
+
     def _periodic_resync_helper(self):
         """Resync the dhcp state at the configured interval."""
         while True:
@@ -290,14 +381,40 @@ class DhcpAgent(manager.Manager):
         if network:
             self.refresh_dhcp_helper(network.id)
 
+    def schedule_reload_allocations(self, network):
+        """Reload the allocations of a network after port_event_delay.
+
+        The port events received in the meantime are applied to the cache
+        and picked up by the same reload.
+        """
+        if not self.conf.port_event_delay:
+            self.call_driver('reload_allocations', network)
+        elif network.id not in self.pending_reloads:
+            self.pending_reloads.add(network.id)
+            eventlet.spawn_after(self.conf.port_event_delay,
+                                 self.reload_allocations_helper, network.id)
+
+    @utils.synchronized('dhcp-agent')
+    def reload_allocations_helper(self, network_id):
+        """Reload the allocations of a network from the cache."""
+        self.pending_reloads.discard(network_id)
+        network = self.cache.get_network_by_id(network_id)
+        if network:
+            self.call_driver('reload_allocations', network)
+
     @utils.synchronized('dhcp-agent')
     def port_update_end(self, context, payload):
         """Handle the port.update.end notification event."""
         updated_port = dhcp.DictModel(payload['port'])
         network = self.cache.get_network_by_id(updated_port.network_id)
         if network:
+            old_port = self.cache.get_port_by_id(updated_port.id)
             self.cache.put_port(updated_port)
-            self.call_driver('reload_allocations', network)
+            if old_port and not _allocations_changed(old_port, updated_port):
+                LOG.debug(_('Port %s update does not affect DHCP'),
+                          updated_port.id)
+                return
+            self.schedule_reload_allocations(network)
 
     # Use the update handler for the port create event.
     port_create_end = port_update_end
@@ -309,14 +426,29 @@ class DhcpAgent(manager.Manager):
         if port:
             network = self.cache.get_network_by_id(port.network_id)
             self.cache.remove_port(port)
-            self.call_driver('reload_allocations', network)
+            self.schedule_reload_allocations(network)
+
+    def batched_notifications(self, context, payload):
+        """Handle notifications coalesced and batched by the server."""
+        for notification in payload['notifications']:
+            method = notification['method']
+            if method not in self.BATCHED_METHODS:
+                LOG.warn(_('Ignoring unexpected batched notification %s'),
+                         method)
+                continue
+            try:
+                getattr(self, method)(context, notification['payload'])
+            except Exception:
+                self.needs_resync = True
+                LOG.exception(_('Unable to process batched notification '
+                                '%s'), method)
 
     def enable_isolated_metadata_proxy(self, network):
 
         # The proxy might work for either a single network
         # or all the networks connected via a router
         # to the one passed as a parameter
-        neutron_lookup_param = '--network_id=%s' % network.id
+        router_id = None
         meta_cidr = netaddr.IPNetwork(dhcp.METADATA_DEFAULT_CIDR)
         has_metadata_subnet = any(netaddr.IPNetwork(s.cidr) in meta_cidr
                                   for s in network.subnets)
@@ -334,8 +466,21 @@ class DhcpAgent(manager.Manager):
                                 {'port_num': len(router_ports),
                                  'port_id': router_ports[0].id,
                                  'router_id': router_ports[0].device_id})
-                neutron_lookup_param = ('--router_id=%s' %
-                                        router_ports[0].device_id)
+                router_id = router_ports[0].device_id
+
+        if self.metadata_proxy:
+            # A proxy spawned in the namespace before switching to the
+            # single proxy would hold the metadata port
+            self._disable_namespace_metadata_proxy(network)
+            self.metadata_proxy.add(network.namespace,
+                                    network_id=network.id,
+                                    router_id=router_id)
+            return
+
+        if router_id:
+            neutron_lookup_param = '--router_id=%s' % router_id
+        else:
+            neutron_lookup_param = '--network_id=%s' % network.id
 
         def callback(pid_file):
             metadata_proxy_socket = cfg.CONF.metadata_proxy_socket
@@ -357,6 +502,11 @@ class DhcpAgent(manager.Manager):
         pm.enable(callback)
 
     def disable_isolated_metadata_proxy(self, network):
+        if self.metadata_proxy:
+            self.metadata_proxy.remove(network.namespace)
+        self._disable_namespace_metadata_proxy(network)
+
+    def _disable_namespace_metadata_proxy(self, network):
         pm = external_process.ProcessManager(
             self.conf,
             network.id,
@@ -365,6 +515,20 @@ class DhcpAgent(manager.Manager):
         pm.disable()
 
 
+def _allocation_key(port):
+    """Return the attributes of a port used by the DHCP server."""
+    fixed_ips = sorted((ip.subnet_id, ip.ip_address)
+                       for ip in port.fixed_ips)
+    dhcp_opts = sorted((opt.opt_name, opt.opt_value)
+                       for opt in getattr(port, 'extra_dhcp_opts', None) or [])
+    return (port.mac_address, getattr(port, 'device_owner', None),
+            fixed_ips, dhcp_opts)
+
+
+def _allocations_changed(old_port, new_port):
+    return _allocation_key(old_port) != _allocation_key(new_port)
+
+
 class DhcpPluginApi(proxy.RpcProxy):
     """Agent side of the dhcp rpc API.
 
@@ -372,6 +536,7 @@ class DhcpPluginApi(proxy.RpcProxy):
         1.0 - Initial version.
         1.1 - Added get_active_networks_info, create_dhcp_port,
               and update_dhcp_port methods.
+        1.3 - Added get_networks_info.
 
     """
 
@@ -392,6 +557,23 @@ class DhcpPluginApi(proxy.RpcProxy):
                              topic=self.topic)
         return [dhcp.NetModel(self.use_namespaces, n) for n in networks]
 
+    def get_active_networks(self):
+        """Make a remote process call to retrieve the active network ids."""
+        return self.call(self.context,
+                         self.make_msg('get_active_networks',
+                                       host=self.host),
+                         topic=self.topic)
+
+    def get_networks_info(self, network_ids):
+        """Make a remote process call to retrieve the info of networks."""
+        networks = self.call(self.context,
+                             self.make_msg('get_networks_info',
+                                           network_ids=network_ids,
+                                           host=self.host),
+                             topic=self.topic,
+                             version=NETWORKS_INFO_RPC_VERSION)
+        return [dhcp.NetModel(self.use_namespaces, n) for n in networks]
+
     def get_network_info(self, network_id):
         """Make a remote process call to retrieve network info."""
         network = self.call(self.context,
@@ -560,6 +742,8 @@ class DhcpAgentWithStateReport(DhcpAgent):
         try:
             self.agent_state.get('configurations').update(
                 self.cache.get_state())
+            self.agent_state['configurations']['sync_progress'] = dict(
+                self.sync_progress)
             ctx = context.get_admin_context_without_session()
             self.state_rpc.report_state(ctx, self.agent_state, self.use_call)
             self.use_call = False
@@ -593,6 +777,7 @@ def register_options():
     config.register_root_helper(cfg.CONF)
     cfg.CONF.register_opts(dhcp.OPTS)
     cfg.CONF.register_opts(interface.OPTS)
+    cfg.CONF.register_opts(ip_lib.OPTS)
 
 
 def main():
@@ -13,7 +13,10 @@
 #    under the License.
 #
 
+import datetime
+
 import eventlet
+from eventlet import queue
 import netaddr
 from oslo.config import cfg
 
@@ -23,6 +26,7 @@ from neutron.agent.linux import interface
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import iptables_manager
 from neutron.agent.linux import ovs_lib  # noqa
+from neutron.agent.metadata import namespace_proxy
 from neutron.agent import rpc as agent_rpc
 from neutron.common import constants as l3_constants
 from neutron.common import legacy
@@ -40,6 +44,7 @@ from neutron.openstack.common import processutils
 from neutron.openstack.common.rpc import common as rpc_common
 from neutron.openstack.common.rpc import proxy
 from neutron.openstack.common import service
+from neutron.openstack.common import timeutils
 from neutron import service as neutron_service
 from neutron.services.firewall.agents.l3reference import firewall_l3_agent
 
@@ -47,9 +52,13 @@ LOG = logging.getLogger(__name__)
 NS_PREFIX = 'qrouter-'
 INTERNAL_DEV_PREFIX = 'qr-'
 EXTERNAL_DEV_PREFIX = 'qg-'
-RPC_LOOP_INTERVAL = 1
 FLOATING_IP_CIDR_SUFFIX = '/32'
 
+# Lower value is higher priority
+PRIORITY_RPC = 0
+PRIORITY_SYNC_ROUTERS_TASK = 1
+DELETE_ROUTER = 1
+
 
 class L3PluginApi(proxy.RpcProxy):
     """Agent side of the l3 agent RPC API.
@@ -57,6 +66,7 @@ class L3PluginApi(proxy.RpcProxy):
     API version history:
         1.0 - Initial version.
         1.1 - Floating IP operational status updates
+        1.2 - Added sync_changed_routers
 
     """
 
@@ -74,6 +84,20 @@ class L3PluginApi(proxy.RpcProxy):
                                        router_ids=router_ids),
                          topic=self.topic)
 
+    def get_changed_routers(self, context, router_revisions, router_ids=None):
+        """Make a remote process call to retrieve the changed routers.
+
+        router_revisions maps the ids of the known routers to the revision
+        they were synced at. Returns a dict with the changed or new routers
+        and the ids of the known routers which were removed.
+        """
+        return self.call(context,
+                         self.make_msg('sync_changed_routers', host=self.host,
+                                       router_ids=router_ids,
+                                       router_revisions=router_revisions),
+                         topic=self.topic,
+                         version='1.2')
+
     def get_external_network_id(self, context):
         """Make a remote process call to retrieve the external network id.
 
@@ -147,6 +171,141 @@ class RouterInfo(object):
         self._snat_action = None
 
 
+class RouterUpdate(object):
+    """Encapsulates a router update
+
+    An instance of this object carries the information necessary to prioritize
+    and process a request to update a router.
+    """
+    def __init__(self, router_id, priority,
+                 action=None, router=None, timestamp=None):
+        self.priority = priority
+        self.timestamp = timestamp
+        if not timestamp:
+            self.timestamp = timeutils.utcnow()
+        self.id = router_id
+        self.action = action
+        self.router = router
+
+    def __lt__(self, other):
+        """Implements priority for processing router updates.
+
+        Used by Queue.PriorityQueue to order router updates for processing.
+        Higher priority updates are processed first, then older ones.
+        """
+        if self.priority != other.priority:
+            return self.priority < other.priority
+        if self.timestamp != other.timestamp:
+            return self.timestamp < other.timestamp
+        return self.id < other.id
+
+
+class ExclusiveRouterProcessor(object):
+    """Manager for access to a router for processing
+
+    This class controls access to a router in a non-blocking way.  The first
+    instance to be created for a given router_id is granted exclusive access to
+    the router.
+
+    Other instances may be created for the same router_id while the first
+    instance has exclusive access.  If that happens then it doesn't block and
+    wait for access.  Instead, it signals to the master instance that an update
+    came in with the timestamp.
+
+    This way, a thread will not block to wait for access to a router.  Instead
+    it effectively signals to the thread that is working on the router that
+    something has changed since it started working on it.  That thread will
+    simply finish its current iteration and then repeat.
+
+    This class keeps track of the last time that a router data was fetched and
+    processed.  The timestamp that it keeps must be before when the data used
+    to process the router last was fetched from the database.  But, as close as
+    possible.  The timestamp should not be recorded, however, until the router
+    has been processed using the fetch data.
+    """
+    _masters = {}
+    _router_timestamps = {}
+
+    def __init__(self, router_id):
+        self._router_id = router_id
+
+        if router_id not in self._masters:
+            self._masters[router_id] = self
+            self._queue = []
+
+        self._master = self._masters[router_id]
+
+    def _i_am_master(self):
+        return self == self._master
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if self._i_am_master():
+            del self._masters[self._router_id]
+
+    def _get_router_data_timestamp(self):
+        return self._router_timestamps.get(self._router_id,
+                                           datetime.datetime.min)
+
+    def fetched_and_processed(self, timestamp):
+        """Records the data timestamp after it is used to update the router."""
+        new_timestamp = max(timestamp, self._get_router_data_timestamp())
+        self._router_timestamps[self._router_id] = new_timestamp
+
+    def queue_update(self, update):
+        """Queues an update from a worker
+
+        This is the queue used to keep new updates that come in while a router
+        is being processed.  These updates have already bubbled to the front of
+        the RouterProcessingQueue.
+        """
+        self._master._queue.append(update)
+
+    def updates(self):
+        """Processes the router until updates stop coming
+
+        Only the master instance will process the router.  However, updates may
+        come in from other workers while it is in progress.  This method loops
+        until they stop coming.
+        """
+        if self._i_am_master():
+            while self._queue:
+                # Remove the update from the queue even if it is old.
+                update = self._queue.pop(0)
+                # Process the update only if it is fresh.
+                if self._get_router_data_timestamp() < update.timestamp:
+                    yield update
+
+
+class RouterProcessingQueue(object):
+    """Manager of the queue of routers to process."""
+    def __init__(self):
+        self._queue = queue.PriorityQueue()
+
+    def add(self, update):
+        self._queue.put(update)
+
+    def each_update_to_next_router(self):
+        """Grabs the next router from the queue and processes
+
+        This method uses a for loop to process the router repeatedly until
+        updates stop bubbling to the front of the queue.
+        """
+        next_update = self._queue.get()
+
+        with ExclusiveRouterProcessor(next_update.id) as rp:
+            # Queue the update whether this worker is the master or not.
+            rp.queue_update(next_update)
+
+            # Here, if the current worker is not the master, the call to
+            # rp.updates() will not yield and so this will essentially be a
+            # noop.
+            for update in rp.updates():
+                yield (rp, update)
+
+
 class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     """Manager for L3NatAgent
 
@@ -190,6 +349,14 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
                           'socket')),
+        cfg.BoolOpt('single_metadata_proxy', default=False,
+                    help=_("Serve metadata in all the router namespaces "
+                           "from a single proxy process instead of "
+                           "spawning one in each namespace.")),
+        cfg.IntOpt('router_processing_workers', default=8,
+                   help=_("Number of routers processed concurrently. "
+                          "Updates to a given router are always processed "
+                          "one at a time.")),
     ]
 
     def __init__(self, host, conf=None):
@@ -199,9 +366,19 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             self.conf = cfg.CONF
         self.root_helper = config.get_root_helper(self.conf)
         self.router_info = {}
+        # Revisions of the routers as last synced and processed
+        self.router_revisions = {}
+        # None until the server is known to support sync_changed_routers
+        self.use_changed_routers_rpc = None
 
         self._check_config_params()
 
+        self.metadata_proxy = None
+        if self.conf.enable_metadata_proxy and self.conf.single_metadata_proxy:
+            self.metadata_proxy = namespace_proxy.MultiplexedProxyManager(
+                self.conf, 'l3-agent-metadata-proxy', self.root_helper,
+                self.conf.metadata_port)
+
         try:
             self.driver = importutils.import_object(
                 self.conf.interface_driver,
@@ -216,16 +393,12 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         self.context = context.get_admin_context_without_session()
         self.plugin_rpc = L3PluginApi(topics.L3PLUGIN, host)
         self.fullsync = True
-        self.updated_routers = set()
-        self.removed_routers = set()
         self.sync_progress = False
 
         self._delete_stale_namespaces = (self.conf.use_namespaces and
                                          self.conf.router_delete_namespaces)
 
-        self.rpc_loop = loopingcall.FixedIntervalLoopingCall(
-            self._rpc_loop)
-        self.rpc_loop.start(interval=RPC_LOOP_INTERVAL)
+        self._queue = RouterProcessingQueue()
         super(L3NATAgent, self).__init__(conf=self.conf)
 
         self.target_ex_net_id = None
@@ -375,6 +548,13 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         self._destroy_router_namespace(ri.ns_name())
 
     def _spawn_metadata_proxy(self, router_id, ns_name):
+        if self.metadata_proxy:
+            # A proxy spawned in the namespace before switching to the
+            # single proxy would hold the metadata port
+            self._disable_namespace_metadata_proxy(router_id, ns_name)
+            self.metadata_proxy.add(ns_name, router_id=router_id)
+            return
+
         def callback(pid_file):
             metadata_proxy_socket = cfg.CONF.metadata_proxy_socket
             proxy_cmd = ['neutron-ns-metadata-proxy',
@@ -396,6 +576,11 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         pm.enable(callback)
 
     def _destroy_metadata_proxy(self, router_id, ns_name):
+        if self.metadata_proxy:
+            self.metadata_proxy.remove(ns_name)
+        self._disable_namespace_metadata_proxy(router_id, ns_name)
+
+    def _disable_namespace_metadata_proxy(self, router_id, ns_name):
         pm = external_process.ProcessManager(
             self.conf,
             router_id,
@@ -704,7 +889,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     def router_deleted(self, context, router_id):
         """Deal with router deletion RPC message."""
         LOG.debug(_('Got router deleted notification for %s'), router_id)
-        self.removed_routers.add(router_id)
+        update = RouterUpdate(router_id, PRIORITY_RPC, action=DELETE_ROUTER)
+        self._queue.add(update)
 
     def routers_updated(self, context, routers):
         """Deal with routers modification and creation RPC message."""
@@ -713,11 +899,15 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             # This is needed for backward compatibility
             if isinstance(routers[0], dict):
                 routers = [router['id'] for router in routers]
-            self.updated_routers.update(routers)
+            for router_id in routers:
+                update = RouterUpdate(router_id, PRIORITY_RPC)
+                self._queue.add(update)
 
     def router_removed_from_agent(self, context, payload):
         LOG.debug(_('Got router removed from agent :%r'), payload)
-        self.removed_routers.add(payload['router_id'])
+        router_id = payload['router_id']
+        update = RouterUpdate(router_id, PRIORITY_RPC, action=DELETE_ROUTER)
+        self._queue.add(update)
 
     def router_added_to_agent(self, context, payload):
         LOG.debug(_('Got router added to agent :%r'), payload)
@@ -772,37 +962,82 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             pool.spawn_n(self._router_removed, router_id)
         pool.waitall()
 
-    @lockutils.synchronized('l3-agent', 'neutron-')
-    def _rpc_loop(self):
-        # _rpc_loop and _sync_routers_task will not be
-        # executed in the same time because of lock.
-        # so we can clear the value of updated_routers
-        # and removed_routers
-        try:
-            LOG.debug(_("Starting RPC loop for %d updated routers"),
-                      len(self.updated_routers))
-            if self.updated_routers:
-                router_ids = list(self.updated_routers)
-                self.updated_routers.clear()
-                routers = self.plugin_rpc.get_routers(
-                    self.context, router_ids)
-                self._process_routers(routers)
-            self._process_router_delete()
-            LOG.debug(_("RPC loop successfully completed"))
-        except Exception:
-            LOG.exception(_("Failed synchronizing routers"))
-            self.fullsync = True
+    def _process_router_update(self):
+        for rp, update in self._queue.each_update_to_next_router():
+            LOG.debug(_("Starting router update for %s"), update.id)
+            router = update.router
+            if update.action != DELETE_ROUTER and not router:
+                try:
+                    update.timestamp = timeutils.utcnow()
+                    routers = self.plugin_rpc.get_routers(self.context,
+                                                          [update.id])
+                except Exception:
+                    msg = _("Failed to fetch router information for '%s'")
+                    LOG.exception(msg, update.id)
+                    self.fullsync = True
+                    continue
 
-    def _process_router_delete(self):
-        current_removed_routers = list(self.removed_routers)
-        for router_id in current_removed_routers:
-            self._router_removed(router_id)
-            self.removed_routers.remove(router_id)
+                if routers:
+                    router = routers[0]
+
+            try:
+                if not router:
+                    self._router_removed(update.id)
+                else:
+                    self._process_routers([router])
+            except Exception:
+                msg = _("Failed to process router '%s'")
+                LOG.exception(msg, update.id)
+                self.router_revisions.pop(update.id, None)
+                self.fullsync = True
+                continue
+            if router and 'revision' in router:
+                self.router_revisions[update.id] = router['revision']
+            else:
+                # Routers fetched on notifications carry no revision, the
+                # next sync fetches them again
+                self.router_revisions.pop(update.id, None)
+            LOG.debug(_("Finished a router update for %s"), update.id)
+            rp.fetched_and_processed(update.timestamp)
+
+    def _process_routers_loop(self):
+        LOG.debug(_("Starting _process_routers_loop"))
+        pool = eventlet.GreenPool(size=self.conf.router_processing_workers)
+        while True:
+            pool.spawn_n(self._process_router_update)
 
     def _router_ids(self):
         if not self.conf.use_namespaces:
             return [self.conf.router_id]
 
+    def _fetch_routers_to_sync(self, context, router_ids, known_router_ids):
+        """Fetch the routers which need to be synced.
+
+        Returns the routers and the ids of the known routers which were
+        removed, or None as ids when all the routers were fetched.
+        """
+        # Stale namespaces are cleaned up against all the hosted routers
+        if (self.use_changed_routers_rpc is not False and
+                not self._delete_stale_namespaces):
+            router_revisions = dict(
+                (router_id, self.router_revisions.get(router_id))
+                for router_id in known_router_ids | set(self.router_revisions))
+            try:
+                result = self.plugin_rpc.get_changed_routers(
+                    context, router_revisions, router_ids)
+            except (rpc_common.RemoteError,
+                    rpc_common.UnsupportedRpcVersion) as e:
+                if (isinstance(e, rpc_common.RemoteError) and
+                        e.exc_type != 'UnsupportedRpcVersion'):
+                    raise
+                LOG.warning(_("sync_changed_routers is not supported by the "
+                              "server, falling back to sync_routers"))
+                self.use_changed_routers_rpc = False
+            else:
+                self.use_changed_routers_rpc = True
+                return result['routers'], result['deleted_router_ids']
+        return self.plugin_rpc.get_routers(context, router_ids), None
+
     @periodic_task.periodic_task
     @lockutils.synchronized('l3-agent', 'neutron-')
     def _sync_routers_task(self, context):
@@ -812,15 +1047,25 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                   self.fullsync)
         if not self.fullsync:
             return
+
+        # Capture a picture of namespaces *before* fetching the full list from
+        # the database.  This is important to correctly identify stale ones.
+        prev_router_ids = set(self.router_info)
+        # Updates older than this timestamp are discarded by the workers
+        timestamp = timeutils.utcnow()
+
         try:
             router_ids = self._router_ids()
-            self.updated_routers.clear()
-            self.removed_routers.clear()
-            routers = self.plugin_rpc.get_routers(
-                context, router_ids)
+            routers, removed_router_ids = self._fetch_routers_to_sync(
+                context, router_ids, prev_router_ids)
 
             LOG.debug(_('Processing :%r'), routers)
-            self._process_routers(routers, all_routers=True)
+            for r in routers:
+                update = RouterUpdate(r['id'],
+                                      PRIORITY_SYNC_ROUTERS_TASK,
+                                      router=r,
+                                      timestamp=timestamp)
+                self._queue.add(update)
             self.fullsync = False
             LOG.debug(_("_sync_routers_task successfully completed"))
         except rpc_common.RPCException:
@@ -830,6 +1075,19 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         except Exception:
             LOG.exception(_("Failed synchronizing routers"))
             self.fullsync = True
+            return
+
+        # Routers which are not hosted by this agent anymore
+        if removed_router_ids is None:
+            curr_router_ids = set([r['id'] for r in routers])
+            removed_router_ids = prev_router_ids - curr_router_ids
+        for router_id in removed_router_ids:
+            self.router_revisions.pop(router_id, None)
+            update = RouterUpdate(router_id,
+                                  PRIORITY_SYNC_ROUTERS_TASK,
+                                  timestamp=timestamp,
+                                  action=DELETE_ROUTER)
+            self._queue.add(update)
 
         # Resync is not necessary for the cleanup of stale
         # namespaces.
@@ -837,6 +1095,7 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             self._cleanup_namespaces(routers)
 
     def after_start(self):
+        eventlet.spawn_n(self._process_routers_loop)
         LOG.info(_("L3 agent started"))
 
     def _update_routing_table(self, ri, operation, route):
@@ -942,6 +1201,7 @@ def main(manager='neutron.agent.l3_agent.L3NATAgentWithStateReport'):
     config.register_root_helper(conf)
     conf.register_opts(interface.OPTS)
     conf.register_opts(external_process.OPTS)
+    conf.register_opts(ip_lib.OPTS)
     conf(project='neutron')
     config.setup_logging(conf)
     legacy.modernize_quantum_config(conf)
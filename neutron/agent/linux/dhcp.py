@@ -273,6 +273,9 @@ class Dnsmasq(DhcpLocalProcess):
 
     _TAG_PREFIX = 'tag%d'
 
+    # Set when _output_hosts_file or _output_opts_file rewrites its file
+    _conf_files_changed = False
+
     NEUTRON_NETWORK_ID_KEY = 'NEUTRON_NETWORK_ID'
     NEUTRON_RELAY_SOCKET_PATH_KEY = 'NEUTRON_RELAY_SOCKET_PATH'
     MINIMUM_VERSION = 2.59
@@ -389,8 +392,15 @@ class Dnsmasq(DhcpLocalProcess):
             return
 
         self._release_unused_leases()
+        self._conf_files_changed = False
         self._output_hosts_file()
         self._output_opts_file()
+        if not self._conf_files_changed and self.active:
+            # dnsmasq already serves these allocations, e.g. only the
+            # status or the name of a port changed
+            LOG.debug(_('Allocations for network %s are unchanged'),
+                      self.network.id)
+            return
         if self.active:
             cmd = ['kill', '-HUP', self.pid]
             utils.execute(cmd, self.root_helper)
@@ -427,9 +437,18 @@ class Dnsmasq(DhcpLocalProcess):
                               (port.mac_address, name, ip_address))
 
         name = self.get_conf_file_name('host')
-        utils.replace_file(name, buf.getvalue())
+        self._replace_conf_file(name, buf.getvalue())
         return name
 
+    def _replace_conf_file(self, name, data):
+        """Write a config file unless it already holds the given data."""
+        if os.path.exists(name):
+            with open(name) as f:
+                if f.read() == data:
+                    return
+        utils.replace_file(name, data)
+        self._conf_files_changed = True
+
     def _read_hosts_file_leases(self, filename):
         leases = set()
         if os.path.exists(filename):
@@ -526,7 +545,7 @@ class Dnsmasq(DhcpLocalProcess):
                                                    ','.join(ips)))
 
         name = self.get_conf_file_name('opts')
-        utils.replace_file(name, '\n'.join(options))
+        self._replace_conf_file(name, '\n'.join(options))
         return name
 
     def _make_subnet_interface_ip_map(self):
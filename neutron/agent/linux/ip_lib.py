@@ -14,9 +14,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+
 import netaddr
 from oslo.config import cfg
 
+from neutron.agent.linux import ip_netlink
 from neutron.agent.linux import utils
 from neutron.common import exceptions
 
@@ -25,6 +28,13 @@ OPTS = [
     cfg.BoolOpt('ip_lib_force_root',
                 default=False,
                 help=_('Force ip_lib calls to use the root helper')),
+    cfg.BoolOpt('ip_lib_use_netlink',
+                default=False,
+                help=_('Query devices, addresses, routes and namespaces '
+                       'through netlink sockets instead of running the ip '
+                       'utility. Queries in a namespace other than the '
+                       'agent one still run ip unless the agent runs as '
+                       'root.')),
 ]
 
 
@@ -36,6 +46,14 @@ VLAN_INTERFACE_DETAIL = ['vlan protocol 802.1q',
                          'vlan id']
 
 
+def use_netlink():
+    try:
+        return cfg.CONF.ip_lib_use_netlink
+    except cfg.NoSuchOptError:
+        # Only callers that want netlink queries need to register the option.
+        return False
+
+
 class SubProcessBase(object):
     def __init__(self, root_helper=None, namespace=None):
         self.root_helper = root_helper
@@ -46,6 +64,13 @@ class SubProcessBase(object):
             # Only callers that need to force use of the root helper
             # need to register the option.
             self.force_root = False
+        self.use_netlink = use_netlink()
+
+    def _netlink_usable(self):
+        # Commands forced through the root helper may run in another
+        # domain, and entering a namespace requires root privileges.
+        return (self.use_netlink and not self.force_root and
+                (not self.namespace or os.geteuid() == 0))
 
     def _run(self, options, command, args):
         if self.namespace:
@@ -91,6 +116,12 @@ class IPWrapper(SubProcessBase):
         return IPDevice(name, self.root_helper, self.namespace)
 
     def get_devices(self, exclude_loopback=False):
+        if self._netlink_usable():
+            return [IPDevice(link['name'], self.root_helper, self.namespace)
+                    for link in ip_netlink.get_links(self.namespace)
+                    if not (exclude_loopback and
+                            link['name'] == LOOPBACK_DEVNAME)]
+
         retval = []
         output = self._execute(['o', 'd'], 'link', ('list',),
                                self.root_helper, self.namespace)
@@ -180,6 +211,8 @@ class IPWrapper(SubProcessBase):
 
     @classmethod
     def get_namespaces(cls, root_helper):
+        if use_netlink():
+            return ip_netlink.list_namespaces()
         output = cls._execute('', 'netns', ('list',), root_helper=root_helper)
         return [l.strip() for l in output.split('\n')]
 
@@ -278,6 +311,9 @@ class IpLinkCommand(IpDeviceCommandBase):
 
     @property
     def attributes(self):
+        if self._parent._netlink_usable():
+            return ip_netlink.get_link_attributes(self.name,
+                                                  self._parent.namespace)
         return self._parse_line(self._run('show', self.name, options='o'))
 
     def _parse_line(self, value):
@@ -321,6 +357,10 @@ class IpAddrCommand(IpDeviceCommandBase):
         if filters is None:
             filters = []
 
+        if (self._parent._netlink_usable() and
+                set(filters) <= set(['permanent'])):
+            return self._list_netlink(scope, to, 'permanent' in filters)
+
         retval = []
 
         if scope:
@@ -356,6 +396,20 @@ class IpAddrCommand(IpDeviceCommandBase):
                                dynamic=('dynamic' == parts[-1])))
         return retval
 
+    def _list_netlink(self, scope, to, permanent):
+        addresses = ip_netlink.get_addresses(self.name,
+                                             self._parent.namespace)
+        if scope:
+            addresses = [a for a in addresses if a['scope'] == scope]
+        if permanent:
+            addresses = [a for a in addresses if not a['dynamic']]
+        if to:
+            to = netaddr.IPNetwork(to)
+            addresses = [a for a in addresses
+                         if a['ip_version'] == to.version and
+                         netaddr.IPNetwork(a['cidr']).ip in to]
+        return addresses
+
 
 class IpRouteCommand(IpDeviceCommandBase):
     COMMAND = 'route'
@@ -379,6 +433,9 @@ class IpRouteCommand(IpDeviceCommandBase):
         if filters is None:
             filters = []
 
+        if self._parent._netlink_usable() and not filters:
+            return self._get_gateway_netlink(scope)
+
         retval = None
 
         if scope:
@@ -399,6 +456,17 @@ class IpRouteCommand(IpDeviceCommandBase):
 
         return retval
 
+    def _get_gateway_netlink(self, scope):
+        namespace = self._parent.namespace
+        index = ip_netlink.get_link(self.name, namespace)['index']
+        for route in ip_netlink.get_routes(namespace):
+            if (route['dst_len'] == 0 and route['oif'] == index and
+                    (not scope or route['scope'] == scope)):
+                retval = dict(gateway=route['gateway'])
+                if route['metric'] is not None:
+                    retval.update(metric=route['metric'])
+                return retval
+
     def pullup_route(self, interface_name):
         """Ensures that the route entry for the interface is before all
         others on the same subnet.
@@ -466,6 +534,8 @@ class IpNetnsCommand(IpCommandBase):
             check_exit_code=check_exit_code)
 
     def exists(self, name):
+        if self._parent.use_netlink:
+            return ip_netlink.namespace_exists(name)
         output = self._as_root('list', options='o', use_root_namespace=True)
 
         for line in output.split('\n'):
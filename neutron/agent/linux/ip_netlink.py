@@ -0,0 +1,315 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read-only rtnetlink queries used by ip_lib instead of running 'ip'.
+
+Devices, addresses and routes are dumped through a NETLINK_ROUTE socket.
+A socket is bound to the network namespace it was created in, so queries
+in another namespace briefly switch the process to it with setns(2) to
+create their socket, which requires root privileges.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import socket
+import struct
+
+import netaddr
+
+
+NETNS_RUN_DIR = '/var/run/netns'
+
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_GETROUTE = 26
+
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_QDISC = 6
+IFLA_TXQLEN = 13
+IFLA_OPERSTATE = 16
+IFLA_IFALIAS = 20
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_BROADCAST = 4
+IFA_F_PERMANENT = 0x80
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_TABLE = 15
+RT_TABLE_MAIN = 254
+
+ARPHRD_ETHER = 1
+ARPHRD_LOOPBACK = 772
+CLONE_NEWNET = 0x40000000
+
+NLMSGHDR = struct.Struct('=LHHLL')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBi')
+RTMSG = struct.Struct('=BBBBBBBBI')
+RTATTR = struct.Struct('=HH')
+
+# Names used by the ip utility
+SCOPE_NAMES = {0: 'global', 200: 'site', 253: 'link', 254: 'host',
+               255: 'nowhere'}
+OPERSTATE_NAMES = ['UNKNOWN', 'NOTPRESENT', 'DOWN', 'LOWERLAYERDOWN',
+                   'TESTING', 'DORMANT', 'UP']
+
+_libc = None
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _setns(fd):
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if _libc.setns(fd, CLONE_NEWNET) != 0:
+        errno = ctypes.get_errno()
+        raise RuntimeError(_("Unable to switch network namespace: %s") %
+                           os.strerror(errno))
+
+
+def _create_socket():
+    return socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+
+
+def _call_in_namespace(namespace, func):
+    if not namespace:
+        return func()
+    try:
+        target = open(os.path.join(NETNS_RUN_DIR, namespace))
+    except IOError as e:
+        raise RuntimeError(_("Cannot open network namespace %(ns)s: "
+                             "%(err)s") % {'ns': namespace, 'err': e})
+    with target:
+        with open('/proc/self/ns/net') as current:
+            _setns(target.fileno())
+            try:
+                return func()
+            finally:
+                _setns(current.fileno())
+
+
+def _open_socket(namespace=None):
+    return _call_in_namespace(namespace, _create_socket)
+
+
+def open_socket(family, sock_type, proto=0, namespace=None):
+    """Create a socket in a network namespace.
+
+    The socket stays bound to the namespace it was created in, so a
+    single process can serve several namespaces without spawning one
+    process in each of them.
+    """
+    return _call_in_namespace(
+        namespace, lambda: socket.socket(family, sock_type, proto))
+
+
+def _parse_attrs(data, offset, end):
+    attrs = {}
+    while offset + RTATTR.size <= end:
+        length, attr_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _dump(msg_type, header, namespace=None):
+    """Send a dump request.
+
+    Returns the replies as (offset of the payload, end offset, buffer).
+    """
+    sock = _open_socket(namespace)
+    try:
+        sock.bind((0, 0))
+        request = NLMSGHDR.pack(NLMSGHDR.size + len(header), msg_type,
+                                NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + header
+        sock.sendall(request)
+        replies = []
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + NLMSGHDR.size <= len(data):
+                length, reply_type = NLMSGHDR.unpack_from(data, offset)[:2]
+                if length < NLMSGHDR.size:
+                    raise RuntimeError(_("Invalid netlink message"))
+                payload = offset + NLMSGHDR.size
+                if reply_type == NLMSG_DONE:
+                    return replies
+                if reply_type == NLMSG_ERROR:
+                    error = struct.unpack_from('=i', data, payload)[0]
+                    if error:
+                        raise RuntimeError(os.strerror(-error))
+                else:
+                    replies.append((payload, offset + length, data))
+                offset += _align(length)
+    finally:
+        sock.close()
+
+
+def _string(value):
+    return value.split('\0', 1)[0]
+
+
+def _int(value):
+    return struct.unpack('=I', value[:4])[0]
+
+
+def get_links(namespace=None):
+    """Return the network devices of a namespace as dicts."""
+    links = []
+    for payload, end, data in _dump(RTM_GETLINK,
+                                    IFINFOMSG.pack(0, 0, 0, 0, 0),
+                                    namespace):
+        _family, link_type, index, flags, _change = IFINFOMSG.unpack_from(
+            data, payload)
+        attrs = _parse_attrs(data, payload + IFINFOMSG.size, end)
+        link = {'index': index,
+                'type': link_type,
+                'flags': flags,
+                'name': _string(attrs.get(IFLA_IFNAME, ''))}
+        if IFLA_ADDRESS in attrs:
+            link['address'] = ':'.join('%02x' % ord(c)
+                                       for c in attrs[IFLA_ADDRESS])
+        if IFLA_MTU in attrs:
+            link['mtu'] = _int(attrs[IFLA_MTU])
+        if IFLA_QDISC in attrs:
+            link['qdisc'] = _string(attrs[IFLA_QDISC])
+        if IFLA_TXQLEN in attrs:
+            link['qlen'] = _int(attrs[IFLA_TXQLEN])
+        if IFLA_OPERSTATE in attrs:
+            state = ord(attrs[IFLA_OPERSTATE][0])
+            if state < len(OPERSTATE_NAMES):
+                link['state'] = OPERSTATE_NAMES[state]
+        if attrs.get(IFLA_IFALIAS):
+            link['alias'] = _string(attrs[IFLA_IFALIAS])
+        links.append(link)
+    return links
+
+
+def get_link(name, namespace=None):
+    for link in get_links(namespace):
+        if link['name'] == name:
+            return link
+    raise RuntimeError(_('Device "%s" does not exist.') % name)
+
+
+def get_link_attributes(name, namespace=None):
+    """Return the attributes of a device as parsed from 'ip -o link'."""
+    link = get_link(name, namespace)
+    attributes = dict((key, link[key])
+                      for key in ('mtu', 'qdisc', 'state', 'qlen', 'alias')
+                      if key in link)
+    if link['type'] == ARPHRD_ETHER and 'address' in link:
+        attributes['link/ether'] = link['address']
+    elif link['type'] == ARPHRD_LOOPBACK and 'address' in link:
+        attributes['link/loopback'] = link['address']
+    return attributes
+
+
+def get_addresses(name, namespace=None):
+    """Return the addresses of a device in the format of IpAddrCommand."""
+    index = get_link(name, namespace)['index']
+    addresses = []
+    for payload, end, data in _dump(RTM_GETADDR,
+                                    IFADDRMSG.pack(0, 0, 0, 0, 0),
+                                    namespace):
+        family, prefixlen, flags, scope, addr_index = IFADDRMSG.unpack_from(
+            data, payload)
+        if addr_index != index or family not in (socket.AF_INET,
+                                                 socket.AF_INET6):
+            continue
+        attrs = _parse_attrs(data, payload + IFADDRMSG.size, end)
+        address = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+        if not address:
+            continue
+        cidr = '%s/%s' % (socket.inet_ntop(family, address), prefixlen)
+        if family == socket.AF_INET6:
+            version = 6
+            broadcast = '::'
+        else:
+            version = 4
+            if IFA_BROADCAST in attrs:
+                broadcast = socket.inet_ntop(family, attrs[IFA_BROADCAST])
+            else:
+                broadcast = str(netaddr.IPNetwork(cidr).broadcast)
+        addresses.append(dict(cidr=cidr,
+                              broadcast=broadcast,
+                              scope=SCOPE_NAMES.get(scope, str(scope)),
+                              ip_version=version,
+                              dynamic=not flags & IFA_F_PERMANENT))
+    return addresses
+
+
+def get_routes(namespace=None, family=socket.AF_INET):
+    """Return the routes of the main table as dicts."""
+    routes = []
+    for payload, end, data in _dump(RTM_GETROUTE,
+                                    RTMSG.pack(family, 0, 0, 0, 0,
+                                               0, 0, 0, 0),
+                                    namespace):
+        (route_family, dst_len, _src_len, _tos, table, _proto, scope,
+         _type, _flags) = RTMSG.unpack_from(data, payload)
+        attrs = _parse_attrs(data, payload + RTMSG.size, end)
+        if RTA_TABLE in attrs:
+            table = _int(attrs[RTA_TABLE])
+        if table != RT_TABLE_MAIN:
+            continue
+        route = {'dst_len': dst_len,
+                 'scope': SCOPE_NAMES.get(scope, str(scope)),
+                 'dst': None,
+                 'gateway': None,
+                 'oif': None,
+                 'metric': None}
+        if RTA_DST in attrs:
+            route['dst'] = socket.inet_ntop(route_family, attrs[RTA_DST])
+        if RTA_GATEWAY in attrs:
+            route['gateway'] = socket.inet_ntop(route_family,
+                                                attrs[RTA_GATEWAY])
+        if RTA_OIF in attrs:
+            route['oif'] = _int(attrs[RTA_OIF])
+        if RTA_PRIORITY in attrs:
+            route['metric'] = _int(attrs[RTA_PRIORITY])
+        routes.append(route)
+    return routes
+
+
+def list_namespaces():
+    try:
+        return sorted(os.listdir(NETNS_RUN_DIR))
+    except OSError:
+        return []
+
+
+def namespace_exists(name):
+    return os.path.exists(os.path.join(NETNS_RUN_DIR, name))
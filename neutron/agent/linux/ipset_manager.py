@@ -0,0 +1,96 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Implements kernel ipsets using the ipset utility."""
+
+from neutron.agent.linux import utils as linux_utils
+from neutron.common import constants
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# ipset names are limited to 31 characters
+MAX_IPSET_NAME_LENGTH = 31
+IPSET_FAMILY = {constants.IPv4: 'inet',
+                constants.IPv6: 'inet6'}
+
+
+def get_ipset_name(ethertype, security_group_id):
+    """Return the name of the ipset holding the members of a group."""
+    return ('%s%s' % (ethertype, security_group_id))[:MAX_IPSET_NAME_LENGTH]
+
+
+class IpsetManager(object):
+    """Wrapper for ipset.
+
+    Keeps track of the members of the sets it manages, so that refreshing
+    a set only adds and deletes the members which changed, in a single
+    'ipset restore' call.
+    """
+
+    def __init__(self, _execute=None, root_helper=None, namespace=None):
+        if _execute:
+            self.execute = _execute
+        else:
+            self.execute = linux_utils.execute
+        self.root_helper = root_helper
+        self.namespace = namespace
+        self.ipsets = {}
+
+    def _run(self, args, process_input=None):
+        args = ['ipset'] + args
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        return self.execute(args, process_input=process_input,
+                            root_helper=self.root_helper)
+
+    def refresh_ipset(self, name, ethertype, member_ips):
+        """Create the set if needed and make its members match member_ips.
+
+        A set seen for the first time is flushed, as it may be left over
+        with stale members from a previous run of the agent.
+        """
+        new_members = set(member_ips)
+        lines = []
+        if name not in self.ipsets:
+            lines.append('create %s hash:net family %s' %
+                         (name, IPSET_FAMILY[ethertype]))
+            lines.append('flush %s' % name)
+            old_members = set()
+        else:
+            old_members = self.ipsets[name]
+        lines += ['del %s %s' % (name, ip)
+                  for ip in sorted(old_members - new_members)]
+        lines += ['add %s %s' % (name, ip)
+                  for ip in sorted(new_members - old_members)]
+        if not lines:
+            return
+        LOG.debug(_("Refreshing ipset %(name)s with %(count)d members"),
+                  {'name': name, 'count': len(new_members)})
+        try:
+            self._run(['restore', '-exist'],
+                      process_input='\n'.join(lines) + '\n')
+        except RuntimeError:
+            # The content of the set is unknown now, rebuild it next time
+            self.ipsets.pop(name, None)
+            raise
+        self.ipsets[name] = new_members
+
+    def destroy_ipset(self, name):
+        """Destroy a set, which must not be referenced by any rule."""
+        if name not in self.ipsets:
+            return
+        LOG.debug(_("Destroying ipset %s"), name)
+        self._run(['destroy', name])
+        del self.ipsets[name]
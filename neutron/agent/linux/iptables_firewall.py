@@ -19,12 +19,15 @@ import netaddr
 from oslo.config import cfg
 
 from neutron.agent import firewall
+from neutron.agent.linux import ipset_manager
 from neutron.agent.linux import iptables_manager
 from neutron.common import constants
 from neutron.openstack.common import log as logging
 
 
 LOG = logging.getLogger(__name__)
+cfg.CONF.import_opt('enable_ipset', 'neutron.agent.securitygroups_rpc',
+                    group='SECURITYGROUP')
 SG_CHAIN = 'sg-chain'
 INGRESS_DIRECTION = 'ingress'
 EGRESS_DIRECTION = 'egress'
@@ -33,6 +36,10 @@ CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'i',
                      EGRESS_DIRECTION: 'o',
                      SPOOF_FILTER: 's'}
 LINUX_DEV_LEN = 14
+DIRECTION_IP_PREFIX = {INGRESS_DIRECTION: 'source_ip_prefix',
+                       EGRESS_DIRECTION: 'dest_ip_prefix'}
+IPSET_DIRECTION = {INGRESS_DIRECTION: 'src',
+                   EGRESS_DIRECTION: 'dst'}
 
 
 class IptablesFirewallDriver(firewall.FirewallDriver):
@@ -49,6 +56,12 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self._add_fallback_chain_v4v6()
         self._defer_apply = False
         self._pre_defer_filtered_ports = None
+        self.enable_ipset = cfg.CONF.SECURITYGROUP.enable_ipset
+        if self.enable_ipset:
+            self.ipset = ipset_manager.IpsetManager(
+                root_helper=cfg.CONF.AGENT.root_helper)
+        # members of the ipsets referenced by the current rules
+        self._ipset_members = {}
 
     @property
     def ports(self):
@@ -61,6 +74,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         # each security group has it own chains
         self._setup_chains()
         self.iptables.apply()
+        self._remove_unused_ipsets()
 
     def update_port_filter(self, port):
         LOG.debug(_("Updating device (%s) filter"), port['device'])
@@ -72,6 +86,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.filtered_ports[port['device']] = port
         self._setup_chains()
         self.iptables.apply()
+        self._remove_unused_ipsets()
 
     def remove_port_filter(self, port):
         LOG.debug(_("Removing device (%s) filter"), port['device'])
@@ -83,6 +98,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.filtered_ports.pop(port['device'], None)
         self._setup_chains()
         self.iptables.apply()
+        self._remove_unused_ipsets()
 
     def _setup_chains(self):
         """Setup ingress and egress chain for a port."""
@@ -91,11 +107,27 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
 
     def _setup_chains_apply(self, ports):
         self._add_chain_by_name_v4v6(SG_CHAIN)
+        self._ipset_members = {}
         for port in ports.values():
             self._setup_chain(port, INGRESS_DIRECTION)
             self._setup_chain(port, EGRESS_DIRECTION)
             self.iptables.ipv4['filter'].add_rule(SG_CHAIN, '-j ACCEPT')
             self.iptables.ipv6['filter'].add_rule(SG_CHAIN, '-j ACCEPT')
+        self._refresh_ipsets()
+
+    def _refresh_ipsets(self):
+        # The sets must exist before the rules referencing them are applied
+        for (name, ethertype), members in self._ipset_members.iteritems():
+            self.ipset.refresh_ipset(name, ethertype, members)
+
+    def _remove_unused_ipsets(self):
+        # Unused sets can only be destroyed once the rules referencing
+        # them have been removed from the kernel
+        if not self.enable_ipset or self._defer_apply:
+            return
+        used = set(name for name, _ethertype in self._ipset_members)
+        for name in set(self.ipset.ipsets) - used:
+            self.ipset.destroy_ipset(name)
 
     def _remove_chains(self):
         """Remove ingress and egress chain for a port."""
@@ -258,6 +290,11 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         # for ipv6, iptables6 command is used
         ipv4_sg_rules, ipv6_sg_rules = self._split_sgr_by_ethertype(
             security_group_rules)
+        if self.enable_ipset:
+            ipv4_sg_rules = self._select_sgr_for_ipset(ipv4_sg_rules,
+                                                       direction)
+            ipv6_sg_rules = self._select_sgr_for_ipset(ipv6_sg_rules,
+                                                       direction)
         ipv4_iptables_rule = []
         ipv6_iptables_rule = []
         if direction == EGRESS_DIRECTION:
@@ -275,6 +312,36 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                      ipv4_iptables_rule,
                                      ipv6_iptables_rule)
 
+    def _select_sgr_for_ipset(self, security_group_rules, direction):
+        """Replace the rules expanded from a remote group with set matches.
+
+        The server expands a rule with a remote_group_id into one rule per
+        member IP. Those rules are merged back into a single rule matching
+        the ipset of the remote group, and the member IPs are recorded as
+        the content of that set.
+        """
+        ip_prefix = DIRECTION_IP_PREFIX[direction]
+        selected_rules = []
+        seen = set()
+        for rule in security_group_rules:
+            remote_group_id = rule.get('remote_group_id')
+            if not remote_group_id:
+                selected_rules.append(rule)
+                continue
+            name = ipset_manager.get_ipset_name(rule['ethertype'],
+                                                remote_group_id)
+            members = self._ipset_members.setdefault(
+                (name, rule['ethertype']), set())
+            if rule.get(ip_prefix):
+                members.add(rule[ip_prefix])
+            ipset_rule = dict(rule, remote_ipset=name)
+            ipset_rule.pop(ip_prefix, None)
+            key = tuple(sorted(ipset_rule.items()))
+            if key not in seen:
+                seen.add(key)
+                selected_rules.append(ipset_rule)
+        return selected_rules
+
     def _convert_sgr_to_iptables_rules(self, security_group_rules):
         iptables_rules = []
         self._drop_invalid_packets(iptables_rules)
@@ -297,6 +364,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                    rule.get('protocol'),
                                    rule.get('port_range_min'),
                                    rule.get('port_range_max'))
+            args += self._ipset_arg(rule)
             args += ['-j RETURN']
             iptables_rules += [' '.join(args)]
 
@@ -335,6 +403,12 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                     '--%ss' % direction,
                     '%s:%s' % (port_range_min, port_range_max)]
 
+    def _ipset_arg(self, rule):
+        if not rule.get('remote_ipset'):
+            return []
+        return ['-m set', '--match-set', rule['remote_ipset'],
+                IPSET_DIRECTION[rule['direction']]]
+
     def _ip_prefix_arg(self, direction, ip_prefix):
         #NOTE (nati) : source_group_id is converted to list of source_
         # ip_prefix in server side
@@ -359,6 +433,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             self._pre_defer_filtered_ports = None
             self._setup_chains_apply(self.filtered_ports)
             self.iptables.defer_apply_off()
+            self._remove_unused_ipsets()
 
 
 class OVSHybridIptablesFirewallDriver(IptablesFirewallDriver):
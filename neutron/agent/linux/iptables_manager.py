@@ -23,6 +23,9 @@
 
 import inspect
 import os
+import time
+
+from oslo.config import cfg
 
 from neutron.agent.linux import utils as linux_utils
 from neutron.common import utils
@@ -31,6 +34,18 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+OPTS = [
+    cfg.BoolOpt('iptables_incremental_apply', default=False,
+                help=_("Only rewrite the chains that changed since the "
+                       "previous apply, using iptables-restore --noflush, "
+                       "instead of saving and restoring the whole ruleset")),
+    cfg.IntOpt('iptables_full_sync_interval', default=100,
+               help=_("Number of incremental applies after which the whole "
+                      "ruleset is saved and restored again, to repair any "
+                      "drift from the expected state")),
+]
+cfg.CONF.register_opts(OPTS)
+
 
 # NOTE(vish): Iptables supports chain names of up to 28 characters,  and we
 #             add up to 12 characters to binary_name which is used as a prefix,
@@ -285,6 +300,15 @@ class IptablesManager(object):
         self.iptables_apply_deferred = False
         self.wrap_name = binary_name[:16]
 
+        # Last applied state of each table, keyed by (cmd, table name),
+        # used to compute incremental updates
+        self.applied_state = {}
+        self.applies_since_full_sync = 0
+        self.stats = {'full_syncs': 0,
+                      'incremental_syncs': 0,
+                      'lines_written': 0,
+                      'apply_time': 0.0}
+
         self.ipv4 = {'filter': IptablesTable(binary_name=self.wrap_name)}
         self.ipv6 = {'filter': IptablesTable(binary_name=self.wrap_name)}
 
@@ -373,32 +397,155 @@ class IptablesManager(object):
     def _apply_synchronized(self):
         """Apply the current in-memory set of iptables rules.
 
-        This will blow away any rules left over from previous runs of the
-        same component of Nova, and replace them with our current set of
-        rules. This happens atomically, thanks to iptables-restore.
-
+        If iptables_incremental_apply is set and the previous state of the
+        tables is known, only the chains changed since the last apply are
+        written. Otherwise the whole ruleset is rewritten.
         """
+        start = time.time()
         s = [('iptables', self.ipv4)]
         if self.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
+        full_sync = (not cfg.CONF.iptables_incremental_apply or
+                     self.applies_since_full_sync >=
+                     cfg.CONF.iptables_full_sync_interval)
+        full_synced = False
+
         for cmd, tables in s:
-            args = ['%s-save' % (cmd,), '-c']
-            if self.namespace:
-                args = ['ip', 'netns', 'exec', self.namespace] + args
-            all_tables = self.execute(args, root_helper=self.root_helper)
-            all_lines = all_tables.split('\n')
-            for table_name, table in tables.iteritems():
-                start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                    all_lines[start:end], table, table_name)
+            if not full_sync:
+                try:
+                    if self._apply_incremental(cmd, tables):
+                        continue
+                except RuntimeError:
+                    LOG.exception(_("Incremental %s apply failed, "
+                                    "falling back to a full sync"), cmd)
+            self._apply_full(cmd, tables)
+            full_synced = True
+
+        if full_synced:
+            self.applies_since_full_sync = 0
+        else:
+            self.applies_since_full_sync += 1
+
+        elapsed = time.time() - start
+        self.stats['apply_time'] += elapsed
+        LOG.debug(_("IPTablesManager.apply completed with success in "
+                    "%(elapsed).3fs, totals: %(stats)s"),
+                  {'elapsed': elapsed, 'stats': self.stats})
 
-            args = ['%s-restore' % (cmd,), '-c']
+    def _apply_full(self, cmd, tables):
+        """Save, modify and restore the whole ruleset of an iptables command.
+
+        This will blow away any rules left over from previous runs of the
+        same component of Nova, and replace them with our current set of
+        rules. This happens atomically, thanks to iptables-restore.
+
+        """
+        args = ['%s-save' % (cmd,), '-c']
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        all_tables = self.execute(args, root_helper=self.root_helper)
+        all_lines = all_tables.split('\n')
+        for table_name, table in tables.iteritems():
+            start, end = self._find_table(all_lines, table_name)
+            all_lines[start:end] = self._modify_rules(
+                all_lines[start:end], table, table_name)
+
+        args = ['%s-restore' % (cmd,), '-c']
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        self.execute(args, process_input='\n'.join(all_lines),
+                     root_helper=self.root_helper)
+
+        if cfg.CONF.iptables_incremental_apply:
+            for table_name, table in tables.iteritems():
+                self.applied_state[(cmd, table_name)] = self._table_state(
+                    table)
+        self.stats['full_syncs'] += 1
+        self.stats['lines_written'] += len(all_lines)
+
+    def _table_state(self, table):
+        """Return a comparable snapshot of a table.
+
+        The snapshot is a tuple of the unwrapped chains and rules, which
+        are shared with other components and thus only handled by full
+        syncs, and a dict mapping each wrapped chain to its rules, in the
+        order the full sync would write them.
+        """
+        unwrapped = (frozenset(table.unwrapped_chains),
+                     tuple(str(rule) for rule in table.rules
+                           if not rule.wrap))
+        top_rules = dict((name, []) for name in table.chains)
+        bot_rules = dict((name, []) for name in table.chains)
+        for rule in table.rules:
+            if rule.wrap:
+                (top_rules if rule.top else bot_rules)[rule.chain].append(
+                    str(rule))
+
+        chains = {}
+        for name in table.chains:
+            # Like the full sync, let the last duplicate take precedence
+            seen = set()
+            rules = []
+            for rule in reversed(top_rules[name] + bot_rules[name]):
+                if rule not in seen:
+                    seen.add(rule)
+                    rules.append(rule)
+            rules.reverse()
+            chains[name] = rules
+        return unwrapped, chains
+
+    def _apply_incremental(self, cmd, tables):
+        """Rewrite only the wrapped chains changed since the last apply.
+
+        Returns False if a full sync is needed instead, i.e. when the last
+        applied state is unknown or the unwrapped chains and rules changed.
+        """
+        lines = []
+        new_states = {}
+        for table_name, table in tables.iteritems():
+            old_state = self.applied_state.get((cmd, table_name))
+            new_state = self._table_state(table)
+            if (old_state is None or old_state[0] != new_state[0] or
+                    table.remove_chains or table.remove_rules):
+                return False
+            new_states[table_name] = new_state
+            old_chains, new_chains = old_state[1], new_state[1]
+
+            changed = sorted(name for name, rules in new_chains.iteritems()
+                             if old_chains.get(name) != rules)
+            removed = sorted(set(old_chains) - set(new_chains))
+            if not changed and not removed:
+                continue
+
+            # With --noflush, declaring an existing chain flushes it
+            lines.append('*%s' % table_name)
+            lines += [':%s-%s - [0:0]' % (self.wrap_name, name)
+                      for name in changed + removed]
+            for name in changed:
+                lines += new_chains[name]
+            lines += ['-X %s-%s' % (self.wrap_name, name)
+                      for name in removed]
+            lines.append('COMMIT')
+
+        if lines:
+            args = ['%s-restore' % (cmd,), '-n']
             if self.namespace:
                 args = ['ip', 'netns', 'exec', self.namespace] + args
-            self.execute(args, process_input='\n'.join(all_lines),
-                         root_helper=self.root_helper)
-        LOG.debug(_("IPTablesManager.apply completed with success"))
+            try:
+                self.execute(args, process_input='\n'.join(lines) + '\n',
+                             root_helper=self.root_helper)
+            except RuntimeError:
+                # The kernel state is unknown now, force a full sync
+                for table_name in tables:
+                    self.applied_state.pop((cmd, table_name), None)
+                raise
+
+        for table_name, state in new_states.iteritems():
+            self.applied_state[(cmd, table_name)] = state
+        self.stats['incremental_syncs'] += 1
+        self.stats['lines_written'] += len(lines)
+        return True
 
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
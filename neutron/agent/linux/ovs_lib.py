@@ -13,7 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import distutils.version as dist_version
+import itertools
 import re
 
 from oslo.config import cfg
@@ -69,8 +71,7 @@ class BaseOVS(object):
                 LOG.error(_("Unable to execute %(cmd)s. "
                             "Exception: %(exception)s"),
                           {'cmd': full_args, 'exception': e})
-                if not check_error:
-                    ctxt.reraise = False
+                ctxt.reraise = check_error
 
     def add_bridge(self, bridge_name):
         self.run_vsctl(["--", "--may-exist", "add-br", bridge_name])
@@ -105,7 +106,8 @@ class OVSBridge(BaseOVS):
         super(OVSBridge, self).__init__(root_helper)
         self.br_name = br_name
         self.defer_apply_flows = False
-        self.deferred_flows = {'add': '', 'mod': '', 'del': ''}
+        # (action, flow) tuples, in the order they were requested
+        self.deferred_flows = []
 
     def set_controller(self, controller_names):
         vsctl_command = ['--', 'set-controller', self.br_name]
@@ -155,14 +157,17 @@ class OVSBridge(BaseOVS):
         args = ["clear", table_name, record, column]
         self.run_vsctl(args)
 
-    def run_ofctl(self, cmd, args, process_input=None):
+    def run_ofctl(self, cmd, args, process_input=None, check_error=False):
         full_args = ["ovs-ofctl", cmd, self.br_name] + args
         try:
             return utils.execute(full_args, root_helper=self.root_helper,
                                  process_input=process_input)
         except Exception as e:
-            LOG.error(_("Unable to execute %(cmd)s. Exception: %(exception)s"),
-                      {'cmd': full_args, 'exception': e})
+            with excutils.save_and_reraise_exception() as ctxt:
+                LOG.error(_("Unable to execute %(cmd)s. "
+                            "Exception: %(exception)s"),
+                          {'cmd': full_args, 'exception': e})
+                ctxt.reraise = check_error
 
     def count_flows(self):
         flow_list = self.run_ofctl("dump-flows", []).split("\n")[1:]
@@ -226,14 +231,14 @@ class OVSBridge(BaseOVS):
     def add_flow(self, **kwargs):
         flow_str = self.add_or_mod_flow_str(**kwargs)
         if self.defer_apply_flows:
-            self.deferred_flows['add'] += flow_str + '\n'
+            self.deferred_flows.append(('add', flow_str))
         else:
             self.run_ofctl("add-flow", [flow_str])
 
     def mod_flow(self, **kwargs):
         flow_str = self.add_or_mod_flow_str(**kwargs)
         if self.defer_apply_flows:
-            self.deferred_flows['mod'] += flow_str + '\n'
+            self.deferred_flows.append(('mod', flow_str))
         else:
             self.run_ofctl("mod-flows", [flow_str])
 
@@ -244,7 +249,7 @@ class OVSBridge(BaseOVS):
             flow_expr_arr.append("actions=%s" % (kwargs["actions"]))
         flow_str = ",".join(flow_expr_arr)
         if self.defer_apply_flows:
-            self.deferred_flows['del'] += flow_str + '\n'
+            self.deferred_flows.append(('del', flow_str))
         else:
             self.run_ofctl("del-flows", [flow_str])
 
@@ -254,16 +259,49 @@ class OVSBridge(BaseOVS):
 
     def defer_apply_off(self):
         LOG.debug(_('defer_apply_off'))
-        for action, flows in self.deferred_flows.items():
-            if flows:
-                LOG.debug(_('Applying following deferred flows '
-                            'to bridge %s'), self.br_name)
-                for line in flows.splitlines():
-                    LOG.debug(_('%(action)s: %(flow)s'),
-                              {'action': action, 'flow': line})
-                self.run_ofctl('%s-flows' % action, ['-'], flows)
+        deferred_flows = self.deferred_flows
         self.defer_apply_flows = False
-        self.deferred_flows = {'add': '', 'mod': '', 'del': ''}
+        self.deferred_flows = []
+        if deferred_flows:
+            LOG.debug(_('Applying %(count)d deferred flows to bridge '
+                        '%(bridge)s'),
+                      {'count': len(deferred_flows), 'bridge': self.br_name})
+        # Consecutive operations of the same kind are sent to a single
+        # ovs-ofctl invocation, preserving the order in which they were
+        # requested: a flow deleted and then added again must be left in
+        # place. A failed invocation drops all of its flows, so it is
+        # raised once the others are applied.
+        error = None
+        for action, flows in itertools.groupby(deferred_flows,
+                                               lambda flow: flow[0]):
+            flows = ''.join('%s\n' % flow for _action, flow in flows)
+            for line in flows.splitlines():
+                LOG.debug(_('%(action)s: %(flow)s'),
+                          {'action': action, 'flow': line})
+            try:
+                self.run_ofctl('%s-flows' % action, ['-'], flows,
+                               check_error=True)
+            except Exception as e:
+                error = error or e
+        if error:
+            raise error
+
+    @contextlib.contextmanager
+    def deferred(self):
+        """Batch the flow operations issued in the block.
+
+        The flows added, modified and deleted within the block are applied
+        when it exits, with one ovs-ofctl call per run of operations of the
+        same kind.  Nested blocks are applied by the outermost one.
+        """
+        if self.defer_apply_flows:
+            yield self
+            return
+        self.defer_apply_on()
+        try:
+            yield self
+        finally:
+            self.defer_apply_off()
 
     def add_tunnel_port(self, port_name, remote_ip, local_ip,
                         tunnel_type=p_const.TYPE_GRE,
@@ -331,69 +369,108 @@ class OVSBridge(BaseOVS):
                             "Exception: %(exception)s"),
                           {'cmd': args, 'exception': e})
 
-    # returns a VIF object for each VIF port
-    def get_vif_ports(self):
-        edge_ports = []
-        port_names = self.get_port_name_list()
-        for name in port_names:
-            external_ids = self.db_get_map("Interface", name, "external_ids",
-                                           check_error=True)
-            ofport = self.db_get_val("Interface", name, "ofport",
-                                     check_error=True)
-            if "iface-id" in external_ids and "attached-mac" in external_ids:
-                p = VifPort(name, ofport, external_ids["iface-id"],
-                            external_ids["attached-mac"], self)
-                edge_ports.append(p)
-            elif ("xs-vif-uuid" in external_ids and
-                  "attached-mac" in external_ids):
-                # if this is a xenserver and iface-id is not automatically
-                # synced to OVS from XAPI, we grab it from XAPI directly
-                iface_id = self.get_xapi_iface_id(external_ids["xs-vif-uuid"])
-                p = VifPort(name, ofport, iface_id,
-                            external_ids["attached-mac"], self)
-                edge_ports.append(p)
+    def get_ports_snapshot(self):
+        """Get a dict of port names and their attributes.
 
-        return edge_ports
+        The name, ofport, external_ids and vlan tag of all the ports of the
+        bridge are retrieved with a single ovs-vsctl call, e.g.::
+
+            {u'tapce5318ff-78': {'name': u'tapce5318ff-78',
+                                 'ofport': 3,
+                                 'external_ids': {u'iface-id': ...},
+                                 'tag': 1}}
 
-    def get_vif_port_set(self):
-        port_names = self.get_port_name_list()
-        edge_ports = set()
-        args = ['--format=json', '--', '--columns=name,external_ids,ofport',
+        Unset ofport and tag values are returned as [].
+        """
+        args = ['--format=json',
+                '--', '--columns=ports', 'list', 'Bridge', self.br_name,
+                '--', '--columns=_uuid,name,tag', 'list', 'Port',
+                '--', '--columns=name,ofport,external_ids',
                 'list', 'Interface']
         result = self.run_vsctl(args, check_error=True)
+        ports = {}
         if not result:
-            return edge_ports
-        for row in jsonutils.loads(result)['data']:
-            name = row[0]
-            if name not in port_names:
+            return ports
+        # The output of each command is a json document on its own line
+        bridge, port_rows, iface_rows = [
+            jsonutils.loads(line)['data'] for line in result.splitlines()
+            if line.strip()]
+        port_uuids = _ovsdb_value(bridge[0][0])
+        if port_uuids and port_uuids[0] == 'uuid':
+            # A set with a single element is encoded as the element itself
+            port_uuids = [port_uuids]
+        port_uuids = set(uuid for _type, uuid in port_uuids)
+        for (_type, uuid), name, tag in port_rows:
+            if uuid in port_uuids:
+                ports[name] = {'name': name,
+                               'ofport': [],
+                               'external_ids': {},
+                               'tag': _ovsdb_value(tag)}
+        for name, ofport, external_ids in iface_rows:
+            if name in ports:
+                ports[name]['ofport'] = _ovsdb_value(ofport)
+                ports[name]['external_ids'] = dict(external_ids[1])
+        return ports
+
+    def _get_vif_port(self, port):
+        external_ids = port['external_ids']
+        if "attached-mac" not in external_ids:
+            return
+        if "iface-id" in external_ids:
+            iface_id = external_ids["iface-id"]
+        elif "xs-vif-uuid" in external_ids:
+            # if this is a xenserver and iface-id is not automatically
+            # synced to OVS from XAPI, we grab it from XAPI directly
+            iface_id = self.get_xapi_iface_id(external_ids["xs-vif-uuid"])
+        else:
+            return
+        return VifPort(port['name'], port['ofport'], iface_id,
+                       external_ids["attached-mac"], self)
+
+    # returns a VIF object for each VIF port
+    def get_vif_ports(self, ports=None):
+        if ports is None:
+            ports = self.get_ports_snapshot()
+        edge_ports = []
+        for name in sorted(ports):
+            vif_port = self._get_vif_port(ports[name])
+            if vif_port:
+                edge_ports.append(vif_port)
+        return edge_ports
+
+    def get_vif_port_dict(self, ports=None):
+        """Get a dict of VIF ids and VIF objects of the ready VIF ports.
+
+        :param ports: a snapshot returned by get_ports_snapshot(), taken
+                      when not given.
+        """
+        if ports is None:
+            ports = self.get_ports_snapshot()
+        edge_ports = {}
+        for port in ports.values():
+            if not ("iface-id" in port['external_ids'] or
+                    "xs-vif-uuid" in port['external_ids']):
                 continue
-            external_ids = dict(row[1][1])
             # Do not consider VIFs which aren't yet ready
             # This can happen when ofport values are either [] or ["set", []]
             # We will therefore consider only integer values for ofport
-            ofport = row[2]
             try:
-                int_ofport = int(ofport)
+                int_ofport = int(port['ofport'])
             except (ValueError, TypeError):
-                LOG.warn(_("Found not yet ready openvswitch port: %s"), row)
+                LOG.warn(_("Found not yet ready openvswitch port: %s"), port)
             else:
                 if int_ofport > 0:
-                    if ("iface-id" in external_ids and
-                        "attached-mac" in external_ids):
-                        edge_ports.add(external_ids['iface-id'])
-                    elif ("xs-vif-uuid" in external_ids and
-                          "attached-mac" in external_ids):
-                        # if this is a xenserver and iface-id is not
-                        # automatically synced to OVS from XAPI, we grab it
-                        # from XAPI directly
-                        iface_id = self.get_xapi_iface_id(
-                            external_ids["xs-vif-uuid"])
-                        edge_ports.add(iface_id)
+                    vif_port = self._get_vif_port(port)
+                    if vif_port:
+                        edge_ports[vif_port.vif_id] = vif_port
                 else:
-                    LOG.warn(_("Found failed openvswitch port: %s"), row)
+                    LOG.warn(_("Found failed openvswitch port: %s"), port)
         return edge_ports
 
-    def get_port_tag_dict(self):
+    def get_vif_port_set(self, ports=None):
+        return set(self.get_vif_port_dict(ports))
+
+    def get_port_tag_dict(self, ports=None):
         """Get a dict of port names and associated vlan tags.
 
         e.g. the returned dict is of the following form::
@@ -404,24 +481,12 @@ class OVSBridge(BaseOVS):
              u'tapce5318ff-78': 1,
              u'tape1400310-e6': 1}
 
-        The TAG ID is only available in the "Port" table and is not available
-        in the "Interface" table queried by the get_vif_port_set() method.
-
+        :param ports: a snapshot returned by get_ports_snapshot(), taken
+                      when not given.
         """
-        port_names = self.get_port_name_list()
-        args = ['--format=json', '--', '--columns=name,tag', 'list', 'Port']
-        result = self.run_vsctl(args, check_error=True)
-        port_tag_dict = {}
-        if not result:
-            return port_tag_dict
-        for name, tag in jsonutils.loads(result)['data']:
-            if name not in port_names:
-                continue
-            # 'tag' can be [u'set', []] or an integer
-            if isinstance(tag, list):
-                tag = tag[1]
-            port_tag_dict[name] = tag
-        return port_tag_dict
+        if ports is None:
+            ports = self.get_ports_snapshot()
+        return dict((name, port['tag']) for name, port in ports.iteritems())
 
     def get_vif_port_by_id(self, port_id):
         args = ['--format=json', '--', '--columns=external_ids,name,ofport',
@@ -485,6 +550,13 @@ class OVSBridge(BaseOVS):
             raise Exception(msg)
 
 
+def _ovsdb_value(value):
+    # Empty columns are encoded as ["set", []] in the json output
+    if isinstance(value, list) and value and value[0] == 'set':
+        return value[1]
+    return value
+
+
 def get_bridge_for_iface(root_helper, iface):
     args = ["ovs-vsctl", "--timeout=%d" % cfg.CONF.ovs_vsctl_timeout,
             "iface-to-br", iface]
@@ -17,6 +17,7 @@
 import eventlet
 
 from neutron.agent.linux import async_process
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 
 
@@ -67,17 +68,25 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
     The has_updates() method indicates whether changes to the ovsdb
     Interface table have been detected since the monitor started or
     since the previous access.
+
+    The interfaces added to and removed from ovsdb are also collected
+    from the rows reported by the monitor, and retrieved with
+    get_events().
     """
 
     def __init__(self, root_helper=None, respawn_interval=None):
         super(SimpleInterfaceMonitor, self).__init__(
             'Interface',
-            columns=['name', 'ofport'],
+            columns=['name', 'ofport', 'external_ids'],
             format='json',
             root_helper=root_helper,
             respawn_interval=respawn_interval,
         )
         self.data_received = False
+        self.new_events = {'added': [], 'removed': []}
+        # Until get_events() has been called while the monitor is active,
+        # the events do not cover all the changes of the Interface table.
+        self.events_lost = True
 
     @property
     def is_active(self):
@@ -94,7 +103,75 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
         the absence of updates at the expense of potential false
         positives.
         """
-        return bool(list(self.iter_stdout())) or not self.is_active
+        return self.process_events() or not self.is_active
+
+    def process_events(self):
+        """Collect the interfaces added and removed from the monitor output.
+
+        Returns whether any output was received since the previous call.
+        """
+        output = list(self.iter_stdout())
+        for line in output:
+            try:
+                update = jsonutils.loads(line)
+                rows = [dict(zip(update['headings'], row))
+                        for row in update['data']]
+            except (ValueError, KeyError, TypeError):
+                LOG.warn(_("Unable to parse ovsdb monitor output: %s"), line)
+                self.events_lost = True
+                continue
+            for row in rows:
+                action = row.get('action')
+                if action == 'delete':
+                    self._interface_removed(row.get('name'),
+                                            row.get('external_ids'))
+                elif action in ('initial', 'insert', 'new'):
+                    # 'new' rows hold all the columns of modified rows,
+                    # while the preceding 'old' rows only hold the
+                    # modified columns and are ignored.
+                    self._interface_added(row.get('name'), row.get('ofport'),
+                                          row.get('external_ids'))
+        return bool(output)
+
+    def _interface_added(self, name, ofport, external_ids):
+        # Interfaces are reported once ready, i.e. with a valid ofport
+        if not isinstance(ofport, int) or ofport <= 0:
+            return
+        self.new_events['added'].append(
+            {'name': name, 'ofport': ofport,
+             'external_ids': _map_to_dict(external_ids)})
+
+    def _interface_removed(self, name, external_ids):
+        # An interface added and removed since the events were last
+        # retrieved is not reported as added
+        self.new_events['added'] = [device for device
+                                    in self.new_events['added']
+                                    if device['name'] != name]
+        self.new_events['removed'].append(
+            {'name': name, 'external_ids': _map_to_dict(external_ids)})
+
+    def get_events(self):
+        """Return the interfaces added and removed since the last call.
+
+        A dict with 'added' and 'removed' lists of interfaces is returned,
+        each of them being a dict with 'name' and 'external_ids' keys, and
+        also 'ofport' for added ones.
+
+        None is returned when the changes may not all have been seen, i.e.
+        when the monitor is not active or has been restarted since the
+        previous call, in which case the caller has to fully resynchronize
+        its view of the interfaces.
+        """
+        self.process_events()
+        events = self.new_events
+        self.new_events = {'added': [], 'removed': []}
+        if not self.is_active:
+            self.events_lost = True
+            return
+        if self.events_lost:
+            self.events_lost = False
+            return
+        return events
 
     def start(self, block=False, timeout=5):
         super(SimpleInterfaceMonitor, self).start()
@@ -105,6 +182,7 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
 
     def _kill(self, *args, **kwargs):
         self.data_received = False
+        self.events_lost = True
         super(SimpleInterfaceMonitor, self)._kill(*args, **kwargs)
 
     def _read_stdout(self):
@@ -112,3 +190,10 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
         if data and not self.data_received:
             self.data_received = True
         return data
+
+
+def _map_to_dict(value):
+    # Maps are encoded as ["map", [[key, value], ...]] in the json output
+    if isinstance(value, list) and len(value) == 2 and value[0] == 'map':
+        return dict(value[1])
+    return {}
@@ -23,9 +23,12 @@ import shlex
 import socket
 import struct
 import tempfile
+import threading
 
 from eventlet.green import subprocess
 from eventlet import greenthread
+from oslo.config import cfg
+from oslo.rootwrap import client
 
 from neutron.common import utils
 from neutron.openstack.common import excutils
@@ -59,20 +62,68 @@ def create_process(cmd, root_helper=None, addl_env=None):
     return obj, cmd
 
 
+class RootwrapDaemonHelper(object):
+    """Holds the client of the root helper daemon of the process."""
+
+    __client = None
+    __lock = threading.Lock()
+
+    def __new__(cls):
+        """There is no reason to instantiate this class."""
+        raise NotImplementedError()
+
+    @classmethod
+    def get_client(cls):
+        with cls.__lock:
+            if cls.__client is None:
+                cls.__client = client.Client(
+                    shlex.split(cfg.CONF.AGENT.root_helper_daemon))
+            return cls.__client
+
+
+def get_root_helper_daemon():
+    try:
+        return cfg.CONF.AGENT.root_helper_daemon
+    except cfg.NoSuchOptError:
+        # Not an agent, or one which doesn't register the root helper options
+        return None
+
+
+def execute_rootwrap_daemon(cmd, process_input=None, addl_env=None):
+    """Run a command through the root helper daemon.
+
+    The daemon matches the command against the rootwrap filters like
+    root_helper does, but without starting a new interpreter for each
+    command.  Returns a tuple of the command, its exit code, stdout and
+    stderr.
+    """
+    cmd = map(str, cmd)
+    LOG.debug(_("Running command (rootwrap daemon): %s"), cmd)
+    client = RootwrapDaemonHelper.get_client()
+    returncode, _stdout, _stderr = client.execute(cmd, addl_env,
+                                                  process_input)
+    return cmd, returncode, _stdout, _stderr
+
+
 def execute(cmd, root_helper=None, process_input=None, addl_env=None,
             check_exit_code=True, return_stderr=False):
     try:
-        obj, cmd = create_process(cmd, root_helper=root_helper,
-                                  addl_env=addl_env)
-        _stdout, _stderr = (process_input and
-                            obj.communicate(process_input) or
-                            obj.communicate())
-        obj.stdin.close()
+        if root_helper and get_root_helper_daemon():
+            cmd, returncode, _stdout, _stderr = execute_rootwrap_daemon(
+                cmd, process_input, addl_env)
+        else:
+            obj, cmd = create_process(cmd, root_helper=root_helper,
+                                      addl_env=addl_env)
+            _stdout, _stderr = (process_input and
+                                obj.communicate(process_input) or
+                                obj.communicate())
+            obj.stdin.close()
+            returncode = obj.returncode
         m = _("\nCommand: %(cmd)s\nExit code: %(code)s\nStdout: %(stdout)r\n"
-              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': obj.returncode,
+              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': returncode,
                                        'stdout': _stdout, 'stderr': _stderr}
         LOG.debug(m)
-        if obj.returncode and check_exit_code:
+        if returncode and check_exit_code:
             raise RuntimeError(m)
     finally:
         # NOTE(termie): this appears to be necessary to let the subprocess
@@ -18,10 +18,13 @@
 
 import hashlib
 import hmac
+import itertools
 import os
 import socket
+import time
 
 import eventlet
+from eventlet import pools
 import httplib2
 from neutronclient.v2_0 import client
 from oslo.config import cfg
@@ -44,6 +47,51 @@ from neutron import wsgi
 LOG = logging.getLogger(__name__)
 
 
+class InstanceCache(object):
+    """Cache of the instance and tenant ids of metadata request sources.
+
+    Entries expire ttl seconds after being added, and the least recently
+    used entry is evicted when size entries are cached. The cache hits and
+    misses are counted.
+    """
+
+    def __init__(self, ttl, size):
+        self.ttl = ttl
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        # key -> [value, expiration time, last use]
+        self._entries = {}
+        self._clock = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry and entry[1] > time.time():
+            entry[2] = next(self._clock)
+            self.hits += 1
+            return entry[0]
+        if entry:
+            del self._entries[key]
+        self.misses += 1
+
+    def set(self, key, value):
+        if self.ttl <= 0 or self.size <= 0:
+            return
+        now = time.time()
+        if key not in self._entries and len(self._entries) >= self.size:
+            for expired in [k for k, entry in self._entries.iteritems()
+                            if entry[1] <= now]:
+                del self._entries[expired]
+            if len(self._entries) >= self.size:
+                lru = min(self._entries,
+                          key=lambda k: self._entries[k][2])
+                del self._entries[lru]
+        self._entries[key] = [value, now + self.ttl, next(self._clock)]
+
+
 class MetadataProxyHandler(object):
     OPTS = [
         cfg.StrOpt('admin_user',
@@ -79,12 +127,31 @@ class MetadataProxyHandler(object):
         cfg.StrOpt('metadata_proxy_shared_secret',
                    default='',
                    help=_('Shared secret to sign instance-id request'),
-                   secret=True)
+                   secret=True),
+        cfg.IntOpt('nova_metadata_pool_size',
+                   default=100,
+                   help=_("Maximum number of connections kept open to the "
+                          "Nova metadata server.")),
+        cfg.IntOpt('metadata_cache_ttl',
+                   default=5,
+                   help=_("Number of seconds the instance and tenant ids "
+                          "found for a metadata request source are cached, "
+                          "0 disables the cache.")),
+        cfg.IntOpt('metadata_cache_size',
+                   default=1000,
+                   help=_("Maximum number of metadata request sources whose "
+                          "instance and tenant ids are cached."))
     ]
 
     def __init__(self, conf):
         self.conf = conf
         self.auth_info = {}
+        self.cache = InstanceCache(conf.metadata_cache_ttl,
+                                   conf.metadata_cache_size)
+        # The connections to the Nova metadata server are reused across
+        # requests, each client being used by a single request at a time.
+        self._http_pool = pools.Pool(max_size=conf.nova_metadata_pool_size,
+                                     create=lambda: httplib2.Http())
 
     def _get_neutron_client(self):
         qclient = client.Client(
@@ -120,12 +187,16 @@ class MetadataProxyHandler(object):
             return webob.exc.HTTPInternalServerError(explanation=unicode(msg))
 
     def _get_instance_and_tenant_id(self, req):
-        qclient = self._get_neutron_client()
-
         remote_address = req.headers.get('X-Forwarded-For')
         network_id = req.headers.get('X-Neutron-Network-ID')
         router_id = req.headers.get('X-Neutron-Router-ID')
 
+        cache_key = (router_id, network_id, remote_address)
+        ids = self.cache.get(cache_key)
+        if ids:
+            return ids
+
+        qclient = self._get_neutron_client()
         if network_id:
             networks = [network_id]
         else:
@@ -141,7 +212,9 @@ class MetadataProxyHandler(object):
 
         self.auth_info = qclient.get_auth_info()
         if len(ports) == 1:
-            return ports[0]['device_id'], ports[0]['tenant_id']
+            ids = ports[0]['device_id'], ports[0]['tenant_id']
+            self.cache.set(cache_key, ids)
+            return ids
         return None, None
 
     def _proxy_request(self, instance_id, tenant_id, req):
@@ -160,9 +233,9 @@ class MetadataProxyHandler(object):
             req.query_string,
             ''))
 
-        h = httplib2.Http()
-        resp, content = h.request(url, method=req.method, headers=headers,
-                                  body=req.body)
+        with self._http_pool.item() as h:
+            resp, content = h.request(url, method=req.method,
+                                      headers=headers, body=req.body)
 
         if resp.status == 200:
             LOG.debug(str(resp))
@@ -272,6 +345,7 @@ class UnixDomainMetadataProxy(object):
         else:
             os.makedirs(dirname, 0o755)
 
+        self.handler = MetadataProxyHandler(self.conf)
         self._init_state_reporting()
 
     def _init_state_reporting(self):
@@ -295,6 +369,12 @@ class UnixDomainMetadataProxy(object):
             self.heartbeat.start(interval=report_interval)
 
     def _report_state(self):
+        # The cache of the handlers run by separate worker processes is not
+        # reported.
+        self.agent_state['configurations']['metadata_cache'] = {
+            'hits': self.handler.cache.hits,
+            'misses': self.handler.cache.misses,
+            'entries': len(self.handler.cache)}
         try:
             self.state_rpc.report_state(
                 self.context,
@@ -313,7 +393,7 @@ class UnixDomainMetadataProxy(object):
 
     def run(self):
         server = UnixDomainWSGIServer('neutron-metadata-agent')
-        server.start(MetadataProxyHandler(self.conf),
+        server.start(self.handler,
                      self.conf.metadata_proxy_socket,
                      workers=self.conf.metadata_workers,
                      backlog=self.conf.metadata_backlog)
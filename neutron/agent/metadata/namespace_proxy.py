@@ -17,22 +17,34 @@
 # @author: Mark McClain, DreamHost
 
 import httplib
+import os
+import signal
 import socket
 
 import eventlet
+from eventlet import semaphore
+import eventlet.wsgi
 import httplib2
 from oslo.config import cfg
 import six.moves.urllib.parse as urlparse
 import webob
 
+from neutron.agent.common import config as agent_conf
 from neutron.agent.linux import daemon
+from neutron.agent.linux import external_process
+from neutron.agent.linux import ip_netlink
+from neutron.agent.linux import utils as linux_utils
 from neutron.common import config
 from neutron.common import utils
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 from neutron import wsgi
 
 LOG = logging.getLogger(__name__)
 
+# Seconds between two attempts to listen in the namespaces not served yet
+LISTEN_RETRY_INTERVAL = 1
+
 
 class UnixDomainHTTPConnection(httplib.HTTPConnection):
     """Connection class for HTTP over UNIX domain socket."""
@@ -143,12 +155,185 @@ class ProxyDaemon(daemon.Daemon):
         proxy.wait()
 
 
+class MultiplexedProxyDaemon(daemon.Daemon):
+    """Serve the metadata proxy of many namespaces from a single process.
+
+    The namespaces file maps each namespace to the router_id or network_id
+    its requests are proxied for. It is read again on SIGHUP, which starts
+    listening in the namespaces added and stops in the ones removed. A
+    namespace whose generation changed was created again, so its server
+    is restarted in the new namespace.
+    """
+
+    def __init__(self, pidfile, port, namespaces_file):
+        super(MultiplexedProxyDaemon, self).__init__(pidfile,
+                                                     uuid=namespaces_file)
+        self.port = port
+        self.namespaces_file = namespaces_file
+        self.namespaces = {}
+        # Namespace -> greenthread serving it
+        self.servers = {}
+        self.pool = eventlet.GreenPool()
+        self.reload_requested = True
+
+    def _handle_sighup(self, signum, frame):
+        self.reload_requested = True
+
+    def _read_namespaces(self):
+        try:
+            with open(self.namespaces_file) as f:
+                return jsonutils.loads(f.read())
+        except (IOError, ValueError) as e:
+            LOG.error(_("Unable to read namespaces file %(file)s: %(err)s"),
+                      {'file': self.namespaces_file, 'err': e})
+
+    def reload(self):
+        namespaces = self._read_namespaces()
+        if namespaces is None:
+            return
+        for namespace in self.servers.keys():
+            if self.namespaces[namespace] != namespaces.get(namespace):
+                LOG.debug(_("Stop serving metadata in namespace %s"),
+                          namespace)
+                self.servers.pop(namespace).kill()
+        self.namespaces = namespaces
+
+    def _listen(self, namespace):
+        sock = ip_netlink.open_socket(socket.AF_INET, socket.SOCK_STREAM,
+                                      namespace=namespace or None)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('0.0.0.0', self.port))
+            sock.listen(cfg.CONF.backlog)
+        except socket.error:
+            sock.close()
+            raise
+        return sock
+
+    def _serve(self, sock, application):
+        eventlet.wsgi.server(sock, application, custom_pool=self.pool,
+                             log=logging.WritableLogger(LOG))
+
+    def start_servers(self):
+        """Listen in the namespaces which are not served yet."""
+        for namespace, ids in self.namespaces.iteritems():
+            if namespace in self.servers:
+                continue
+            if namespace and not ip_netlink.namespace_exists(namespace):
+                # Not created yet, or left over after a reboot
+                continue
+            try:
+                sock = self._listen(namespace)
+            except (socket.error, RuntimeError) as e:
+                LOG.warn(_("Unable to serve metadata in namespace "
+                           "%(ns)s: %(err)s"), {'ns': namespace, 'err': e})
+                continue
+            handler = NetworkMetadataProxyHandler(ids.get('network_id'),
+                                                  ids.get('router_id'))
+            self.servers[namespace] = eventlet.spawn(self._serve, sock,
+                                                     handler)
+            LOG.debug(_("Serving metadata in namespace %s"), namespace)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self._handle_sighup)
+        while True:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            self.start_servers()
+            eventlet.sleep(LISTEN_RETRY_INTERVAL)
+
+
+class MultiplexedProxyManager(object):
+    """Manage the namespaces served by a single metadata proxy daemon.
+
+    Used by the agents instead of spawning a proxy process in every
+    namespace. The namespaces are written to a file which the daemon
+    reads again when it is sent SIGHUP.
+    """
+
+    def __init__(self, conf, uuid, root_helper, metadata_port):
+        self.conf = conf
+        self.uuid = uuid
+        self.root_helper = root_helper
+        self.metadata_port = metadata_port
+        self.process = external_process.ProcessManager(conf, uuid,
+                                                       root_helper)
+        pid_file = self.process.get_pid_file_name(ensure_pids_dir=True)
+        self.namespaces_file = os.path.join(os.path.dirname(pid_file),
+                                            uuid + '.namespaces')
+        self.namespaces = self._load()
+        # Numbers the namespaces added, so that the daemon tells a namespace
+        # deleted and created again from the one it is listening in
+        self._generation = max([ids.get('generation', 0)
+                                for ids in self.namespaces.values()] + [0])
+        # Routers and networks are processed concurrently by the agents
+        self._lock = semaphore.Semaphore()
+
+    def _load(self):
+        # Keep serving the namespaces of a previous run of the agent
+        try:
+            with open(self.namespaces_file) as f:
+                return jsonutils.loads(f.read())
+        except (IOError, ValueError):
+            return {}
+
+    def _get_cmd(self, pid_file):
+        cmd = ['neutron-ns-metadata-proxy',
+               '--pid_file=%s' % pid_file,
+               '--metadata_proxy_socket=%s' % cfg.CONF.metadata_proxy_socket,
+               '--namespaces_file=%s' % self.namespaces_file,
+               '--state_path=%s' % self.conf.state_path,
+               '--metadata_port=%s' % self.metadata_port]
+        cmd.extend(agent_conf.get_log_args(
+            cfg.CONF, 'neutron-ns-metadata-proxy-%s.log' % self.uuid))
+        return cmd
+
+    def _update(self, changed):
+        if changed:
+            linux_utils.replace_file(self.namespaces_file,
+                                     jsonutils.dumps(self.namespaces))
+        if not self.process.active:
+            self.process.enable(self._get_cmd)
+        elif changed:
+            linux_utils.execute(['kill', '-HUP', self.process.pid],
+                                self.root_helper)
+
+    def add(self, namespace, network_id=None, router_id=None):
+        """Serve metadata in a namespace, None being the default one."""
+        if router_id:
+            ids = {'router_id': router_id}
+        else:
+            ids = {'network_id': network_id}
+        namespace = namespace or ''
+        with self._lock:
+            known = dict(self.namespaces.get(namespace) or {})
+            known.pop('generation', None)
+            changed = known != ids
+            if changed:
+                self._generation += 1
+                self.namespaces[namespace] = dict(ids,
+                                                  generation=self._generation)
+            self._update(changed)
+
+    def remove(self, namespace):
+        """Stop serving metadata in a namespace."""
+        with self._lock:
+            if self.namespaces.pop(namespace or '', None) is not None:
+                self._update(True)
+
+
 def main():
     eventlet.monkey_patch()
     opts = [
         cfg.StrOpt('network_id'),
         cfg.StrOpt('router_id'),
         cfg.StrOpt('pid_file'),
+        cfg.StrOpt('namespaces_file',
+                   help=_("File mapping namespaces to the router_id or "
+                          "network_id to serve in each of them, from a "
+                          "single process. network_id and router_id are "
+                          "ignored when it is set.")),
         cfg.BoolOpt('daemonize', default=True),
         cfg.IntOpt('metadata_port',
                    default=9697,
@@ -165,10 +350,15 @@ def main():
     cfg.CONF(project='neutron', default_config_files=[])
     config.setup_logging(cfg.CONF)
     utils.log_opt_values(LOG)
-    proxy = ProxyDaemon(cfg.CONF.pid_file,
-                        cfg.CONF.metadata_port,
-                        network_id=cfg.CONF.network_id,
-                        router_id=cfg.CONF.router_id)
+    if cfg.CONF.namespaces_file:
+        proxy = MultiplexedProxyDaemon(cfg.CONF.pid_file,
+                                       cfg.CONF.metadata_port,
+                                       cfg.CONF.namespaces_file)
+    else:
+        proxy = ProxyDaemon(cfg.CONF.pid_file,
+                            cfg.CONF.metadata_port,
+                            network_id=cfg.CONF.network_id,
+                            router_id=cfg.CONF.router_id)
 
     if cfg.CONF.daemonize:
         proxy.start()
@@ -21,11 +21,15 @@ from neutron.common import topics
 
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import rpc
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.openstack.common.rpc import proxy
 from neutron.openstack.common import timeutils
 
 
 LOG = logging.getLogger(__name__)
+# Version of the plugin side RPC API which added get_devices_details_list,
+# update_devices_up and update_devices_down
+DEVICES_LIST_RPC_VERSION = '1.4'
 
 
 def create_consumers(dispatcher, prefix, topic_details):
@@ -79,6 +83,8 @@ class PluginApi(proxy.RpcProxy):
 
     API version history:
         1.0 - Initial version.
+        1.4 - Added get_devices_details_list, update_devices_up and
+              update_devices_down.
 
     '''
 
@@ -87,6 +93,45 @@ class PluginApi(proxy.RpcProxy):
     def __init__(self, topic):
         super(PluginApi, self).__init__(
             topic=topic, default_version=self.BASE_RPC_API_VERSION)
+        # Whether the server supports the device list calls, None until
+        # the first call tells
+        self.use_devices_list_rpc = None
+
+    def _call_devices_list(self, context, method, devices, agent_id, host):
+        """Call the list method of the server for all the devices.
+
+        use_devices_list_rpc is False afterwards if the server does not
+        support it.
+        """
+        if self.use_devices_list_rpc is False:
+            return
+        try:
+            result = self.call(context,
+                               self.make_msg(method, devices=devices,
+                                             agent_id=agent_id, host=host),
+                               topic=self.topic,
+                               version=DEVICES_LIST_RPC_VERSION)
+        except (rpc_common.RemoteError,
+                rpc_common.UnsupportedRpcVersion) as e:
+            if (isinstance(e, rpc_common.RemoteError) and
+                    e.exc_type != 'UnsupportedRpcVersion'):
+                raise
+            LOG.warning(_("%s is not supported by the server, falling "
+                          "back to a call per device"), method)
+            self.use_devices_list_rpc = False
+            return
+        self.use_devices_list_rpc = True
+        return result
+
+    def get_devices_details_list(self, context, devices, agent_id,
+                                 host=None):
+        details = self._call_devices_list(context,
+                                          'get_devices_details_list',
+                                          devices, agent_id, host)
+        if self.use_devices_list_rpc is False:
+            details = [self.get_device_details(context, device, agent_id)
+                       for device in devices]
+        return details
 
     def get_device_details(self, context, device, agent_id):
         return self.call(context,
@@ -106,6 +151,22 @@ class PluginApi(proxy.RpcProxy):
                                        agent_id=agent_id, host=host),
                          topic=self.topic)
 
+    def update_devices_down(self, context, devices, agent_id, host=None):
+        result = self._call_devices_list(context, 'update_devices_down',
+                                         devices, agent_id, host)
+        if self.use_devices_list_rpc is False:
+            result = [self.update_device_down(context, device, agent_id,
+                                              host)
+                      for device in devices]
+        return result
+
+    def update_devices_up(self, context, devices, agent_id, host=None):
+        self._call_devices_list(context, 'update_devices_up', devices,
+                                agent_id, host)
+        if self.use_devices_list_rpc is False:
+            for device in devices:
+                self.update_device_up(context, device, agent_id, host)
+
     def tunnel_sync(self, context, tunnel_ip, tunnel_type=None):
         return self.call(context,
                          self.make_msg('tunnel_sync', tunnel_ip=tunnel_ip,
@@ -16,20 +16,33 @@
 #    under the License.
 #
 
+import netaddr
 from oslo.config import cfg
 
 from neutron.common import topics
 from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
+from neutron.openstack.common.rpc import common as rpc_common
 
 LOG = logging.getLogger(__name__)
 SG_RPC_VERSION = "1.1"
+# Version of the plugin side RPC API which added
+# security_group_info_for_devices
+SG_INFO_RPC_VERSION = "1.2"
+
+DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
+                       'egress': 'dest_ip_prefix'}
 
 security_group_opts = [
     cfg.StrOpt(
         'firewall_driver',
         default='neutron.agent.firewall.NoopFirewallDriver',
-        help=_('Driver for Security Groups Firewall'))
+        help=_('Driver for Security Groups Firewall')),
+    cfg.BoolOpt(
+        'enable_ipset',
+        default=False,
+        help=_('Use ipsets to match the members of remote security groups '
+               'instead of one iptables rule per member'))
 ]
 cfg.CONF.register_opts(security_group_opts, 'SECURITYGROUP')
 
@@ -57,6 +70,15 @@ class SecurityGroupServerRpcApiMixin(object):
                          version=SG_RPC_VERSION,
                          topic=self.topic)
 
+    def security_group_info_for_devices(self, context, devices):
+        LOG.debug(_("Get security group information "
+                    "for devices via rpc %r"), devices)
+        return self.call(context,
+                         self.make_msg('security_group_info_for_devices',
+                                       devices=devices),
+                         version=SG_INFO_RPC_VERSION,
+                         topic=self.topic)
+
 
 class SecurityGroupAgentRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent
@@ -119,13 +141,73 @@ class SecurityGroupAgentRpcMixin(object):
         self.devices_to_refilter = set()
         # Flag raised when a global refresh is needed
         self.global_refresh_firewall = False
+        # Whether the server supports security_group_info_for_devices,
+        # None until the first call tells
+        self.use_enhanced_rpc = None
+
+    def _get_devices_with_rules(self, device_ids):
+        """Return the devices with their expanded security group rules.
+
+        security_group_info_for_devices is used when the server supports
+        it, falling back to security_group_rules_for_devices otherwise.
+        """
+        if self.use_enhanced_rpc is not False:
+            try:
+                info = self.plugin_rpc.security_group_info_for_devices(
+                    self.context, list(device_ids))
+            except (rpc_common.RemoteError,
+                    rpc_common.UnsupportedRpcVersion) as e:
+                if (isinstance(e, rpc_common.RemoteError) and
+                        e.exc_type != 'UnsupportedRpcVersion'):
+                    raise
+                LOG.warning(_("security_group_info_for_devices is not "
+                              "supported by the server, falling back to "
+                              "security_group_rules_for_devices"))
+                self.use_enhanced_rpc = False
+            else:
+                self.use_enhanced_rpc = True
+                return self._expand_security_group_info(info)
+        return self.plugin_rpc.security_group_rules_for_devices(
+            self.context, list(device_ids))
+
+    def _expand_security_group_info(self, info):
+        """Build per device rules from security_group_info_for_devices.
+
+        Rules of the security groups of each device are appended to its
+        provider rules, and remote_group_id rules are converted to one rule
+        per member IP of the remote group, as the server does in
+        security_group_rules_for_devices.
+        """
+        security_groups = info['security_groups']
+        sg_member_ips = info['sg_member_ips']
+        devices = info['devices']
+        for device in devices.values():
+            rules = device['security_group_rules']
+            for security_group_id in device.get('security_groups', []):
+                for rule in security_groups.get(security_group_id, []):
+                    remote_group_id = rule.get('remote_group_id')
+                    if not remote_group_id:
+                        rules.append(rule)
+                        continue
+                    device['security_group_source_groups'].append(
+                        remote_group_id)
+                    direction_ip_prefix = DIRECTION_IP_PREFIX[
+                        rule['direction']]
+                    member_ips = sg_member_ips.get(remote_group_id, {})
+                    for ip in member_ips.get(rule['ethertype'], []):
+                        if ip in device.get('fixed_ips', []):
+                            continue
+                        ip_rule = rule.copy()
+                        ip_rule[direction_ip_prefix] = str(
+                            netaddr.IPNetwork(ip).cidr)
+                        rules.append(ip_rule)
+        return devices
 
     def prepare_devices_filter(self, device_ids):
         if not device_ids:
             return
         LOG.info(_("Preparing filters for devices %s"), device_ids)
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, list(device_ids))
+        devices = self._get_devices_with_rules(device_ids)
         with self.firewall.defer_apply():
             for device in devices.values():
                 self.firewall.prepare_port_filter(device)
@@ -187,8 +269,7 @@ class SecurityGroupAgentRpcMixin(object):
             if not device_ids:
                 LOG.info(_("No ports here to refresh firewall"))
                 return
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, device_ids)
+        devices = self._get_devices_with_rules(device_ids)
         with self.firewall.defer_apply():
             for device in devices.values():
                 LOG.debug(_("Update port filter for %s"), device['device'])
@@ -79,10 +79,13 @@ def get_limit_and_marker(request):
                     GET variables. 'marker' is the id of the last element
                     the client has seen, and 'limit' is the maximum number
                     of items to return. If limit == 0, it means we needn't
-                    pagination, then return None.
+                    pagination, then return None. Without limit, the
+                    pagination_default_limit is used.
     """
     max_limit = _get_pagination_max_limit()
     limit = _get_limit_param(request, max_limit)
+    if 'limit' not in request.GET and cfg.CONF.pagination_default_limit > 0:
+        limit = cfg.CONF.pagination_default_limit
     if max_limit > 0:
         limit = min(max_limit, limit) or max_limit
     if not limit:
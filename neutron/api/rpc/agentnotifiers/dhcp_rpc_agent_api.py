@@ -13,9 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
+
+import eventlet
+from oslo.config import cfg
+
 from neutron.common import constants
 from neutron.common import topics
 from neutron.common import utils
+from neutron import context as n_context
 from neutron import manager
 from neutron.openstack.common import log as logging
 from neutron.openstack.common.rpc import proxy
@@ -25,7 +31,13 @@ LOG = logging.getLogger(__name__)
 
 
 class DhcpAgentNotifyAPI(proxy.RpcProxy):
-    """API for plugin to notify DHCP agent."""
+    """API for plugin to notify DHCP agent.
+
+    API version history:
+        1.0 - Initial version.
+        1.1 - Added batched_notifications.
+    """
+
     BASE_RPC_API_VERSION = '1.0'
     # It seems dhcp agent does not support bulk operation
     VALID_RESOURCES = ['network', 'subnet', 'port']
@@ -42,6 +54,9 @@ class DhcpAgentNotifyAPI(proxy.RpcProxy):
     def __init__(self, topic=topics.DHCP_AGENT):
         super(DhcpAgentNotifyAPI, self).__init__(
             topic=topic, default_version=self.BASE_RPC_API_VERSION)
+        # (agent topic, host) -> {resource key: (sequence, method, payload)}
+        self._pending = {}
+        self._sequence = itertools.count()
 
     def _get_enabled_dhcp_agents(self, context, network_id):
         """Return enabled dhcp agents associated with the given network."""
@@ -56,7 +71,45 @@ class DhcpAgentNotifyAPI(proxy.RpcProxy):
                                    payload=payload),
             topic='%s.%s' % (topics.DHCP_AGENT, host))
 
-    def _notification(self, context, method, payload, network_id):
+    def _cast_to_agent(self, context, method, payload, agent, key=None):
+        """Notify an agent, or buffer the notification.
+
+        When notifications are batched, a notification about the resource
+        identified by key replaces the one pending for the same resource.
+        """
+        interval = cfg.CONF.agent_notification_batch_interval
+        if key is None or interval <= 0:
+            self.cast(
+                context, self.make_msg(method,
+                                       payload=payload),
+                topic='%s.%s' % (agent.topic, agent.host))
+            return
+        if not self._pending:
+            eventlet.spawn_after(interval, self._send_pending_notifications)
+        notifications = self._pending.setdefault((agent.topic, agent.host),
+                                                 {})
+        notifications[key] = (next(self._sequence), method, payload)
+
+    def _send_pending_notifications(self):
+        """Send the buffered notifications, one message per agent."""
+        pending, self._pending = self._pending, {}
+        context = n_context.get_admin_context()
+        for (topic, host), notifications in pending.iteritems():
+            batch = [{'method': method, 'payload': payload}
+                     for sequence, method, payload
+                     in sorted(notifications.itervalues())]
+            LOG.debug(_('Sending %(count)d notifications to DHCP agent on '
+                        '%(host)s'), {'count': len(batch), 'host': host})
+            try:
+                self.cast(
+                    context, self.make_msg('batched_notifications',
+                                           payload={'notifications': batch}),
+                    topic='%s.%s' % (topic, host),
+                    version='1.1')
+            except Exception:
+                LOG.exception(_('Failed to notify DHCP agent on %s'), host)
+
+    def _notification(self, context, method, payload, network_id, key=None):
         """Notify all the agents that are hosting the network."""
         plugin = manager.NeutronManager.get_plugin()
         if (method != 'network_delete_end' and utils.is_extension_supported(
@@ -71,10 +124,10 @@ class DhcpAgentNotifyAPI(proxy.RpcProxy):
                 chosen_agents = plugin.schedule_network(adminContext, network)
                 if chosen_agents:
                     for agent in chosen_agents:
-                        self._notification_host(
+                        self._cast_to_agent(
                             context, 'network_create_end',
                             {'network': {'id': network_id}},
-                            agent['host'])
+                            agent, key=('network', network_id))
             agents = self._get_enabled_dhcp_agents(context, network_id)
             if not agents:
                 LOG.error(_("No DHCP agents are associated with network "
@@ -98,10 +151,7 @@ class DhcpAgentNotifyAPI(proxy.RpcProxy):
                                 'net_id': network_id,
                             })
             for agent in agents:
-                self.cast(
-                    context, self.make_msg(method,
-                                           payload=payload),
-                    topic='%s.%s' % (agent.topic, agent.host))
+                self._cast_to_agent(context, method, payload, agent, key)
         else:
             # besides the non-agentscheduler plugin,
             # There is no way to query who is hosting the network
@@ -143,11 +193,13 @@ class DhcpAgentNotifyAPI(proxy.RpcProxy):
             network_id = obj_value['network_id']
         if not network_id:
             return
+        # Identifies the resource to coalesce the notifications about it
+        key = (obj_type, obj_value['id']) if 'id' in obj_value else None
         method_name = method_name.replace(".", "_")
         if method_name.endswith("_delete_end"):
             if 'id' in obj_value:
                 self._notification(context, method_name,
                                    {obj_type + '_id': obj_value['id']},
-                                   network_id)
+                                   network_id, key)
         else:
-            self._notification(context, method_name, data, network_id)
+            self._notification(context, method_name, data, network_id, key)
@@ -13,9 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import eventlet
+from oslo.config import cfg
+
 from neutron.common import constants
 from neutron.common import topics
 from neutron.common import utils
+from neutron import context as n_context
 from neutron import manager
 from neutron.openstack.common import log as logging
 from neutron.openstack.common.rpc import proxy
@@ -32,6 +36,8 @@ class L3AgentNotifyAPI(proxy.RpcProxy):
     def __init__(self, topic=topics.L3_AGENT):
         super(L3AgentNotifyAPI, self).__init__(
             topic=topic, default_version=self.BASE_RPC_API_VERSION)
+        # Routers waiting to be notified when notifications are batched
+        self._pending_router_ids = set()
 
     def _notification_host(self, context, method, payload, host):
         """Notify the agent that is hosting the router."""
@@ -46,6 +52,12 @@ class L3AgentNotifyAPI(proxy.RpcProxy):
     def _agent_notification(self, context, method, router_ids,
                             operation, data):
         """Notify changed routers to hosting l3 agents."""
+        interval = cfg.CONF.agent_notification_batch_interval
+        if method == 'routers_updated' and interval > 0:
+            if not self._pending_router_ids:
+                eventlet.spawn_after(interval, self._send_pending_routers)
+            self._pending_router_ids.update(router_ids)
+            return
         adminContext = context.is_admin and context or context.elevated()
         plugin = manager.NeutronManager.get_service_plugins().get(
             service_constants.L3_ROUTER_NAT)
@@ -66,6 +78,39 @@ class L3AgentNotifyAPI(proxy.RpcProxy):
                     topic='%s.%s' % (l3_agent.topic, l3_agent.host),
                     version='1.1')
 
+    def _send_pending_routers(self):
+        """Notify the buffered routers, one message per hosting agent."""
+        router_ids, self._pending_router_ids = self._pending_router_ids, set()
+        context = n_context.get_admin_context()
+        plugin = manager.NeutronManager.get_service_plugins().get(
+            service_constants.L3_ROUTER_NAT)
+        routers_by_agent = {}
+        try:
+            for binding in plugin._get_l3_bindings_hosting_routers(
+                    context, list(router_ids)):
+                l3_agent = binding.l3_agent
+                if l3_agent.admin_state_up and l3_agent.is_active:
+                    routers_by_agent.setdefault(
+                        (l3_agent.topic, l3_agent.host), []).append(
+                            binding.router_id)
+        except Exception:
+            LOG.exception(_('Failed to find the L3 agents hosting routers '
+                            '%s'), list(router_ids))
+            return
+        for (topic, host), agent_router_ids in routers_by_agent.iteritems():
+            LOG.debug(_('Notify agent at %(topic)s.%(host)s the message '
+                        'routers_updated for %(count)d routers'),
+                      {'topic': topic, 'host': host,
+                       'count': len(agent_router_ids)})
+            try:
+                self.cast(
+                    context, self.make_msg('routers_updated',
+                                           routers=agent_router_ids),
+                    topic='%s.%s' % (topic, host),
+                    version='1.1')
+            except Exception:
+                LOG.exception(_('Failed to notify L3 agent on %s'), host)
+
     def _notification(self, context, method, router_ids, operation, data):
         """Notify all the agents that are hosting the routers."""
         plugin = manager.NeutronManager.get_service_plugins().get(
@@ -28,6 +28,7 @@ from neutron.api.v2 import resource as wsgi_resource
 from neutron.common import constants as const
 from neutron.common import exceptions
 from neutron.notifiers import nova
+from neutron.openstack.common import excutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common.notifier import api as notifier_api
 from neutron import policy
@@ -126,16 +127,15 @@ class Controller(object):
                                     % self._plugin.__class__.__name__)
         return getattr(self._plugin, native_sorting_attr_name, False)
 
-    def _is_visible(self, context, attr_name, data):
+    def _check_attribute_policy(self, context, attr_name, items):
+        """Return whether the attribute is visible on each of the items."""
         action = "%s:%s" % (self._plugin_handlers[self.SHOW], attr_name)
-        # Optimistically init authz_check to True
-        authz_check = True
         try:
             attr = (attributes.RESOURCE_ATTRIBUTE_MAP
                     [self._collection].get(attr_name))
             if attr and attr.get('enforce_policy'):
-                authz_check = policy.check_if_exists(
-                    context, action, data)
+                return policy.check_items(context, action, items,
+                                          must_exist=True)
         except KeyError:
             # The extension was not configured for adding its resources
             # to the global resource attribute map. Policy check should
@@ -150,17 +150,39 @@ class Controller(object):
                         "authZ check is defined for %(attr)s"),
                       {'action': action,
                        'attr': attr_name})
-        attr_val = self._attr_info.get(attr_name)
-        return attr_val and attr_val['is_visible'] and authz_check
+        # Optimistically assume the attribute is visible
+        return [True] * len(items)
 
-    def _view(self, context, data, fields_to_strip=None):
-        # make sure fields_to_strip is iterable
-        if not fields_to_strip:
-            fields_to_strip = []
+    def _views(self, context, items, fields_to_strip=None):
+        """Strip the attributes of the items which must not be returned.
+
+        The policy of each attribute is checked on all the items having it
+        at once, rather than item by item.
+        """
+        fields_to_strip = set(fields_to_strip or [])
+        hidden = [set() for data in items]
+        attr_names = set()
+        for data in items:
+            attr_names.update(data)
+        for attr_name in attr_names:
+            attr_val = self._attr_info.get(attr_name)
+            if (attr_name in fields_to_strip or
+                    not (attr_val and attr_val['is_visible'])):
+                for hidden_attrs in hidden:
+                    hidden_attrs.add(attr_name)
+                continue
+            indexes = [i for i, data in enumerate(items) if attr_name in data]
+            results = self._check_attribute_policy(
+                context, attr_name, [items[i] for i in indexes])
+            for i, visible in zip(indexes, results):
+                if not visible:
+                    hidden[i].add(attr_name)
+        return [dict(item for item in data.iteritems()
+                     if item[0] not in hidden_attrs)
+                for data, hidden_attrs in zip(items, hidden)]
 
-        return dict(item for item in data.iteritems()
-                    if (self._is_visible(context, item[0], data) and
-                        item[0] not in fields_to_strip))
+    def _view(self, context, data, fields_to_strip=None):
+        return self._views(context, [data], fields_to_strip)[0]
 
     def _do_field_list(self, original_fields):
         fields_to_add = None
@@ -241,15 +263,14 @@ class Controller(object):
             # FIXME(salvatore-orlando): obj_getter might return references to
             # other resources. Must check authZ on them too.
             # Omit items from list that should not be visible
-            obj_list = [obj for obj in obj_list
-                        if policy.check(request.context,
-                                        self._plugin_handlers[self.SHOW],
-                                        obj,
-                                        plugin=self._plugin)]
+            results = policy.check_items(request.context,
+                                         self._plugin_handlers[self.SHOW],
+                                         obj_list)
+            obj_list = [obj for obj, allowed in zip(obj_list, results)
+                        if allowed]
         collection = {self._collection:
-                      [self._view(request.context, obj,
-                                  fields_to_strip=fields_to_add)
-                       for obj in obj_list]}
+                      self._views(request.context, obj_list,
+                                  fields_to_strip=fields_to_add)}
         pagination_links = pagination_helper.get_links(obj_list)
         if pagination_links:
             collection[self._collection + "_links"] = pagination_links
@@ -358,36 +379,52 @@ class Controller(object):
         if self._collection in body:
             # Have to account for bulk create
             items = body[self._collection]
-            deltas = {}
-            bulk = True
         else:
             items = [body]
-            bulk = False
+        deltas = {}
         for item in items:
             self._validate_network_tenant_ownership(request,
                                                     item[self._resource])
             policy.enforce(request.context,
                            action,
                            item[self._resource])
-            try:
-                tenant_id = item[self._resource]['tenant_id']
-                count = quota.QUOTAS.count(request.context, self._resource,
-                                           self._plugin, self._collection,
-                                           tenant_id)
-                if bulk:
-                    delta = deltas.get(tenant_id, 0) + 1
-                    deltas[tenant_id] = delta
-                else:
-                    delta = 1
-                kwargs = {self._resource: count + delta}
-            except exceptions.QuotaResourceUnknown as e:
-                # We don't want to quota this resource
-                LOG.debug(e)
-            else:
-                quota.QUOTAS.limit_check(request.context,
-                                         item[self._resource]['tenant_id'],
-                                         **kwargs)
+            tenant_id = item[self._resource]['tenant_id']
+            deltas[tenant_id] = deltas.get(tenant_id, 0) + 1
+        reservations = self._make_reservations(request.context, deltas)
+        try:
+            result = self._create(request, body, action, parent_id)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for reservation in reservations:
+                    quota.QUOTAS.cancel_reservation(request.context,
+                                                    reservation)
+        for reservation in reservations:
+            quota.QUOTAS.commit_reservation(request.context, reservation)
+        return result
 
+    def _make_reservations(self, context, deltas):
+        """Check the quotas of the tenants creating resources.
+
+        :param deltas: A dictionary of the number of resources created
+                       by each tenant.
+        :return: The list of reservations made.
+        """
+        reservations = []
+        try:
+            for tenant_id, delta in deltas.iteritems():
+                reservations.append(quota.QUOTAS.make_reservation(
+                    context, tenant_id, self._resource, delta,
+                    self._plugin, self._collection, tenant_id))
+        except exceptions.QuotaResourceUnknown as e:
+            # We don't want to quota this resource
+            LOG.debug(e)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for reservation in reservations:
+                    quota.QUOTAS.cancel_reservation(context, reservation)
+        return reservations
+
+    def _create(self, request, body, action, parent_id):
         def notify(create_result):
             notifier_method = self._resource + '.create.end'
             notifier_api.notify(request.context,
@@ -405,8 +442,8 @@ class Controller(object):
             # plugin does atomic bulk create operations
             obj_creator = getattr(self._plugin, "%s_bulk" % action)
             objs = obj_creator(request.context, body, **kwargs)
-            return notify({self._collection: [self._view(request.context, obj)
-                                              for obj in objs]})
+            return notify({self._collection: self._views(request.context,
+                                                         objs)})
         else:
             obj_creator = getattr(self._plugin, action)
             if self._collection in body:
@@ -63,18 +63,36 @@ core_opts = [
                help=_("The maximum number of items returned in a single "
                       "response, value was 'infinite' or negative integer "
                       "means no limit")),
+    cfg.IntOpt('pagination_default_limit', default=-1,
+               help=_("The number of items returned in a single response "
+                      "when the request doesn't specify a limit, a "
+                      "negative value means no limit")),
     cfg.IntOpt('max_dns_nameservers', default=5,
                help=_("Maximum number of DNS nameservers")),
     cfg.IntOpt('max_subnet_host_routes', default=20,
                help=_("Maximum number of host routes per subnet")),
     cfg.IntOpt('max_fixed_ips_per_port', default=5,
                help=_("Maximum number of fixed ips per port")),
+    cfg.IntOpt('ip_availability_range_size', default=0,
+               help=_("Maximum number of addresses tracked by a single IP "
+                      "availability range. Larger allocation pools are "
+                      "split into several ranges, 0 means no limit")),
+    cfg.BoolOpt('randomize_ip_allocation', default=False,
+                help=_("Allocate IP addresses from a randomly chosen "
+                       "availability range of the subnet instead of the "
+                       "first one")),
     cfg.IntOpt('dhcp_lease_duration', default=86400,
                deprecated_name='dhcp_lease_time',
                help=_("DHCP lease duration")),
     cfg.BoolOpt('dhcp_agent_notification', default=True,
                 help=_("Allow sending resource operation"
                        " notification to DHCP agent")),
+    cfg.FloatOpt('agent_notification_batch_interval', default=0,
+                 help=_("Seconds during which the notifications to the "
+                        "DHCP and L3 agents are buffered and coalesced, to "
+                        "send a single message per agent. The DHCP agents "
+                        "must support batched notifications. 0 sends each "
+                        "notification right away.")),
     cfg.BoolOpt('allow_overlapping_ips', default=False,
                 help=_("Allow overlapping IP support in Neutron")),
     cfg.StrOpt('host', default=utils.get_hostname(),
@@ -21,6 +21,7 @@ from oslo.config import cfg
 import sqlalchemy as sa
 from sqlalchemy.orm import exc
 
+from neutron import context as n_context
 from neutron.db import model_base
 from neutron.db import models_v2
 from neutron.extensions import agent as ext_agent
@@ -29,6 +30,7 @@ from neutron.openstack.common.db import exception as db_exc
 from neutron.openstack.common import excutils
 from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
 from neutron.openstack.common import timeutils
 
 LOG = logging.getLogger(__name__)
@@ -37,6 +39,13 @@ cfg.CONF.register_opt(
                help=_("Seconds to regard the agent is down; should be at "
                       "least twice report_interval, to be sure the "
                       "agent is down for good.")))
+cfg.CONF.register_opt(
+    cfg.IntOpt('agent_heartbeat_batch_interval', default=0,
+               help=_("Seconds during which the heartbeats of the agents "
+                      "are kept in memory before being written to the "
+                      "database in a single batch. Should be less than "
+                      "agent_down_time minus report_interval. 0 writes "
+                      "each heartbeat right away.")))
 
 
 class Agent(model_base.BASEV2, models_v2.HasId):
@@ -72,6 +81,90 @@ class Agent(model_base.BASEV2, models_v2.HasId):
         return not AgentDbMixin.is_agent_down(self.heartbeat_timestamp)
 
 
+class AgentHeartbeats(object):
+    """Keeps the agents which report to this process in memory.
+
+    A report which only refreshes the heartbeat of a known agent is kept
+    in memory and written with the other pending heartbeats in a single
+    batched update. New agents, restarted agents and changed
+    configurations are still written right away, so that the other
+    workers see them at once.
+    """
+
+    def __init__(self):
+        # (agent_type, host) -> (agent id, configurations)
+        self.agents = {}
+        # agent id -> heartbeat not written yet
+        self.pending = {}
+        self._flush_loop = None
+
+    def record(self, agent_db):
+        self.agents[(agent_db.agent_type, agent_db.host)] = (
+            agent_db.id, agent_db.configurations)
+        # The heartbeat was just written with the agent
+        self.pending.pop(agent_db.id, None)
+
+    def forget(self, agent_id):
+        for key, (known_id, configurations) in self.agents.items():
+            if known_id == agent_id:
+                del self.agents[key]
+        self.pending.pop(agent_id, None)
+
+    def heartbeat(self, agent, configurations):
+        """Record the heartbeat of a known and unchanged agent.
+
+        Returns False if the report has to be written right away.
+        """
+        known = self.agents.get((agent['agent_type'], agent['host']))
+        if (not known or known[1] != configurations or
+                agent.get('start_flag')):
+            return False
+        self.pending[known[0]] = timeutils.utcnow()
+        if not self._flush_loop:
+            self._flush_loop = loopingcall.FixedIntervalLoopingCall(
+                self.flush)
+            self._flush_loop.start(
+                interval=cfg.CONF.agent_heartbeat_batch_interval)
+        return True
+
+    def flush(self, context=None):
+        """Write the pending heartbeats."""
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        context = context or n_context.get_admin_context()
+        table = Agent.__table__
+        statement = table.update().where(
+            table.c.id == sa.bindparam('agent_id')).values(
+                heartbeat_timestamp=sa.bindparam('heartbeat'))
+        try:
+            with context.session.begin(subtransactions=True):
+                result = context.session.execute(
+                    statement, [{'agent_id': agent_id, 'heartbeat': heartbeat}
+                                for agent_id, heartbeat in pending.items()])
+                deleted = []
+                # Some drivers can't count the rows updated by an
+                # executemany, in which case the agents are looked up
+                if (result.rowcount != len(pending) or
+                        (len(pending) > 1 and
+                         not result.dialect.supports_sane_multi_rowcount)):
+                    query = context.session.query(Agent.id).filter(
+                        Agent.id.in_(pending.keys()))
+                    deleted = set(pending) - set(row[0] for row in query)
+        except Exception:
+            LOG.exception(_("Failed to write the heartbeats of %d agents"),
+                          len(pending))
+            for agent_id, heartbeat in pending.items():
+                self.pending.setdefault(agent_id, heartbeat)
+            return
+        # The next reports of the deleted agents recreate them
+        for agent_id in deleted:
+            self.forget(agent_id)
+
+
+_heartbeats = AgentHeartbeats()
+
+
 class AgentDbMixin(ext_agent.AgentPluginBase):
     """Mixin class to add agent extension to db_plugin_base_v2."""
 
@@ -112,6 +205,7 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
         with context.session.begin(subtransactions=True):
             agent = self._get_agent(context, id)
             context.session.delete(agent)
+        _heartbeats.forget(id)
 
     def update_agent(self, context, id, agent):
         agent_data = agent['agent']
@@ -172,10 +266,20 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
                 greenthread.sleep(0)
                 context.session.add(agent_db)
             greenthread.sleep(0)
+        return agent_db
 
     def create_or_update_agent(self, context, agent):
         """Create or update agent according to report."""
+        if cfg.CONF.agent_heartbeat_batch_interval > 0:
+            configurations = jsonutils.dumps(agent.get('configurations', {}))
+            if _heartbeats.heartbeat(agent, configurations):
+                return
+            agent_db = self._create_or_update_agent_retry(context, agent)
+            _heartbeats.record(agent_db)
+            return agent_db
+        return self._create_or_update_agent_retry(context, agent)
 
+    def _create_or_update_agent_retry(self, context, agent):
         try:
             return self._create_or_update_agent(context, agent)
         except db_exc.DBDuplicateEntry as e:
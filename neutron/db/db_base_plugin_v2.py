@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
 import random
 
 import netaddr
@@ -62,6 +63,23 @@ class CommonDbMixin(object):
     # TODO(salvatore-orlando): Avoid using class-level variables
     _dict_extend_functions = {}
 
+    # Relationships of the models read when building the dicts of their
+    # resources, by the name of the attribute built from them. The
+    # collection queries eagerly load the relationships of the requested
+    # attributes and skip loading the others.
+    _dict_relationships = {
+        models_v2.Network: {'subnets': 'subnets'},
+        models_v2.Subnet: {'allocation_pools': 'allocation_pools',
+                           'dns_nameservers': 'dns_nameservers',
+                           'host_routes': 'routes'},
+        models_v2.Port: {'fixed_ips': 'fixed_ips'},
+    }
+
+    # Relationships of the models read by the dict extend functions, which
+    # the collection queries eagerly load when extended attributes are
+    # requested
+    _dict_extend_relationships = {}
+
     @classmethod
     def register_model_query_hook(cls, model, name, query_hook, filter_hook,
                                   result_filters=None):
@@ -170,6 +188,38 @@ class CommonDbMixin(object):
             if func:
                 func(*args)
 
+    def _needs_dict_extension(self, model, fields):
+        """Return whether the requested fields include extended attributes.
+
+        The attributes built by the dict functions of the core resources are
+        the columns of their model and the attributes registered in
+        _dict_relationships.
+        """
+        if not fields:
+            return True
+        core_fields = set(column.name for column in model.__table__.columns)
+        core_fields.update(self._dict_relationships.get(model, {}))
+        return not core_fields.issuperset(fields)
+
+    def _apply_dict_relationships(self, query, model, fields):
+        relationships = self._dict_relationships.get(model)
+        if relationships is None:
+            return query
+        if self._needs_dict_extension(model, fields):
+            query = query.options(*[
+                orm.subqueryload(name)
+                for name in self._dict_extend_relationships.get(model, [])])
+        else:
+            # Only core attributes are requested, so that no relationship
+            # other than the ones loaded below is read
+            query = query.options(orm.lazyload('*'))
+        for key, name in relationships.iteritems():
+            if not fields or key in fields:
+                query = query.options(orm.subqueryload(name))
+            else:
+                query = query.options(orm.lazyload(name))
+        return query
+
     def _get_collection_query(self, context, model, filters=None,
                               sorts=None, limit=None, marker_obj=None,
                               page_reverse=False):
@@ -190,7 +240,9 @@ class CommonDbMixin(object):
                                            limit=limit,
                                            marker_obj=marker_obj,
                                            page_reverse=page_reverse)
+        query = self._apply_dict_relationships(query, model, fields)
         items = [dict_func(c, fields) for c in query]
+        self._check_keyset_marker(items, marker_obj)
         if limit and page_reverse:
             items.reverse()
         return items
@@ -203,6 +255,20 @@ class CommonDbMixin(object):
             return getattr(self, '_get_%s' % resource)(context, marker)
         return None
 
+    def _get_keyset_marker(self, context, resource, model, limit, marker):
+        """Return the marker of a page without fetching it from the db."""
+        if limit and marker:
+            return sqlalchemyutils.KeysetMarker(
+                self._model_query(context, model), model, marker,
+                lambda: getattr(self, '_get_%s' % resource)(context, marker))
+        return None
+
+    def _check_keyset_marker(self, items, marker_obj):
+        # The page is empty as well when the marker doesn't exist
+        if (not items and
+                isinstance(marker_obj, sqlalchemyutils.KeysetMarker)):
+            marker_obj.ensure_found()
+
 
 class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                         CommonDbMixin):
@@ -240,6 +306,13 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
         cur_funcs.extend(funcs)
         cls._dict_extend_functions[resource] = cur_funcs
 
+    @classmethod
+    def register_dict_extend_relationships(cls, model, relationships):
+        """Register the relationships read by dict extend functions."""
+        cur_relationships = cls._dict_extend_relationships.get(model, [])
+        cur_relationships.extend(relationships)
+        cls._dict_extend_relationships[model] = cur_relationships
+
     def _filter_non_model_columns(self, data, model):
         """Remove all the attributes from data which are not columns of
         the model passed as second parameter.
@@ -287,16 +360,20 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
         return context.session.query(models_v2.Subnet).all()
 
     @staticmethod
-    def _generate_mac(context, network_id):
+    def _random_mac():
         base_mac = cfg.CONF.base_mac.split(':')
+        mac = [int(base_mac[0], 16), int(base_mac[1], 16),
+               int(base_mac[2], 16), random.randint(0x00, 0xff),
+               random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
+        if base_mac[3] != '00':
+            mac[3] = int(base_mac[3], 16)
+        return ':'.join(map(lambda x: "%02x" % x, mac))
+
+    @staticmethod
+    def _generate_mac(context, network_id):
         max_retries = cfg.CONF.mac_generation_retries
         for i in range(max_retries):
-            mac = [int(base_mac[0], 16), int(base_mac[1], 16),
-                   int(base_mac[2], 16), random.randint(0x00, 0xff),
-                   random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
-            if base_mac[3] != '00':
-                mac[3] = int(base_mac[3], 16)
-            mac_address = ':'.join(map(lambda x: "%02x" % x, mac))
+            mac_address = NeutronDbPluginV2._random_mac()
             if NeutronDbPluginV2._check_unique_mac(context, network_id,
                                                    mac_address):
                 LOG.debug(_("Generated mac for network %(network_id)s "
@@ -323,6 +400,40 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             return True
         return False
 
+    @staticmethod
+    def _generate_macs(context, network_id, count, reserved=()):
+        """Generate count unique mac addresses for ports of the network.
+
+        The candidates of each attempt are checked with a single query,
+        and only the ones found in use are generated again. The reserved
+        addresses are never returned.
+        """
+        max_retries = cfg.CONF.mac_generation_retries
+        macs = set()
+        for i in range(max_retries):
+            candidates = set()
+            while len(candidates) < count - len(macs):
+                mac_address = NeutronDbPluginV2._random_mac()
+                if mac_address not in macs and mac_address not in reserved:
+                    candidates.add(mac_address)
+            used = context.session.query(models_v2.Port.mac_address).filter(
+                models_v2.Port.network_id == network_id,
+                models_v2.Port.mac_address.in_(candidates))
+            candidates.difference_update(row[0] for row in used)
+            macs.update(candidates)
+            if len(macs) == count:
+                LOG.debug(_("Generated %(count)s macs for network "
+                            "%(network_id)s"),
+                          {'count': count, 'network_id': network_id})
+                return list(macs)
+            LOG.debug(_("%(used)s generated macs exist. Remaining "
+                        "attempts %(max_retries)s."),
+                      {'used': count - len(macs),
+                       'max_retries': max_retries - (i + 1)})
+        LOG.error(_("Unable to generate mac address after %s attempts"),
+                  max_retries)
+        raise n_exc.MacAddressGenerationFailure(net_id=network_id)
+
     @staticmethod
     def _delete_ip_allocation(context, network_id, subnet_id, ip_address):
 
@@ -346,6 +457,38 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
 
         return NeutronDbPluginV2._try_generate_ip(context, subnets)
 
+    @staticmethod
+    def _get_availability_range(context, subnet_id):
+        """Return a locked availability range of the subnet, if any.
+
+        By default the first range is used. When randomize_ip_allocation
+        is set, the ranges are first listed without locking and one of
+        them is picked at random, so that concurrent allocations on the
+        same subnet are spread over different rows.
+        """
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).join(
+                models_v2.IPAllocationPool).with_lockmode('update')
+        if not cfg.CONF.randomize_ip_allocation:
+            return range_qry.filter_by(subnet_id=subnet_id).first()
+
+        candidates = context.session.query(
+            models_v2.IPAvailabilityRange.allocation_pool_id,
+            models_v2.IPAvailabilityRange.first_ip,
+            models_v2.IPAvailabilityRange.last_ip).join(
+                models_v2.IPAllocationPool).filter_by(
+                    subnet_id=subnet_id).all()
+        random.shuffle(candidates)
+        for pool_id, first_ip, last_ip in candidates:
+            # The range may have been consumed or shrunk by a concurrent
+            # allocation since it was listed, in which case try the next one
+            range = range_qry.filter(
+                models_v2.IPAvailabilityRange.allocation_pool_id == pool_id,
+                models_v2.IPAvailabilityRange.first_ip == first_ip,
+                models_v2.IPAvailabilityRange.last_ip == last_ip).first()
+            if range:
+                return range
+
     @staticmethod
     def _try_generate_ip(context, subnets):
         """Generate an IP address.
@@ -353,11 +496,9 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
         The IP address will be generated from one of the subnets defined on
         the network.
         """
-        range_qry = context.session.query(
-            models_v2.IPAvailabilityRange).join(
-                models_v2.IPAllocationPool).with_lockmode('update')
         for subnet in subnets:
-            range = range_qry.filter_by(subnet_id=subnet['id']).first()
+            range = NeutronDbPluginV2._get_availability_range(context,
+                                                              subnet['id'])
             if not range:
                 LOG.debug(_("All IPs from subnet %(subnet_id)s (%(cidr)s) "
                             "allocated"),
@@ -380,6 +521,77 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             return {'ip_address': ip_address, 'subnet_id': subnet['id']}
         raise n_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
 
+    @staticmethod
+    def _generate_ips(context, subnets, count):
+        """Generate count IP addresses from the subnets.
+
+        Each availability range is locked and consumed as a whole, rather
+        than once per address. The ranges are rebuilt once if the subnets
+        run out of addresses.
+        """
+        try:
+            return NeutronDbPluginV2._try_generate_ips(context, subnets,
+                                                       count)
+        except n_exc.IpAddressGenerationFailure:
+            NeutronDbPluginV2._rebuild_availability_ranges(context, subnets)
+
+        return NeutronDbPluginV2._try_generate_ips(context, subnets, count)
+
+    @staticmethod
+    def _try_generate_ips(context, subnets, count):
+        ips = []
+        for subnet in subnets:
+            while True:
+                # The ranges are picked as for a single address, so that
+                # randomize_ip_allocation spreads bulk allocations too
+                ip_range = NeutronDbPluginV2._get_availability_range(
+                    context, subnet['id'])
+                if not ip_range:
+                    break
+                first = netaddr.IPAddress(ip_range['first_ip'])
+                last = netaddr.IPAddress(ip_range['last_ip'])
+                taken = min(count - len(ips), int(last) - int(first) + 1)
+                ips.extend({'ip_address': str(first + i),
+                            'subnet_id': subnet['id']}
+                           for i in range(taken))
+                if first + (taken - 1) == last:
+                    context.session.delete(ip_range)
+                else:
+                    ip_range['first_ip'] = str(first + taken)
+                if len(ips) == count:
+                    LOG.debug(_("Allocated %(count)s IPs from subnets "
+                                "%(subnets)s"),
+                              {'count': count,
+                               'subnets': [s['id'] for s in subnets]})
+                    return ips
+        # All the ranges of the subnets are consumed at this point, so a
+        # retry after rebuilding them starts from scratch
+        raise n_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+
+    @staticmethod
+    def _split_availability_range(first_ip, last_ip):
+        """Split an address range into availability ranges.
+
+        Each resulting (first_ip, last_ip) tuple holds at most
+        ip_availability_range_size addresses.
+        """
+        size = cfg.CONF.ip_availability_range_size
+        if size <= 0:
+            return [(str(first_ip), str(last_ip))]
+        first = netaddr.IPAddress(first_ip)
+        last = netaddr.IPAddress(last_ip)
+        ranges = []
+        while first <= last:
+            # Address arithmetic past the end of the address space raises
+            # an error, so clamp on the integer values
+            end = netaddr.IPAddress(min(int(first) + size - 1, int(last)),
+                                    first.version)
+            ranges.append((str(first), str(end)))
+            if end == last:
+                break
+            first = end + 1
+        return ranges
+
     @staticmethod
     def _rebuild_availability_ranges(context, subnets):
         ip_qry = context.session.query(
@@ -393,37 +605,41 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             LOG.debug(_("Rebuilding availability ranges for subnet %s")
                       % subnet)
 
-            # Create a set of all currently allocated addresses
+            # Sorted list of all currently allocated addresses, so that the
+            # free ranges are computed in O(allocated) rather than by
+            # enumerating every address of the pools
             ip_qry_results = ip_qry.filter_by(subnet_id=subnet['id'])
-            allocations = netaddr.IPSet([netaddr.IPAddress(i['ip_address'])
-                                        for i in ip_qry_results])
+            allocations = sorted(int(netaddr.IPAddress(i['ip_address']))
+                                 for i in ip_qry_results)
 
             for pool in pool_qry.filter_by(subnet_id=subnet['id']):
-                # Create a set of all addresses in the pool
-                poolset = netaddr.IPSet(netaddr.iter_iprange(pool['first_ip'],
-                                                             pool['last_ip']))
-
-                # Use set difference to find free addresses in the pool
-                available = poolset - allocations
-
-                # Generator compacts an ip set into contiguous ranges
-                def ipset_to_ranges(ipset):
-                    first, last = None, None
-                    for cidr in ipset.iter_cidrs():
-                        if last and last + 1 != cidr.first:
-                            yield netaddr.IPRange(first, last)
-                            first = None
-                        first, last = first if first else cidr.first, cidr.last
-                    if first:
-                        yield netaddr.IPRange(first, last)
+                version = netaddr.IPAddress(pool['first_ip']).version
+                pool_first = int(netaddr.IPAddress(pool['first_ip']))
+                pool_last = int(netaddr.IPAddress(pool['last_ip']))
+
+                # Walk the gaps between the allocations within the pool
+                free_ranges = []
+                first = pool_first
+                start = bisect.bisect_left(allocations, pool_first)
+                end = bisect.bisect_right(allocations, pool_last)
+                for ip in allocations[start:end]:
+                    if ip > first:
+                        free_ranges.append((first, ip - 1))
+                    first = max(first, ip + 1)
+                if first <= pool_last:
+                    free_ranges.append((first, pool_last))
 
                 # Write the ranges to the db
-                for range in ipset_to_ranges(available):
-                    available_range = models_v2.IPAvailabilityRange(
-                        allocation_pool_id=pool['id'],
-                        first_ip=str(netaddr.IPAddress(range.first)),
-                        last_ip=str(netaddr.IPAddress(range.last)))
-                    context.session.add(available_range)
+                for range_first, range_last in free_ranges:
+                    for first_ip, last_ip in (
+                        NeutronDbPluginV2._split_availability_range(
+                            netaddr.IPAddress(range_first, version),
+                            netaddr.IPAddress(range_last, version))):
+                        available_range = models_v2.IPAvailabilityRange(
+                            allocation_pool_id=pool['id'],
+                            first_ip=first_ip,
+                            last_ip=last_ip)
+                        context.session.add(available_range)
 
     @staticmethod
     def _allocate_specific_ip(context, subnet_id, ip_address):
@@ -826,11 +1042,14 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                'tenant_id': network['tenant_id'],
                'admin_state_up': network['admin_state_up'],
                'status': network['status'],
-               'shared': network['shared'],
-               'subnets': [subnet['id']
-                           for subnet in network['subnets']]}
+               'shared': network['shared']}
+        # Relationships are only read for the requested fields, as they may
+        # not have been loaded by the query
+        if not fields or 'subnets' in fields:
+            res['subnets'] = [subnet['id'] for subnet in network['subnets']]
         # Call auxiliary extend functions, if any
-        if process_extensions:
+        if (process_extensions and
+                self._needs_dict_extension(models_v2.Network, fields)):
             self._apply_dict_extend_functions(
                 attributes.NETWORKS, res, network)
         return self._fields(res, fields)
@@ -842,18 +1061,21 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                'network_id': subnet['network_id'],
                'ip_version': subnet['ip_version'],
                'cidr': subnet['cidr'],
-               'allocation_pools': [{'start': pool['first_ip'],
-                                     'end': pool['last_ip']}
-                                    for pool in subnet['allocation_pools']],
                'gateway_ip': subnet['gateway_ip'],
                'enable_dhcp': subnet['enable_dhcp'],
-               'dns_nameservers': [dns['address']
-                                   for dns in subnet['dns_nameservers']],
-               'host_routes': [{'destination': route['destination'],
-                                'nexthop': route['nexthop']}
-                               for route in subnet['routes']],
                'shared': subnet['shared']
                }
+        if not fields or 'allocation_pools' in fields:
+            res['allocation_pools'] = [{'start': pool['first_ip'],
+                                        'end': pool['last_ip']}
+                                       for pool in subnet['allocation_pools']]
+        if not fields or 'dns_nameservers' in fields:
+            res['dns_nameservers'] = [dns['address']
+                                      for dns in subnet['dns_nameservers']]
+        if not fields or 'host_routes' in fields:
+            res['host_routes'] = [{'destination': route['destination'],
+                                   'nexthop': route['nexthop']}
+                                  for route in subnet['routes']]
         return self._fields(res, fields)
 
     def _make_port_dict(self, port, fields=None,
@@ -865,13 +1087,15 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                "mac_address": port["mac_address"],
                "admin_state_up": port["admin_state_up"],
                "status": port["status"],
-               "fixed_ips": [{'subnet_id': ip["subnet_id"],
-                              'ip_address': ip["ip_address"]}
-                             for ip in port["fixed_ips"]],
                "device_id": port["device_id"],
                "device_owner": port["device_owner"]}
+        if not fields or 'fixed_ips' in fields:
+            res['fixed_ips'] = [{'subnet_id': ip["subnet_id"],
+                                 'ip_address': ip["ip_address"]}
+                                for ip in port["fixed_ips"]]
         # Call auxiliary extend functions, if any
-        if process_extensions:
+        if (process_extensions and
+                self._needs_dict_extension(models_v2.Port, fields)):
             self._apply_dict_extend_functions(
                 attributes.PORTS, res, port)
         return self._fields(res, fields)
@@ -963,7 +1187,8 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
     def get_networks(self, context, filters=None, fields=None,
                      sorts=None, limit=None, marker=None,
                      page_reverse=False):
-        marker_obj = self._get_marker_obj(context, 'network', limit, marker)
+        marker_obj = self._get_keyset_marker(context, 'network',
+                                             models_v2.Network, limit, marker)
         return self._get_collection(context, models_v2.Network,
                                     self._make_network_dict,
                                     filters=filters, fields=fields,
@@ -1115,11 +1340,13 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                                                      first_ip=pool['start'],
                                                      last_ip=pool['end'])
                 context.session.add(ip_pool)
-                ip_range = models_v2.IPAvailabilityRange(
-                    ipallocationpool=ip_pool,
-                    first_ip=pool['start'],
-                    last_ip=pool['end'])
-                context.session.add(ip_range)
+                for first_ip, last_ip in self._split_availability_range(
+                        pool['start'], pool['end']):
+                    ip_range = models_v2.IPAvailabilityRange(
+                        ipallocationpool=ip_pool,
+                        first_ip=first_ip,
+                        last_ip=last_ip)
+                    context.session.add(ip_range)
 
         return self._make_subnet_dict(subnet)
 
@@ -1234,7 +1461,8 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
     def get_subnets(self, context, filters=None, fields=None,
                     sorts=None, limit=None, marker=None,
                     page_reverse=False):
-        marker_obj = self._get_marker_obj(context, 'subnet', limit, marker)
+        marker_obj = self._get_keyset_marker(context, 'subnet',
+                                             models_v2.Subnet, limit, marker)
         return self._get_collection(context, models_v2.Subnet,
                                     self._make_subnet_dict,
                                     filters=filters, fields=fields,
@@ -1278,43 +1506,129 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             # Returns the IP's for the port
             ips = self._allocate_ips_for_port(context, network, port)
 
-            if 'status' not in p:
-                status = constants.PORT_STATUS_ACTIVE
-            else:
-                status = p['status']
-
-            port = models_v2.Port(tenant_id=tenant_id,
-                                  name=p['name'],
-                                  id=port_id,
-                                  network_id=network_id,
-                                  mac_address=mac_address,
-                                  admin_state_up=p['admin_state_up'],
-                                  status=status,
-                                  device_id=p['device_id'],
-                                  device_owner=p['device_owner'])
-            context.session.add(port)
-
-            # Update the allocated IP's
-            if ips:
-                for ip in ips:
-                    ip_address = ip['ip_address']
-                    subnet_id = ip['subnet_id']
-                    LOG.debug(_("Allocated IP %(ip_address)s "
-                                "(%(network_id)s/%(subnet_id)s/%(port_id)s)"),
-                              {'ip_address': ip_address,
-                               'network_id': network_id,
-                               'subnet_id': subnet_id,
-                               'port_id': port_id})
-                    allocated = models_v2.IPAllocation(
-                        network_id=network_id,
-                        port_id=port_id,
-                        ip_address=ip_address,
-                        subnet_id=subnet_id,
-                    )
-                    context.session.add(allocated)
+            port = self._add_port(context, p, port_id, tenant_id,
+                                  mac_address, ips)
 
         return self._make_port_dict(port, process_extensions=False)
 
+    def _add_port(self, context, p, port_id, tenant_id, mac_address, ips):
+        """Add the port and its allocated IPs to the session."""
+        network_id = p['network_id']
+        if 'status' not in p:
+            status = constants.PORT_STATUS_ACTIVE
+        else:
+            status = p['status']
+
+        port = models_v2.Port(tenant_id=tenant_id,
+                              name=p['name'],
+                              id=port_id,
+                              network_id=network_id,
+                              mac_address=mac_address,
+                              admin_state_up=p['admin_state_up'],
+                              status=status,
+                              device_id=p['device_id'],
+                              device_owner=p['device_owner'])
+
+        # Update the allocated IP's. They are set on the new port so that
+        # building its dict doesn't load them back from the db.
+        for ip in ips:
+            ip_address = ip['ip_address']
+            subnet_id = ip['subnet_id']
+            LOG.debug(_("Allocated IP %(ip_address)s "
+                        "(%(network_id)s/%(subnet_id)s/%(port_id)s)"),
+                      {'ip_address': ip_address,
+                       'network_id': network_id,
+                       'subnet_id': subnet_id,
+                       'port_id': port_id})
+            allocated = models_v2.IPAllocation(
+                network_id=network_id,
+                port_id=port_id,
+                ip_address=ip_address,
+                subnet_id=subnet_id,
+            )
+            port.fixed_ips.append(allocated)
+        context.session.add(port)
+        return port
+
+    def _create_ports_db(self, context, ports):
+        """Create the ports of a bulk request in one transaction.
+
+        Unlike a loop of create_port, the network and subnets are looked
+        up once per network of the request, and the MAC and IP addresses
+        which are not requested are generated for all its ports at once.
+        Returns the port dicts, in the order of the request, without the
+        extensions.
+        """
+        items = [port['port'] for port in ports]
+        port_ids = [p.get('id') or uuidutils.generate_uuid() for p in items]
+        tenant_ids = [self._get_tenant_id_for_create(context, p)
+                      for p in items]
+        by_network = {}
+        for i, p in enumerate(items):
+            by_network.setdefault(p['network_id'], []).append(i)
+
+        ports_db = [None] * len(items)
+        with context.session.begin(subtransactions=True):
+            for network_id, indexes in by_network.iteritems():
+                network = self._get_network(context, network_id)
+
+                # The requested MACs must be unique on the network and in
+                # the request
+                requested = [items[i]['mac_address'] for i in indexes
+                             if items[i]['mac_address'] is not
+                             attributes.ATTR_NOT_SPECIFIED]
+                used = set()
+                if requested:
+                    used.update(row[0] for row in context.session.query(
+                        models_v2.Port.mac_address).filter(
+                            models_v2.Port.network_id == network_id,
+                            models_v2.Port.mac_address.in_(requested)))
+                for mac_address in requested:
+                    if mac_address in used:
+                        raise n_exc.MacAddressInUse(net_id=network_id,
+                                                    mac=mac_address)
+                    used.add(mac_address)
+                macs = {}
+                generated = [i for i in indexes if items[i]['mac_address'] is
+                             attributes.ATTR_NOT_SPECIFIED]
+                if generated:
+                    macs = dict(zip(generated, self._generate_macs(
+                        context, network_id, len(generated), reserved=used)))
+
+                # Ports with fixed IPs are added first, so that the other
+                # ports are not given the addresses they request
+                generated = []
+                for i in indexes:
+                    if items[i]['fixed_ips'] is attributes.ATTR_NOT_SPECIFIED:
+                        generated.append(i)
+                        continue
+                    ips = self._allocate_ips_for_port(context, network,
+                                                      ports[i])
+                    ports_db[i] = self._add_port(
+                        context, items[i], port_ids[i], tenant_ids[i],
+                        macs.get(i, items[i]['mac_address']), ips)
+                if not generated:
+                    continue
+
+                ips = dict((i, []) for i in generated)
+                subnets = self.get_subnets(
+                    context, filters={'network_id': [network_id]})
+                for version in (4, 6):
+                    version_subnets = [subnet for subnet in subnets
+                                       if subnet['ip_version'] == version]
+                    if not version_subnets:
+                        continue
+                    for i, ip in zip(generated, self._generate_ips(
+                            context, version_subnets, len(generated))):
+                        ips[i].append(ip)
+                for i in generated:
+                    ports_db[i] = self._add_port(
+                        context, items[i], port_ids[i], tenant_ids[i],
+                        macs.get(i, items[i]['mac_address']), ips[i])
+
+        return [self._make_port_dict(port, process_extensions=False)
+                for port in ports_db]
+
     def update_port(self, context, id, port):
         p = port['port']
 
@@ -1428,12 +1742,15 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
     def get_ports(self, context, filters=None, fields=None,
                   sorts=None, limit=None, marker=None,
                   page_reverse=False):
-        marker_obj = self._get_marker_obj(context, 'port', limit, marker)
+        marker_obj = self._get_keyset_marker(context, 'port',
+                                             models_v2.Port, limit, marker)
         query = self._get_ports_query(context, filters=filters,
                                       sorts=sorts, limit=limit,
                                       marker_obj=marker_obj,
                                       page_reverse=page_reverse)
+        query = self._apply_dict_relationships(query, models_v2.Port, fields)
         items = [self._make_port_dict(c, fields) for c in query]
+        self._check_keyset_marker(items, marker_obj)
         if limit and page_reverse:
             items.reverse()
         return items
@@ -86,25 +86,50 @@ class DhcpRpcCallbackMixin(object):
         nets = self._get_active_networks(context, **kwargs)
         return [net['id'] for net in nets]
 
-    def get_active_networks_info(self, context, **kwargs):
-        """Returns all the networks/subnets/ports in system."""
-        host = kwargs.get('host')
-        LOG.debug(_('get_active_networks_info from %s'), host)
-        networks = self._get_active_networks(context, **kwargs)
+    def _add_subnets_and_ports(self, context, networks, subnet_filters=None):
+        """Add the subnets and ports of each network with two queries."""
         plugin = manager.NeutronManager.get_plugin()
         filters = {'network_id': [network['id'] for network in networks]}
         ports = plugin.get_ports(context, filters=filters)
-        filters['enable_dhcp'] = [True]
+        filters.update(subnet_filters or {})
         subnets = plugin.get_subnets(context, filters=filters)
 
+        networks_by_id = {}
         for network in networks:
-            network['subnets'] = [subnet for subnet in subnets
-                                  if subnet['network_id'] == network['id']]
-            network['ports'] = [port for port in ports
-                                if port['network_id'] == network['id']]
-
+            network['subnets'] = []
+            network['ports'] = []
+            networks_by_id[network['id']] = network
+        for subnet in subnets:
+            networks_by_id[subnet['network_id']]['subnets'].append(subnet)
+        for port in ports:
+            networks_by_id[port['network_id']]['ports'].append(port)
         return networks
 
+    def get_active_networks_info(self, context, **kwargs):
+        """Returns all the networks/subnets/ports in system."""
+        host = kwargs.get('host')
+        LOG.debug(_('get_active_networks_info from %s'), host)
+        networks = self._get_active_networks(context, **kwargs)
+        return self._add_subnets_and_ports(context, networks,
+                                           {'enable_dhcp': [True]})
+
+    def get_networks_info(self, context, **kwargs):
+        """Retrieve and return extended information about networks.
+
+        This is the bulk version of get_network_info. Networks which do not
+        exist are left out of the result.
+        """
+        network_ids = kwargs.get('network_ids')
+        host = kwargs.get('host')
+        LOG.debug(_('Networks %(network_ids)s requested from %(host)s'),
+                  {'network_ids': network_ids, 'host': host})
+        if not network_ids:
+            return []
+        plugin = manager.NeutronManager.get_plugin()
+        networks = plugin.get_networks(context,
+                                       filters={'id': network_ids})
+        return self._add_subnets_and_ports(context, networks)
+
     def get_network_info(self, context, **kwargs):
         """Retrieve and return a extended information about a network."""
         network_id = kwargs.get('network_id')
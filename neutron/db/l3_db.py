@@ -52,6 +52,10 @@ class Router(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
     admin_state_up = sa.Column(sa.Boolean)
     gw_port_id = sa.Column(sa.String(36), sa.ForeignKey('ports.id'))
     gw_port = orm.relationship(models_v2.Port)
+    # Incremented whenever the router, its interfaces or its floating ips
+    # change, so that the l3 agents only sync the routers which changed
+    revision = sa.Column(sa.BigInteger, nullable=False, default=0,
+                         server_default='0')
 
 
 class FloatingIP(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
@@ -111,6 +115,27 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                 l3.ROUTERS, res, router)
         return self._fields(res, fields)
 
+    def _bump_router_revisions(self, context, router_ids):
+        """Mark routers as changed for the l3 agents.
+
+        This must be called once the change is committed, so that an agent
+        never records a revision newer than the data it has synced.
+        """
+        with context.session.begin(subtransactions=True):
+            query = context.session.query(Router)
+            query = query.filter(Router.id.in_(router_ids))
+            query.update({'revision': Router.revision + 1},
+                         synchronize_session=False)
+
+    def get_router_revisions(self, context, router_ids=None, active=None):
+        """Return the revisions of routers as a dict keyed by router id."""
+        query = context.session.query(Router.id, Router.revision)
+        if router_ids:
+            query = query.filter(Router.id.in_(router_ids))
+        if active is not None:
+            query = query.filter(Router.admin_state_up == active)
+        return dict((router_id, revision) for router_id, revision in query)
+
     def create_router(self, context, router):
         r = router['router']
         has_gw_info = False
@@ -146,6 +171,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             # Ensure we actually have something to update
             if r.keys():
                 router_db.update(r)
+        self._bump_router_revisions(context, [router_db['id']])
         self.l3_rpc_notifier.routers_updated(
             context, [router_db['id']])
         return self._make_router_dict(router_db)
@@ -255,7 +281,8 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
     def get_routers(self, context, filters=None, fields=None,
                     sorts=None, limit=None, marker=None,
                     page_reverse=False):
-        marker_obj = self._get_marker_obj(context, 'router', limit, marker)
+        marker_obj = self._get_keyset_marker(context, 'router', Router,
+                                             limit, marker)
         return self._get_collection(context, Router,
                                     self._make_router_dict,
                                     filters=filters, fields=fields,
@@ -354,6 +381,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                  'device_owner': DEVICE_OWNER_ROUTER_INTF,
                  'name': ''}})
 
+        self._bump_router_revisions(context, [router_id])
         self.l3_rpc_notifier.routers_updated(
             context, [router_id], 'add_router_interface')
         info = {'id': router_id,
@@ -428,6 +456,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             if not found:
                 raise l3.RouterInterfaceNotFoundForSubnet(router_id=router_id,
                                                           subnet_id=subnet_id)
+        self._bump_router_revisions(context, [router_id])
         self.l3_rpc_notifier.routers_updated(
             context, [router_id], 'remove_router_interface')
         info = {'id': router_id,
@@ -648,6 +677,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
 
         router_id = floatingip_db['router_id']
         if router_id:
+            self._bump_router_revisions(context, [router_id])
             self.l3_rpc_notifier.routers_updated(
                 context, [router_id],
                 'create_floatingip')
@@ -671,6 +701,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
         if router_id and router_id != before_router_id:
             router_ids.append(router_id)
         if router_ids:
+            self._bump_router_revisions(context, router_ids)
             self.l3_rpc_notifier.routers_updated(
                 context, router_ids, 'update_floatingip')
         return self._make_floatingip_dict(floatingip_db)
@@ -690,6 +721,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                                           floatingip['floating_port_id'],
                                           l3_port_check=False)
         if router_id:
+            self._bump_router_revisions(context, [router_id])
             self.l3_rpc_notifier.routers_updated(
                 context, [router_id],
                 'delete_floatingip')
@@ -701,8 +733,8 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
     def get_floatingips(self, context, filters=None, fields=None,
                         sorts=None, limit=None, marker=None,
                         page_reverse=False):
-        marker_obj = self._get_marker_obj(context, 'floatingip', limit,
-                                          marker)
+        marker_obj = self._get_keyset_marker(context, 'floatingip',
+                                             FloatingIP, limit, marker)
         if filters is not None:
             for key, val in API_TO_DB_COLUMN_MAP.iteritems():
                 if key in filters:
@@ -761,6 +793,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                 raise Exception(_('Multiple floating IPs found for port %s')
                                 % port_id)
         if router_id:
+            self._bump_router_revisions(context, [router_id])
             self.l3_rpc_notifier.routers_updated(
                 context, [router_id])
 
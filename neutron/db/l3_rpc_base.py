@@ -65,6 +65,59 @@ class L3RpcCallbackMixin(object):
                   jsonutils.dumps(routers, indent=5))
         return routers
 
+    def sync_changed_routers(self, context, **kwargs):
+        """Sync the routers of an agent which changed since its last sync.
+
+        @param context: contain user information
+        @param kwargs: host, router_ids, router_revisions
+                       router_revisions maps the ids of the routers the
+                       agent knows about to their synced revision, or None
+        @return: a dict with the changed or new routers, with their
+                 interfaces, floating_ips and revision, and the ids of
+                 the known routers which are not hosted anymore
+        """
+        router_ids = kwargs.get('router_ids')
+        host = kwargs.get('host')
+        known_revisions = kwargs.get('router_revisions') or {}
+        context = neutron_context.get_admin_context()
+        l3plugin = manager.NeutronManager.get_service_plugins()[
+            plugin_constants.L3_ROUTER_NAT]
+        if not l3plugin:
+            revisions = {}
+            LOG.error(_('No plugin for L3 routing registered! Will reply '
+                        'to l3 agent with empty router dictionary.'))
+        elif utils.is_extension_supported(
+                l3plugin, constants.L3_AGENT_SCHEDULER_EXT_ALIAS):
+            if cfg.CONF.router_auto_schedule:
+                l3plugin.auto_schedule_routers(context, host, router_ids)
+            revisions = (
+                l3plugin.list_active_router_revisions_on_active_l3_agent(
+                    context, host, router_ids))
+        else:
+            revisions = l3plugin.get_router_revisions(context, router_ids)
+        # The revisions are read before the routers, so that a change made
+        # in between is synced again next time rather than missed
+        changed_ids = [router_id for router_id, revision
+                       in revisions.iteritems()
+                       if known_revisions.get(router_id) != revision]
+        routers = []
+        if changed_ids:
+            routers = l3plugin.get_sync_data(context, changed_ids)
+            for router in routers:
+                router['revision'] = revisions[router['id']]
+        plugin = manager.NeutronManager.get_plugin()
+        if utils.is_extension_supported(
+            plugin, constants.PORT_BINDING_EXT_ALIAS):
+            self._ensure_host_set_on_ports(context, plugin, host, routers)
+        deleted_ids = [router_id for router_id in known_revisions
+                       if router_id not in revisions and
+                       (not router_ids or router_id in router_ids)]
+        LOG.debug(_("Routers changed for l3 agent %(host)s: %(changed)s, "
+                    "removed: %(deleted)s"),
+                  {'host': host, 'changed': changed_ids,
+                   'deleted': deleted_ids})
+        return {'routers': routers, 'deleted_router_ids': deleted_ids}
+
     def _ensure_host_set_on_ports(self, context, plugin, host, routers):
         for router in routers:
             LOG.debug(_("Checking router: %(id)s for host: %(host)s"),
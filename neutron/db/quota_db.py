@@ -15,11 +15,35 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+import weakref
+
+from oslo.config import cfg
 import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy import orm
+from sqlalchemy import sql
 
 from neutron.common import exceptions
 from neutron.db import model_base
 from neutron.db import models_v2
+from neutron.openstack.common.db import exception as db_exc
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import timeutils
+from neutron.openstack.common import uuidutils
+
+LOG = logging.getLogger(__name__)
+cfg.CONF.import_opt('reservation_expiration', 'neutron.quota',
+                    group='QUOTAS')
+
+# Models of the resources whose usage is tracked by TrackedUsageQuotaDriver
+TRACKED_RESOURCES = {'network': models_v2.Network,
+                     'subnet': models_v2.Subnet,
+                     'port': models_v2.Port}
+
+# Reservations made through each session, by tenant and resource, which
+# are consumed as the reserved resources are inserted
+_session_reservations = weakref.WeakKeyDictionary()
 
 
 class Quota(model_base.BASEV2, models_v2.HasId):
@@ -33,6 +57,28 @@ class Quota(model_base.BASEV2, models_v2.HasId):
     limit = sa.Column(sa.Integer)
 
 
+class QuotaUsage(model_base.BASEV2):
+    """Represent the number of resources of a tenant.
+
+    The usage is maintained by the TrackedUsageQuotaDriver when resources
+    are created and deleted. A dirty usage is counted again from the
+    resources the next time it is used.
+    """
+    tenant_id = sa.Column(sa.String(255), primary_key=True)
+    resource = sa.Column(sa.String(255), primary_key=True)
+    in_use = sa.Column(sa.Integer, nullable=False, default=0)
+    dirty = sa.Column(sa.Boolean, nullable=False, default=False)
+
+
+class QuotaReservation(model_base.BASEV2):
+    """Represent resources of a tenant reserved before their creation."""
+    id = sa.Column(sa.String(36), primary_key=True)
+    resource = sa.Column(sa.String(255), primary_key=True)
+    tenant_id = sa.Column(sa.String(255), nullable=False, index=True)
+    delta = sa.Column(sa.Integer, nullable=False)
+    expiration = sa.Column(sa.DateTime, nullable=False)
+
+
 class DbQuotaDriver(object):
     """Driver to perform necessary checks to enforce quotas and obtain quota
     information.
@@ -179,3 +225,223 @@ class DbQuotaDriver(object):
                  if quotas[key] >= 0 and quotas[key] < val]
         if overs:
             raise exceptions.OverQuota(overs=sorted(overs))
+
+
+def _update_usage(connection, resource, tenant_id, delta):
+    usages = QuotaUsage.__table__
+    connection.execute(
+        usages.update().
+        where(sql.and_(usages.c.tenant_id == tenant_id,
+                       usages.c.resource == resource)).
+        values(in_use=usages.c.in_use + delta))
+
+
+def _consume_reservation(connection, session, resource, tenant_id):
+    reservation_id = _session_reservations.get(session, {}).get(
+        (tenant_id, resource))
+    if not reservation_id:
+        return
+    # The resource is now counted in its usage, so it no longer is reserved
+    reservations = QuotaReservation.__table__
+    connection.execute(
+        reservations.update().
+        where(sql.and_(reservations.c.id == reservation_id,
+                       reservations.c.resource == resource,
+                       reservations.c.delta > 0)).
+        values(delta=reservations.c.delta - 1))
+
+
+def _mark_usages_dirty(connection, resource, tenant_id=None):
+    usages = QuotaUsage.__table__
+    criteria = usages.c.resource == resource
+    if tenant_id:
+        criteria = sql.and_(criteria, usages.c.tenant_id == tenant_id)
+    connection.execute(usages.update().where(criteria).values(dirty=True))
+
+
+def _track_resource(resource, model):
+    def after_insert(mapper, connection, target):
+        _update_usage(connection, resource, target.tenant_id, 1)
+        _consume_reservation(connection, orm.object_session(target),
+                             resource, target.tenant_id)
+
+    def after_delete(mapper, connection, target):
+        _update_usage(connection, resource, target.tenant_id, -1)
+
+    event.listen(model, 'after_insert', after_insert)
+    event.listen(model, 'after_delete', after_delete)
+
+
+def _after_bulk_delete(session, query, query_context, result):
+    # The deleted resources are unknown, so their usages are counted again
+    model = query.column_descriptions[0]['type']
+    for resource, tracked_model in TRACKED_RESOURCES.iteritems():
+        if model is tracked_model and result.rowcount:
+            _mark_usages_dirty(session, resource)
+
+
+_usage_tracked = False
+
+
+def _track_usages():
+    global _usage_tracked
+    if _usage_tracked:
+        return
+    for resource, model in TRACKED_RESOURCES.iteritems():
+        _track_resource(resource, model)
+    event.listen(orm.Session, 'after_bulk_delete', _after_bulk_delete)
+    _usage_tracked = True
+
+
+class TrackedUsageQuotaDriver(DbQuotaDriver):
+    """Quota driver keeping track of the usage of the resources.
+
+    Rather than counting the resources of a tenant on every creation, the
+    usage of the resources in TRACKED_RESOURCES is kept in the quotausages
+    table, and updated in the transactions creating and deleting them.
+    Resources are reserved while they are created, so that concurrent
+    requests can't both use the last resources of a quota. A reservation
+    is consumed in the transaction inserting the reserved resources, so
+    they are never counted both in use and reserved.
+    """
+
+    def __init__(self):
+        _track_usages()
+
+    def tracks_usage(self, resource):
+        return resource in TRACKED_RESOURCES
+
+    def _get_usage(self, context, tenant_id, resource):
+        """Return the locked usage of a resource, counting it if needed."""
+        query = context.session.query(QuotaUsage).filter_by(
+            tenant_id=tenant_id, resource=resource)
+        # The usage may have been marked dirty since it was loaded
+        usage = query.with_lockmode('update').populate_existing().first()
+        if usage is None or usage.dirty:
+            model = TRACKED_RESOURCES[resource]
+            in_use = context.session.query(
+                sql.func.count(model.id)).filter_by(
+                    tenant_id=tenant_id).scalar()
+            if usage is None:
+                usage = QuotaUsage(tenant_id=tenant_id, resource=resource,
+                                   in_use=in_use)
+                context.session.add(usage)
+            else:
+                LOG.debug(_("Counted %(in_use)s %(resource)s of tenant "
+                            "%(tenant)s"), {'in_use': in_use,
+                                            'resource': resource,
+                                            'tenant': tenant_id})
+                usage.in_use = in_use
+                usage.dirty = False
+        return usage
+
+    def get_usages(self, context, tenant_id, resources):
+        """Return the usage of the given resources, including reservations.
+
+        :param resources: A list of names of tracked resources.
+        """
+        now = timeutils.utcnow()
+        usages = {}
+        with context.session.begin(subtransactions=True):
+            for resource in sorted(resources):
+                in_use = self._get_usage(context, tenant_id,
+                                         resource).in_use
+                reserved = context.session.query(
+                    sql.func.sum(QuotaReservation.delta)).filter(
+                        QuotaReservation.tenant_id == tenant_id,
+                        QuotaReservation.resource == resource,
+                        QuotaReservation.expiration > now).scalar()
+                usages[resource] = in_use + (reserved or 0)
+        return usages
+
+    @staticmethod
+    def _get_overs(quotas, usages, deltas):
+        return [key for key, val in deltas.items()
+                if quotas[key] >= 0 and quotas[key] < usages[key] + val]
+
+    def make_reservation(self, context, tenant_id, resources, deltas):
+        """Check the quotas of resources to create and reserve them.
+
+        If any of the resources would be put over its quota once its usage
+        is counted again, an OverQuota exception is raised. Otherwise the
+        resources are reserved until the reservation is committed,
+        cancelled, or expires.
+
+        :param context: The request context, for access checks.
+        :param tenant_id: The tenant_id to check the quota.
+        :param resources: A dictionary of the registered resources.
+        :param deltas: A dictionary of the number of resources to create.
+        :return: The id of the reservation.
+        """
+        unders = [key for key, val in deltas.items() if val < 0]
+        if unders:
+            raise exceptions.InvalidQuotaValue(unders=sorted(unders))
+
+        quotas = self._get_quotas(context, tenant_id, resources,
+                                  deltas.keys())
+        reservation_id = uuidutils.generate_uuid()
+        expiration = timeutils.utcnow() + datetime.timedelta(
+            seconds=cfg.CONF.QUOTAS.reservation_expiration)
+        try:
+            with context.session.begin(subtransactions=True):
+                usages = self.get_usages(context, tenant_id, deltas.keys())
+                overs = self._get_overs(quotas, usages, deltas)
+                if overs:
+                    # The usages may have drifted from the actual number of
+                    # resources, count them again before refusing the request
+                    for resource in overs:
+                        self.resync_usages(context, resource, tenant_id)
+                    usages.update(self.get_usages(context, tenant_id, overs))
+                    overs = self._get_overs(quotas, usages, deltas)
+                if overs:
+                    raise exceptions.OverQuota(overs=sorted(overs))
+                for resource, delta in deltas.iteritems():
+                    context.session.add(QuotaReservation(
+                        id=reservation_id, resource=resource,
+                        tenant_id=tenant_id, delta=delta,
+                        expiration=expiration))
+        except db_exc.DBDuplicateEntry:
+            # The usage was created by a concurrent request
+            return self.make_reservation(context, tenant_id, resources,
+                                         deltas)
+        session_reservations = _session_reservations.setdefault(
+            context.session, {})
+        for resource in deltas:
+            session_reservations[(tenant_id, resource)] = reservation_id
+        return reservation_id
+
+    def _remove_reservation(self, context, reservation_id):
+        session_reservations = _session_reservations.get(context.session, {})
+        for key, value in session_reservations.items():
+            if value == reservation_id:
+                del session_reservations[key]
+        with context.session.begin(subtransactions=True):
+            query = context.session.query(QuotaReservation)
+            query.filter_by(id=reservation_id).delete()
+            # Remove the reservations left over by failed servers
+            query.filter(
+                QuotaReservation.expiration < timeutils.utcnow()).delete()
+
+    def commit_reservation(self, context, reservation_id):
+        """Release a reservation once the resources have been created.
+
+        The usage was updated when creating the resources.
+        """
+        self._remove_reservation(context, reservation_id)
+
+    def cancel_reservation(self, context, reservation_id):
+        """Release a reservation of resources which were not created."""
+        self._remove_reservation(context, reservation_id)
+
+    def resync_usages(self, context, resource, tenant_id=None):
+        """Count the usage of a resource again the next time it is used.
+
+        This corrects usages which drifted from the actual number of
+        resources, for instance when they were deleted outside of neutron.
+        It is done by make_reservation before refusing resources over
+        their quota.
+        """
+        with context.session.begin(subtransactions=True):
+            # Write the usages changed in the session before marking them
+            context.session.flush()
+            _mark_usages_dirty(context.session, resource, tenant_id)
@@ -147,8 +147,8 @@ class SecurityGroupDbMixin(ext_sg.SecurityGroupPluginBase):
         # GETS. TODO(arosen)  context handling can probably be improved here.
         if not default_sg and context.tenant_id:
             self._ensure_default_security_group(context, context.tenant_id)
-        marker_obj = self._get_marker_obj(context, 'security_group', limit,
-                                          marker)
+        marker_obj = self._get_keyset_marker(context, 'security_group',
+                                             SecurityGroup, limit, marker)
         return self._get_collection(context,
                                     SecurityGroup,
                                     self._make_security_group_dict,
@@ -453,6 +453,8 @@ class SecurityGroupDbMixin(ext_sg.SecurityGroupPluginBase):
     # Register dict extend functions for ports
     db_base_plugin_v2.NeutronDbPluginV2.register_dict_extend_funcs(
         attr.PORTS, ['_extend_port_dict_security_group'])
+    db_base_plugin_v2.NeutronDbPluginV2.register_dict_extend_relationships(
+        models_v2.Port, ['security_groups'])
 
     def _process_port_create_security_group(self, context, port,
                                             security_group_ids):
@@ -122,6 +122,25 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
             self.notifier.security_groups_member_updated(
                 context, port.get(ext_sg.SECURITYGROUPS))
 
+    def notify_security_groups_members_updated(self, context, ports):
+        """Notify update event of security group members of many ports.
+
+        The agents are notified once for all the security groups of the
+        ports, rather than once per port.
+        """
+        provider_updated = False
+        security_groups = set()
+        for port in ports:
+            if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
+                provider_updated = True
+            else:
+                security_groups.update(port.get(ext_sg.SECURITYGROUPS) or [])
+        if provider_updated:
+            self.notifier.security_groups_provider_updated(context)
+        if security_groups:
+            self.notifier.security_groups_member_updated(
+                context, sorted(security_groups))
+
 
 class SecurityGroupServerRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent support in plugin
@@ -138,16 +157,51 @@ class SecurityGroupServerRpcCallbackMixin(object):
         :returns: port correspond to the devices with security group rules
         """
         devices = kwargs.get('devices')
+        ports = self._select_ports_for_devices(devices)
+        return self._security_group_rules_for_ports(context, ports)
+
+    def security_group_info_for_devices(self, context, **kwargs):
+        """Return security group information for each port.
 
+        Unlike security_group_rules_for_devices, the rules of each security
+        group are returned only once, and remote_group_id rules are not
+        expanded; the member IPs of the remote groups are returned instead,
+        so that the agent can expand them itself.
+
+        :params devices: list of devices
+        :returns: dict with
+            devices: ports correspond to the devices, with their
+                security_groups and provider rules,
+            security_groups: rules of each security group of the ports,
+            sg_member_ips: IPs of the members of each remote group,
+                by ethertype
+        """
+        devices = kwargs.get('devices')
+        ports = self._select_ports_for_devices(devices)
+        return self._security_group_info_for_ports(context, ports)
+
+    def get_ports_from_devices(self, devices):
+        """Return the ports of the devices, keyed by device.
+
+        Plugins can override this to look up the ports of all the devices
+        at once, rather than calling get_port_from_device for each device.
+        Ports owned by the network may be left out, as security group rules
+        are not applied to them.
+        """
         ports = {}
         for device in devices:
             port = self.get_port_from_device(device)
-            if not port:
-                continue
+            if port:
+                ports[device] = port
+        return ports
+
+    def _select_ports_for_devices(self, devices):
+        ports = {}
+        for port in self.get_ports_from_devices(devices).itervalues():
             if port['device_owner'].startswith('network:'):
                 continue
             ports[port['id']] = port
-        return self._security_group_rules_for_ports(context, ports)
+        return ports
 
     def _select_rules_for_ports(self, context, ports):
         if not ports:
@@ -164,6 +218,15 @@ class SecurityGroupServerRpcCallbackMixin(object):
         query = query.filter(sg_binding_port.in_(ports.keys()))
         return query.all()
 
+    def _select_rules_for_security_groups(self, context, security_group_ids):
+        if not security_group_ids:
+            return []
+        sgr_sgid = sg_db.SecurityGroupRule.security_group_id
+
+        query = context.session.query(sg_db.SecurityGroupRule)
+        query = query.filter(sgr_sgid.in_(security_group_ids))
+        return query.all()
+
     def _select_ips_for_remote_group(self, context, remote_group_ids):
         ips_by_group = {}
         if not remote_group_ids:
@@ -288,25 +351,57 @@ class SecurityGroupServerRpcCallbackMixin(object):
             self._add_ingress_ra_rule(port, ips)
             self._add_ingress_dhcp_rule(port, ips)
 
+    def _make_rule_dict_for_agent(self, rule_in_db):
+        direction = rule_in_db['direction']
+        rule_dict = {
+            'security_group_id': rule_in_db['security_group_id'],
+            'direction': direction,
+            'ethertype': rule_in_db['ethertype'],
+        }
+        for key in ('protocol', 'port_range_min', 'port_range_max',
+                    'remote_ip_prefix', 'remote_group_id'):
+            if rule_in_db.get(key):
+                if key == 'remote_ip_prefix':
+                    direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
+                    rule_dict[direction_ip_prefix] = rule_in_db[key]
+                    continue
+                rule_dict[key] = rule_in_db[key]
+        return rule_dict
+
     def _security_group_rules_for_ports(self, context, ports):
         rules_in_db = self._select_rules_for_ports(context, ports)
         for (binding, rule_in_db) in rules_in_db:
             port_id = binding['port_id']
             port = ports[port_id]
-            direction = rule_in_db['direction']
-            rule_dict = {
-                'security_group_id': rule_in_db['security_group_id'],
-                'direction': direction,
-                'ethertype': rule_in_db['ethertype'],
-            }
-            for key in ('protocol', 'port_range_min', 'port_range_max',
-                        'remote_ip_prefix', 'remote_group_id'):
-                if rule_in_db.get(key):
-                    if key == 'remote_ip_prefix':
-                        direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
-                        rule_dict[direction_ip_prefix] = rule_in_db[key]
-                        continue
-                    rule_dict[key] = rule_in_db[key]
-            port['security_group_rules'].append(rule_dict)
+            port['security_group_rules'].append(
+                self._make_rule_dict_for_agent(rule_in_db))
         self._apply_provider_rule(context, ports)
         return self._convert_remote_group_id_to_ip_prefix(context, ports)
+
+    def _security_group_info_for_ports(self, context, ports):
+        security_groups = {}
+        for port in ports.values():
+            for security_group_id in port.get('security_groups', []):
+                security_groups[security_group_id] = []
+
+        remote_group_ids = set()
+        for rule_in_db in self._select_rules_for_security_groups(
+                context, security_groups.keys()):
+            rule_dict = self._make_rule_dict_for_agent(rule_in_db)
+            security_groups[rule_dict['security_group_id']].append(rule_dict)
+            if rule_dict.get('remote_group_id'):
+                remote_group_ids.add(rule_dict['remote_group_id'])
+
+        sg_member_ips = {}
+        ips = self._select_ips_for_remote_group(context, remote_group_ids)
+        for remote_group_id, member_ips in ips.iteritems():
+            ips_by_ethertype = {q_const.IPv4: [], q_const.IPv6: []}
+            for ip in member_ips:
+                ethertype = 'IPv%s' % netaddr.IPNetwork(ip).version
+                ips_by_ethertype[ethertype].append(ip)
+            sg_member_ips[remote_group_id] = ips_by_ethertype
+
+        self._apply_provider_rule(context, ports)
+        return {'devices': ports,
+                'security_groups': security_groups,
+                'sg_member_ips': sg_member_ips}
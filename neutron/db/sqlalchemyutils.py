@@ -25,6 +25,41 @@ from neutron.openstack.common import log as logging
 LOG = logging.getLogger(__name__)
 
 
+class KeysetMarker(object):
+    """Marker of a page which is not loaded from the db.
+
+    The attributes of the marker are subqueries selecting the attributes of
+    the row with the marker id, so that paginate_query compares the sort
+    keys of the rows with the ones of the marker in the query of the page
+    itself, rather than after fetching the marker object. The subqueries
+    are built from the query of the collection, so that a marker is only
+    found among the rows visible in the context of the request.
+
+    :param query: the query of the rows the marker is searched in
+    :param model: the ORM model class
+    :param marker_id: the id of the marker
+    :param get_marker: function fetching the marker, raising the not found
+                       error of the resource if it doesn't exist
+    """
+
+    def __init__(self, query, model, marker_id, get_marker):
+        self._query = query.filter(model.id == marker_id)
+        self._model = model
+        self._get_marker = get_marker
+
+    def __getattr__(self, name):
+        return self._query.with_entities(
+            getattr(self._model, name)).correlate(None).as_scalar()
+
+    def ensure_found(self):
+        """Raise the not found error of a marker which doesn't exist.
+
+        The page following such a marker is empty, so this is only needed
+        when no row was found after the marker.
+        """
+        self._get_marker()
+
+
 def paginate_query(query, model, limit, sorts, marker_obj=None):
     """Returns a query with sorting / pagination criteria added.
 
@@ -42,8 +77,8 @@ def paginate_query(query, model, limit, sorts, marker_obj=None):
     We also have to cope with different sort directions.
 
     Typically, the id of the last row is used as the client-facing pagination
-    marker, then the actual marker object must be fetched from the db and
-    passed in to us as marker.
+    marker, then the actual marker object must be fetched from the db, or
+    a KeysetMarker built from the id, and passed in to us as marker.
 
     :param query: the query object to which we should add paging/sorting
     :param model: the ORM model class
@@ -62,7 +62,9 @@ class LinuxBridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
 
     # history
     #   1.1 Support Security Group RPC
-    RPC_API_VERSION = '1.1'
+    #   1.2 Support security_group_info_for_devices
+    #   1.3 Support get_networks_info and sync_changed_routers
+    RPC_API_VERSION = '1.3'
     # Device names start with "tap"
     TAP_PREFIX_LEN = 3
 
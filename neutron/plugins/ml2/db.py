@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import sqlalchemy as sa
 from sqlalchemy.orm import exc
 
 from neutron.db import api as db_api
@@ -56,6 +57,23 @@ def get_network_segments(session, network_id):
                 for record in records]
 
 
+def get_networks_segments(session, network_ids):
+    """Return the segments of the networks, keyed by network id."""
+    segments = dict((network_id, []) for network_id in network_ids)
+    if not network_ids:
+        return segments
+    with session.begin(subtransactions=True):
+        records = (session.query(models.NetworkSegment).
+                   filter(models.NetworkSegment.network_id.in_(network_ids)))
+        for record in records:
+            segments[record.network_id].append(
+                {api.ID: record.id,
+                 api.NETWORK_TYPE: record.network_type,
+                 api.PHYSICAL_NETWORK: record.physical_network,
+                 api.SEGMENTATION_ID: record.segmentation_id})
+    return segments
+
+
 def ensure_port_binding(session, port_id):
     with session.begin(subtransactions=True):
         try:
@@ -70,6 +88,71 @@ def ensure_port_binding(session, port_id):
         return record
 
 
+def ensure_port_bindings(session, port_ids):
+    """Return the bindings of the ports, keyed by port id.
+
+    The missing bindings are created.
+    """
+    with session.begin(subtransactions=True):
+        bindings = {}
+        if port_ids:
+            bindings = dict(
+                (record.port_id, record) for record in
+                session.query(models.PortBinding).filter(
+                    models.PortBinding.port_id.in_(port_ids)))
+        for port_id in set(port_ids) - set(bindings):
+            bindings[port_id] = models.PortBinding(
+                port_id=port_id,
+                vif_type=portbindings.VIF_TYPE_UNBOUND)
+            session.add(bindings[port_id])
+        return bindings
+
+
+def _filter_port_ids(query, column, port_ids):
+    """Filter the query on port ids, which may be prefixes of the ids."""
+    ids = [port_id for port_id in port_ids
+           if uuidutils.is_uuid_like(port_id)]
+    conditions = [column.startswith(port_id) for port_id in port_ids
+                  if not uuidutils.is_uuid_like(port_id)]
+    if ids:
+        conditions.append(column.in_(ids))
+    return query.filter(sa.or_(*conditions))
+
+
+def _match_port_ids(port_ids, records, key):
+    """Key the records by the port ids or id prefixes they match.
+
+    A prefix matching several records is left out, as get_port does.
+    """
+    by_id = dict((key(record), record) for record in records)
+    matches = {}
+    for port_id in port_ids:
+        if port_id in by_id:
+            matches[port_id] = by_id[port_id]
+            continue
+        found = [record for record_id, record in by_id.iteritems()
+                 if record_id.startswith(port_id)]
+        if len(found) == 1:
+            matches[port_id] = found[0]
+        elif found:
+            LOG.error(_("Multiple ports have port_id starting with %s"),
+                      port_id)
+    return matches
+
+
+def get_ports(session, port_ids):
+    """Get the port records of the port ids or id prefixes.
+
+    Returns the records keyed by the ids they were requested with.
+    """
+    if not port_ids:
+        return {}
+    with session.begin(subtransactions=True):
+        query = _filter_port_ids(session.query(models_v2.Port),
+                                 models_v2.Port.id, port_ids)
+        return _match_port_ids(port_ids, query.all(), lambda r: r.id)
+
+
 def get_port(session, port_id):
     """Get port record for update within transcation."""
 
@@ -94,6 +177,17 @@ def get_port_from_device_mac(device_mac):
     return qry.first()
 
 
+def _make_port_and_sgs_dict(port, sg_ids):
+    plugin = manager.NeutronManager.get_plugin()
+    port_dict = plugin._make_port_dict(port)
+    port_dict['security_groups'] = sg_ids
+    port_dict['security_group_rules'] = []
+    port_dict['security_group_source_groups'] = []
+    port_dict['fixed_ips'] = [ip['ip_address']
+                              for ip in port['fixed_ips']]
+    return port_dict
+
+
 def get_port_and_sgs(port_id):
     """Get port from database with security group info."""
 
@@ -111,15 +205,41 @@ def get_port_and_sgs(port_id):
         if not port_and_sgs:
             return
         port = port_and_sgs[0][0]
-        plugin = manager.NeutronManager.get_plugin()
-        port_dict = plugin._make_port_dict(port)
-        port_dict['security_groups'] = [
-            sg_id for port_, sg_id in port_and_sgs if sg_id]
-        port_dict['security_group_rules'] = []
-        port_dict['security_group_source_groups'] = []
-        port_dict['fixed_ips'] = [ip['ip_address']
-                                  for ip in port['fixed_ips']]
-        return port_dict
+        return _make_port_and_sgs_dict(
+            port, [sg_id for port_, sg_id in port_and_sgs if sg_id])
+
+
+def get_ports_and_sgs(port_ids):
+    """Get the ports of the port ids or id prefixes with security group info.
+
+    Returns the ports keyed by the ids they were requested with. The ports
+    owned by the network are left out, as no security group rules are
+    applied to them.
+    """
+    LOG.debug(_("get_ports_and_sgs() called for port_ids %s"), port_ids)
+    if not port_ids:
+        return {}
+    session = db_api.get_session()
+    sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
+
+    with session.begin(subtransactions=True):
+        query = session.query(models_v2.Port,
+                              sg_db.SecurityGroupPortBinding.security_group_id)
+        query = query.outerjoin(sg_db.SecurityGroupPortBinding,
+                                models_v2.Port.id == sg_binding_port)
+        query = _filter_port_ids(query, models_v2.Port.id, port_ids)
+        query = query.filter(
+            ~models_v2.Port.device_owner.startswith('network:'))
+        ports = {}
+        sg_ids = {}
+        for port, sg_id in query:
+            ports[port.id] = port
+            sg_ids.setdefault(port.id, [])
+            if sg_id:
+                sg_ids[port.id].append(sg_id)
+        matches = _match_port_ids(port_ids, ports.values(), lambda r: r.id)
+        return dict((port_id, _make_port_and_sgs_dict(port, sg_ids[port.id]))
+                    for port_id, port in matches.iteritems())
 
 
 def get_port_binding_host(port_id):
@@ -134,3 +254,17 @@ def get_port_binding_host(port_id):
                       {'port_id': port_id})
             return
     return query.host
+
+
+def get_port_binding_hosts(port_ids):
+    """Return the hosts of the port ids or id prefixes which are bound."""
+    if not port_ids:
+        return {}
+    session = db_api.get_session()
+    with session.begin(subtransactions=True):
+        query = _filter_port_ids(session.query(models.PortBinding),
+                                 models.PortBinding.port_id, port_ids)
+        bindings = _match_port_ids(port_ids, query.all(),
+                                   lambda r: r.port_id)
+    return dict((port_id, binding.host)
+                for port_id, binding in bindings.iteritems())
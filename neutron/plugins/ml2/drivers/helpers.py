@@ -0,0 +1,128 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Segmentation id allocation for the ML2 type drivers.
+
+The allocation tables of the type drivers only hold a row per allocated
+segmentation id; the free ids are the configured ranges minus these rows.
+Tenant segments are allocated at random in the ranges, so that concurrent
+allocations rarely try the same id, and an allocation only has to look up
+the ids it tries rather than lock a shared free row. When two allocations
+still pick the same id, the primary key rejects the second row, which is
+retried with another id.
+"""
+
+import bisect
+import random
+
+from neutron.openstack.common.db import exception as db_exc
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Number of random ids tried before looking up all the allocated ids
+MAX_RANDOM_ATTEMPTS = 10
+# Number of ids tried when the rows picked are inserted concurrently
+MAX_INSERT_ATTEMPTS = 10
+
+
+def merge_ranges(ranges):
+    """Return sorted ranges of (min, max) without any overlap."""
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def _nth_free_id(ranges, used_ids, index):
+    """Return the index-th id of ranges which is not in used_ids.
+
+    used_ids must be sorted, ranges merged.
+    """
+    for low, high in ranges:
+        start = bisect.bisect_left(used_ids, low)
+        end = bisect.bisect_right(used_ids, high)
+        free = high - low + 1 - (end - start)
+        if index >= free:
+            index -= free
+            continue
+        candidate = low + index
+        for used_id in used_ids[start:end]:
+            if used_id > candidate:
+                break
+            candidate += 1
+        return candidate
+
+
+def _pick_free_id(session, id_column, ranges, size, query, filters):
+    """Return a random id of ranges without row, None if there is none."""
+    for i in range(MAX_RANDOM_ATTEMPTS):
+        candidate = _nth_free_id(ranges, [], random.randrange(size))
+        if not query.filter(id_column == candidate).first():
+            return candidate
+    # The ranges are mostly allocated, pick among the free ids
+    used_ids = sorted(
+        row[0] for row in session.query(id_column).filter_by(**filters)
+        if any(low <= row[0] <= high for low, high in ranges))
+    if len(used_ids) < size:
+        return _nth_free_id(ranges, used_ids,
+                            random.randrange(size - len(used_ids)))
+
+
+def insert_allocation(session, model, **columns):
+    """Insert an allocated row of model in a savepoint.
+
+    :returns: the new allocation, or None if the row already exists, in
+              which case the enclosing transaction can go on
+    """
+    alloc = model(allocated=True, **columns)
+    try:
+        with session.begin_nested():
+            session.add(alloc)
+    except db_exc.DBDuplicateEntry:
+        return
+    return alloc
+
+
+def allocate_segmentation_id(session, model, id_column, ranges, **filters):
+    """Allocate a random id of ranges with a new row of model.
+
+    :param id_column: column of model holding the segmentation id
+    :param ranges: merged ranges of allocatable ids
+    :param filters: other columns of the rows, such as physical_network
+    :returns: the new allocation, or None if every id is allocated
+    """
+    size = sum(high - low + 1 for low, high in ranges)
+    if not size:
+        return
+    query = session.query(model).filter_by(**filters)
+    for i in range(MAX_INSERT_ATTEMPTS):
+        candidate = _pick_free_id(session, id_column, ranges, size, query,
+                                  filters)
+        if candidate is None:
+            return
+        filters[id_column.key] = candidate
+        alloc = insert_allocation(session, model, **filters)
+        if alloc:
+            return alloc
+        LOG.debug(_("Segmentation id %s was allocated concurrently, "
+                    "trying another one"), candidate)
+        del filters[id_column.key]
+    LOG.warning(_("Unable to allocate a segmentation id of %(model)s after "
+                  "%(attempts)s attempts"),
+                {'model': model.__name__, 'attempts': MAX_INSERT_ATTEMPTS})
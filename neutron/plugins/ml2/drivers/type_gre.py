@@ -23,6 +23,7 @@ from neutron.db import model_base
 from neutron.openstack.common import log
 from neutron.plugins.common import constants as p_const
 from neutron.plugins.ml2 import driver_api as api
+from neutron.plugins.ml2.drivers import helpers
 from neutron.plugins.ml2.drivers import type_tunnel
 
 LOG = log.getLogger(__name__)
@@ -81,26 +82,23 @@ class GreTypeDriver(type_tunnel.TunnelTypeDriver):
                          one())
                 if alloc.allocated:
                     raise exc.TunnelIdInUse(tunnel_id=segmentation_id)
-                LOG.debug(_("Reserving specific gre tunnel %s from pool"),
-                          segmentation_id)
+                # Unallocated row left by an earlier release
                 alloc.allocated = True
             except sa_exc.NoResultFound:
-                LOG.debug(_("Reserving specific gre tunnel %s outside pool"),
-                          segmentation_id)
-                alloc = GreAllocation(gre_id=segmentation_id)
-                alloc.allocated = True
-                session.add(alloc)
+                alloc = helpers.insert_allocation(
+                    session, GreAllocation, gre_id=segmentation_id)
+                if not alloc:
+                    raise exc.TunnelIdInUse(tunnel_id=segmentation_id)
+            LOG.debug(_("Reserving specific gre tunnel %s"), segmentation_id)
 
     def allocate_tenant_segment(self, session):
         with session.begin(subtransactions=True):
-            alloc = (session.query(GreAllocation).
-                     filter_by(allocated=False).
-                     with_lockmode('update').
-                     first())
+            alloc = helpers.allocate_segmentation_id(
+                session, GreAllocation, GreAllocation.gre_id,
+                self.gre_id_ranges)
             if alloc:
                 LOG.debug(_("Allocating gre tunnel id  %(gre_id)s"),
                           {'gre_id': alloc.gre_id})
-                alloc.allocated = True
                 return {api.NETWORK_TYPE: p_const.TYPE_GRE,
                         api.PHYSICAL_NETWORK: None,
                         api.SEGMENTATION_ID: alloc.gre_id}
@@ -108,58 +106,32 @@ class GreTypeDriver(type_tunnel.TunnelTypeDriver):
     def release_segment(self, session, segment):
         gre_id = segment[api.SEGMENTATION_ID]
         with session.begin(subtransactions=True):
-            try:
-                alloc = (session.query(GreAllocation).
-                         filter_by(gre_id=gre_id).
-                         with_lockmode('update').
-                         one())
-                alloc.allocated = False
-                for lo, hi in self.gre_id_ranges:
-                    if lo <= gre_id <= hi:
-                        LOG.debug(_("Releasing gre tunnel %s to pool"),
-                                  gre_id)
-                        break
-                else:
-                    session.delete(alloc)
-                    LOG.debug(_("Releasing gre tunnel %s outside pool"),
-                              gre_id)
-            except sa_exc.NoResultFound:
+            count = (session.query(GreAllocation).
+                     filter_by(gre_id=gre_id).
+                     delete())
+            if count:
+                LOG.debug(_("Releasing gre tunnel %s"), gre_id)
+            else:
                 LOG.warning(_("gre_id %s not found"), gre_id)
 
     def _sync_gre_allocations(self):
-        """Synchronize gre_allocations table with configured tunnel ranges."""
-
-        # determine current configured allocatable gres
-        gre_ids = set()
-        for gre_id_range in self.gre_id_ranges:
-            tun_min, tun_max = gre_id_range
-            if tun_max + 1 - tun_min > 1000000:
-                LOG.error(_("Skipping unreasonable gre ID range "
-                            "%(tun_min)s:%(tun_max)s"),
-                          {'tun_min': tun_min, 'tun_max': tun_max})
-            else:
-                gre_ids |= set(xrange(tun_min, tun_max + 1))
+        """Synchronize gre_allocations table with configured tunnel ranges.
+
+        Only allocated tunnels have a row, so this merges the configured
+        ranges and removes the rows of unallocated tunnels left by previous
+        releases.
+        """
+
+        self.gre_id_ranges = helpers.merge_ranges(self.gre_id_ranges)
 
         session = db_api.get_session()
         with session.begin(subtransactions=True):
-            # remove from table unallocated tunnels not currently allocatable
-            allocs = (session.query(GreAllocation).all())
-            for alloc in allocs:
-                try:
-                    # see if tunnel is allocatable
-                    gre_ids.remove(alloc.gre_id)
-                except KeyError:
-                    # it's not allocatable, so check if its allocated
-                    if not alloc.allocated:
-                        # it's not, so remove it from table
-                        LOG.debug(_("Removing tunnel %s from pool"),
-                                  alloc.gre_id)
-                        session.delete(alloc)
-
-            # add missing allocatable tunnels to table
-            for gre_id in sorted(gre_ids):
-                alloc = GreAllocation(gre_id=gre_id)
-                session.add(alloc)
+            count = (session.query(GreAllocation).
+                     filter_by(allocated=False).
+                     delete())
+            if count:
+                LOG.debug(_("Removed %s unallocated gre tunnels from table"),
+                          count)
 
     def get_gre_allocation(self, session, gre_id):
         return session.query(GreAllocation).filter_by(gre_id=gre_id).first()
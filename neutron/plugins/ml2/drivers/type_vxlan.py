@@ -24,6 +24,7 @@ from neutron.db import model_base
 from neutron.openstack.common import log
 from neutron.plugins.common import constants as p_const
 from neutron.plugins.ml2 import driver_api as api
+from neutron.plugins.ml2.drivers import helpers
 from neutron.plugins.ml2.drivers import type_tunnel
 
 LOG = log.getLogger(__name__)
@@ -90,26 +91,23 @@ class VxlanTypeDriver(type_tunnel.TunnelTypeDriver):
                          one())
                 if alloc.allocated:
                     raise exc.TunnelIdInUse(tunnel_id=segmentation_id)
-                LOG.debug(_("Reserving specific vxlan tunnel %s from pool"),
-                          segmentation_id)
+                # Unallocated row left by an earlier release
                 alloc.allocated = True
             except sa_exc.NoResultFound:
-                LOG.debug(_("Reserving specific vxlan tunnel %s outside pool"),
-                          segmentation_id)
-                alloc = VxlanAllocation(vxlan_vni=segmentation_id)
-                alloc.allocated = True
-                session.add(alloc)
+                alloc = helpers.insert_allocation(
+                    session, VxlanAllocation, vxlan_vni=segmentation_id)
+                if not alloc:
+                    raise exc.TunnelIdInUse(tunnel_id=segmentation_id)
+            LOG.debug(_("Reserving specific vxlan tunnel %s"), segmentation_id)
 
     def allocate_tenant_segment(self, session):
         with session.begin(subtransactions=True):
-            alloc = (session.query(VxlanAllocation).
-                     filter_by(allocated=False).
-                     with_lockmode('update').
-                     first())
+            alloc = helpers.allocate_segmentation_id(
+                session, VxlanAllocation, VxlanAllocation.vxlan_vni,
+                self.vxlan_vni_ranges)
             if alloc:
                 LOG.debug(_("Allocating vxlan tunnel vni %(vxlan_vni)s"),
                           {'vxlan_vni': alloc.vxlan_vni})
-                alloc.allocated = True
                 return {api.NETWORK_TYPE: p_const.TYPE_VXLAN,
                         api.PHYSICAL_NETWORK: None,
                         api.SEGMENTATION_ID: alloc.vxlan_vni}
@@ -117,59 +115,40 @@ class VxlanTypeDriver(type_tunnel.TunnelTypeDriver):
     def release_segment(self, session, segment):
         vxlan_vni = segment[api.SEGMENTATION_ID]
         with session.begin(subtransactions=True):
-            try:
-                alloc = (session.query(VxlanAllocation).
-                         filter_by(vxlan_vni=vxlan_vni).
-                         with_lockmode('update').
-                         one())
-                alloc.allocated = False
-                for low, high in self.vxlan_vni_ranges:
-                    if low <= vxlan_vni <= high:
-                        LOG.debug(_("Releasing vxlan tunnel %s to pool"),
-                                  vxlan_vni)
-                        break
-                else:
-                    session.delete(alloc)
-                    LOG.debug(_("Releasing vxlan tunnel %s outside pool"),
-                              vxlan_vni)
-            except sa_exc.NoResultFound:
+            count = (session.query(VxlanAllocation).
+                     filter_by(vxlan_vni=vxlan_vni).
+                     delete())
+            if count:
+                LOG.debug(_("Releasing vxlan tunnel %s"), vxlan_vni)
+            else:
                 LOG.warning(_("vxlan_vni %s not found"), vxlan_vni)
 
     def _sync_vxlan_allocations(self):
         """
         Synchronize vxlan_allocations table with configured tunnel ranges.
+
+        Only allocated vnis have a row, so this merges the configured ranges
+        and removes the rows of unallocated vnis left by previous releases.
         """
 
-        # determine current configured allocatable vnis
-        vxlan_vnis = set()
+        vxlan_vni_ranges = []
         for tun_min, tun_max in self.vxlan_vni_ranges:
             if tun_max + 1 - tun_min > MAX_VXLAN_VNI:
                 LOG.error(_("Skipping unreasonable VXLAN VNI range "
                             "%(tun_min)s:%(tun_max)s"),
                           {'tun_min': tun_min, 'tun_max': tun_max})
             else:
-                vxlan_vnis |= set(xrange(tun_min, tun_max + 1))
+                vxlan_vni_ranges.append((tun_min, tun_max))
+        self.vxlan_vni_ranges = helpers.merge_ranges(vxlan_vni_ranges)
 
         session = db_api.get_session()
         with session.begin(subtransactions=True):
-            # remove from table unallocated tunnels not currently allocatable
-            allocs = session.query(VxlanAllocation)
-            for alloc in allocs:
-                try:
-                    # see if tunnel is allocatable
-                    vxlan_vnis.remove(alloc.vxlan_vni)
-                except KeyError:
-                    # it's not allocatable, so check if its allocated
-                    if not alloc.allocated:
-                        # it's not, so remove it from table
-                        LOG.debug(_("Removing tunnel %s from pool"),
-                                  alloc.vxlan_vni)
-                        session.delete(alloc)
-
-            # add missing allocatable tunnels to table
-            for vxlan_vni in sorted(vxlan_vnis):
-                alloc = VxlanAllocation(vxlan_vni=vxlan_vni)
-                session.add(alloc)
+            count = (session.query(VxlanAllocation).
+                     filter_by(allocated=False).
+                     delete())
+            if count:
+                LOG.debug(_("Removed %s unallocated vxlan tunnels from "
+                            "table"), count)
 
     def get_vxlan_allocation(self, session, vxlan_vni):
         with session.begin(subtransactions=True):
@@ -638,6 +638,60 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
         self.notify_security_groups_member_updated(context, result)
         return result
 
+    def create_port_bulk(self, context, ports):
+        items = ports['ports']
+        for item in items:
+            item['port']['status'] = const.PORT_STATUS_DOWN
+
+        session = context.session
+        mech_contexts = []
+        with session.begin(subtransactions=True):
+            sgids = []
+            for item in items:
+                self._ensure_default_security_group_on_port(context, item)
+                sgids.append(self._get_security_groups_on_port(context,
+                                                               item))
+            results = self._create_ports_db(context, items)
+            networks = {}
+            for item, result, port_sgids in zip(items, results, sgids):
+                attrs = item['port']
+                self._process_port_create_security_group(context, result,
+                                                         port_sgids)
+                network_id = result['network_id']
+                if network_id not in networks:
+                    networks[network_id] = self.get_network(context,
+                                                            network_id)
+                # The ports are new, so are their bindings
+                binding = models.PortBinding(
+                    port_id=result['id'],
+                    vif_type=portbindings.VIF_TYPE_UNBOUND)
+                session.add(binding)
+                mech_context = driver_context.PortContext(
+                    self, context, result, networks[network_id],
+                    binding=binding)
+                self._process_port_binding(mech_context, attrs)
+                result[addr_pair.ADDRESS_PAIRS] = (
+                    self._process_create_allowed_address_pairs(
+                        context, result,
+                        attrs.get(addr_pair.ADDRESS_PAIRS)))
+                self._process_port_create_extra_dhcp_opts(
+                    context, result, attrs.get(edo_ext.EXTRADHCPOPTS, []))
+                self.mechanism_manager.create_port_precommit(mech_context)
+                mech_contexts.append(mech_context)
+
+        try:
+            for mech_context in mech_contexts:
+                self.mechanism_manager.create_port_postcommit(mech_context)
+        except ml2_exc.MechanismDriverError:
+            with excutils.save_and_reraise_exception():
+                LOG.error(_("mechanism_manager.create_port_postcommit "
+                            "failed, deleting ports %s"),
+                          [result['id'] for result in results])
+                for result in results:
+                    self.delete_port(context, result['id'])
+        self.notify_security_groups_members_updated(context, results)
+        return results
+
     def update_port(self, context, id, port):
         attrs = port['port']
         need_port_update_notify = False
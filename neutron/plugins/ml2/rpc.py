@@ -41,10 +41,14 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
                    sg_db_rpc.SecurityGroupServerRpcCallbackMixin,
                    type_tunnel.TunnelRpcCallbackMixin):
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.4'
     # history
     #   1.0 Initial version (from openvswitch/linuxbridge)
     #   1.1 Support Security Group RPC
+    #   1.2 Support security_group_info_for_devices
+    #   1.3 Support get_networks_info
+    #   1.4 Support get_devices_details_list, update_devices_up and
+    #       update_devices_down
 
     def __init__(self, notifier, type_manager):
         # REVISIT(kmestery): This depends on the first three super classes
@@ -86,6 +90,18 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             port['device'] = device
         return port
 
+    @classmethod
+    def get_ports_from_devices(cls, devices):
+        port_ids = dict((device, cls._device_to_port_id(device))
+                        for device in devices)
+        ports = db.get_ports_and_sgs(list(set(port_ids.values())))
+        devices_ports = {}
+        for device, port_id in port_ids.iteritems():
+            port = ports.get(port_id)
+            if port:
+                devices_ports[device] = dict(port, device=device)
+        return devices_ports
+
     def get_device_details(self, rpc_context, **kwargs):
         """Agent requests device details."""
         agent_id = kwargs.get('agent_id')
@@ -98,61 +114,101 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
         session = db_api.get_session()
         with session.begin(subtransactions=True):
             port = db.get_port(session, port_id)
-            if not port:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s not found in database"),
-                            {'device': device, 'agent_id': agent_id})
-                return {'device': device}
-
-            segments = db.get_network_segments(session, port.network_id)
-            if not segments:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s has network %(network_id)s with "
-                              "no segments"),
-                            {'device': device,
-                             'agent_id': agent_id,
-                             'network_id': port.network_id})
-                return {'device': device}
-
-            binding = db.ensure_port_binding(session, port.id)
-            if not binding.segment:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s on network %(network_id)s not "
-                              "bound, vif_type: %(vif_type)s"),
-                            {'device': device,
-                             'agent_id': agent_id,
-                             'network_id': port.network_id,
-                             'vif_type': binding.vif_type})
-                return {'device': device}
-
-            segment = self._find_segment(segments, binding.segment)
-            if not segment:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s on network %(network_id)s "
-                              "invalid segment, vif_type: %(vif_type)s"),
-                            {'device': device,
-                             'agent_id': agent_id,
-                             'network_id': port.network_id,
-                             'vif_type': binding.vif_type})
-                return {'device': device}
-
-            new_status = (q_const.PORT_STATUS_BUILD if port.admin_state_up
-                          else q_const.PORT_STATUS_DOWN)
-            if port.status != new_status:
-                plugin = manager.NeutronManager.get_plugin()
-                plugin.update_port_status(rpc_context,
-                                          port_id,
-                                          new_status)
-                port.status = new_status
-            entry = {'device': device,
-                     'network_id': port.network_id,
-                     'port_id': port.id,
-                     'admin_state_up': port.admin_state_up,
-                     'network_type': segment[api.NETWORK_TYPE],
-                     'segmentation_id': segment[api.SEGMENTATION_ID],
-                     'physical_network': segment[api.PHYSICAL_NETWORK]}
-            LOG.debug(_("Returning: %s"), entry)
-            return entry
+            segments = binding = None
+            if port:
+                segments = db.get_network_segments(session, port.network_id)
+                if segments:
+                    binding = db.ensure_port_binding(session, port.id)
+            return self._get_device_details(rpc_context, agent_id, device,
+                                            port, segments, binding)
+
+    def get_devices_details_list(self, rpc_context, **kwargs):
+        """Agent requests the details of many devices at once.
+
+        The ports, their network segments and their bindings are looked
+        up with a query each for all the devices.
+        """
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        LOG.debug(_("Details of devices %(devices)s requested by agent "
+                    "%(agent_id)s"),
+                  {'devices': devices, 'agent_id': agent_id})
+        port_ids = dict((device, self._device_to_port_id(device))
+                        for device in devices)
+
+        session = db_api.get_session()
+        with session.begin(subtransactions=True):
+            ports = db.get_ports(session, list(set(port_ids.values())))
+            segments = db.get_networks_segments(
+                session, list(set(port.network_id
+                                  for port in ports.itervalues())))
+            bindings = db.ensure_port_bindings(
+                session, [port.id for port in ports.itervalues()
+                          if segments[port.network_id]])
+            details = []
+            for device in devices:
+                port = ports.get(port_ids[device])
+                details.append(self._get_device_details(
+                    rpc_context, agent_id, device, port,
+                    port and segments[port.network_id],
+                    port and bindings.get(port.id)))
+            return details
+
+    def _get_device_details(self, rpc_context, agent_id, device, port,
+                            segments, binding):
+        if not port:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s not found in database"),
+                        {'device': device, 'agent_id': agent_id})
+            return {'device': device}
+
+        if not segments:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s has network %(network_id)s with "
+                          "no segments"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id})
+            return {'device': device}
+
+        if not binding.segment:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s on network %(network_id)s not "
+                          "bound, vif_type: %(vif_type)s"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id,
+                         'vif_type': binding.vif_type})
+            return {'device': device}
+
+        segment = self._find_segment(segments, binding.segment)
+        if not segment:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s on network %(network_id)s "
+                          "invalid segment, vif_type: %(vif_type)s"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id,
+                         'vif_type': binding.vif_type})
+            return {'device': device}
+
+        new_status = (q_const.PORT_STATUS_BUILD if port.admin_state_up
+                      else q_const.PORT_STATUS_DOWN)
+        if port.status != new_status:
+            plugin = manager.NeutronManager.get_plugin()
+            plugin.update_port_status(rpc_context,
+                                      port.id,
+                                      new_status)
+            port.status = new_status
+        entry = {'device': device,
+                 'network_id': port.network_id,
+                 'port_id': port.id,
+                 'admin_state_up': port.admin_state_up,
+                 'network_type': segment[api.NETWORK_TYPE],
+                 'segmentation_id': segment[api.SEGMENTATION_ID],
+                 'physical_network': segment[api.PHYSICAL_NETWORK]}
+        LOG.debug(_("Returning: %s"), entry)
+        return entry
 
     def _find_segment(self, segments, segment_id):
         for segment in segments:
@@ -202,6 +258,57 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
         plugin.update_port_status(rpc_context, port_id,
                                   q_const.PORT_STATUS_ACTIVE)
 
+    def _get_bound_port_ids(self, devices, host):
+        """Map the devices bound to the host to their port ids.
+
+        The bindings of all the devices are looked up with one query.
+        """
+        port_ids = dict((device, self._device_to_port_id(device))
+                        for device in devices)
+        if not host:
+            return port_ids
+        hosts = db.get_port_binding_hosts(list(set(port_ids.values())))
+        for device, port_id in port_ids.items():
+            if hosts.get(port_id) != host:
+                LOG.debug(_("Device %(device)s not bound to the"
+                            " agent host %(host)s"),
+                          {'device': device, 'host': host})
+                del port_ids[device]
+        return port_ids
+
+    def update_devices_down(self, rpc_context, **kwargs):
+        """Devices no longer exist on agent."""
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        host = kwargs.get('host')
+        LOG.debug(_("Devices %(devices)s no longer exist at agent "
+                    "%(agent_id)s"),
+                  {'devices': devices, 'agent_id': agent_id})
+        plugin = manager.NeutronManager.get_plugin()
+        port_ids = self._get_bound_port_ids(devices, host)
+        result = []
+        for device in devices:
+            port_exists = True
+            if device in port_ids:
+                port_exists = plugin.update_port_status(
+                    rpc_context, port_ids[device], q_const.PORT_STATUS_DOWN)
+            result.append({'device': device, 'exists': port_exists})
+        return result
+
+    def update_devices_up(self, rpc_context, **kwargs):
+        """Devices are up on agent."""
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        host = kwargs.get('host')
+        LOG.debug(_("Devices %(devices)s up at agent %(agent_id)s"),
+                  {'devices': devices, 'agent_id': agent_id})
+        plugin = manager.NeutronManager.get_plugin()
+        port_ids = self._get_bound_port_ids(devices, host)
+        for device in devices:
+            if device in port_ids:
+                plugin.update_port_status(rpc_context, port_ids[device],
+                                          q_const.PORT_STATUS_ACTIVE)
+
 
 class AgentNotifierApi(proxy.RpcProxy,
                        sg_rpc.SecurityGroupAgentRpcApiMixin,
@@ -14,6 +14,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import signal
 import sys
 import time
@@ -152,7 +153,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                  veth_mtu=None, l2_population=False,
                  minimize_polling=False,
                  ovsdb_monitor_respawn_interval=(
-                     constants.DEFAULT_OVSDBMON_RESPAWN)):
+                     constants.DEFAULT_OVSDBMON_RESPAWN),
+                 ovsdb_monitor_resync_interval=(
+                     constants.DEFAULT_OVSDBMON_RESYNC)):
         '''Constructor.
 
         :param integ_br: name of the integration bridge.
@@ -170,6 +173,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         :param ovsdb_monitor_respawn_interval: Optional, when using polling
                minimization, the number of seconds to wait before respawning
                the ovsdb monitor.
+        :param ovsdb_monitor_resync_interval: Optional, when using polling
+               minimization, the number of seconds between full scans of the
+               integration bridge ports.
         '''
         self.veth_mtu = veth_mtu
         self.root_helper = root_helper
@@ -202,6 +208,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         self.polling_interval = polling_interval
         self.minimize_polling = minimize_polling
         self.ovsdb_monitor_respawn_interval = ovsdb_monitor_respawn_interval
+        self.ovsdb_monitor_resync_interval = ovsdb_monitor_resync_interval
 
         if tunnel_types:
             self.enable_tunneling = True
@@ -327,8 +334,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 continue
             agent_ports = values.get('ports')
             agent_ports.pop(self.local_ip, None)
-            if len(agent_ports):
-                self.tun_br.defer_apply_on()
+            if not len(agent_ports):
+                continue
+            with self.tun_br.deferred():
                 for agent_ip, ports in agent_ports.items():
                     # Ensure we have a tunnel port with this remote agent
                     ofport = self.tun_br_ofports[
@@ -344,7 +352,6 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                             continue
                     for port in ports:
                         self._add_fdb_flow(port, agent_ip, lvm, ofport)
-                self.tun_br.defer_apply_off()
 
     def fdb_remove(self, context, fdb_entries):
         LOG.debug(_("fdb_remove received"))
@@ -355,8 +362,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 continue
             agent_ports = values.get('ports')
             agent_ports.pop(self.local_ip, None)
-            if len(agent_ports):
-                self.tun_br.defer_apply_on()
+            if not len(agent_ports):
+                continue
+            with self.tun_br.deferred():
                 for agent_ip, ports in agent_ports.items():
                     ofport = self.tun_br_ofports[
                         lvm.network_type].get(agent_ip)
@@ -364,7 +372,6 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                         continue
                     for port in ports:
                         self._del_fdb_flow(port, agent_ip, lvm, ofport)
-                self.tun_br.defer_apply_off()
 
     def _add_fdb_flow(self, port_info, agent_ip, lvm, ofport):
         if port_info == q_const.FLOODING_ENTRY:
@@ -815,12 +822,17 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 phys_veth.link.set_mtu(self.veth_mtu)
 
     def scan_ports(self, registered_ports, updated_ports=None):
-        cur_ports = self.int_br.get_vif_port_set()
+        # The VIF ports and vlan tags are read from a single snapshot of
+        # the integration bridge, which is also used to wire the devices.
+        ports = self.int_br.get_ports_snapshot()
+        vif_ports = self.int_br.get_vif_port_dict(ports)
+        cur_ports = set(vif_ports)
         self.int_br_device_count = len(cur_ports)
-        port_info = {'current': cur_ports}
+        port_info = {'current': cur_ports, 'vif_ports': vif_ports}
         if updated_ports is None:
             updated_ports = set()
-        updated_ports.update(self.check_changed_vlans(registered_ports))
+        updated_ports.update(self.check_changed_vlans(registered_ports,
+                                                      ports))
         if updated_ports:
             # Some updated ports might have been removed in the
             # meanwhile, and therefore should not be processed.
@@ -841,13 +853,59 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         port_info['removed'] = registered_ports - cur_ports
         return port_info
 
-    def check_changed_vlans(self, registered_ports):
+    def process_port_events(self, events, registered_ports,
+                            updated_ports=None):
+        """Return the port info of the integration bridge from ovsdb events.
+
+        Unlike scan_ports(), only the devices added or removed according to
+        the events, and the updated ones, are looked up on the bridge.
+        None is returned when the events can not be mapped to devices, in
+        which case the ports have to be scanned.
+
+        :param events: the interfaces added and removed, as returned by the
+                       get_events() method of the polling manager.
+        """
+        added = set()
+        removed = set()
+        for action, devices in (('added', added), ('removed', removed)):
+            for device in events[action]:
+                external_ids = device['external_ids']
+                if 'iface-id' in external_ids:
+                    devices.add(external_ids['iface-id'])
+                elif 'xs-vif-uuid' in external_ids:
+                    # The port id of xenserver VIFs is retrieved from XAPI
+                    return
+        # A device removed and added again is rewired
+        removed = (removed - added) & registered_ports
+        if updated_ports is None:
+            updated_ports = set()
+        vif_ports = {}
+        for port_id in added | updated_ports:
+            port = self.int_br.get_vif_port_by_id(port_id)
+            if port:
+                vif_ports[port_id] = port
+        # Devices plugged on other bridges are ignored
+        added &= set(vif_ports)
+        cur_ports = (registered_ports - removed) | added
+        self.int_br_device_count = len(cur_ports)
+        port_info = {'current': cur_ports, 'vif_ports': vif_ports}
+        updated_ports = (updated_ports | (added & registered_ports)) & set(
+            vif_ports)
+        if updated_ports:
+            port_info['updated'] = updated_ports
+        if added - registered_ports:
+            port_info['added'] = added - registered_ports
+        if removed:
+            port_info['removed'] = removed
+        return port_info
+
+    def check_changed_vlans(self, registered_ports, ports=None):
         """Return ports which have lost their vlan tag.
 
         The returned value is a set of port ids of the ports concerned by a
         vlan tag loss.
         """
-        port_tags = self.int_br.get_port_tag_dict()
+        port_tags = self.int_br.get_port_tag_dict(ports)
         changed_ports = set()
         for lvm in self.local_vlan_map.values():
             for port in registered_ports:
@@ -949,30 +1007,16 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                     self.tun_br.delete_port(port_name)
                     self.tun_br_ofports[tunnel_type].pop(remote_ip, None)
 
-    def treat_devices_added_or_updated(self, devices):
-        resync = False
-        for device in devices:
-            LOG.debug(_("Processing port %s"), device)
-            port = self.int_br.get_vif_port_by_id(device)
-            if not port:
-                # The port has disappeared and should not be processed
-                # There is no need to put the port DOWN in the plugin as
-                # it never went up in the first place
-                LOG.info(_("Port %s was not found on the integration bridge "
-                           "and will therefore not be processed"), device)
-                continue
-            try:
-                # TODO(salv-orlando): Provide bulk API for retrieving
-                # details for all devices in one call
-                details = self.plugin_rpc.get_device_details(self.context,
-                                                             device,
-                                                             self.agent_id)
-            except Exception as e:
-                LOG.debug(_("Unable to get port details for "
-                            "%(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
+    def _wire_devices(self, devices_details_list, vif_ports):
+        """Wire the VIF ports of devices_details_list.
+
+        :returns: the lists of devices to report up and down
+        """
+        devices_up = []
+        devices_down = []
+        for details in devices_details_list:
+            device = details['device']
+            port = vif_ports[device]
             if 'port_id' in details:
                 LOG.info(_("Port %(device)s updated. Details: %(details)s"),
                          {'device': device, 'details': details})
@@ -985,18 +1029,68 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 # update plugin about port status
                 if details.get('admin_state_up'):
                     LOG.debug(_("Setting status for %s to UP"), device)
-                    self.plugin_rpc.update_device_up(
-                        self.context, device, self.agent_id, cfg.CONF.host)
+                    devices_up.append(device)
                 else:
                     LOG.debug(_("Setting status for %s to DOWN"), device)
-                    self.plugin_rpc.update_device_down(
-                        self.context, device, self.agent_id, cfg.CONF.host)
+                    devices_down.append(device)
                 LOG.info(_("Configuration for device %s completed."), device)
             else:
                 LOG.warn(_("Device %s not defined on plugin"), device)
                 if (port and port.ofport != -1):
                     self.port_dead(port)
-        return resync
+        return devices_up, devices_down
+
+    def treat_devices_added_or_updated(self, devices, ports=None):
+        """Wire the given devices.
+
+        :param ports: a dict of VIF ports of the integration bridge keyed by
+                      VIF id, as returned by scan_ports(). The devices are
+                      looked up on the bridge one by one when not given.
+        """
+        vif_ports = {}
+        for device in devices:
+            LOG.debug(_("Processing port %s"), device)
+            if ports is None:
+                port = self.int_br.get_vif_port_by_id(device)
+            else:
+                port = ports.get(device)
+            if not port:
+                # The port has disappeared and should not be processed
+                # There is no need to put the port DOWN in the plugin as
+                # it never went up in the first place
+                LOG.info(_("Port %s was not found on the integration bridge "
+                           "and will therefore not be processed"), device)
+                continue
+            vif_ports[device] = port
+        if not vif_ports:
+            return False
+        try:
+            devices_details_list = self.plugin_rpc.get_devices_details_list(
+                self.context, [device for device in devices
+                               if device in vif_ports],
+                self.agent_id, cfg.CONF.host)
+        except Exception as e:
+            LOG.debug(_("Unable to get port details for "
+                        "%(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        try:
+            with self.deferred_flows():
+                devices_up, devices_down = self._wire_devices(
+                    devices_details_list, vif_ports)
+        except Exception:
+            # The devices are reported up only once their flows are in place
+            LOG.exception(_("Unable to program the flows of devices %s"),
+                          devices)
+            return True
+        if devices_up:
+            self.plugin_rpc.update_devices_up(
+                self.context, devices_up, self.agent_id, cfg.CONF.host)
+        if devices_down:
+            self.plugin_rpc.update_devices_down(
+                self.context, devices_down, self.agent_id, cfg.CONF.host)
+        return False
 
     def treat_ancillary_devices_added(self, devices):
         resync = False
@@ -1020,22 +1114,28 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         return resync
 
     def treat_devices_removed(self, devices):
-        resync = False
         self.sg_agent.remove_devices_filter(devices)
         for device in devices:
             LOG.info(_("Attachment %s removed"), device)
-            try:
-                self.plugin_rpc.update_device_down(self.context,
-                                                   device,
-                                                   self.agent_id,
-                                                   cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
-            self.port_unbound(device)
-        return resync
+        try:
+            self.plugin_rpc.update_devices_down(self.context,
+                                                list(devices),
+                                                self.agent_id,
+                                                cfg.CONF.host)
+        except Exception as e:
+            LOG.debug(_("port_removed failed for %(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        try:
+            with self.deferred_flows():
+                for device in devices:
+                    self.port_unbound(device)
+        except Exception:
+            LOG.exception(_("Unable to remove the flows of devices %s"),
+                          devices)
+            return True
+        return False
 
     def treat_ancillary_devices_removed(self, devices):
         resync = False
@@ -1058,6 +1158,19 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 LOG.debug(_("Device %s not defined on plugin"), device)
         return resync
 
+    @contextlib.contextmanager
+    def deferred_flows(self):
+        """Batch the flows programmed on the bridges of the agent.
+
+        Flows are applied when the block exits, with a single ovs-ofctl
+        call per bridge and kind of operation instead of one per flow.
+        """
+        bridges = [self.int_br] + self.phys_brs.values()
+        if self.enable_tunneling:
+            bridges.append(self.tun_br)
+        with contextlib.nested(*[br.deferred() for br in bridges]):
+            yield
+
     def process_network_ports(self, port_info):
         resync_a = False
         resync_b = False
@@ -1081,7 +1194,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         if devices_added_updated:
             start = time.time()
             resync_a = self.treat_devices_added_or_updated(
-                devices_added_updated)
+                devices_added_updated, port_info.get('vif_ports'))
             LOG.debug(_("process_network_ports - iteration:%(iter_num)d -"
                         "treat_devices_added_or_updated completed "
                         "in %(elapsed).3f"),
@@ -1137,28 +1250,32 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                                                       self.local_ip,
                                                       tunnel_type)
                 if not self.l2_pop:
-                    tunnels = details['tunnels']
-                    for tunnel in tunnels:
-                        if self.local_ip != tunnel['ip_address']:
-                            tunnel_id = tunnel.get('id')
-                            # Unlike the OVS plugin, ML2 doesn't return an id
-                            # key. So use ip_address to form port name instead.
-                            # Port name must be <=15 chars, so use shorter hex.
-                            remote_ip = tunnel['ip_address']
-                            remote_ip_hex = self.get_ip_in_hex(remote_ip)
-                            if not tunnel_id and not remote_ip_hex:
-                                continue
-                            tun_name = '%s-%s' % (tunnel_type,
-                                                  tunnel_id or remote_ip_hex)
-                            self.setup_tunnel_port(tun_name,
-                                                   tunnel['ip_address'],
-                                                   tunnel_type)
+                    with self.tun_br.deferred():
+                        self._setup_tunnel_ports(tunnel_type,
+                                                 details['tunnels'])
         except Exception as e:
             LOG.debug(_("Unable to sync tunnel IP %(local_ip)s: %(e)s"),
                       {'local_ip': self.local_ip, 'e': e})
             resync = True
         return resync
 
+    def _setup_tunnel_ports(self, tunnel_type, tunnels):
+        for tunnel in tunnels:
+            if self.local_ip != tunnel['ip_address']:
+                tunnel_id = tunnel.get('id')
+                # Unlike the OVS plugin, ML2 doesn't return an id
+                # key. So use ip_address to form port name instead.
+                # Port name must be <=15 chars, so use shorter hex.
+                remote_ip = tunnel['ip_address']
+                remote_ip_hex = self.get_ip_in_hex(remote_ip)
+                if not tunnel_id and not remote_ip_hex:
+                    continue
+                tun_name = '%s-%s' % (tunnel_type,
+                                      tunnel_id or remote_ip_hex)
+                self.setup_tunnel_port(tun_name,
+                                       tunnel['ip_address'],
+                                       tunnel_type)
+
     def _agent_has_updates(self, polling_manager):
         return (polling_manager.is_polling_required or
                 self.updated_ports or
@@ -1178,6 +1295,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         updated_ports_copy = set()
         ancillary_ports = set()
         tunnel_sync = True
+        last_full_scan = None
         while True:
             start = time.time()
             port_stats = {'regular': {'added': 0,
@@ -1192,6 +1310,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 ports.clear()
                 ancillary_ports.clear()
                 sync = False
+                last_full_scan = None
                 polling_manager.force_polling()
             # Notify the plugin of tunnel IP
             if self.enable_tunneling and tunnel_sync:
@@ -1201,7 +1320,12 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 except Exception:
                     LOG.exception(_("Error while synchronizing tunnels"))
                     tunnel_sync = True
-            if self._agent_has_updates(polling_manager):
+            # The ports are periodically scanned even when tracked from
+            # the ovsdb events, in case some of them were missed.
+            full_scan = (last_full_scan is None or
+                         start - last_full_scan >=
+                         self.ovsdb_monitor_resync_interval)
+            if self._agent_has_updates(polling_manager) or full_scan:
                 try:
                     LOG.debug(_("Agent rpc_loop - iteration:%(iter_num)d - "
                                 "starting polling. Elapsed:%(elapsed).3f"),
@@ -1213,7 +1337,16 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                     # between these two statements, this will be thread-safe
                     updated_ports_copy = self.updated_ports
                     self.updated_ports = set()
-                    port_info = self.scan_ports(ports, updated_ports_copy)
+                    port_info = None
+                    # The events are retrieved before scanning, which
+                    # discards the ones already covered by the scan.
+                    events = polling_manager.get_events()
+                    if events is not None and not full_scan:
+                        port_info = self.process_port_events(
+                            events, ports, updated_ports_copy)
+                    if port_info is None:
+                        last_full_scan = start
+                        port_info = self.scan_ports(ports, updated_ports_copy)
                     ports = port_info['current']
                     LOG.debug(_("Agent rpc_loop - iteration:%(iter_num)d - "
                                 "port information retrieved. "
@@ -1319,6 +1452,8 @@ def create_agent_config_map(config):
         root_helper=config.AGENT.root_helper,
         polling_interval=config.AGENT.polling_interval,
         minimize_polling=config.AGENT.minimize_polling,
+        ovsdb_monitor_resync_interval=(
+            config.AGENT.ovsdb_monitor_resync_interval),
         tunnel_types=config.AGENT.tunnel_types,
         veth_mtu=config.AGENT.veth_mtu,
         l2_population=config.AGENT.l2_population,
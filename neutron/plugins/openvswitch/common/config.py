@@ -70,6 +70,11 @@ agent_opts = [
                default=constants.DEFAULT_OVSDBMON_RESPAWN,
                help=_("The number of seconds to wait before respawning the "
                       "ovsdb monitor after losing communication with it")),
+    cfg.IntOpt('ovsdb_monitor_resync_interval',
+               default=constants.DEFAULT_OVSDBMON_RESYNC,
+               help=_("The number of seconds between full scans of the "
+                      "integration bridge ports, which are otherwise "
+                      "tracked from the ovsdb monitor events")),
     cfg.ListOpt('tunnel_types', default=DEFAULT_TUNNEL_TYPES,
                 help=_("Network types supported by the agent "
                        "(gre and/or vxlan)")),
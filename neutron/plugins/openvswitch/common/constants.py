@@ -49,3 +49,6 @@ TUN_TABLE = {p_const.TYPE_GRE: GRE_TUN_TO_LV,
 
 # The default respawn interval for the ovsdb monitor
 DEFAULT_OVSDBMON_RESPAWN = 30
+
+# The default interval between full port scans when using the ovsdb monitor
+DEFAULT_OVSDBMON_RESYNC = 60
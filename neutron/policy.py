@@ -36,6 +36,9 @@ from neutron.openstack.common import policy
 LOG = logging.getLogger(__name__)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+# Match rules built by _build_match_rule, by action and by the attributes
+# of the target whose policies are enforced for the action
+_MATCH_RULE_CACHE = {}
 ADMIN_CTX_POLICY = 'context_is_admin'
 # Maps deprecated 'extension' policies to new-style policies
 DEPRECATED_POLICY_MAP = {
@@ -62,6 +65,7 @@ def reset():
     global _POLICY_CACHE
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _MATCH_RULE_CACHE.clear()
     policy.reset()
 
 
@@ -116,6 +120,7 @@ def _set_rules(data):
                 LOG.error(_("Backward compatibility unavailable for "
                             "deprecated policy %s. The policy will "
                             "not be enforced"), pol)
+    _MATCH_RULE_CACHE.clear()
     policy.set_rules(policies)
 
 
@@ -193,6 +198,48 @@ def _build_match_rule(action, target):
     return match_rule
 
 
+def _match_rule_key(action, target):
+    """Return the key of the match rule of an action in _MATCH_RULE_CACHE.
+
+    The match rule only depends on the action and on the attributes with an
+    enforced policy which are explicitly set in the target, along with their
+    sub-attributes. None is returned when the rule must not be cached.
+    """
+    resource, is_write = get_resource_and_action(action)
+    res_map = attributes.RESOURCE_ATTRIBUTE_MAP
+    if not is_write or resource not in res_map:
+        return (action,)
+    enforced = []
+    for attribute_name, attribute in res_map[resource].iteritems():
+        if ('enforce_policy' not in attribute or
+                not _is_attribute_explicitly_set(attribute_name,
+                                                 res_map[resource],
+                                                 target)):
+            continue
+        validate = attribute.get('validate')
+        if (validate and any([k.startswith('type:dict') and v
+                              for (k, v) in validate.iteritems()])):
+            if not isinstance(target[attribute_name], dict):
+                return
+            enforced.append((attribute_name,
+                             tuple(sorted(target[attribute_name]))))
+        else:
+            enforced.append((attribute_name, None))
+    return (action, tuple(sorted(enforced)))
+
+
+def _get_match_rule(action, target):
+    """Return the match rule of an action, building it when not cached."""
+    key = _match_rule_key(action, target)
+    if key is None:
+        return _build_match_rule(action, target)
+    match_rule = _MATCH_RULE_CACHE.get(key)
+    if match_rule is None:
+        match_rule = _build_match_rule(action, target)
+        _MATCH_RULE_CACHE[key] = match_rule
+    return match_rule
+
+
 # This check is registered as 'tenant_id' so that it can override
 # GenericCheck which was used for validating parent resource ownership.
 # This will prevent us from having to handling backward compatibility
@@ -321,7 +368,7 @@ def _prepare_check(context, action, target):
     # Compare with None to distinguish case in which target is {}
     if target is None:
         target = {}
-    match_rule = _build_match_rule(action, target)
+    match_rule = _get_match_rule(action, target)
     credentials = context.to_dict()
     return match_rule, target, credentials
 
@@ -359,6 +406,30 @@ def check_if_exists(context, action, target):
     return policy.check(*(_prepare_check(context, action, target)))
 
 
+def check_items(context, action, targets, must_exist=False):
+    """Verify that the action is valid on each of the targets.
+
+    The policy is loaded and the credentials are built once for all the
+    targets, and the match rule is built once per set of attributes of the
+    targets.
+
+    :param context: neutron context
+    :param action: string representing the action to be checked
+    :param targets: list of dictionaries representing the objects
+    :param must_exist: raise a PolicyRuleNotFound exception if the action
+        is not defined in the policy engine, like check_if_exists.
+
+    :return: Returns a list with the result of the check of each target.
+    """
+    init()
+    if must_exist and (not policy._rules or action not in policy._rules):
+        raise exceptions.PolicyRuleNotFound(rule=action)
+    credentials = context.to_dict()
+    return [policy.check(_get_match_rule(action, target), target,
+                         credentials)
+            for target in targets]
+
+
 def enforce(context, action, target, plugin=None):
     """Verifies that the action is valid on the target in this context.
 
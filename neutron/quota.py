@@ -30,6 +30,7 @@ LOG = logging.getLogger(__name__)
 QUOTA_DB_MODULE = 'neutron.db.quota_db'
 QUOTA_DB_DRIVER = 'neutron.db.quota_db.DbQuotaDriver'
 QUOTA_CONF_DRIVER = 'neutron.quota.ConfDriver'
+QUOTA_TRACKED_DRIVER = 'neutron.db.quota_db.TrackedUsageQuotaDriver'
 
 quota_opts = [
     cfg.ListOpt('quota_items',
@@ -55,6 +56,11 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default=QUOTA_DB_DRIVER,
                help=_('Default driver to use for quota checks')),
+    cfg.IntOpt('reservation_expiration',
+               default=120,
+               help=_('Number of seconds after which the resources '
+                      'reserved by a request are released, when the '
+                      'quota driver tracks the usage of the resources.')),
 ]
 # Register the configuration options
 cfg.CONF.register_opts(quota_opts, 'QUOTAS')
@@ -223,7 +229,7 @@ class QuotaEngine(object):
         if self._driver is None:
             _driver_class = (self._driver_class or
                              cfg.CONF.QUOTAS.quota_driver)
-            if (_driver_class == QUOTA_DB_DRIVER and
+            if (_driver_class in (QUOTA_DB_DRIVER, QUOTA_TRACKED_DRIVER) and
                     QUOTA_DB_MODULE not in sys.modules):
                 # If quotas table is not loaded, force config quota driver.
                 _driver_class = QUOTA_CONF_DRIVER
@@ -301,6 +307,44 @@ class QuotaEngine(object):
         return self.get_driver().limit_check(context, tenant_id,
                                              self._resources, values)
 
+    def make_reservation(self, context, tenant_id, resource, delta,
+                         *args, **kwargs):
+        """Check the quota of new resources and reserve them.
+
+        When the driver keeps track of the usage of the resource, the new
+        resources are reserved until the reservation is committed or
+        cancelled. Otherwise the resource is counted, passing the
+        arguments following delta to the count function, and its limit is
+        checked.
+
+        :param context: The request context, for access checks.
+        :param tenant_id: The tenant_id to check the quota.
+        :param resource: The name of the resource, as a string.
+        :param delta: The number of resources to create.
+        :return: The id of the reservation, or None if nothing was
+                 reserved.
+        """
+        if resource not in self._resources:
+            raise exceptions.QuotaResourceUnknown(unknown=[resource])
+        driver = self.get_driver()
+        if getattr(driver, 'tracks_usage', None) and driver.tracks_usage(
+                resource):
+            return driver.make_reservation(context, tenant_id,
+                                           self._resources,
+                                           {resource: delta})
+        count = self.count(context, resource, *args, **kwargs)
+        self.limit_check(context, tenant_id, **{resource: count + delta})
+
+    def commit_reservation(self, context, reservation_id):
+        """Release a reservation once its resources were created."""
+        if reservation_id:
+            self.get_driver().commit_reservation(context, reservation_id)
+
+    def cancel_reservation(self, context, reservation_id):
+        """Release a reservation of resources which were not created."""
+        if reservation_id:
+            self.get_driver().cancel_reservation(context, reservation_id)
+
     @property
     def resources(self):
         return self._resources
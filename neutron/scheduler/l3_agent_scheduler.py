@@ -20,13 +20,16 @@ import random
 
 import six
 from sqlalchemy.orm import exc
+from sqlalchemy import sql
 from sqlalchemy.sql import exists
 
 from neutron.common import constants
 from neutron.db import agents_db
 from neutron.db import l3_agentschedulers_db
 from neutron.db import l3_db
+from neutron.db import models_v2
 from neutron.openstack.common import log as logging
+from neutron.openstack.common import uuidutils
 
 
 LOG = logging.getLogger(__name__)
@@ -68,54 +71,77 @@ class L3Scheduler(object):
             if agents_db.AgentDbMixin.is_agent_down(
                 l3_agent.heartbeat_timestamp):
                 LOG.warn(_('L3 agent %s is not active'), l3_agent.id)
-            # check if each of the specified routers is hosted
-            if router_ids:
-                unscheduled_router_ids = []
-                for router_id in router_ids:
-                    l3_agents = plugin.get_l3_agents_hosting_routers(
-                        context, [router_id], admin_state_up=True)
-                    if l3_agents:
-                        LOG.debug(_('Router %(router_id)s has already been'
-                                    ' hosted by L3 agent %(agent_id)s'),
-                                  {'router_id': router_id,
-                                   'agent_id': l3_agents[0]['id']})
-                    else:
-                        unscheduled_router_ids.append(router_id)
-                if not unscheduled_router_ids:
+            routers = self._get_unscheduled_routers(context, router_ids)
+            if not routers:
+                if router_ids:
                     # all (specified) routers are already scheduled
-                    return False
-            else:
-                # get all routers that are not hosted
-                #TODO(gongysh) consider the disabled agent's router
-                stmt = ~exists().where(
-                    l3_db.Router.id ==
-                    l3_agentschedulers_db.RouterL3AgentBinding.router_id)
-                unscheduled_router_ids = [router_id_[0] for router_id_ in
-                                          context.session.query(
-                                              l3_db.Router.id).filter(stmt)]
-                if not unscheduled_router_ids:
+                    LOG.debug(_('Routers %s have already been hosted'),
+                              router_ids)
+                else:
                     LOG.debug(_('No non-hosted routers'))
-                    return False
+                return False
 
             # check if the configuration of l3 agent is compatible
             # with the router
-            routers = plugin.get_routers(
-                context, filters={'id': unscheduled_router_ids})
-            to_removed_ids = []
-            for router in routers:
-                candidates = plugin.get_l3_agent_candidates(router, [l3_agent])
-                if not candidates:
-                    to_removed_ids.append(router['id'])
-            router_ids = set([r['id'] for r in routers]) - set(to_removed_ids)
+            router_ids = self._filter_compatible_routers(plugin, routers,
+                                                         l3_agent)
             if not router_ids:
                 LOG.warn(_('No routers compatible with L3 agent configuration'
                            ' on host %s'), host)
                 return False
 
-            for router_id in router_ids:
-                self.bind_router(context, router_id, l3_agent)
+            self.bind_routers(context, router_ids, l3_agent)
         return True
 
+    def _get_unscheduled_routers(self, context, router_ids):
+        """Return the routers which are not hosted.
+
+        The routers are returned as dicts with the id and the external
+        gateway info used to check the compatibility with the agents.
+        If router_ids is given, the routers hosted by disabled agents are
+        returned too.
+        """
+        binding = l3_agentschedulers_db.RouterL3AgentBinding
+        query = context.session.query(l3_db.Router.id,
+                                      models_v2.Port.network_id)
+        query = query.outerjoin(
+            models_v2.Port, l3_db.Router.gw_port_id == models_v2.Port.id)
+        if router_ids:
+            query = query.filter(l3_db.Router.id.in_(router_ids))
+            hosted = exists().where(sql.and_(
+                binding.router_id == l3_db.Router.id,
+                binding.l3_agent_id == agents_db.Agent.id,
+                agents_db.Agent.admin_state_up == True))
+        else:
+            #TODO(gongysh) consider the disabled agent's router
+            hosted = exists().where(l3_db.Router.id == binding.router_id)
+        query = query.filter(~hosted)
+        return [{'id': router_id,
+                 'external_gateway_info': (network_id and
+                                           {'network_id': network_id})}
+                for router_id, network_id in query]
+
+    def _filter_compatible_routers(self, plugin, routers, l3_agent):
+        """Return the ids of the routers which l3_agent can host."""
+        agent_conf = plugin.get_configuration_dict(l3_agent)
+        if not agent_conf.get('use_namespaces', True):
+            # Such an agent only hosts the router it is configured with
+            routers = [router for router in routers
+                       if router['id'] == agent_conf.get('router_id')]
+        # The compatibility only depends on the gateway network otherwise,
+        # so it is checked once per network
+        routers_by_network = {}
+        for router in routers:
+            network_id = (router['external_gateway_info'] or {}).get(
+                'network_id')
+            routers_by_network.setdefault(network_id, []).append(router)
+        router_ids = []
+        for network_routers in routers_by_network.itervalues():
+            if plugin.get_l3_agent_candidates(network_routers[0],
+                                              [l3_agent]):
+                router_ids.extend(router['id'] for router in network_routers)
+        return router_ids
+
     def get_candidates(self, plugin, context, sync_router):
         """Return L3 agents where a router could be scheduled."""
         with context.session.begin(subtransactions=True):
@@ -157,6 +183,23 @@ class L3Scheduler(object):
                       {'router_id': router_id,
                        'agent_id': chosen_agent.id})
 
+    def bind_routers(self, context, router_ids, chosen_agent):
+        """Bind the routers to the l3 agent in a single insert."""
+        if not router_ids:
+            return
+        binding_table = l3_agentschedulers_db.RouterL3AgentBinding.__table__
+        with context.session.begin(subtransactions=True):
+            context.session.execute(
+                binding_table.insert(),
+                [{'id': uuidutils.generate_uuid(),
+                  'router_id': router_id,
+                  'l3_agent_id': chosen_agent.id}
+                 for router_id in router_ids])
+        LOG.debug(_('Routers %(router_ids)s are scheduled to '
+                    'L3 agent %(agent_id)s'),
+                  {'router_ids': router_ids,
+                   'agent_id': chosen_agent.id})
+
 
 class ChanceScheduler(L3Scheduler):
     """Randomly allocate an L3 agent for a router."""
@@ -37,7 +37,12 @@ from neutron.plugins.common import constants
 
 class L3RouterPluginRpcCallbacks(l3_rpc_base.L3RpcCallbackMixin):
 
-    RPC_API_VERSION = '1.1'
+    # history
+    #   1.0 Initial version
+    #   1.1 Floating IP operational status updates
+    #   1.2 Support sync_changed_routers
+
+    RPC_API_VERSION = '1.2'
 
     def create_rpc_dispatcher(self):
         """Get the rpc dispatcher for this manager.
@@ -64,6 +69,9 @@ class L3RouterPlugin(db_base_plugin_v2.CommonDbMixin,
     supported_extension_aliases = ["router", "ext-gw-mode",
                                    "extraroute", "l3_agent_scheduler"]
 
+    __native_pagination_support = True
+    __native_sorting_support = True
+
     def __init__(self):
         qdbapi.register_models(base=model_base.BASEV2)
         self.setup_rpc()
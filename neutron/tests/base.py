@@ -20,11 +20,13 @@
 import contextlib
 import logging
 import os
+import sqlite3
 
 import eventlet.timeout
 import fixtures
 import mock
 from oslo.config import cfg
+import sqlalchemy
 import testtools
 
 from neutron import manager
@@ -40,6 +42,42 @@ def fake_use_fatal_exceptions(*args):
     return True
 
 
+# pysqlite commits the transaction before a SAVEPOINT, so that
+# Session.begin_nested() can't work with its default transaction handling.
+# The transactions of the test database are begun by SQLAlchemy instead.
+# The connections of the in-memory database share a single sqlite
+# connection, so a transaction begun through one of them is not begun again.
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    info = connection.connection.info
+    if not info.get('in_transaction'):
+        connection.execute('BEGIN')
+        info['in_transaction'] = True
+
+
+def _sqlite_end(connection):
+    if connection.dialect.name == 'sqlite':
+        connection.connection.info['in_transaction'] = False
+
+
+def _sqlite_reset(dbapi_connection, connection_record):
+    connection_record.info['in_transaction'] = False
+
+
+sqlalchemy.event.listen(sqlalchemy.pool.Pool, 'connect', _sqlite_connect)
+sqlalchemy.event.listen(sqlalchemy.pool.Pool, 'reset', _sqlite_reset)
+sqlalchemy.event.listen(sqlalchemy.engine.Engine, 'begin', _sqlite_begin)
+sqlalchemy.event.listen(sqlalchemy.engine.Engine, 'commit', _sqlite_end)
+sqlalchemy.event.listen(sqlalchemy.engine.Engine, 'rollback', _sqlite_end)
+
+
 class BaseTestCase(testtools.TestCase):
 
     def _cleanup_coreplugin(self):
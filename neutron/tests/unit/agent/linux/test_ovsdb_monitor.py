@@ -14,10 +14,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import eventlet.event
 import mock
 
 from neutron.agent.linux import ovsdb_monitor
+from neutron.openstack.common import jsonutils
 from neutron.tests import base
 
 
@@ -110,3 +113,86 @@ class TestSimpleInterfaceMonitor(base.BaseTestCase):
                 return_value=output):
             self.monitor._read_stdout()
         self.assertFalse(self.monitor.data_received)
+
+    def mock_is_active(self, return_value=True):
+        target = ('neutron.agent.linux.ovsdb_monitor.SimpleInterfaceMonitor'
+                  '.is_active')
+        return mock.patch(target,
+                          new_callable=mock.PropertyMock(
+                              return_value=return_value))
+
+    def _encode_update(self, *rows):
+        headings = ['row', 'action', 'name', 'ofport', 'external_ids']
+        return jsonutils.dumps({'headings': headings, 'data': list(rows)})
+
+    def _iface_row(self, action, name, ofport=1):
+        return ['%s-uuid' % name, action, name, ofport,
+                ['map', [['iface-id', '%s-id' % name]]]]
+
+    def _mock_output(self, *lines):
+        return mock.patch.object(self.monitor, 'iter_stdout',
+                                 return_value=list(lines))
+
+    def test_process_events_collects_added_and_removed_interfaces(self):
+        output = [self._encode_update(self._iface_row('insert', 'tap1'),
+                                      self._iface_row('insert', 'tap2',
+                                                      ['set', []])),
+                  self._encode_update(self._iface_row('old', 'tap2', ''),
+                                      self._iface_row('new', 'tap2', 2),
+                                      self._iface_row('delete', 'tap3'))]
+        with self._mock_output(*output):
+            self.assertTrue(self.monitor.process_events())
+        self.assertEqual(
+            {'added': [{'name': 'tap1', 'ofport': 1,
+                        'external_ids': {'iface-id': 'tap1-id'}},
+                       {'name': 'tap2', 'ofport': 2,
+                        'external_ids': {'iface-id': 'tap2-id'}}],
+             'removed': [{'name': 'tap3',
+                          'external_ids': {'iface-id': 'tap3-id'}}]},
+            self.monitor.new_events)
+
+    def test_process_events_drops_interfaces_added_then_removed(self):
+        output = [self._encode_update(self._iface_row('insert', 'tap1')),
+                  self._encode_update(self._iface_row('delete', 'tap1'))]
+        with self._mock_output(*output):
+            self.monitor.process_events()
+        self.assertEqual([], self.monitor.new_events['added'])
+        self.assertEqual(['tap1'], [device['name'] for device
+                                    in self.monitor.new_events['removed']])
+
+    def test_get_events_returns_none_when_events_were_lost(self):
+        with contextlib.nested(
+            self.mock_is_active(),
+            self._mock_output(
+                self._encode_update(self._iface_row('initial', 'tap1')))
+        ):
+            self.assertIsNone(self.monitor.get_events())
+        with contextlib.nested(
+            self.mock_is_active(),
+            self._mock_output(
+                self._encode_update(self._iface_row('insert', 'tap2')))
+        ):
+            events = self.monitor.get_events()
+        self.assertEqual(['tap2'],
+                         [device['name'] for device in events['added']])
+        self.assertEqual({'added': [], 'removed': []},
+                         self.monitor.new_events)
+
+    def test_get_events_returns_none_if_not_active(self):
+        self.monitor.events_lost = False
+        with self.mock_is_active(False):
+            self.assertIsNone(self.monitor.get_events())
+        self.assertTrue(self.monitor.events_lost)
+
+    def test_get_events_returns_none_for_unparsable_output(self):
+        self.monitor.events_lost = False
+        with contextlib.nested(self.mock_is_active(),
+                               self._mock_output('foo')):
+            self.assertIsNone(self.monitor.get_events())
+
+    def test__kill_sets_events_lost(self):
+        self.monitor.events_lost = False
+        with mock.patch(
+                'neutron.agent.linux.ovsdb_monitor.OvsdbMonitor._kill'):
+            self.monitor._kill()
+        self.assertTrue(self.monitor.events_lost)
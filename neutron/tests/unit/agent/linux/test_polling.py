@@ -86,6 +86,10 @@ class TestAlwaysPoll(base.BaseTestCase):
         pm = polling.AlwaysPoll()
         self.assertTrue(pm.is_polling_required)
 
+    def test_get_events_returns_none(self):
+        pm = polling.AlwaysPoll()
+        self.assertIsNone(pm.get_events())
+
 
 class TestInterfacePollingMinimizer(base.BaseTestCase):
 
@@ -103,6 +107,11 @@ class TestInterfacePollingMinimizer(base.BaseTestCase):
             self.pm.stop()
         mock_stop.assert_called_with()
 
+    def test_get_events_returns_monitor_events(self):
+        with mock.patch.object(self.pm._monitor, 'get_events',
+                               return_value=mock.sentinel.events):
+            self.assertEqual(mock.sentinel.events, self.pm.get_events())
+
     def mock_has_updates(self, return_value):
         target = ('neutron.agent.linux.ovsdb_monitor.SimpleInterfaceMonitor'
                   '.has_updates')
@@ -15,7 +15,9 @@
 
 import contextlib
 
+import eventlet
 import mock
+from oslo.config import cfg
 
 from neutron.api.rpc.agentnotifiers import dhcp_rpc_agent_api
 from neutron.common import utils
@@ -74,3 +76,44 @@ class TestDhcpAgentNotifyAPI(base.BaseTestCase):
                 self._test_notification([agent])
         self.assertEqual(mock_cast.call_count, 1)
         self.assertEqual(mock_log.call_count, 1)
+
+    def _notify_port(self, method, port_id, network_id='net_id'):
+        self.notify.notify(mock.Mock(),
+                           {'port': {'id': port_id,
+                                     'network_id': network_id}},
+                           method)
+
+    def test_batched_notifications(self):
+        cfg.CONF.set_override('agent_notification_batch_interval', 1)
+        agent = mock.Mock(topic='dhcp_agent', host='host1')
+        with contextlib.nested(
+            mock.patch.object(manager.NeutronManager, 'get_plugin'),
+            mock.patch.object(utils, 'is_extension_supported',
+                              return_value=True),
+            mock.patch.object(self.notify, '_get_enabled_dhcp_agents',
+                              return_value=[agent]),
+            mock.patch.object(self.notify, 'cast'),
+            mock.patch.object(eventlet, 'spawn_after')
+        ) as (get_plugin, ext_supported, get_agents, cast, spawn_after):
+            get_plugin.return_value.schedule_network.return_value = []
+            self._notify_port('port.create.end', 'port1')
+            self._notify_port('port.create.end', 'port2')
+            self._notify_port('port.update.end', 'port1')
+            self._notify_port('port.delete.end', 'port2')
+            self.assertFalse(cast.called)
+            spawn_after.assert_called_once_with(
+                1, self.notify._send_pending_notifications)
+
+            self.notify._send_pending_notifications()
+        self.assertEqual({}, self.notify._pending)
+        self.assertEqual(1, cast.call_count)
+        msg = cast.call_args[0][1]
+        self.assertEqual('batched_notifications', msg['method'])
+        self.assertEqual(
+            [{'method': 'port_update_end',
+              'payload': {'port': {'id': 'port1', 'network_id': 'net_id'}}},
+             {'method': 'port_delete_end',
+              'payload': {'port_id': 'port2'}}],
+            msg['args']['payload']['notifications'])
+        self.assertEqual('dhcp_agent.host1', cast.call_args[1]['topic'])
+        self.assertEqual('1.1', cast.call_args[1]['version'])
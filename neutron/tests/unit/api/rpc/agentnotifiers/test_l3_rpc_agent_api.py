@@ -0,0 +1,75 @@
+# Copyright (c) 2014 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+
+import eventlet
+import mock
+from oslo.config import cfg
+
+from neutron.api.rpc.agentnotifiers import l3_rpc_agent_api
+from neutron.common import utils
+from neutron import manager
+from neutron.tests import base
+
+
+class TestL3AgentNotifyAPI(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestL3AgentNotifyAPI, self).setUp()
+        self.notify = l3_rpc_agent_api.L3AgentNotifyAPI()
+        self.plugin = mock.Mock()
+        mock.patch.object(manager.NeutronManager, 'get_service_plugins',
+                          return_value={'L3_ROUTER_NAT': self.plugin}).start()
+        mock.patch.object(utils, 'is_extension_supported',
+                          return_value=True).start()
+
+    def _binding(self, router_id, host, active=True):
+        agent = mock.Mock(topic='l3_agent', host=host, admin_state_up=True,
+                          is_active=active)
+        return mock.Mock(router_id=router_id, l3_agent=agent)
+
+    def test_routers_updated(self):
+        agent = mock.Mock(topic='l3_agent', host='host1')
+        self.plugin.get_l3_agents_hosting_routers.return_value = [agent]
+        with mock.patch.object(self.notify, 'cast') as cast:
+            self.notify.routers_updated(mock.Mock(), ['r1', 'r2'])
+        self.assertEqual(2, cast.call_count)
+        self.assertEqual(2, self.plugin.get_l3_agents_hosting_routers.
+                         call_count)
+
+    def test_batched_routers_updated(self):
+        cfg.CONF.set_override('agent_notification_batch_interval', 1)
+        self.plugin._get_l3_bindings_hosting_routers.return_value = [
+            self._binding('r1', 'host1'), self._binding('r2', 'host1'),
+            self._binding('r1', 'host2'), self._binding('r2', 'host3',
+                                                        active=False)]
+        with contextlib.nested(
+            mock.patch.object(self.notify, 'cast'),
+            mock.patch.object(eventlet, 'spawn_after')
+        ) as (cast, spawn_after):
+            self.notify.routers_updated(mock.Mock(), ['r1'])
+            self.notify.routers_updated(mock.Mock(), ['r2', 'r1'])
+            self.assertFalse(cast.called)
+            spawn_after.assert_called_once_with(
+                1, self.notify._send_pending_routers)
+            self.notify._send_pending_routers()
+        self.assertEqual(set(), self.notify._pending_router_ids)
+        get_bindings = self.plugin._get_l3_bindings_hosting_routers
+        self.assertEqual(['r1', 'r2'], sorted(get_bindings.call_args[0][1]))
+        casts = dict((c[1]['topic'], c[0][1]['args']['routers'])
+                     for c in cast.call_args_list)
+        self.assertEqual({'l3_agent.host1': ['r1', 'r2'],
+                          'l3_agent.host2': ['r1']}, casts)
@@ -243,14 +243,14 @@ class TestCiscoPortsV2(CiscoML2MechanismTestCase,
 
         with mock.patch('__builtin__.hasattr',
                         new=fakehasattr):
-            plugin_obj = NeutronManager.get_plugin()
-            orig = plugin_obj.create_port
-            with mock.patch.object(plugin_obj,
-                                   'create_port') as patched_plugin:
+            mech_manager = NeutronManager.get_plugin().mechanism_manager
+            orig = mech_manager.create_port_precommit
+            with mock.patch.object(mech_manager,
+                                   'create_port_precommit') as patched_plugin:
 
                 def side_effect(*args, **kwargs):
-                    return self._do_side_effect(patched_plugin, orig,
-                                                *args, **kwargs)
+                    return self._fail_second_call(patched_plugin, orig,
+                                                  *args, **kwargs)
 
                 patched_plugin.side_effect = side_effect
                 with self.network() as net:
@@ -277,14 +277,14 @@ class TestCiscoPortsV2(CiscoML2MechanismTestCase,
             self.skipTest("Plugin does not support native bulk port create")
         ctx = context.get_admin_context()
         with self.network() as net:
-            plugin_obj = NeutronManager.get_plugin()
-            orig = plugin_obj.create_port
-            with mock.patch.object(plugin_obj,
-                                   'create_port') as patched_plugin:
+            mech_manager = NeutronManager.get_plugin().mechanism_manager
+            orig = mech_manager.create_port_precommit
+            with mock.patch.object(mech_manager,
+                                   'create_port_precommit') as patched_plugin:
 
                 def side_effect(*args, **kwargs):
-                    return self._do_side_effect(patched_plugin, orig,
-                                                *args, **kwargs)
+                    return self._fail_second_call(patched_plugin, orig,
+                                                  *args, **kwargs)
 
                 patched_plugin.side_effect = side_effect
                 res = self._create_port_bulk(self.fmt, 2, net['network']['id'],
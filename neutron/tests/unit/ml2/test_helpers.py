@@ -0,0 +1,156 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+
+import mock
+
+from neutron.db import api as db
+from neutron.openstack.common.db import exception as db_exc
+from neutron.plugins.ml2.drivers import helpers
+from neutron.plugins.ml2.drivers import type_vlan
+from neutron.tests import base
+
+PHYS_NET = 'physnet1'
+VLAN_MODEL = type_vlan.VlanAllocation
+
+
+class HelpersTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(HelpersTest, self).setUp()
+        db.configure_db()
+        self.session = db.get_session()
+        self.addCleanup(db.clear_db)
+
+    def _allocate(self, ranges, physical_network=PHYS_NET):
+        with self.session.begin():
+            return helpers.allocate_segmentation_id(
+                self.session, VLAN_MODEL, VLAN_MODEL.vlan_id, ranges,
+                physical_network=physical_network)
+
+    def _add_allocation(self, vlan_id, physical_network=PHYS_NET):
+        with self.session.begin():
+            self.session.add(VLAN_MODEL(physical_network=physical_network,
+                                        vlan_id=vlan_id, allocated=True))
+
+    def test_merge_ranges(self):
+        self.assertEqual([(1, 20), (30, 40)],
+                         helpers.merge_ranges([(30, 40), (5, 20), (1, 10),
+                                               (11, 12)]))
+        self.assertEqual([(1, 20)], helpers.merge_ranges([(11, 20), (1, 10)]))
+        self.assertEqual([], helpers.merge_ranges([]))
+
+    def test_nth_free_id(self):
+        ranges = [(10, 14), (20, 24)]
+        self.assertEqual(10, helpers._nth_free_id(ranges, [], 0))
+        self.assertEqual(20, helpers._nth_free_id(ranges, [], 5))
+        self.assertEqual(13, helpers._nth_free_id(ranges, [10, 11, 12], 0))
+        self.assertEqual(20, helpers._nth_free_id(ranges, [12, 13], 3))
+        self.assertEqual(24, helpers._nth_free_id(ranges, [21, 22, 23], 6))
+        self.assertIsNone(helpers._nth_free_id(ranges, [], 10))
+
+    def test_allocate_segmentation_id(self):
+        alloc = self._allocate([(10, 14)])
+        self.assertTrue(alloc.allocated)
+        self.assertEqual(PHYS_NET, alloc.physical_network)
+        self.assertTrue(10 <= alloc.vlan_id <= 14)
+        self.assertEqual(alloc, self.session.query(VLAN_MODEL).one())
+
+    def test_allocate_segmentation_id_random(self):
+        with mock.patch.object(helpers.random, 'randrange',
+                               return_value=7) as randrange:
+            alloc = self._allocate([(10, 14), (20, 24)])
+        randrange.assert_called_once_with(10)
+        self.assertEqual(22, alloc.vlan_id)
+
+    def test_allocate_segmentation_id_mostly_allocated(self):
+        for vlan_id in (10, 11, 13, 14):
+            self._add_allocation(vlan_id)
+        # Allocations of another physical network do not count
+        self._add_allocation(12, 'physnet2')
+        with mock.patch.object(helpers.random, 'randrange',
+                               side_effect=[0] * helpers.MAX_RANDOM_ATTEMPTS +
+                               [0]) as randrange:
+            alloc = self._allocate([(10, 14)])
+        self.assertEqual(12, alloc.vlan_id)
+        randrange.assert_called_with(1)
+
+    def test_allocate_segmentation_id_exhausted(self):
+        for vlan_id in range(10, 15):
+            self._add_allocation(vlan_id)
+        # Allocations outside the ranges do not count
+        self._add_allocation(100)
+        self.assertIsNone(self._allocate([(10, 14)]))
+        self.assertIsNone(self._allocate([]))
+
+    def test_allocate_segmentation_id_all(self):
+        vlan_ids = set(self._allocate([(10, 19)]).vlan_id for i in range(10))
+        self.assertEqual(set(range(10, 20)), vlan_ids)
+        self.assertIsNone(self._allocate([(10, 19)]))
+
+    def test_allocate_segmentation_id_concurrent(self):
+        # Another allocation inserted 12 after it was checked, so that the
+        # row is rejected by the primary key and rolled back to a savepoint
+        self._add_allocation(12)
+        with mock.patch.object(helpers, '_pick_free_id',
+                               side_effect=[12, 13]):
+            with self.session.begin():
+                self.session.add(VLAN_MODEL(physical_network='physnet2',
+                                            vlan_id=12, allocated=True))
+                alloc = helpers.allocate_segmentation_id(
+                    self.session, VLAN_MODEL, VLAN_MODEL.vlan_id,
+                    [(10, 14)], physical_network=PHYS_NET)
+        self.assertEqual(13, alloc.vlan_id)
+        # The enclosing transaction was committed
+        self.assertEqual(
+            [('physnet1', 12), ('physnet1', 13), ('physnet2', 12)],
+            sorted((a.physical_network, a.vlan_id)
+                   for a in self.session.query(VLAN_MODEL)))
+
+    def test_insert_allocation_duplicate_row(self):
+        self._add_allocation(12)
+        with self.session.begin():
+            self.assertIsNone(helpers.insert_allocation(
+                self.session, VLAN_MODEL, physical_network=PHYS_NET,
+                vlan_id=12))
+        self.assertEqual(1, self.session.query(VLAN_MODEL).count())
+
+    def test_allocate_segmentation_id_concurrent_exhausted(self):
+        with contextlib.nested(
+            mock.patch.object(helpers, '_pick_free_id', return_value=12),
+            mock.patch.object(helpers, 'insert_allocation',
+                              return_value=None)
+        ) as (pick_free_id, insert_allocation):
+            self.assertIsNone(self._allocate([(10, 14)]))
+        self.assertEqual(helpers.MAX_INSERT_ATTEMPTS,
+                         insert_allocation.call_count)
+
+    def test_insert_allocation_savepoint(self):
+        session = mock.MagicMock()
+        alloc = helpers.insert_allocation(session, VLAN_MODEL,
+                                          physical_network=PHYS_NET,
+                                          vlan_id=12)
+        self.assertEqual(12, alloc.vlan_id)
+        self.assertTrue(alloc.allocated)
+        session.begin_nested.assert_called_once_with()
+        session.add.assert_called_once_with(alloc)
+
+    def test_insert_allocation_duplicate(self):
+        session = mock.MagicMock()
+        savepoint = session.begin_nested.return_value
+        savepoint.__exit__.side_effect = db_exc.DBDuplicateEntry()
+        self.assertIsNone(helpers.insert_allocation(
+            session, VLAN_MODEL, physical_network=PHYS_NET, vlan_id=12))
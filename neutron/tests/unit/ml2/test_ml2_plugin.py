@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 import testtools
 import webob
@@ -102,6 +104,101 @@ class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
             self.assertEqual(port['port']['status'], 'DOWN')
             self.assertEqual(self.port_create_status, 'DOWN')
 
+    def _test_create_ports_bulk_precommit_failure(self):
+        # The native bulk create doesn't go through create_port, fail the
+        # precommit of the second port instead
+        mech_manager = manager.NeutronManager.get_plugin().mechanism_manager
+        orig = mech_manager.create_port_precommit
+        with mock.patch.object(mech_manager,
+                               'create_port_precommit') as patched:
+
+            def side_effect(*args, **kwargs):
+                return self._fail_second_call(patched, orig,
+                                              *args, **kwargs)
+
+            patched.side_effect = side_effect
+            with self.network() as net:
+                res = self._create_port_bulk(self.fmt, 2,
+                                             net['network']['id'],
+                                             'test', True)
+                self._validate_behavior_on_bulk_failure(
+                    res, 'ports', webob.exc.HTTPServerError.code)
+
+    def test_create_ports_bulk_emulated_plugin_failure(self):
+        self._test_create_ports_bulk_precommit_failure()
+
+    def test_create_ports_bulk_native_plugin_failure(self):
+        self._test_create_ports_bulk_precommit_failure()
+
+    def test_create_ports_bulk_postcommit_failure(self):
+        plugin = manager.NeutronManager.get_plugin()
+        with self.network() as net:
+            with mock.patch.object(plugin.mechanism_manager,
+                                   'create_port_postcommit',
+                                   side_effect=ml2_exc.MechanismDriverError(
+                                       method='create_port_postcommit')):
+                res = self._create_port_bulk(self.fmt, 2,
+                                             net['network']['id'],
+                                             'test', True)
+                self._validate_behavior_on_bulk_failure(
+                    res, 'ports', webob.exc.HTTPServerError.code)
+
+    def test_create_ports_bulk_allocates_once_per_network(self):
+        plugin = manager.NeutronManager.get_plugin()
+        with self.subnet() as subnet:
+            net_id = subnet['subnet']['network_id']
+            with contextlib.nested(
+                mock.patch.object(plugin, '_generate_mac'),
+                mock.patch.object(plugin, '_generate_ip'),
+                mock.patch.object(plugin, '_generate_macs',
+                                  wraps=plugin._generate_macs),
+                mock.patch.object(plugin, '_generate_ips',
+                                  wraps=plugin._generate_ips),
+                mock.patch.object(plugin.notifier,
+                                  'security_groups_member_updated')
+            ) as (gen_mac, gen_ip, gen_macs, gen_ips, sg_notify):
+                res = self._create_port_bulk(self.fmt, 3, net_id, 'test',
+                                             True)
+            ports = self.deserialize(self.fmt, res)['ports']
+            self.assertEqual(3, len(ports))
+            self.assertEqual(3, len(set(p['mac_address'] for p in ports)))
+            self.assertEqual(['10.0.0.2', '10.0.0.3', '10.0.0.4'],
+                             [p['fixed_ips'][0]['ip_address'] for p in ports])
+            self.assertFalse(gen_mac.called)
+            self.assertFalse(gen_ip.called)
+            self.assertEqual(1, gen_macs.call_count)
+            self.assertEqual(1, gen_ips.call_count)
+            self.assertEqual(1, sg_notify.call_count)
+            for port in ports:
+                self._delete('ports', port['id'])
+
+    def test_create_ports_bulk_with_fixed_ips(self):
+        with self.subnet() as subnet:
+            net_id = subnet['subnet']['network_id']
+            fixed_ips = [{'subnet_id': subnet['subnet']['id'],
+                          'ip_address': '10.0.0.2'}]
+            res = self._create_port_bulk(
+                self.fmt, 2, net_id, 'test', True,
+                override={1: {'fixed_ips': fixed_ips,
+                              'mac_address': '00:11:22:33:44:55'}})
+            ports = self.deserialize(self.fmt, res)['ports']
+            self.assertEqual('10.0.0.3',
+                             ports[0]['fixed_ips'][0]['ip_address'])
+            self.assertEqual('10.0.0.2',
+                             ports[1]['fixed_ips'][0]['ip_address'])
+            self.assertEqual('00:11:22:33:44:55', ports[1]['mac_address'])
+            for port in ports:
+                self._delete('ports', port['id'])
+
+    def test_create_ports_bulk_duplicate_mac(self):
+        with self.network() as net:
+            mac = {'mac_address': '00:11:22:33:44:55'}
+            res = self._create_port_bulk(self.fmt, 2, net['network']['id'],
+                                         'test', True,
+                                         override={0: mac, 1: mac})
+            self._validate_behavior_on_bulk_failure(
+                res, 'ports', webob.exc.HTTPConflict.code)
+
     def test_update_non_existent_port(self):
         ctx = context.get_admin_context()
         plugin = manager.NeutronManager.get_plugin()
@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 
 from neutron import context
@@ -85,6 +87,57 @@ class PortBindingTestCase(test_plugin.NeutronDbPluginV2TestCase):
                                 portbindings.VIF_TYPE_BRIDGE,
                                 True, True)
 
+    def test_get_devices_details_list(self):
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                self.port(subnet=subnet, arg_list=(portbindings.HOST_ID,),
+                          **{portbindings.HOST_ID: 'host-ovs-no_filter'}),
+                self.port(subnet=subnet)
+            ) as (bound, unbound):
+                bound_id = bound['port']['id']
+                unbound_id = unbound['port']['id']
+                devices = ['tap' + bound_id[:11], unbound_id, 'unknown']
+                neutron_context = context.get_admin_context()
+                details = self.plugin.callbacks.get_devices_details_list(
+                    neutron_context, agent_id="theAgentId", devices=devices)
+                self.assertEqual(devices, [d['device'] for d in details])
+                self.assertEqual(bound_id, details[0]['port_id'])
+                self.assertEqual('local', details[0]['network_type'])
+                self.assertEqual({'device': unbound_id}, details[1])
+                self.assertEqual({'device': 'unknown'}, details[2])
+                self.assertEqual(
+                    details[0], self.plugin.callbacks.get_device_details(
+                        neutron_context, agent_id="theAgentId",
+                        device=devices[0]))
+
+    def test_update_devices_up_and_down(self):
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                self.port(subnet=subnet, arg_list=(portbindings.HOST_ID,),
+                          **{portbindings.HOST_ID: 'host-ovs-no_filter'}),
+                self.port(subnet=subnet, arg_list=(portbindings.HOST_ID,),
+                          **{portbindings.HOST_ID: 'host-bridge-filter'})
+            ) as (bound, other):
+                devices = [bound['port']['id'], other['port']['id']]
+                neutron_context = context.get_admin_context()
+                with mock.patch.object(self.plugin,
+                                       'update_port_status',
+                                       return_value=False) as update_status:
+                    self.plugin.callbacks.update_devices_up(
+                        neutron_context, agent_id="theAgentId",
+                        devices=devices, host='host-ovs-no_filter')
+                    update_status.assert_called_once_with(
+                        neutron_context, devices[0], 'ACTIVE')
+                    update_status.reset_mock()
+                    result = self.plugin.callbacks.update_devices_down(
+                        neutron_context, agent_id="theAgentId",
+                        devices=devices, host='host-ovs-no_filter')
+                    update_status.assert_called_once_with(
+                        neutron_context, devices[0], 'DOWN')
+                self.assertEqual([{'device': devices[0], 'exists': False},
+                                  {'device': devices[1], 'exists': True}],
+                                 result)
+
     def _test_update_port_binding(self, host, new_host=None):
         with mock.patch.object(self.plugin,
                                '_notify_port_updated') as notify_mock:
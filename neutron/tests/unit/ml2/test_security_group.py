@@ -14,9 +14,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 
 from neutron.api.v2 import attributes
+from neutron.common import constants as const
 from neutron.extensions import securitygroup as ext_sg
 from neutron import manager
 from neutron.tests.unit import test_extension_security_group as test_sg
@@ -83,6 +86,26 @@ class TestMl2SecurityGroups(Ml2SecurityGroupsTestCase,
                                      port_dict['fixed_ips'])
                     self._delete('ports', port_id)
 
+    def test_security_group_get_ports_from_devices(self):
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                self.port(subnet=subnet),
+                self.port(subnet=subnet),
+                self.port(subnet=subnet,
+                          device_owner=const.DEVICE_OWNER_DHCP)
+            ) as (p1, p2, p3):
+                port_ids = [p['port']['id'] for p in (p1, p2, p3)]
+                devices = ['tap' + port_ids[0][:11], port_ids[1],
+                           port_ids[2], 'bad_device_id']
+                plugin = manager.NeutronManager.get_plugin()
+                ports = plugin.callbacks.get_ports_from_devices(devices)
+                self.assertEqual(set(devices[:2]), set(ports))
+                for device, port in zip(devices, (p1, p2)):
+                    self.assertEqual(port['port']['id'], ports[device]['id'])
+                    self.assertEqual(device, ports[device]['device'])
+                    self.assertEqual(port['port'][ext_sg.SECURITYGROUPS],
+                                     ports[device][ext_sg.SECURITYGROUPS])
+
     def test_security_group_get_port_from_device_with_no_port(self):
         plugin = manager.NeutronManager.get_plugin()
         port_dict = plugin.callbacks.get_port_from_device('bad_device_id')
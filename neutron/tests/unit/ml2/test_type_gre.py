@@ -54,58 +54,20 @@ class GreTypeTest(base.BaseTestCase):
             self.driver.validate_provider_segment(segment)
 
     def test_sync_tunnel_allocations(self):
-        self.assertIsNone(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MIN - 1))
-        )
-        self.assertFalse(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MIN)).allocated
-        )
-        self.assertFalse(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MIN + 1)).allocated
-        )
-        self.assertFalse(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MAX - 1)).allocated
-        )
-        self.assertFalse(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MAX)).allocated
-        )
-        self.assertIsNone(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MAX + 1))
-        )
-
-        self.driver.gre_id_ranges = UPDATED_TUNNEL_RANGES
+        with self.session.begin():
+            for tunnel_id, allocated in ((TUN_MIN, False),
+                                         (TUN_MIN + 1, True)):
+                self.session.add(type_gre.GreAllocation(
+                    gre_id=tunnel_id, allocated=allocated))
+        self.driver.gre_id_ranges = UPDATED_TUNNEL_RANGES + TUNNEL_RANGES
         self.driver._sync_gre_allocations()
 
+        self.assertEqual([(TUN_MIN, TUN_MAX + 5)],
+                         self.driver.gre_id_ranges)
         self.assertIsNone(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MIN + 5 - 1))
-        )
-        self.assertFalse(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MIN + 5)).allocated
-        )
-        self.assertFalse(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MIN + 5 + 1)).allocated
-        )
-        self.assertFalse(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MAX + 5 - 1)).allocated
-        )
-        self.assertFalse(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MAX + 5)).allocated
-        )
-        self.assertIsNone(
-            self.driver.get_gre_allocation(self.session,
-                                           (TUN_MAX + 5 + 1))
-        )
+            self.driver.get_gre_allocation(self.session, TUN_MIN))
+        alloc = self.driver.get_gre_allocation(self.session, TUN_MIN + 1)
+        self.assertTrue(alloc.allocated)
 
     def test_reserve_provider_segment(self):
         segment = {api.NETWORK_TYPE: 'gre',
@@ -122,7 +84,7 @@ class GreTypeTest(base.BaseTestCase):
         self.driver.release_segment(self.session, segment)
         alloc = self.driver.get_gre_allocation(self.session,
                                                segment[api.SEGMENTATION_ID])
-        self.assertFalse(alloc.allocated)
+        self.assertIsNone(alloc)
 
         segment[api.SEGMENTATION_ID] = 1000
         self.driver.reserve_provider_segment(self.session, segment)
@@ -204,4 +166,4 @@ class GreTypeMultiRangeTest(base.BaseTestCase):
         for key in (self.TUN_MIN0, self.TUN_MAX0,
                     self.TUN_MIN1, self.TUN_MAX1):
             alloc = self.driver.get_gre_allocation(self.session, key)
-            self.assertFalse(alloc.allocated)
+            self.assertIsNone(alloc)
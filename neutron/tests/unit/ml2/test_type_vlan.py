@@ -0,0 +1,89 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo.config import cfg
+import testtools
+
+from neutron.common import exceptions as exc
+from neutron.db import api as db
+from neutron.plugins.common import constants as p_const
+from neutron.plugins.ml2 import driver_api as api
+from neutron.plugins.ml2.drivers import type_vlan
+from neutron.tests import base
+
+PROVIDER_NET = 'phys_net1'
+TENANT_NET = 'phys_net2'
+VLAN_MIN = 200
+VLAN_MAX = 209
+NETWORK_VLAN_RANGES = [PROVIDER_NET, "%s:%s:%s" %
+                       (TENANT_NET, VLAN_MIN, VLAN_MAX)]
+
+
+class VlanTypeTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(VlanTypeTest, self).setUp()
+        db.configure_db()
+        cfg.CONF.set_override('network_vlan_ranges', NETWORK_VLAN_RANGES,
+                              group='ml2_type_vlan')
+        self.driver = type_vlan.VlanTypeDriver()
+        self.driver._sync_vlan_allocations()
+        self.session = db.get_session()
+        self.addCleanup(db.clear_db)
+
+    def _get_allocation(self, physical_network, vlan_id):
+        return self.session.query(type_vlan.VlanAllocation).filter_by(
+            physical_network=physical_network, vlan_id=vlan_id).first()
+
+    def test_sync_vlan_allocations(self):
+        with self.session.begin():
+            for vlan_id, allocated in ((VLAN_MIN, False),
+                                       (VLAN_MIN + 1, True)):
+                self.session.add(type_vlan.VlanAllocation(
+                    physical_network=TENANT_NET, vlan_id=vlan_id,
+                    allocated=allocated))
+        self.driver._sync_vlan_allocations()
+        self.assertIsNone(self._get_allocation(TENANT_NET, VLAN_MIN))
+        self.assertTrue(self._get_allocation(TENANT_NET,
+                                             VLAN_MIN + 1).allocated)
+
+    def test_reserve_provider_segment(self):
+        segment = {api.NETWORK_TYPE: p_const.TYPE_VLAN,
+                   api.PHYSICAL_NETWORK: PROVIDER_NET,
+                   api.SEGMENTATION_ID: 101}
+        self.driver.reserve_provider_segment(self.session, segment)
+        self.assertTrue(self._get_allocation(PROVIDER_NET, 101).allocated)
+
+        with testtools.ExpectedException(exc.VlanIdInUse):
+            self.driver.reserve_provider_segment(self.session, segment)
+
+        self.driver.release_segment(self.session, segment)
+        self.assertIsNone(self._get_allocation(PROVIDER_NET, 101))
+
+    def test_allocate_tenant_segment(self):
+        vlan_ids = set()
+        for x in range(VLAN_MIN, VLAN_MAX + 1):
+            segment = self.driver.allocate_tenant_segment(self.session)
+            self.assertEqual(p_const.TYPE_VLAN, segment[api.NETWORK_TYPE])
+            self.assertEqual(TENANT_NET, segment[api.PHYSICAL_NETWORK])
+            vlan_ids.add(segment[api.SEGMENTATION_ID])
+        self.assertEqual(set(range(VLAN_MIN, VLAN_MAX + 1)), vlan_ids)
+        self.assertIsNone(self.driver.allocate_tenant_segment(self.session))
+
+        segment[api.SEGMENTATION_ID] = VLAN_MIN
+        self.driver.release_segment(self.session, segment)
+        self.assertIsNone(self._get_allocation(TENANT_NET, VLAN_MIN))
+        segment = self.driver.allocate_tenant_segment(self.session)
+        self.assertEqual(VLAN_MIN, segment[api.SEGMENTATION_ID])
@@ -69,52 +69,20 @@ class VxlanTypeTest(base.BaseTestCase):
             self.driver.validate_provider_segment(segment)
 
     def test_sync_tunnel_allocations(self):
-        self.assertIsNone(
-            self.driver.get_vxlan_allocation(self.session,
-                                             (TUN_MIN - 1))
-        )
-        self.assertFalse(
-            self.driver.get_vxlan_allocation(self.session,
-                                             (TUN_MIN)).allocated
-        )
-        self.assertFalse(
-            self.driver.get_vxlan_allocation(self.session,
-                                             (TUN_MIN + 1)).allocated
-        )
-        self.assertFalse(
-            self.driver.get_vxlan_allocation(self.session,
-                                             (TUN_MAX - 1)).allocated
-        )
-        self.assertFalse(
-            self.driver.get_vxlan_allocation(self.session,
-                                             (TUN_MAX)).allocated
-        )
-        self.assertIsNone(
-            self.driver.get_vxlan_allocation(self.session,
-                                             (TUN_MAX + 1))
-        )
-
-        self.driver.vxlan_vni_ranges = UPDATED_TUNNEL_RANGES
+        with self.session.begin():
+            for tunnel_id, allocated in ((TUN_MIN, False),
+                                         (TUN_MIN + 1, True)):
+                self.session.add(type_vxlan.VxlanAllocation(
+                    vxlan_vni=tunnel_id, allocated=allocated))
+        self.driver.vxlan_vni_ranges = UPDATED_TUNNEL_RANGES + TUNNEL_RANGES
         self.driver._sync_vxlan_allocations()
 
-        self.assertIsNone(self.driver.
-                          get_vxlan_allocation(self.session,
-                                               (TUN_MIN + 5 - 1)))
-        self.assertFalse(self.driver.
-                         get_vxlan_allocation(self.session, (TUN_MIN + 5)).
-                         allocated)
-        self.assertFalse(self.driver.
-                         get_vxlan_allocation(self.session, (TUN_MIN + 5 + 1)).
-                         allocated)
-        self.assertFalse(self.driver.
-                         get_vxlan_allocation(self.session, (TUN_MAX + 5 - 1)).
-                         allocated)
-        self.assertFalse(self.driver.
-                         get_vxlan_allocation(self.session, (TUN_MAX + 5)).
-                         allocated)
-        self.assertIsNone(self.driver.
-                          get_vxlan_allocation(self.session,
-                                               (TUN_MAX + 5 + 1)))
+        self.assertEqual([(TUN_MIN, TUN_MAX + 5)],
+                         self.driver.vxlan_vni_ranges)
+        self.assertIsNone(
+            self.driver.get_vxlan_allocation(self.session, TUN_MIN))
+        alloc = self.driver.get_vxlan_allocation(self.session, TUN_MIN + 1)
+        self.assertTrue(alloc.allocated)
 
     def test_reserve_provider_segment(self):
         segment = {api.NETWORK_TYPE: 'vxlan',
@@ -131,7 +99,7 @@ class VxlanTypeTest(base.BaseTestCase):
         self.driver.release_segment(self.session, segment)
         alloc = self.driver.get_vxlan_allocation(self.session,
                                                  segment[api.SEGMENTATION_ID])
-        self.assertFalse(alloc.allocated)
+        self.assertIsNone(alloc)
 
         segment[api.SEGMENTATION_ID] = 1000
         self.driver.reserve_provider_segment(self.session, segment)
@@ -224,4 +192,4 @@ class VxlanTypeMultiRangeTest(base.BaseTestCase):
         for key in (self.TUN_MIN0, self.TUN_MAX0,
                     self.TUN_MIN1, self.TUN_MAX1):
             alloc = self.driver.get_vxlan_allocation(self.session, key)
-            self.assertFalse(alloc.allocated)
+            self.assertIsNone(alloc)
@@ -326,10 +326,77 @@ class OVS_Lib_Test(base.BaseTestCase):
         ])
         flow_expr.assert_called_once_with(delete=True, flow='deleted_flow_1')
         run_ofctl.assert_has_calls([
-            mock.call('add-flows', ['-'], 'added_flow_1\nadded_flow_2\n'),
-            mock.call('del-flows', ['-'], 'deleted_flow_1\n')
+            mock.call('add-flows', ['-'], 'added_flow_1\nadded_flow_2\n',
+                      check_error=True),
+            mock.call('del-flows', ['-'], 'deleted_flow_1\n',
+                      check_error=True)
         ])
 
+    def test_defer_apply_flows_preserves_order(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        self.br.defer_apply_on()
+        self.br.delete_flows(in_port=1)
+        self.br.add_flow(in_port=1, actions='drop')
+        self.br.add_flow(in_port=2, actions='drop')
+        self.br.delete_flows(in_port=2)
+        self.br.defer_apply_off()
+        run_ofctl.assert_has_calls([
+            mock.call('del-flows', ['-'], 'in_port=1\n', check_error=True),
+            mock.call('add-flows', ['-'],
+                      'hard_timeout=0,idle_timeout=0,priority=0,in_port=1,'
+                      'actions=drop\n'
+                      'hard_timeout=0,idle_timeout=0,priority=0,in_port=2,'
+                      'actions=drop\n', check_error=True),
+            mock.call('del-flows', ['-'], 'in_port=2\n', check_error=True)
+        ])
+        self.assertEqual(3, run_ofctl.call_count)
+
+    def test_deferred(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        with self.br.deferred() as br:
+            br.delete_flows(in_port=1)
+            with self.br.deferred():
+                self.br.delete_flows(in_port=2)
+            self.assertFalse(run_ofctl.called)
+        run_ofctl.assert_called_once_with('del-flows', ['-'],
+                                          'in_port=1\nin_port=2\n',
+                                          check_error=True)
+        self.assertFalse(self.br.defer_apply_flows)
+        self.br.delete_flows(in_port=3)
+        run_ofctl.assert_called_with('del-flows', ['in_port=3'])
+
+    def test_deferred_applies_flows_on_error(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+
+        def program_flows():
+            with self.br.deferred():
+                self.br.delete_flows(in_port=1)
+                raise RuntimeError()
+
+        self.assertRaises(RuntimeError, program_flows)
+        run_ofctl.assert_called_once_with('del-flows', ['-'], 'in_port=1\n',
+                                          check_error=True)
+        self.assertFalse(self.br.defer_apply_flows)
+
+    def test_defer_apply_off_raises_on_failure(self):
+        self.execute.side_effect = [RuntimeError(), None]
+        self.br.defer_apply_on()
+        self.br.add_flow(in_port=-1, actions='drop')
+        self.br.delete_flows(in_port=2)
+        self.assertRaises(RuntimeError, self.br.defer_apply_off)
+        # The flows of the other invocations are applied anyway
+        self.execute.assert_called_with(
+            ['ovs-ofctl', 'del-flows', self.BR_NAME, '-'],
+            process_input='in_port=2\n', root_helper=self.root_helper)
+        self.assertFalse(self.br.defer_apply_flows)
+        self.assertEqual([], self.br.deferred_flows)
+
+    def test_run_ofctl_check_error(self):
+        self.execute.side_effect = RuntimeError()
+        self.assertIsNone(self.br.run_ofctl('add-flow', ['in_port=1']))
+        self.assertRaises(RuntimeError, self.br.run_ofctl, 'add-flow',
+                          ['in_port=1'], check_error=True)
+
     def test_add_tunnel_port(self):
         pname = "tap99"
         local_ip = "1.1.1.1"
@@ -380,32 +447,105 @@ class OVS_Lib_Test(base.BaseTestCase):
         self.assertEqual(self.br.add_patch_port(pname, peer), ofport)
         tools.verify_mock_calls(self.execute, expected_calls_and_values)
 
+    def _encode_ovs_json(self, headings, data):
+        # See man ovs-vsctl(8) for the encoding details.
+        r = {"data": [],
+             "headings": headings}
+        for row in data:
+            ovs_row = []
+            r["data"].append(ovs_row)
+            for cell in row:
+                if isinstance(cell, (str, int, list)):
+                    ovs_row.append(cell)
+                elif isinstance(cell, dict):
+                    ovs_row.append(["map", cell.items()])
+                elif isinstance(cell, set):
+                    ovs_row.append(["set", cell])
+                else:
+                    raise TypeError('%r not int, str, list, set or dict' %
+                                    type(cell))
+        return jsonutils.dumps(r)
+
+    def _ports_snapshot_call(self):
+        return mock.call(["ovs-vsctl", self.TO, "--format=json",
+                          "--", "--columns=ports", "list", "Bridge",
+                          self.BR_NAME,
+                          "--", "--columns=_uuid,name,tag", "list", "Port",
+                          "--", "--columns=name,ofport,external_ids",
+                          "list", "Interface"],
+                         root_helper=self.root_helper)
+
+    def _encode_ports_snapshot(self, data, other_ports=()):
+        """Encode the output of get_ports_snapshot's ovs-vsctl call.
+
+        :param data: (name, ofport, external_ids, tag) rows of the ports
+                     of the bridge.
+        :param other_ports: the same rows for ports on other bridges.
+        """
+        port_rows = []
+        iface_rows = []
+        port_uuids = []
+        for name, ofport, external_ids, tag in list(data) + list(other_ports):
+            uuid = ['uuid', name + '-uuid']
+            port_rows.append([uuid, name, tag])
+            iface_rows.append([name, ofport, external_ids])
+            if name in [row[0] for row in data]:
+                port_uuids.append(uuid)
+        if len(port_uuids) == 1:
+            bridge_ports = port_uuids[0]
+        else:
+            bridge_ports = ['set', port_uuids]
+        return '\n'.join([
+            self._encode_ovs_json(['ports'], [[bridge_ports]]),
+            self._encode_ovs_json(['_uuid', 'name', 'tag'], port_rows),
+            self._encode_ovs_json(['name', 'ofport', 'external_ids'],
+                                  iface_rows)]) + '\n'
+
+    def test_get_ports_snapshot(self):
+        data = [
+            ['tap99', 1, {'iface-id': 'tap99id'}, 2],
+            ['tap98', ['set', []], {}, ['set', []]],
+        ]
+        other_ports = [['tap88', 3, {'iface-id': 'tap88id'}, 4]]
+        expected_calls_and_values = [
+            (self._ports_snapshot_call(),
+             self._encode_ports_snapshot(data, other_ports)),
+        ]
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        ports = self.br.get_ports_snapshot()
+        self.assertEqual(
+            {'tap99': {'name': 'tap99', 'ofport': 1,
+                       'external_ids': {'iface-id': 'tap99id'}, 'tag': 2},
+             'tap98': {'name': 'tap98', 'ofport': [],
+                       'external_ids': {}, 'tag': []}},
+            ports)
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+
+    def test_get_ports_snapshot_single_port(self):
+        data = [['tap99', 1, {}, 2]]
+        expected_calls_and_values = [
+            (self._ports_snapshot_call(), self._encode_ports_snapshot(data)),
+        ]
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+        self.assertEqual(['tap99'], self.br.get_ports_snapshot().keys())
+
     def _test_get_vif_ports(self, is_xen=False):
         pname = "tap99"
-        ofport = "6"
+        ofport = 6
         vif_id = uuidutils.generate_uuid()
         mac = "ca:fe:de:ad:be:ef"
 
         if is_xen:
-            external_ids = ('{xs-vif-uuid="%s", attached-mac="%s"}'
-                            % (vif_id, mac))
+            external_ids = {'xs-vif-uuid': vif_id, 'attached-mac': mac}
         else:
-            external_ids = ('{iface-id="%s", attached-mac="%s"}'
-                            % (vif_id, mac))
+            external_ids = {'iface-id': vif_id, 'attached-mac': mac}
+        data = [[pname, ofport, external_ids, 1],
+                ['tun22', 2, {}, ['set', []]]]
 
         # Each element is a tuple of (expected mock call, return_value)
         expected_calls_and_values = [
-            (mock.call(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
-                       root_helper=self.root_helper),
-             "%s\n" % pname),
-            (mock.call(["ovs-vsctl", self.TO, "get",
-                        "Interface", pname, "external_ids"],
-                       root_helper=self.root_helper),
-             external_ids),
-            (mock.call(["ovs-vsctl", self.TO, "get",
-                        "Interface", pname, "ofport"],
-                       root_helper=self.root_helper),
-             ofport),
+            (self._ports_snapshot_call(), self._encode_ports_snapshot(data)),
         ]
         if is_xen:
             expected_calls_and_values.append(
@@ -425,57 +565,33 @@ class OVS_Lib_Test(base.BaseTestCase):
         self.assertEqual(ports[0].switch.br_name, self.BR_NAME)
         tools.verify_mock_calls(self.execute, expected_calls_and_values)
 
-    def _encode_ovs_json(self, headings, data):
-        # See man ovs-vsctl(8) for the encoding details.
-        r = {"data": [],
-             "headings": headings}
-        for row in data:
-            ovs_row = []
-            r["data"].append(ovs_row)
-            for cell in row:
-                if isinstance(cell, (str, int, list)):
-                    ovs_row.append(cell)
-                elif isinstance(cell, dict):
-                    ovs_row.append(["map", cell.items()])
-                elif isinstance(cell, set):
-                    ovs_row.append(["set", cell])
-                else:
-                    raise TypeError('%r not int, str, list, set or dict' %
-                                    type(cell))
-        return jsonutils.dumps(r)
-
     def _test_get_vif_port_set(self, is_xen):
         if is_xen:
             id_key = 'xs-vif-uuid'
         else:
             id_key = 'iface-id'
 
-        headings = ['name', 'external_ids']
         data = [
             # A vif port on this bridge:
-            ['tap99', {id_key: 'tap99id', 'attached-mac': 'tap99mac'}, 1],
+            ['tap99', 1, {id_key: 'tap99id', 'attached-mac': 'tap99mac'}, 1],
             # A vif port on this bridge not yet configured
-            ['tap98', {id_key: 'tap98id', 'attached-mac': 'tap98mac'}, []],
+            ['tap98', [], {id_key: 'tap98id', 'attached-mac': 'tap98mac'},
+             1],
             # Another vif port on this bridge not yet configured
-            ['tap97', {id_key: 'tap97id', 'attached-mac': 'tap97mac'},
-             ['set', []]],
-
-            # A vif port on another bridge:
-            ['tap88', {id_key: 'tap88id', 'attached-mac': 'tap88id'}, 1],
+            ['tap97', ['set', []],
+             {id_key: 'tap97id', 'attached-mac': 'tap97mac'}, 1],
             # Non-vif port on this bridge:
-            ['tun22', {}, 2],
+            ['tun22', 2, {}, ['set', []]],
+        ]
+        other_ports = [
+            # A vif port on another bridge:
+            ['tap88', 1, {id_key: 'tap88id', 'attached-mac': 'tap88id'}, 1],
         ]
 
         # Each element is a tuple of (expected mock call, return_value)
         expected_calls_and_values = [
-            (mock.call(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
-                       root_helper=self.root_helper),
-             'tap99\ntun22'),
-            (mock.call(["ovs-vsctl", self.TO, "--format=json",
-                        "--", "--columns=name,external_ids,ofport",
-                        "list", "Interface"],
-                       root_helper=self.root_helper),
-             self._encode_ovs_json(headings, data)),
+            (self._ports_snapshot_call(),
+             self._encode_ports_snapshot(data, other_ports)),
         ]
         tools.setup_mock_calls(self.execute, expected_calls_and_values)
 
@@ -502,11 +618,20 @@ class OVS_Lib_Test(base.BaseTestCase):
     def test_get_vif_port_set_xen(self):
         self._test_get_vif_port_set(True)
 
+    def test_get_vif_port_dict_from_snapshot(self):
+        ports = {'tap99': {'name': 'tap99', 'ofport': 1, 'tag': 1,
+                           'external_ids': {'iface-id': 'tap99id',
+                                            'attached-mac': 'tap99mac'}}}
+        vif_ports = self.br.get_vif_port_dict(ports)
+        self.assertEqual(['tap99id'], vif_ports.keys())
+        self.assertEqual('tap99', vif_ports['tap99id'].port_name)
+        self.assertEqual(1, vif_ports['tap99id'].ofport)
+        self.assertEqual('tap99mac', vif_ports['tap99id'].vif_mac)
+        self.assertFalse(self.execute.called)
+
     def test_get_vif_ports_list_ports_error(self):
         expected_calls_and_values = [
-            (mock.call(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
-                       root_helper=self.root_helper),
-             RuntimeError()),
+            (self._ports_snapshot_call(), RuntimeError()),
         ]
         tools.setup_mock_calls(self.execute, expected_calls_and_values)
         self.assertRaises(RuntimeError, self.br.get_vif_ports)
@@ -514,49 +639,24 @@ class OVS_Lib_Test(base.BaseTestCase):
 
     def test_get_vif_port_set_list_ports_error(self):
         expected_calls_and_values = [
-            (mock.call(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
-                       root_helper=self.root_helper),
-             RuntimeError()),
-        ]
-        tools.setup_mock_calls(self.execute, expected_calls_and_values)
-        self.assertRaises(RuntimeError, self.br.get_vif_port_set)
-        tools.verify_mock_calls(self.execute, expected_calls_and_values)
-
-    def test_get_vif_port_set_list_interface_error(self):
-        expected_calls_and_values = [
-            (mock.call(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
-                       root_helper=self.root_helper),
-             'tap99\n'),
-            (mock.call(["ovs-vsctl", self.TO, "--format=json",
-                        "--", "--columns=name,external_ids,ofport",
-                        "list", "Interface"],
-                       root_helper=self.root_helper),
-             RuntimeError()),
+            (self._ports_snapshot_call(), RuntimeError()),
         ]
         tools.setup_mock_calls(self.execute, expected_calls_and_values)
         self.assertRaises(RuntimeError, self.br.get_vif_port_set)
         tools.verify_mock_calls(self.execute, expected_calls_and_values)
 
     def test_get_port_tag_dict(self):
-        headings = ['name', 'tag']
         data = [
-            ['int-br-eth2', set()],
-            ['patch-tun', set()],
-            ['qr-76d9e6b6-21', 1],
-            ['tapce5318ff-78', 1],
-            ['tape1400310-e6', 1],
+            ['int-br-eth2', 1, {}, ['set', []]],
+            ['patch-tun', 2, {}, ['set', []]],
+            ['qr-76d9e6b6-21', 3, {}, 1],
+            ['tapce5318ff-78', 4, {}, 1],
+            ['tape1400310-e6', 5, {}, 1],
         ]
 
         # Each element is a tuple of (expected mock call, return_value)
         expected_calls_and_values = [
-            (mock.call(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
-                       root_helper=self.root_helper),
-             '\n'.join((iface for iface, tag in data))),
-            (mock.call(["ovs-vsctl", self.TO, "--format=json",
-                        "--", "--columns=name,tag",
-                        "list", "Port"],
-                       root_helper=self.root_helper),
-             self._encode_ovs_json(headings, data)),
+            (self._ports_snapshot_call(), self._encode_ports_snapshot(data)),
         ]
         tools.setup_mock_calls(self.execute, expected_calls_and_values)
 
@@ -631,9 +731,7 @@ class OVS_Lib_Test(base.BaseTestCase):
 
     def test_delete_neutron_ports_list_error(self):
         expected_calls_and_values = [
-            (mock.call(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
-                       root_helper=self.root_helper),
-             RuntimeError()),
+            (self._ports_snapshot_call(), RuntimeError()),
         ]
         tools.setup_mock_calls(self.execute, expected_calls_and_values)
         self.assertRaises(RuntimeError, self.br.delete_ports, all_ports=False)
@@ -122,7 +122,7 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                        'FixedIntervalLoopingCall',
                        new=MockFixedIntervalLoopingCall)):
             self.agent = ovs_neutron_agent.OVSNeutronAgent(**kwargs)
-            self.agent.tun_br = mock.Mock()
+            self.agent.tun_br = mock.MagicMock()
         self.agent.sg_agent = mock.Mock()
 
     def _mock_port_bound(self, ofport=None, new_local_vlan=None,
@@ -194,13 +194,22 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                         updated_ports=None, port_tags_dict=None):
         if port_tags_dict is None:  # Because empty dicts evaluate as False.
             port_tags_dict = {}
+        ports = mock.sentinel.ports
+        vif_ports = dict((port_id, mock.Mock()) for port_id in vif_port_set)
         with contextlib.nested(
-            mock.patch.object(self.agent.int_br, 'get_vif_port_set',
-                              return_value=vif_port_set),
+            mock.patch.object(self.agent.int_br, 'get_ports_snapshot',
+                              return_value=ports),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_dict',
+                              return_value=vif_ports),
             mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
                               return_value=port_tags_dict)
-        ):
-            return self.agent.scan_ports(registered_ports, updated_ports)
+        ) as (get_ports, get_vif_ports, get_tags):
+            port_info = self.agent.scan_ports(registered_ports, updated_ports)
+        get_ports.assert_called_once_with()
+        get_vif_ports.assert_called_once_with(ports)
+        get_tags.assert_called_once_with(ports)
+        self.assertEqual(vif_ports, port_info.pop('vif_ports'))
+        return port_info
 
     def test_scan_ports_returns_current_only_for_unchanged_ports(self):
         vif_port_set = set([1, 3])
@@ -252,6 +261,53 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                                       updated_ports)
         self.assertEqual(expected, actual)
 
+    def _device_event(self, port_id, key='iface-id'):
+        return {'name': 'tap%s' % port_id, 'external_ids': {key: port_id}}
+
+    def mock_process_port_events(self, added, removed, registered_ports,
+                                 updated_ports=None, int_br_ports=None):
+        events = {'added': [self._device_event(port_id)
+                            for port_id in added],
+                  'removed': [self._device_event(port_id)
+                              for port_id in removed]}
+        if int_br_ports is None:
+            int_br_ports = set(added) | (updated_ports or set())
+        vif_ports = dict((port_id, mock.Mock()) for port_id in int_br_ports)
+        with mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                               side_effect=vif_ports.get):
+            port_info = self.agent.process_port_events(
+                events, registered_ports, updated_ports)
+        self.assertEqual(vif_ports, port_info.pop('vif_ports'))
+        return port_info
+
+    def test_process_port_events_returns_port_changes(self):
+        actual = self.mock_process_port_events(
+            ['3'], ['2', '5'], set(['1', '2']))
+        self.assertEqual(dict(current=set(['1', '3']), added=set(['3']),
+                              removed=set(['2'])), actual)
+
+    def test_process_port_events_rewires_readded_port(self):
+        actual = self.mock_process_port_events(
+            ['2'], ['2'], set(['1', '2']))
+        self.assertEqual(dict(current=set(['1', '2']), updated=set(['2'])),
+                         actual)
+
+    def test_process_port_events_with_updated_ports(self):
+        actual = self.mock_process_port_events(
+            [], [], set(['1', '2']), set(['2']))
+        self.assertEqual(dict(current=set(['1', '2']), updated=set(['2'])),
+                         actual)
+
+    def test_process_port_events_ignores_ports_of_other_bridges(self):
+        actual = self.mock_process_port_events(
+            ['3'], [], set(['1']), int_br_ports=set())
+        self.assertEqual(dict(current=set(['1'])), actual)
+
+    def test_process_port_events_requires_scan_for_xen_ports(self):
+        events = {'added': [self._device_event('3', 'xs-vif-uuid')],
+                  'removed': []}
+        self.assertIsNone(self.agent.process_port_events(events, set()))
+
     def test_update_ports_returns_changed_vlan(self):
         br = ovs_lib.OVSBridge('br-int', 'sudo')
         mac = "ca:fe:de:ad:be:ef"
@@ -273,11 +329,12 @@ class TestOvsNeutronAgent(base.BaseTestCase):
 
     def test_treat_devices_added_returns_true_for_missing_device(self):
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
                               side_effect=Exception()),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=mock.Mock())):
-            self.assertTrue(self.agent.treat_devices_added_or_updated([{}]))
+            self.assertTrue(self.agent.treat_devices_added_or_updated(['x']))
 
     def _mock_treat_devices_added_updated(self, details, port, func_name):
         """Mock treat devices added or updated.
@@ -288,40 +345,68 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         :returns: whether the named function was called
         """
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
-                              return_value=details),
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=port),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, func_name)
         ) as (get_dev_fn, get_vif_func, upd_dev_up, upd_dev_down, func):
-            self.assertFalse(self.agent.treat_devices_added_or_updated([{}]))
+            self.assertFalse(self.agent.treat_devices_added_or_updated(
+                [details['device']]))
         return func.called
 
+    def test_treat_devices_added_updated_uses_scanned_ports(self):
+        port = mock.Mock()
+        port.ofport = 1
+        details = {'device': 'xxx'}
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id'),
+            mock.patch.object(self.agent, 'port_dead')
+        ) as (get_dev_fn, get_vif_func, port_dead):
+            self.assertFalse(self.agent.treat_devices_added_or_updated(
+                ['xxx', 'yyy'], {'xxx': port}))
+        self.assertFalse(get_vif_func.called)
+        get_dev_fn.assert_called_once_with(
+            self.agent.context, ['xxx'], self.agent.agent_id, cfg.CONF.host)
+        port_dead.assert_called_once_with(port)
+
     def test_treat_devices_added_updated_ignores_invalid_ofport(self):
         port = mock.Mock()
         port.ofport = -1
         self.assertFalse(self._mock_treat_devices_added_updated(
-            mock.MagicMock(), port, 'port_dead'))
+            {'device': 'xxx'}, port, 'port_dead'))
 
     def test_treat_devices_added_updated_marks_unknown_port_as_dead(self):
         port = mock.Mock()
         port.ofport = 1
         self.assertTrue(self._mock_treat_devices_added_updated(
-            mock.MagicMock(), port, 'port_dead'))
+            {'device': 'xxx'}, port, 'port_dead'))
 
     def test_treat_devices_added_does_not_process_missing_port(self):
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details'),
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list'),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=None)
         ) as (get_dev_fn, get_vif_func):
+            self.assertFalse(self.agent.treat_devices_added_or_updated(
+                ['xxx']))
             self.assertFalse(get_dev_fn.called)
 
     def test_treat_devices_added__updated_updates_known_port(self):
-        details = mock.MagicMock()
-        details.__contains__.side_effect = lambda x: True
+        details = {'admin_state_up': True,
+                   'port_id': 'xxx',
+                   'device': 'xxx',
+                   'network_id': 'yyy',
+                   'physical_network': 'foo',
+                   'segmentation_id': 'bar',
+                   'network_type': 'baz'}
         self.assertTrue(self._mock_treat_devices_added_updated(
             details, mock.Mock(), 'treat_vif_port'))
 
@@ -334,30 +419,124 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                              'segmentation_id': 'bar',
                              'network_type': 'baz'}
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
-                              return_value=fake_details_dict),
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[fake_details_dict]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=mock.MagicMock()),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, 'treat_vif_port')
         ) as (get_dev_fn, get_vif_func, upd_dev_up,
               upd_dev_down, treat_vif_port):
-            self.assertFalse(self.agent.treat_devices_added_or_updated([{}]))
+            self.assertFalse(self.agent.treat_devices_added_or_updated(
+                ['xxx']))
             self.assertTrue(treat_vif_port.called)
-            self.assertTrue(upd_dev_down.called)
+            upd_dev_down.assert_called_once_with(
+                self.agent.context, ['xxx'], self.agent.agent_id,
+                cfg.CONF.host)
+            self.assertFalse(upd_dev_up.called)
+
+    def test_treat_devices_added_updated_in_one_call(self):
+        details = [{'admin_state_up': True,
+                    'port_id': device,
+                    'device': device,
+                    'network_id': 'yyy',
+                    'physical_network': 'foo',
+                    'segmentation_id': 'bar',
+                    'network_type': 'baz'} for device in ('xxx', 'zzz')]
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=details),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.MagicMock()),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent, 'treat_vif_port')
+        ) as (get_dev_fn, get_vif_func, upd_dev_up, treat_vif_port):
+            self.assertFalse(self.agent.treat_devices_added_or_updated(
+                ['xxx', 'zzz']))
+            get_dev_fn.assert_called_once_with(
+                self.agent.context, ['xxx', 'zzz'], self.agent.agent_id,
+                cfg.CONF.host)
+            upd_dev_up.assert_called_once_with(
+                self.agent.context, ['xxx', 'zzz'], self.agent.agent_id,
+                cfg.CONF.host)
+            self.assertEqual(2, treat_vif_port.call_count)
+
+    def test_treat_devices_added_updated_applies_flows_before_up(self):
+        details = {'admin_state_up': True,
+                   'port_id': 'xxx',
+                   'device': 'xxx',
+                   'network_id': 'yyy',
+                   'physical_network': 'foo',
+                   'segmentation_id': 'bar',
+                   'network_type': 'baz'}
+        calls = mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.MagicMock()),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent, 'treat_vif_port'),
+            mock.patch.object(self.agent, 'deferred_flows')
+        ) as (get_dev_fn, get_vif_func, upd_dev_up, treat_vif_port,
+              deferred_flows):
+            calls.attach_mock(deferred_flows.return_value, 'deferred')
+            calls.attach_mock(upd_dev_up, 'update_devices_up')
+            self.assertFalse(self.agent.treat_devices_added_or_updated(
+                ['xxx']))
+        self.assertEqual(['deferred.__enter__', 'deferred.__exit__',
+                          'update_devices_up'],
+                         [c[0] for c in calls.mock_calls])
+
+    def test_treat_devices_added_updated_flows_failure(self):
+        details = {'admin_state_up': True,
+                   'port_id': 'xxx',
+                   'device': 'xxx',
+                   'network_id': 'yyy',
+                   'physical_network': 'foo',
+                   'segmentation_id': 'bar',
+                   'network_type': 'baz'}
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.MagicMock()),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent, 'treat_vif_port'),
+            mock.patch.object(self.agent, 'deferred_flows')
+        ) as (get_dev_fn, get_vif_func, upd_dev_up, treat_vif_port,
+              deferred_flows):
+            deferred_flows.return_value.__exit__.side_effect = RuntimeError()
+            self.assertTrue(self.agent.treat_devices_added_or_updated(
+                ['xxx']))
+        self.assertFalse(upd_dev_up.called)
+
+    def test_treat_devices_removed_flows_failure(self):
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
+            mock.patch.object(self.agent, 'port_unbound'),
+            mock.patch.object(self.agent, 'deferred_flows')
+        ) as (upd_dev_down, port_unbound, deferred_flows):
+            deferred_flows.return_value.__exit__.side_effect = RuntimeError()
+            self.assertTrue(self.agent.treat_devices_removed(['xxx']))
+        port_unbound.assert_called_once_with('xxx')
 
     def test_treat_devices_removed_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                                side_effect=Exception()):
-            self.assertTrue(self.agent.treat_devices_removed([{}]))
+            self.assertTrue(self.agent.treat_devices_removed(['xxx']))
 
     def _mock_treat_devices_removed(self, port_exists):
-        details = dict(exists=port_exists)
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        details = [dict(device='xxx', exists=port_exists)]
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                                return_value=details):
             with mock.patch.object(self.agent, 'port_unbound') as port_unbound:
-                self.assertFalse(self.agent.treat_devices_removed([{}]))
+                self.assertFalse(self.agent.treat_devices_removed(['xxx']))
         self.assertTrue(port_unbound.called)
 
     def test_treat_devices_removed_unbinds_port(self):
@@ -378,7 +557,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             setup_port_filters.assert_called_once_with(
                 port_info['added'], port_info.get('updated', set()))
             device_added_updated.assert_called_once_with(
-                port_info['added'] | port_info.get('updated', set()))
+                port_info['added'] | port_info.get('updated', set()),
+                port_info.get('vif_ports'))
             device_removed.assert_called_once_with(port_info['removed'])
 
     def test_process_network_ports(self):
@@ -394,6 +574,13 @@ class TestOvsNeutronAgent(base.BaseTestCase):
              'removed': set(['eth0']),
              'added': set(['eth1'])})
 
+    def test_process_network_ports_with_vif_ports(self):
+        self._test_process_network_ports(
+            {'current': set(['tap0', 'eth1']),
+             'vif_ports': {'tap0': mock.Mock(), 'eth1': mock.Mock()},
+             'removed': set(['eth0']),
+             'added': set(['eth1'])})
+
     def test_report_state(self):
         with mock.patch.object(self.agent.state_rpc,
                                "report_state") as report_st:
@@ -696,6 +883,40 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                                        constants.DEFAULT_OVSDBMON_RESPAWN)
         mock_loop.called_once()
 
+    def _test_rpc_loop_with_port_events(self, resync_interval):
+        self.agent.ovsdb_monitor_resync_interval = resync_interval
+        polling_manager = mock.Mock()
+        polling_manager.get_events.return_value = {'added': [],
+                                                   'removed': []}
+        port_info = {'current': set(['tap0'])}
+        with contextlib.nested(
+            mock.patch.object(self.agent, 'scan_ports',
+                              return_value=port_info),
+            mock.patch.object(self.agent, 'process_port_events',
+                              return_value=port_info),
+            mock.patch.object(ovs_neutron_agent.time, 'sleep',
+                              side_effect=[None, None,
+                                           RuntimeError('stop the loop')])
+        ) as (scan_ports, process_port_events, sleep):
+            self.assertRaises(RuntimeError, self.agent.rpc_loop,
+                              polling_manager)
+        self.assertEqual(3, polling_manager.get_events.call_count)
+        return scan_ports, process_port_events
+
+    def test_rpc_loop_processes_port_events_between_scans(self):
+        scan_ports, process_port_events = (
+            self._test_rpc_loop_with_port_events(60))
+        scan_ports.assert_called_once_with(set(), set())
+        self.assertEqual(
+            [mock.call({'added': [], 'removed': []}, set(['tap0']), set())] *
+            2, process_port_events.call_args_list)
+
+    def test_rpc_loop_scans_ports_when_resync_interval_elapsed(self):
+        scan_ports, process_port_events = (
+            self._test_rpc_loop_with_port_events(0))
+        self.assertEqual(3, scan_ports.call_count)
+        self.assertFalse(process_port_events.called)
+
     def test_setup_tunnel_port_error_negative(self):
         with contextlib.nested(
             mock.patch.object(self.agent.tun_br, 'add_tunnel_port',
@@ -745,6 +966,32 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             expected_calls = [mock.call('gre-42', '100.101.102.103', 'gre')]
             setup_tunnel_port_fn.assert_has_calls(expected_calls)
 
+    def test_tunnel_sync_defers_flows(self):
+        fake_tunnel_details = {'tunnels': [{'ip_address': '100.101.31.15'}]}
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc, 'tunnel_sync',
+                              return_value=fake_tunnel_details),
+            mock.patch.object(self.agent, 'setup_tunnel_port')
+        ) as (tunnel_sync_rpc_fn, setup_tunnel_port_fn):
+            self.agent.tunnel_types = ['vxlan']
+            self.agent.tunnel_sync()
+            deferred = self.agent.tun_br.deferred
+            deferred.assert_called_once_with()
+            deferred.return_value.__exit__.assert_called_once_with(
+                None, None, None)
+
+    def test_deferred_flows(self):
+        self.agent.enable_tunneling = True
+        self.agent.int_br = mock.MagicMock()
+        phys_br = mock.MagicMock()
+        self.agent.phys_brs = {'physnet1': phys_br}
+        with self.agent.deferred_flows():
+            for br in (self.agent.int_br, phys_br, self.agent.tun_br):
+                br.deferred.return_value.__enter__.assert_called_once_with()
+                self.assertFalse(br.deferred.return_value.__exit__.called)
+        for br in (self.agent.int_br, phys_br, self.agent.tun_br):
+            self.assertTrue(br.deferred.return_value.__exit__.called)
+
     def test_tunnel_sync_with_ml2_plugin(self):
         fake_tunnel_details = {'tunnels': [{'ip_address': '100.101.31.15'}]}
         with contextlib.nested(
@@ -16,8 +16,10 @@
 #    under the License.
 
 import copy
+import datetime
 import time
 
+import mock
 from oslo.config import cfg
 from webob import exc
 
@@ -236,6 +238,98 @@ class AgentDBTestCase(AgentDBTestMixIn,
             query_string='binary=neutron-l3-agent&host=' + L3_HOSTB)
         self.assertFalse(agents['agents'][0]['alive'])
 
+    def _get_heartbeat(self, agent_id):
+        query = self.adminContext.session.query(
+            agents_db.Agent.heartbeat_timestamp)
+        return query.filter_by(id=agent_id).one()[0]
+
+    def test_batched_heartbeats(self):
+        cfg.CONF.set_override('agent_heartbeat_batch_interval', 2)
+        heartbeats = agents_db.AgentHeartbeats()
+        mock.patch.object(agents_db, '_heartbeats', heartbeats).start()
+        loop = mock.patch.object(agents_db.loopingcall,
+                                 'FixedIntervalLoopingCall').start()
+        dhcp_host = self._register_one_dhcp_agent()[0]
+        agent_id = self._list_agents()['agents'][0]['id']
+        first_heartbeat = self._get_heartbeat(agent_id)
+        self.assertFalse(loop.called)
+
+        # Heartbeats of a known agent are kept in memory
+        callback = agents_db.AgentExtRpcCallback()
+        with mock.patch.object(timeutils, 'utcnow',
+                               return_value=first_heartbeat +
+                               datetime.timedelta(seconds=4)):
+            callback.report_state(self.adminContext,
+                                  agent_state={'agent_state': dhcp_host},
+                                  time=timeutils.strtime())
+        self.assertEqual(first_heartbeat, self._get_heartbeat(agent_id))
+        loop.assert_called_once_with(heartbeats.flush)
+        loop.return_value.start.assert_called_once_with(interval=2)
+
+        heartbeats.flush(self.adminContext)
+        self.assertEqual(first_heartbeat + datetime.timedelta(seconds=4),
+                         self._get_heartbeat(agent_id))
+        self.assertEqual({}, heartbeats.pending)
+
+        # Changed configurations are written right away
+        dhcp_host['configurations']['networks'] = 3
+        callback.report_state(self.adminContext,
+                              agent_state={'agent_state': dhcp_host},
+                              time=timeutils.strtime())
+        agent = self._show('agents', agent_id)['agent']
+        self.assertEqual(3, agent['configurations']['networks'])
+
+    def test_batched_heartbeats_of_deleted_agent(self):
+        cfg.CONF.set_override('agent_heartbeat_batch_interval', 2)
+        heartbeats = agents_db.AgentHeartbeats()
+        mock.patch.object(agents_db, '_heartbeats', heartbeats).start()
+        mock.patch.object(agents_db.loopingcall,
+                          'FixedIntervalLoopingCall').start()
+        dhcp_host = self._register_one_dhcp_agent()[0]
+        agent_id = self._list_agents()['agents'][0]['id']
+        callback = agents_db.AgentExtRpcCallback()
+        callback.report_state(self.adminContext,
+                              agent_state={'agent_state': dhcp_host},
+                              time=timeutils.strtime())
+        # The agent is deleted by another worker
+        self.adminContext.session.query(agents_db.Agent).delete()
+        heartbeats.flush(self.adminContext)
+        self.assertEqual({}, heartbeats.agents)
+
+        callback.report_state(self.adminContext,
+                              agent_state={'agent_state': dhcp_host},
+                              time=timeutils.strtime())
+        agents = self._list_agents()['agents']
+        self.assertEqual(1, len(agents))
+        self.assertNotEqual(agent_id, agents[0]['id'])
+
+    def test_batched_heartbeats_without_sane_multi_rowcount(self):
+        cfg.CONF.set_override('agent_heartbeat_batch_interval', 2)
+        heartbeats = agents_db.AgentHeartbeats()
+        mock.patch.object(agents_db, '_heartbeats', heartbeats).start()
+        mock.patch.object(agents_db.loopingcall,
+                          'FixedIntervalLoopingCall').start()
+        hosts = self._register_agent_states()
+        agents = self._list_agents()['agents']
+        self.assertTrue(len(agents) > 2)
+        callback = agents_db.AgentExtRpcCallback()
+        for host in hosts:
+            callback.report_state(self.adminContext,
+                                  agent_state={'agent_state': host},
+                                  time=timeutils.strtime())
+        self.assertEqual(len(agents), len(heartbeats.pending))
+        # Another worker deletes one of the agents
+        deleted_id = agents[0]['id']
+        self.adminContext.session.query(agents_db.Agent).filter_by(
+            id=deleted_id).delete()
+        dialect = self.adminContext.session.bind.dialect
+        with mock.patch.object(dialect, 'supports_sane_multi_rowcount',
+                               False):
+            heartbeats.flush(self.adminContext)
+        self.assertEqual(
+            set(agent['id'] for agent in agents[1:]),
+            set(agent_id for agent_id, conf in heartbeats.agents.values()))
+
 
 class AgentDBTestCaseXML(AgentDBTestCase):
     fmt = 'xml'
@@ -14,8 +14,10 @@
 
 import fixtures
 import mock
+from oslo.config import cfg
 import testtools
 
+from neutron.agent.common import config
 from neutron.agent.linux import utils
 from neutron.tests import base
 
@@ -77,6 +79,58 @@ class AgentUtilsExecuteTest(base.BaseTestCase):
         self.assertEqual(result, expected)
 
 
+class AgentUtilsExecuteRootwrapDaemonTest(base.BaseTestCase):
+    def setUp(self):
+        super(AgentUtilsExecuteRootwrapDaemonTest, self).setUp()
+        config.register_root_helper(cfg.CONF)
+        self.config(group='AGENT', root_helper_daemon='sudo rootwrap-daemon')
+        self.client = mock.Mock()
+        self.get_client_p = mock.patch.object(utils.RootwrapDaemonHelper,
+                                              'get_client',
+                                              return_value=self.client)
+        self.get_client_p.start()
+        self.mock_popen = mock.patch("subprocess.Popen.communicate").start()
+
+    def test_with_helper(self):
+        self.client.execute.return_value = (0, "out\n", "")
+        result = utils.execute(["ls", 1], "sudo", process_input="in",
+                               addl_env={'foo': 'bar'})
+        self.assertEqual("out\n", result)
+        self.client.execute.assert_called_once_with(["ls", "1"],
+                                                    {'foo': 'bar'}, "in")
+        self.assertFalse(self.mock_popen.called)
+
+    def test_without_helper(self):
+        self.mock_popen.return_value = ["out\n", ""]
+        result = utils.execute(["ls"])
+        self.assertEqual("out\n", result)
+        self.assertFalse(self.client.execute.called)
+
+    def test_without_daemon(self):
+        self.config(group='AGENT', root_helper_daemon=None)
+        self.mock_popen.return_value = ["out\n", ""]
+        result = utils.execute(["ls"], "echo")
+        self.assertEqual("out\n", result)
+        self.assertFalse(self.client.execute.called)
+
+    def test_check_exit_code(self):
+        self.client.execute.return_value = (1, "", "error")
+        self.assertRaises(RuntimeError, utils.execute, ["ls"], "sudo")
+        self.assertEqual(
+            ("", "error"),
+            utils.execute(["ls"], "sudo", check_exit_code=False,
+                          return_stderr=True))
+
+    def test_get_client(self):
+        mock.patch.object(utils.RootwrapDaemonHelper, '_RootwrapDaemonHelper'
+                          '__client', None).start()
+        self.get_client_p.stop()
+        with mock.patch.object(utils.client, 'Client') as client_cls:
+            client = utils.RootwrapDaemonHelper.get_client()
+            self.assertEqual(client, utils.RootwrapDaemonHelper.get_client())
+        client_cls.assert_called_once_with(['sudo', 'rootwrap-daemon'])
+
+
 class AgentUtilsGetInterfaceMAC(base.BaseTestCase):
     def test_get_interface_mac(self):
         expect_val = '01:02:03:04:05:06'
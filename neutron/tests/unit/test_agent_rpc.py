@@ -15,10 +15,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 
 from neutron.agent import rpc
 from neutron.openstack.common import context
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.tests import base
 
 
@@ -45,6 +48,56 @@ class AgentRPCPluginApi(base.BaseTestCase):
     def test_tunnel_sync(self):
         self._test_rpc_call('tunnel_sync')
 
+    def test_get_devices_details_list(self):
+        agent = rpc.PluginApi('fake_topic')
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        with mock.patch.object(agent, 'call',
+                               return_value=['foo']) as call:
+            self.assertEqual(['foo'], agent.get_devices_details_list(
+                ctxt, ['fake_device'], 'fake_agent_id', 'fake_host'))
+        self.assertEqual('get_devices_details_list',
+                         call.call_args[0][1]['method'])
+        self.assertEqual(rpc.DEVICES_LIST_RPC_VERSION,
+                         call.call_args[1]['version'])
+        self.assertTrue(agent.use_devices_list_rpc)
+
+    def test_devices_list_falls_back_to_device_calls(self):
+        agent = rpc.PluginApi('fake_topic')
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        error = rpc_common.RemoteError(exc_type='UnsupportedRpcVersion')
+        with contextlib.nested(
+            mock.patch.object(agent, 'call', side_effect=error),
+            mock.patch.object(agent, 'get_device_details',
+                              side_effect=lambda c, d, a: d),
+            mock.patch.object(agent, 'update_device_up')
+        ) as (call, get_details, update_up):
+            self.assertEqual(['dev1', 'dev2'], agent.get_devices_details_list(
+                ctxt, ['dev1', 'dev2'], 'fake_agent_id'))
+            self.assertFalse(agent.use_devices_list_rpc)
+            agent.update_devices_up(ctxt, ['dev1'], 'fake_agent_id', 'host')
+        # The server is not asked again once it is known not to support it
+        self.assertEqual(1, call.call_count)
+        update_up.assert_called_once_with(ctxt, 'dev1', 'fake_agent_id',
+                                          'host')
+
+    def _test_devices_list_raises_remote_error(self, exc_type):
+        agent = rpc.PluginApi('fake_topic')
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        error = rpc_common.RemoteError(exc_type=exc_type)
+        with mock.patch.object(agent, 'call', side_effect=error):
+            self.assertRaises(rpc_common.RemoteError,
+                              agent.update_devices_down,
+                              ctxt, ['dev1'], 'fake_agent_id')
+        self.assertIsNone(agent.use_devices_list_rpc)
+
+    def test_devices_list_raises_other_remote_errors(self):
+        self._test_devices_list_raises_remote_error('Timeout')
+
+    def test_devices_list_raises_remote_attribute_error(self):
+        # An AttributeError raised by the server method itself doesn't
+        # mean that the server doesn't support the list calls
+        self._test_devices_list_raises_remote_error('AttributeError')
+
 
 class AgentPluginReportState(base.BaseTestCase):
     def test_plugin_report_state_use_call(self):
@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import os
 
 import mock
@@ -321,6 +322,35 @@ class APIv2TestCase(APIv2TestBase):
         kwargs = self._get_collection_kwargs(limit=1000)
         instance.get_networks.assert_called_once_with(mock.ANY, **kwargs)
 
+    def test_limit_with_default_limit(self):
+        cfg.CONF.set_override('pagination_default_limit', 100)
+        cfg.CONF.set_override('pagination_max_limit', '1000')
+        instance = self.plugin.return_value
+        instance.get_networks.return_value = []
+
+        self.api.get(_get_path('networks'))
+        kwargs = self._get_collection_kwargs(limit=100)
+        instance.get_networks.assert_called_once_with(mock.ANY, **kwargs)
+
+    def test_limit_with_default_limit_great_than_max_limit(self):
+        cfg.CONF.set_override('pagination_default_limit', 100)
+        cfg.CONF.set_override('pagination_max_limit', '10')
+        instance = self.plugin.return_value
+        instance.get_networks.return_value = []
+
+        self.api.get(_get_path('networks'))
+        kwargs = self._get_collection_kwargs(limit=10)
+        instance.get_networks.assert_called_once_with(mock.ANY, **kwargs)
+
+    def test_limit_overrides_default_limit(self):
+        cfg.CONF.set_override('pagination_default_limit', 100)
+        instance = self.plugin.return_value
+        instance.get_networks.return_value = []
+
+        self.api.get(_get_path('networks'), {'limit': '10'})
+        kwargs = self._get_collection_kwargs(limit=10)
+        instance.get_networks.assert_called_once_with(mock.ANY, **kwargs)
+
     def test_limit_with_negative_value(self):
         cfg.CONF.set_default('pagination_max_limit', '1000')
         instance = self.plugin.return_value
@@ -1399,6 +1429,38 @@ class QuotaTest(APIv2TestBase):
             _get_path('networks'), initial_input)
         self.assertEqual(res.status_int, exc.HTTPCreated.code)
 
+    def _test_create_network_reservation(self, create_error=None):
+        tenant_id = _uuid()
+        initial_input = {'network': {'name': 'net1', 'tenant_id': tenant_id}}
+        instance = self.plugin.return_value
+        instance.create_network.side_effect = create_error
+        instance.create_network.return_value = {'id': _uuid(),
+                                                'tenant_id': tenant_id}
+        with contextlib.nested(
+            mock.patch.object(quota.QUOTAS, 'make_reservation',
+                              return_value='reservation'),
+            mock.patch.object(quota.QUOTAS, 'commit_reservation'),
+            mock.patch.object(quota.QUOTAS, 'cancel_reservation')
+        ) as (make, commit, cancel):
+            res = self.api.post_json(_get_path('networks'), initial_input,
+                                     expect_errors=True)
+        make.assert_called_once_with(mock.ANY, tenant_id, 'network', 1,
+                                     mock.ANY, 'networks', tenant_id)
+        return res, commit, cancel
+
+    def test_create_network_commits_reservation(self):
+        res, commit, cancel = self._test_create_network_reservation()
+        self.assertEqual(exc.HTTPCreated.code, res.status_int)
+        commit.assert_called_once_with(mock.ANY, 'reservation')
+        self.assertFalse(cancel.called)
+
+    def test_create_network_failure_cancels_reservation(self):
+        res, commit, cancel = self._test_create_network_reservation(
+            n_exc.NeutronException())
+        self.assertEqual(exc.HTTPInternalServerError.code, res.status_int)
+        cancel.assert_called_once_with(mock.ANY, 'reservation')
+        self.assertFalse(commit.called)
+
 
 class ExtensionTestCase(base.BaseTestCase):
     def setUp(self):
@@ -1452,6 +1452,24 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
                 self.assertEqual(len(alloc), 0)
                 self._delete('ports', port['port']['id'])
 
+    def test_range_allocation_randomized_split_ranges(self):
+        cfg.CONF.set_override('ip_availability_range_size', 2)
+        cfg.CONF.set_override('randomize_ip_allocation', True)
+        with self.subnet(gateway_ip='10.0.0.3',
+                         cidr='10.0.0.0/29') as subnet:
+            kwargs = {"fixed_ips":
+                      [{'subnet_id': subnet['subnet']['id']}] * 5}
+            net_id = subnet['subnet']['network_id']
+            res = self._create_port(self.fmt, net_id=net_id, **kwargs)
+            port = self.deserialize(self.fmt, res)
+            ips = port['port']['fixed_ips']
+            self.assertEqual(
+                ['10.0.0.1', '10.0.0.2', '10.0.0.4', '10.0.0.5', '10.0.0.6'],
+                sorted(ip['ip_address'] for ip in ips))
+            res = self._create_port(self.fmt, net_id=net_id)
+            self.assertEqual(webob.exc.HTTPConflict.code, res.status_int)
+            self._delete('ports', port['port']['id'])
+
     def test_requested_invalid_fixed_ips(self):
         with self.subnet() as subnet:
             with self.port(subnet=subnet) as port:
@@ -3593,6 +3611,38 @@ class TestNeutronDbPluginV2(base.BaseTestCase):
         self.assertEqual(2, generate.call_count)
         rebuild.assert_called_once_with('c', 's')
 
+    def test_generate_ips_exhausted_pool(self):
+        with mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                               '_try_generate_ips') as generate:
+            with mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                                   '_rebuild_availability_ranges') as rebuild:
+                exception = n_exc.IpAddressGenerationFailure(net_id='n')
+                generate.side_effect = [exception, ['ip1', 'ip2']]
+
+                ips = db_base_plugin_v2.NeutronDbPluginV2._generate_ips(
+                    'c', 's', 2)
+
+        self.assertEqual(['ip1', 'ip2'], ips)
+        generate.assert_called_with('c', 's', 2)
+        rebuild.assert_called_once_with('c', 's')
+
+    def test_try_generate_ips_picks_availability_ranges(self):
+        ranges = [{'first_ip': '10.0.0.5', 'last_ip': '10.0.0.6'},
+                  {'first_ip': '10.0.0.2', 'last_ip': '10.0.0.4'}]
+        context = mock.Mock()
+        with mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                               '_get_availability_range',
+                               side_effect=ranges) as get_range:
+            ips = db_base_plugin_v2.NeutronDbPluginV2._try_generate_ips(
+                context, [{'id': 's', 'network_id': 'n'}], 3)
+
+        self.assertEqual(['10.0.0.5', '10.0.0.6', '10.0.0.2'],
+                         [ip['ip_address'] for ip in ips])
+        get_range.assert_called_with(context, 's')
+        self.assertEqual(2, get_range.call_count)
+        context.session.delete.assert_called_once_with(ranges[0])
+        self.assertEqual('10.0.0.3', ranges[1]['first_ip'])
+
     def test_rebuild_availability_ranges(self):
         pools = [{'id': 'a',
                   'first_ip': '192.168.1.3',
@@ -3640,6 +3690,60 @@ class TestNeutronDbPluginV2(base.BaseTestCase):
                           ['b', '192.168.1.100', '192.168.1.109'],
                           ['b', '192.168.1.112', '192.168.1.120']], actual)
 
+    def test_rebuild_availability_ranges_split(self):
+        cfg.CONF.set_override('ip_availability_range_size', 4)
+        pools = [{'id': 'a',
+                  'first_ip': '192.168.1.3',
+                  'last_ip': '192.168.1.20'}]
+        allocations = [{'ip_address': '192.168.1.5'},
+                       {'ip_address': '192.168.1.6'}]
+
+        ip_qry = mock.Mock()
+        ip_qry.with_lockmode.return_value = ip_qry
+        ip_qry.filter_by.return_value = allocations
+
+        pool_qry = mock.Mock()
+        pool_qry.options.return_value = pool_qry
+        pool_qry.with_lockmode.return_value = pool_qry
+        pool_qry.filter_by.return_value = pools
+
+        def return_queries_side_effect(*args, **kwargs):
+            if args[0] == models_v2.IPAllocation:
+                return ip_qry
+            if args[0] == models_v2.IPAllocationPool:
+                return pool_qry
+
+        context = mock.Mock()
+        context.session.query.side_effect = return_queries_side_effect
+
+        db_base_plugin_v2.NeutronDbPluginV2._rebuild_availability_ranges(
+            context, [mock.MagicMock()])
+
+        actual = [[args[0].allocation_pool_id,
+                   args[0].first_ip, args[0].last_ip]
+                  for _name, args, _kwargs in context.session.add.mock_calls]
+
+        self.assertEqual([['a', '192.168.1.3', '192.168.1.4'],
+                          ['a', '192.168.1.7', '192.168.1.10'],
+                          ['a', '192.168.1.11', '192.168.1.14'],
+                          ['a', '192.168.1.15', '192.168.1.18'],
+                          ['a', '192.168.1.19', '192.168.1.20']], actual)
+
+    def test_split_availability_range_no_limit(self):
+        self.assertEqual(
+            [('10.0.0.2', '10.0.255.254')],
+            db_base_plugin_v2.NeutronDbPluginV2._split_availability_range(
+                '10.0.0.2', '10.0.255.254'))
+
+    def test_split_availability_range_end_of_address_space(self):
+        cfg.CONF.set_override('ip_availability_range_size', 3)
+        prefix = 'ffff:ffff:ffff:ffff:ffff:ffff:ffff:'
+        self.assertEqual(
+            [(prefix + 'fffa', prefix + 'fffc'),
+             (prefix + 'fffd', prefix + 'ffff')],
+            db_base_plugin_v2.NeutronDbPluginV2._split_availability_range(
+                prefix + 'fffa', prefix + 'ffff'))
+
 
 class NeutronDbPluginV2AsMixinTestCase(base.BaseTestCase):
     """Tests for NeutronDbPluginV2 as Mixin.
@@ -3676,6 +3780,76 @@ class NeutronDbPluginV2AsMixinTestCase(base.BaseTestCase):
         net = self.plugin.create_network(self.context, self.net_data)
         self.assertEqual(net['status'], 'BUILD')
 
+    def test_get_networks_with_core_fields(self):
+        self.plugin.create_network(self.context, self.net_data)
+        with mock.patch.object(self.plugin,
+                               '_apply_dict_extend_functions') as extend:
+            nets = self.plugin.get_networks(self.context,
+                                            fields=['id', 'name'])
+            self.assertEqual([{'id': 'fake-id', 'name': 'net1'}], nets)
+            self.assertFalse(extend.called)
+            self.plugin.get_networks(self.context, fields=['id', 'ext'])
+            self.assertEqual(1, extend.call_count)
+
+    def test_get_networks_with_keyset_marker(self):
+        for i, name in enumerate(['c', 'b', 'a', 'd']):
+            self.net_data['network'].update(id='fake-id%d' % i, name=name)
+            self.plugin.create_network(self.context, self.net_data)
+        with mock.patch.object(self.plugin, '_get_network') as get_network:
+            nets = self.plugin.get_networks(self.context,
+                                            sorts=[('name', True),
+                                                   ('id', True)],
+                                            limit=2, marker='fake-id1')
+            self.assertFalse(get_network.called)
+        self.assertEqual(['c', 'd'], [net['name'] for net in nets])
+        nets = self.plugin.get_networks(self.context,
+                                        sorts=[('name', True), ('id', True)],
+                                        limit=2, marker='fake-id1',
+                                        page_reverse=True)
+        self.assertEqual(['a'], [net['name'] for net in nets])
+        self.assertRaises(n_exc.NetworkNotFound, self.plugin.get_networks,
+                          self.context, sorts=[('name', True), ('id', True)],
+                          limit=2, marker='unknown-id')
+
+    def test_get_networks_with_keyset_marker_of_other_tenant(self):
+        for i, tenant_id in enumerate(['tenant', 'other-tenant']):
+            self.net_data['network'].update(id='fake-id%d' % i,
+                                            name='net%d' % i,
+                                            tenant_id=tenant_id)
+            self.plugin.create_network(self.context, self.net_data)
+        tenant_context = context.Context('', 'tenant')
+        self.assertRaises(n_exc.NetworkNotFound, self.plugin.get_networks,
+                          tenant_context, sorts=[('id', False)],
+                          limit=2, marker='fake-id1')
+        nets = self.plugin.get_networks(tenant_context, sorts=[('id', True)],
+                                        limit=2, marker='fake-id0')
+        self.assertEqual([], nets)
+
+    def test_get_subnets_with_fields(self):
+        self.plugin.create_network(self.context, self.net_data)
+        subnet = {'subnet': {'network_id': 'fake-id',
+                             'cidr': '10.0.0.0/24',
+                             'ip_version': 4,
+                             'name': 'subnet1',
+                             'tenant_id': 'test-tenant',
+                             'gateway_ip': attributes.ATTR_NOT_SPECIFIED,
+                             'allocation_pools':
+                             attributes.ATTR_NOT_SPECIFIED,
+                             'dns_nameservers': ['8.8.8.8'],
+                             'host_routes': attributes.ATTR_NOT_SPECIFIED,
+                             'enable_dhcp': True}}
+        subnet_id = self.plugin.create_subnet(self.context, subnet)['id']
+        self.assertEqual(
+            [{'id': subnet_id, 'dns_nameservers': ['8.8.8.8']}],
+            self.plugin.get_subnets(self.context,
+                                    fields=['id', 'dns_nameservers']))
+        nets = self.plugin.get_networks(self.context)
+        self.assertEqual([subnet_id], nets[0]['subnets'])
+        subnets = self.plugin.get_subnets(self.context)
+        self.assertEqual([{'start': '10.0.0.2', 'end': '10.0.0.254'}],
+                         subnets[0]['allocation_pools'])
+        self.assertEqual([], subnets[0]['host_routes'])
+
 
 class TestBasicGetXML(TestBasicGet):
     fmt = 'xml'
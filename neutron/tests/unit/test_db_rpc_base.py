@@ -47,6 +47,48 @@ class TestDhcpRpcCallbackMixin(base.BaseTestCase):
 
         self.assertEqual(len(self.log.mock_calls), 1)
 
+    def test_get_active_networks_info(self):
+        self.plugin.get_networks.return_value = [dict(id='a'), dict(id='b')]
+        self.plugin.get_subnets.return_value = [
+            dict(id='s1', network_id='b')]
+        self.plugin.get_ports.return_value = [
+            dict(id='p1', network_id='a'), dict(id='p2', network_id='b')]
+
+        networks = self.callbacks.get_active_networks_info(mock.Mock(),
+                                                           host='host')
+
+        self.assertEqual(
+            [dict(id='a', subnets=[], ports=[dict(id='p1', network_id='a')]),
+             dict(id='b', subnets=[dict(id='s1', network_id='b')],
+                  ports=[dict(id='p2', network_id='b')])],
+            networks)
+        self.plugin.get_subnets.assert_called_once_with(
+            mock.ANY, filters=dict(network_id=['a', 'b'], enable_dhcp=[True]))
+
+    def test_get_networks_info(self):
+        self.plugin.get_networks.return_value = [dict(id='a')]
+        self.plugin.get_subnets.return_value = [dict(id='s1', network_id='a')]
+        self.plugin.get_ports.return_value = [dict(id='p1', network_id='a')]
+
+        networks = self.callbacks.get_networks_info(
+            mock.Mock(), network_ids=['a', 'deleted'], host='host')
+
+        self.assertEqual([dict(id='a',
+                               subnets=[dict(id='s1', network_id='a')],
+                               ports=[dict(id='p1', network_id='a')])],
+                         networks)
+        self.plugin.assert_has_calls(
+            [mock.call.get_networks(mock.ANY,
+                                    filters=dict(id=['a', 'deleted'])),
+             mock.call.get_ports(mock.ANY, filters=dict(network_id=['a'])),
+             mock.call.get_subnets(mock.ANY,
+                                   filters=dict(network_id=['a']))])
+
+    def test_get_networks_info_no_networks(self):
+        self.assertEqual([], self.callbacks.get_networks_info(
+            mock.Mock(), network_ids=[], host='host'))
+        self.assertFalse(self.plugin.get_networks.called)
+
     def _test__port_action_with_failures(self, exc=None, action=None):
         port = {
             'network_id': 'foo_network_id',
@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import copy
 import os
 import sys
@@ -170,6 +171,11 @@ class TestDhcpAgent(base.BaseTestCase):
                             [mock.call(mock.ANY),
                              mock.call().report_state(mock.ANY, mock.ANY,
                                                       mock.ANY)])
+                        agent_state = (state_rpc.return_value.report_state.
+                                       call_args[0][1])
+                        self.assertEqual(
+                            {'networks_total': 0, 'networks_synced': 0},
+                            agent_state['configurations']['sync_progress'])
 
     def test_dhcp_agent_main_agent_manager(self):
         logging_str = 'neutron.agent.common.config.setup_logging'
@@ -244,7 +250,9 @@ class TestDhcpAgent(base.BaseTestCase):
     def _test_sync_state_helper(self, known_networks, active_networks):
         with mock.patch(DHCP_PLUGIN) as plug:
             mock_plugin = mock.Mock()
-            mock_plugin.get_active_networks_info.return_value = active_networks
+            mock_plugin.get_active_networks.return_value = [
+                getattr(net, 'id', net) for net in active_networks]
+            mock_plugin.get_networks_info.return_value = []
             plug.return_value = mock_plugin
 
             dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
@@ -295,7 +303,7 @@ class TestDhcpAgent(base.BaseTestCase):
     def test_sync_state_plugin_error(self):
         with mock.patch(DHCP_PLUGIN) as plug:
             mock_plugin = mock.Mock()
-            mock_plugin.get_active_networks_info.side_effect = Exception
+            mock_plugin.get_active_networks.side_effect = Exception
             plug.return_value = mock_plugin
 
             with mock.patch.object(dhcp_agent.LOG, 'exception') as log:
@@ -305,6 +313,89 @@ class TestDhcpAgent(base.BaseTestCase):
                 self.assertTrue(log.called)
                 self.assertTrue(dhcp.needs_resync)
 
+    def _make_networks(self, count):
+        return [dhcp.NetModel(True, dict(id=str(i), admin_state_up=True,
+                                         subnets=[], ports=[]))
+                for i in range(count)]
+
+    def test_sync_state_batches(self):
+        cfg.CONF.set_override('sync_networks_batch_size', 2)
+        networks = self._make_networks(5)
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks.return_value = [
+                net.id for net in networks]
+            mock_plugin.get_networks_info.side_effect = (
+                lambda ids: [net for net in networks if net.id in ids])
+            plug.return_value = mock_plugin
+
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp,
+                                   'safe_configure_dhcp_for_network') as conf:
+                dhcp.sync_state()
+                conf.assert_has_calls([mock.call(net) for net in networks],
+                                      any_order=True)
+
+        self.assertTrue(dhcp.use_networks_info_rpc)
+        mock_plugin.assert_has_calls(
+            [mock.call.get_networks_info([]),
+             mock.call.get_active_networks(),
+             mock.call.get_networks_info(['0', '1']),
+             mock.call.get_networks_info(['2', '3']),
+             mock.call.get_networks_info(['4'])])
+        self.assertEqual({'networks_total': 5, 'networks_synced': 5},
+                         dhcp.sync_progress)
+        self.assertFalse(dhcp.needs_resync)
+
+    def test_sync_state_batch_error(self):
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks.return_value = ['a']
+            mock_plugin.get_networks_info.side_effect = [[], Exception]
+            plug.return_value = mock_plugin
+
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp_agent.LOG, 'exception') as log:
+                dhcp.sync_state()
+                self.assertTrue(log.called)
+
+        self.assertTrue(dhcp.needs_resync)
+        self.assertEqual({'networks_total': 1, 'networks_synced': 0},
+                         dhcp.sync_progress)
+
+    def _test_sync_state_fallback(self, exc):
+        networks = self._make_networks(2)
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_networks_info.side_effect = exc
+            mock_plugin.get_active_networks_info.return_value = networks
+            plug.return_value = mock_plugin
+
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp,
+                                   'safe_configure_dhcp_for_network') as conf:
+                dhcp.sync_state()
+                dhcp.sync_state()
+                self.assertEqual(4, conf.call_count)
+
+        self.assertIs(False, dhcp.use_networks_info_rpc)
+        self.assertEqual(1, mock_plugin.get_networks_info.call_count)
+        self.assertFalse(mock_plugin.get_active_networks.called)
+        self.assertEqual({'networks_total': 2, 'networks_synced': 2},
+                         dhcp.sync_progress)
+
+    def test_sync_state_fallback_unsupported_version(self):
+        self._test_sync_state_fallback(common.UnsupportedRpcVersion(
+            version='1.3'))
+
+    def test_sync_state_fallback_remote_unsupported_version(self):
+        self._test_sync_state_fallback(common.RemoteError(
+            exc_type='UnsupportedRpcVersion'))
+
+    def test_sync_state_fallback_remote_attribute_error(self):
+        self._test_sync_state_fallback(common.RemoteError(
+            exc_type='AttributeError'))
+
     def test_periodic_resync(self):
         dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
         with mock.patch.object(dhcp_agent.eventlet, 'spawn') as spawn:
@@ -478,6 +569,7 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.call_driver_p = mock.patch.object(self.dhcp, 'call_driver')
 
         self.call_driver = self.call_driver_p.start()
+        cfg.CONF.set_override('port_event_delay', 0)
         self.external_process_p = mock.patch(
             'neutron.agent.linux.external_process.ProcessManager'
         )
@@ -677,6 +769,51 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         finally:
             self.external_process_p.start()
 
+    def test_single_metadata_proxy(self):
+        cfg.CONF.set_override('single_metadata_proxy', True)
+        with contextlib.nested(
+            mock.patch.object(dhcp_agent.namespace_proxy,
+                              'MultiplexedProxyManager'),
+            mock.patch.object(dhcp.Dnsmasq, 'check_version',
+                              return_value=dhcp.Dnsmasq.MINIMUM_VERSION)
+        ) as (manager, check_v):
+            agent = dhcp_agent.DhcpAgent(HOSTNAME)
+        manager.assert_called_once_with(cfg.CONF,
+                                        'dhcp-agent-metadata-proxy', 'sudo',
+                                        dhcp.METADATA_PORT)
+        self.assertEqual(manager.return_value, agent.metadata_proxy)
+
+    def test_enable_isolated_metadata_proxy_single(self):
+        self.dhcp.metadata_proxy = mock.Mock()
+        self.dhcp.enable_isolated_metadata_proxy(fake_network)
+        self.external_process.assert_has_calls([
+            mock.call(
+                cfg.CONF,
+                '12345678-1234-5678-1234567890ab',
+                'sudo',
+                'qdhcp-12345678-1234-5678-1234567890ab'),
+            mock.call().disable()
+        ])
+        self.assertFalse(self.external_process.return_value.enable.called)
+        self.dhcp.metadata_proxy.add.assert_called_once_with(
+            'qdhcp-12345678-1234-5678-1234567890ab',
+            network_id=fake_network.id, router_id=None)
+
+    def test_enable_isolated_metadata_proxy_single_metadata_network(self):
+        cfg.CONF.set_override('enable_metadata_network', True)
+        self.dhcp.metadata_proxy = mock.Mock()
+        self.dhcp.enable_isolated_metadata_proxy(fake_meta_network)
+        self.dhcp.metadata_proxy.add.assert_called_once_with(
+            'qdhcp-12345678-1234-5678-1234567890ab',
+            network_id=fake_meta_network.id, router_id='forzanapoli')
+
+    def test_disable_isolated_metadata_proxy_single(self):
+        self.dhcp.metadata_proxy = mock.Mock()
+        self.dhcp.disable_isolated_metadata_proxy(fake_network)
+        self.external_process.return_value.disable.assert_called_once_with()
+        self.dhcp.metadata_proxy.remove.assert_called_once_with(
+            'qdhcp-12345678-1234-5678-1234567890ab')
+
     def test_network_create_end(self):
         payload = dict(network=dict(id=fake_network.id))
 
@@ -790,14 +927,59 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
     def test_port_update_end(self):
         payload = dict(port=vars(fake_port2))
         self.cache.get_network_by_id.return_value = fake_network
+        self.cache.get_port_by_id.return_value = None
+        self.dhcp.port_update_end(None, payload)
+        self.cache.assert_has_calls(
+            [mock.call.get_network_by_id(fake_port2.network_id),
+             mock.call.get_port_by_id(fake_port2.id),
+             mock.call.put_port(mock.ANY)])
+        self.call_driver.assert_called_once_with('reload_allocations',
+                                                 fake_network)
+
+    def test_port_update_end_allocations_unchanged(self):
+        payload = dict(port=dict(vars(fake_port2), status='ACTIVE'))
+        self.cache.get_network_by_id.return_value = fake_network
         self.cache.get_port_by_id.return_value = fake_port2
         self.dhcp.port_update_end(None, payload)
         self.cache.assert_has_calls(
             [mock.call.get_network_by_id(fake_port2.network_id),
+             mock.call.get_port_by_id(fake_port2.id),
              mock.call.put_port(mock.ANY)])
+        self.assertFalse(self.call_driver.called)
+
+    def test_port_update_end_extra_dhcp_opts_changed(self):
+        old_port = dhcp.DictModel(dict(vars(fake_port2), extra_dhcp_opts=[]))
+        opts = [dict(opt_name='bootfile-name', opt_value='pxelinux.0')]
+        payload = dict(port=dict(vars(fake_port2), extra_dhcp_opts=opts))
+        self.cache.get_network_by_id.return_value = fake_network
+        self.cache.get_port_by_id.return_value = old_port
+        self.dhcp.port_update_end(None, payload)
         self.call_driver.assert_called_once_with('reload_allocations',
                                                  fake_network)
 
+    def test_port_events_coalesced(self):
+        cfg.CONF.set_override('port_event_delay', 0.5)
+        self.cache.get_network_by_id.return_value = fake_network
+        self.cache.get_port_by_id.return_value = None
+        with mock.patch.object(eventlet, 'spawn_after') as spawn_after:
+            self.dhcp.port_create_end(None, dict(port=vars(fake_port1)))
+            self.dhcp.port_create_end(None, dict(port=vars(fake_port2)))
+            spawn_after.assert_called_once_with(
+                0.5, self.dhcp.reload_allocations_helper, fake_network.id)
+        self.assertFalse(self.call_driver.called)
+
+        self.dhcp.reload_allocations_helper(fake_network.id)
+        self.call_driver.assert_called_once_with('reload_allocations',
+                                                 fake_network)
+        self.assertEqual(set(), self.dhcp.pending_reloads)
+
+    def test_reload_allocations_helper_network_removed(self):
+        self.dhcp.pending_reloads.add(fake_network.id)
+        self.cache.get_network_by_id.return_value = None
+        self.dhcp.reload_allocations_helper(fake_network.id)
+        self.assertFalse(self.call_driver.called)
+        self.assertEqual(set(), self.dhcp.pending_reloads)
+
     def test_port_update_change_ip_on_port(self):
         payload = dict(port=vars(fake_port1))
         self.cache.get_network_by_id.return_value = fake_network
@@ -807,6 +989,7 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.dhcp.port_update_end(None, payload)
         self.cache.assert_has_calls(
             [mock.call.get_network_by_id(fake_port1.network_id),
+             mock.call.get_port_by_id(fake_port1.id),
              mock.call.put_port(mock.ANY)])
         self.call_driver.assert_has_calls(
             [mock.call.call_driver('reload_allocations', fake_network)])
@@ -833,6 +1016,25 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.cache.assert_has_calls([mock.call.get_port_by_id('unknown')])
         self.assertEqual(self.call_driver.call_count, 0)
 
+    def test_batched_notifications(self):
+        payload = {'notifications': [
+            {'method': 'port_delete_end', 'payload': {'port_id': 'p1'}},
+            {'method': 'sync_state', 'payload': {}},
+            {'method': 'network_delete_end',
+             'payload': {'network_id': 'n1'}}]}
+        with contextlib.nested(
+            mock.patch.object(self.dhcp, 'port_delete_end',
+                              side_effect=Exception()),
+            mock.patch.object(self.dhcp, 'sync_state'),
+            mock.patch.object(self.dhcp, 'network_delete_end')
+        ) as (port_delete_end, sync_state, network_delete_end):
+            self.dhcp.batched_notifications(None, payload)
+        port_delete_end.assert_called_once_with(None, {'port_id': 'p1'})
+        self.assertFalse(sync_state.called)
+        network_delete_end.assert_called_once_with(None,
+                                                   {'network_id': 'n1'})
+        self.assertTrue(self.dhcp.needs_resync)
+
 
 class TestDhcpPluginApiProxy(base.BaseTestCase):
     def setUp(self):
@@ -878,6 +1080,23 @@ class TestDhcpPluginApiProxy(base.BaseTestCase):
         self.make_msg.assert_called_once_with('get_active_networks_info',
                                               host='foo')
 
+    def test_get_active_networks(self):
+        self.call.return_value = ['a']
+        self.assertEqual(['a'], self.proxy.get_active_networks())
+        self.make_msg.assert_called_once_with('get_active_networks',
+                                              host='foo')
+
+    def test_get_networks_info(self):
+        self.call.return_value = [dict(id='a'), dict(id='b')]
+        retval = self.proxy.get_networks_info(['a', 'b'])
+        self.assertEqual(['a', 'b'], [net.id for net in retval])
+        self.make_msg.assert_called_once_with('get_networks_info',
+                                              network_ids=['a', 'b'],
+                                              host='foo')
+        self.call.assert_called_once_with(
+            mock.ANY, mock.ANY, topic=mock.ANY,
+            version=dhcp_agent.NETWORKS_INFO_RPC_VERSION)
+
     def test_create_dhcp_port(self):
         port_body = (
             {'port':
@@ -0,0 +1,207 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import socket
+import struct
+
+import mock
+
+from neutron.agent.linux import ip_netlink as nl
+from neutron.tests import base
+
+
+def _attr(attr_type, value):
+    length = nl.RTATTR.size + len(value)
+    padding = '\0' * (nl._align(length) - length)
+    return nl.RTATTR.pack(length, attr_type) + value + padding
+
+
+def _msg(msg_type, payload):
+    return nl.NLMSGHDR.pack(nl.NLMSGHDR.size + len(payload), msg_type,
+                            0, 1, 0) + payload
+
+
+def _done():
+    return _msg(nl.NLMSG_DONE, struct.pack('=i', 0))
+
+
+def _link(index, name, link_type=nl.ARPHRD_ETHER, mac=None, mtu=1500,
+          state=6):
+    payload = nl.IFINFOMSG.pack(0, link_type, index, 0, 0)
+    payload += _attr(nl.IFLA_IFNAME, name + '\0')
+    if mac:
+        payload += _attr(nl.IFLA_ADDRESS,
+                         ''.join(chr(int(b, 16)) for b in mac.split(':')))
+    payload += _attr(nl.IFLA_MTU, struct.pack('=I', mtu))
+    payload += _attr(nl.IFLA_QDISC, 'noqueue\0')
+    payload += _attr(nl.IFLA_TXQLEN, struct.pack('=I', 0))
+    payload += _attr(nl.IFLA_OPERSTATE, chr(state))
+    return _msg(nl.RTM_NEWLINK, payload)
+
+
+def _addr(index, family, address, prefixlen, scope=0, flags=0,
+          broadcast=None):
+    payload = nl.IFADDRMSG.pack(family, prefixlen, flags, scope, index)
+    payload += _attr(nl.IFA_ADDRESS, socket.inet_pton(family, address))
+    if family == socket.AF_INET:
+        payload += _attr(nl.IFA_LOCAL, socket.inet_pton(family, address))
+    if broadcast:
+        payload += _attr(nl.IFA_BROADCAST,
+                         socket.inet_pton(family, broadcast))
+    return _msg(nl.RTM_NEWADDR, payload)
+
+
+def _route(oif, dst=None, dst_len=0, gateway=None, metric=None,
+           table=nl.RT_TABLE_MAIN, scope=0):
+    payload = nl.RTMSG.pack(socket.AF_INET, dst_len, 0, 0, table, 0, scope,
+                            1, 0)
+    payload += _attr(nl.RTA_TABLE, struct.pack('=I', table))
+    if dst:
+        payload += _attr(nl.RTA_DST, socket.inet_aton(dst))
+    if gateway:
+        payload += _attr(nl.RTA_GATEWAY, socket.inet_aton(gateway))
+    if metric is not None:
+        payload += _attr(nl.RTA_PRIORITY, struct.pack('=I', metric))
+    payload += _attr(nl.RTA_OIF, struct.pack('=I', oif))
+    return _msg(nl.RTM_NEWROUTE, payload)
+
+
+LINKS = [_link(1, 'lo', nl.ARPHRD_LOOPBACK, '00:00:00:00:00:00', 65536, 0),
+         _link(2, 'tap0', mac='cc:dd:ee:ff:ab:cd')]
+
+
+class TestIpNetlink(base.BaseTestCase):
+    def setUp(self):
+        super(TestIpNetlink, self).setUp()
+        self.sock = mock.Mock()
+        self.create_socket = mock.patch.object(
+            nl, '_create_socket', return_value=self.sock).start()
+
+    def _replies(self, *dumps):
+        # Each dump is answered with two datagrams
+        datagrams = []
+        for dump in dumps:
+            datagrams.append(''.join(dump))
+            datagrams.append(_done())
+        self.sock.recv.side_effect = datagrams
+
+    def test_get_links(self):
+        self._replies(LINKS)
+        links = nl.get_links()
+        self.assertEqual(['lo', 'tap0'], [l['name'] for l in links])
+        self.assertEqual({'index': 2, 'type': nl.ARPHRD_ETHER, 'flags': 0,
+                          'name': 'tap0', 'address': 'cc:dd:ee:ff:ab:cd',
+                          'mtu': 1500, 'qdisc': 'noqueue', 'qlen': 0,
+                          'state': 'UP'}, links[1])
+        request = self.sock.sendall.call_args[0][0]
+        length, msg_type, flags = nl.NLMSGHDR.unpack_from(request)[:3]
+        self.assertEqual(len(request), length)
+        self.assertEqual(nl.RTM_GETLINK, msg_type)
+        self.assertEqual(nl.NLM_F_REQUEST | nl.NLM_F_DUMP, flags)
+        self.sock.close.assert_called_once_with()
+
+    def test_get_link_attributes(self):
+        self._replies(LINKS, LINKS)
+        self.assertEqual({'mtu': 1500, 'qdisc': 'noqueue', 'qlen': 0,
+                          'state': 'UP', 'link/ether': 'cc:dd:ee:ff:ab:cd'},
+                         nl.get_link_attributes('tap0'))
+        self.assertEqual('00:00:00:00:00:00',
+                         nl.get_link_attributes('lo')['link/loopback'])
+
+    def test_get_link_not_found(self):
+        self._replies(LINKS)
+        self.assertRaises(RuntimeError, nl.get_link, 'tap1')
+
+    def test_netlink_error(self):
+        self.sock.recv.return_value = _msg(nl.NLMSG_ERROR,
+                                           struct.pack('=i', -1))
+        self.assertRaises(RuntimeError, nl.get_links)
+        self.sock.close.assert_called_once_with()
+
+    def test_get_addresses(self):
+        addresses = [
+            _addr(1, socket.AF_INET, '127.0.0.1', 8, scope=254,
+                  flags=nl.IFA_F_PERMANENT),
+            _addr(2, socket.AF_INET, '10.0.0.3', 24,
+                  flags=nl.IFA_F_PERMANENT, broadcast='10.0.0.255'),
+            _addr(2, socket.AF_INET, '192.168.0.3', 24),
+            _addr(2, socket.AF_INET6, 'fe80::cedd:eeff:feff:abcd', 64,
+                  scope=253, flags=nl.IFA_F_PERMANENT)]
+        self._replies(LINKS, addresses)
+        self.assertEqual(
+            [dict(cidr='10.0.0.3/24', broadcast='10.0.0.255',
+                  scope='global', ip_version=4, dynamic=False),
+             dict(cidr='192.168.0.3/24', broadcast='192.168.0.255',
+                  scope='global', ip_version=4, dynamic=True),
+             dict(cidr='fe80::cedd:eeff:feff:abcd/64', broadcast='::',
+                  scope='link', ip_version=6, dynamic=False)],
+            nl.get_addresses('tap0'))
+
+    def test_get_routes(self):
+        routes = [_route(2, gateway='10.0.0.1', metric=100),
+                  _route(2, '10.0.0.0', 24, scope=253),
+                  _route(2, '10.0.0.3', 32, table=255)]
+        self._replies(routes)
+        self.assertEqual(
+            [{'dst_len': 0, 'dst': None, 'gateway': '10.0.0.1', 'oif': 2,
+              'metric': 100, 'scope': 'global'},
+             {'dst_len': 24, 'dst': '10.0.0.0', 'gateway': None, 'oif': 2,
+              'metric': None, 'scope': 'link'}],
+            nl.get_routes())
+
+    def test_namespace_socket(self):
+        self._replies(LINKS)
+        with mock.patch('__builtin__.open') as open_, \
+                mock.patch.object(nl, '_setns') as setns:
+            target = open_.return_value.__enter__.return_value
+            target.fileno.return_value = 10
+            nl.get_links('ns')
+        open_.assert_any_call('/var/run/netns/ns')
+        open_.assert_any_call('/proc/self/ns/net')
+        self.assertEqual(2, setns.call_count)
+        self.create_socket.assert_called_once_with()
+
+    def test_namespace_does_not_exist(self):
+        with mock.patch('__builtin__.open', side_effect=IOError()):
+            self.assertRaises(RuntimeError, nl.get_links, 'ns')
+        self.assertFalse(self.create_socket.called)
+
+    def test_open_socket_in_namespace(self):
+        with contextlib.nested(
+            mock.patch('__builtin__.open'),
+            mock.patch.object(nl, '_setns'),
+            mock.patch('socket.socket')
+        ) as (open_, setns, socket_):
+            sock = nl.open_socket(socket.AF_INET, socket.SOCK_STREAM,
+                                  namespace='ns')
+        self.assertEqual(socket_.return_value, sock)
+        socket_.assert_called_once_with(socket.AF_INET, socket.SOCK_STREAM, 0)
+        open_.assert_any_call('/var/run/netns/ns')
+        self.assertEqual(2, setns.call_count)
+
+    def test_open_socket_without_namespace(self):
+        with contextlib.nested(
+            mock.patch.object(nl, '_setns'),
+            mock.patch('socket.socket')
+        ) as (setns, socket_):
+            nl.open_socket(socket.AF_INET, socket.SOCK_STREAM)
+        socket_.assert_called_once_with(socket.AF_INET, socket.SOCK_STREAM, 0)
+        self.assertFalse(setns.called)
+
+    def test_list_namespaces(self):
+        with mock.patch('os.listdir', return_value=['ns2', 'ns1']):
+            self.assertEqual(['ns1', 'ns2'], nl.list_namespaces())
+        with mock.patch('os.listdir', side_effect=OSError()):
+            self.assertEqual([], nl.list_namespaces())
@@ -0,0 +1,84 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.agent.linux import ipset_manager
+from neutron.tests import base
+
+
+class IpsetManagerTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IpsetManagerTestCase, self).setUp()
+        self.root_helper = 'sudo'
+        self.execute = mock.Mock()
+        self.ipset = ipset_manager.IpsetManager(_execute=self.execute,
+                                                root_helper=self.root_helper)
+
+    def test_get_ipset_name(self):
+        sg_id = 'a1b2c3d4-0000-1111-2222-333344445555'
+        self.assertEqual('IPv4a1b2c3d4-0000-1111-2222-333',
+                         ipset_manager.get_ipset_name('IPv4', sg_id))
+
+    def test_refresh_new_ipset(self):
+        self.ipset.refresh_ipset('set1', 'IPv6', ['fe80::1/128'])
+        self.execute.assert_called_once_with(
+            ['ipset', 'restore', '-exist'],
+            process_input=('create set1 hash:net family inet6\n'
+                           'flush set1\n'
+                           'add set1 fe80::1/128\n'),
+            root_helper=self.root_helper)
+        self.assertEqual({'set1': set(['fe80::1/128'])}, self.ipset.ipsets)
+
+    def test_refresh_ipset_only_writes_changes(self):
+        self.ipset.refresh_ipset('set1', 'IPv4',
+                                 ['10.0.0.1/32', '10.0.0.2/32'])
+        self.execute.reset_mock()
+        self.ipset.refresh_ipset('set1', 'IPv4',
+                                 ['10.0.0.2/32', '10.0.0.3/32'])
+        self.execute.assert_called_once_with(
+            ['ipset', 'restore', '-exist'],
+            process_input=('del set1 10.0.0.1/32\n'
+                           'add set1 10.0.0.3/32\n'),
+            root_helper=self.root_helper)
+
+    def test_refresh_unchanged_ipset(self):
+        self.ipset.refresh_ipset('set1', 'IPv4', ['10.0.0.1/32'])
+        self.execute.reset_mock()
+        self.ipset.refresh_ipset('set1', 'IPv4', ['10.0.0.1/32'])
+        self.assertFalse(self.execute.called)
+
+    def test_refresh_ipset_failure_forgets_members(self):
+        self.execute.side_effect = RuntimeError()
+        self.assertRaises(RuntimeError, self.ipset.refresh_ipset,
+                          'set1', 'IPv4', ['10.0.0.1/32'])
+        self.assertEqual({}, self.ipset.ipsets)
+
+    def test_refresh_ipset_in_namespace(self):
+        self.ipset.namespace = 'ns'
+        self.ipset.refresh_ipset('set1', 'IPv4', [])
+        self.execute.assert_called_once_with(
+            ['ip', 'netns', 'exec', 'ns', 'ipset', 'restore', '-exist'],
+            process_input=mock.ANY, root_helper=self.root_helper)
+
+    def test_destroy_ipset(self):
+        self.ipset.refresh_ipset('set1', 'IPv4', [])
+        self.execute.reset_mock()
+        self.ipset.destroy_ipset('set1')
+        self.ipset.destroy_ipset('unknown')
+        self.execute.assert_called_once_with(
+            ['ipset', 'destroy', 'set1'], process_input=None,
+            root_helper=self.root_helper)
+        self.assertEqual({}, self.ipset.ipsets)
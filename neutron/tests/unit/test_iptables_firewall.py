@@ -1134,3 +1134,61 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                  call.add_rule('ofake_dev', '-j $sg-fallback'),
                  call.add_rule('sg-chain', '-j ACCEPT')]
         self.v4filter_inst.assert_has_calls(calls)
+
+
+class IptablesFirewallIpsetTestCase(IptablesFirewallTestCase):
+    def setUp(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        super(IptablesFirewallIpsetTestCase, self).setUp()
+        self.firewall.ipset = mock.Mock()
+        self.firewall.ipset.ipsets = {}
+
+    def _remote_group_rules(self, remote_group_id, ips):
+        return [{'ethertype': 'IPv4',
+                 'direction': 'ingress',
+                 'protocol': 'tcp',
+                 'port_range_min': 22,
+                 'port_range_max': 22,
+                 'remote_group_id': remote_group_id,
+                 'source_ip_prefix': '%s/32' % ip} for ip in ips]
+
+    def test_prepare_port_filter_with_remote_group(self):
+        remote_group_id = _uuid()
+        ipset_name = ('IPv4' + remote_group_id)[:31]
+        port = self._fake_port()
+        port['security_group_rules'] = self._remote_group_rules(
+            remote_group_id, ['10.0.0.2', '10.0.0.3'])
+        self.firewall.prepare_port_filter(port)
+
+        ipset_rule = call.add_rule(
+            'ifake_dev',
+            '-p tcp -m tcp --dport 22 -m set --match-set %s src -j RETURN'
+            % ipset_name)
+        self.assertEqual(
+            1, self.v4filter_inst.add_rule.mock_calls.count(ipset_rule))
+        self.assertFalse([c for c in self.v4filter_inst.add_rule.mock_calls
+                          if '10.0.0.2' in str(c)])
+        self.firewall.ipset.refresh_ipset.assert_called_once_with(
+            ipset_name, 'IPv4', set(['10.0.0.2/32', '10.0.0.3/32']))
+
+    def test_remove_port_filter_destroys_unused_ipset(self):
+        remote_group_id = _uuid()
+        ipset_name = ('IPv4' + remote_group_id)[:31]
+        port = self._fake_port()
+        port['security_group_rules'] = self._remote_group_rules(
+            remote_group_id, ['10.0.0.2'])
+        self.firewall.prepare_port_filter(port)
+        self.firewall.ipset.ipsets = {ipset_name: set(['10.0.0.2/32'])}
+        self.assertFalse(self.firewall.ipset.destroy_ipset.called)
+
+        self.firewall.remove_port_filter(port)
+        self.firewall.ipset.destroy_ipset.assert_called_once_with(ipset_name)
+
+    def test_defer_apply_destroys_unused_ipset_after_apply(self):
+        port = self._fake_port()
+        self.firewall.ipset.ipsets = {'IPv4stale': set()}
+        with self.firewall.defer_apply():
+            self.firewall.prepare_port_filter(port)
+            self.assertFalse(self.firewall.ipset.destroy_ipset.called)
+        self.firewall.ipset.destroy_ipset.assert_called_once_with(
+            'IPv4stale')
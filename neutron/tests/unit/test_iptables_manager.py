@@ -616,3 +616,106 @@ class IptablesManagerStateLessTestCase(base.BaseTestCase):
 
     def test_nat_not_found(self):
         self.assertNotIn('nat', self.iptables.ipv4)
+
+
+class IptablesManagerIncrementalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IptablesManagerIncrementalTestCase, self).setUp()
+        self.root_helper = 'sudo'
+        self.config(iptables_incremental_apply=True)
+        self.iptables = (iptables_manager.
+                         IptablesManager(root_helper=self.root_helper))
+        self.execute = mock.patch.object(self.iptables, "execute").start()
+
+    def _full_sync_calls(self):
+        return [
+            (mock.call(['iptables-save', '-c'],
+                       root_helper=self.root_helper),
+             ''),
+            (mock.call(['iptables-restore', '-c'],
+                       process_input=mock.ANY,
+                       root_helper=self.root_helper),
+             None),
+        ]
+
+    def test_apply_changed_chains_only(self):
+        filter_diff = ('*filter\n'
+                       ':%(bn)s-filter - [0:0]\n'
+                       '-A %(bn)s-filter -s 0/0 -d 192.168.0.2\n'
+                       'COMMIT\n' % IPTABLES_ARG)
+        remove_diff = ('*filter\n'
+                       ':%(bn)s-filter - [0:0]\n'
+                       '-X %(bn)s-filter\n'
+                       'COMMIT\n' % IPTABLES_ARG)
+        expected_calls_and_values = self._full_sync_calls() + [
+            (mock.call(['iptables-restore', '-n'],
+                       process_input=filter_diff,
+                       root_helper=self.root_helper),
+             None),
+            (mock.call(['iptables-restore', '-n'],
+                       process_input=remove_diff,
+                       root_helper=self.root_helper),
+             None),
+        ]
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.iptables.apply()
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.ipv4['filter'].add_rule('filter',
+                                              '-s 0/0 -d 192.168.0.2')
+        self.iptables.apply()
+        # Nothing changed, nothing is written
+        self.iptables.apply()
+        self.iptables.ipv4['filter'].remove_chain('filter')
+        self.iptables.apply()
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+        self.assertEqual(1, self.iptables.stats['full_syncs'])
+        self.assertEqual(3, self.iptables.stats['incremental_syncs'])
+
+    def test_apply_unwrapped_change_is_full_sync(self):
+        expected_calls_and_values = (self._full_sync_calls() +
+                                     self._full_sync_calls())
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.iptables.apply()
+        self.iptables.ipv4['filter'].add_rule('FORWARD', '-j DROP',
+                                              wrap=False)
+        self.iptables.apply()
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+
+    def test_apply_falls_back_to_full_sync_on_error(self):
+        expected_calls_and_values = self._full_sync_calls() + [
+            (mock.call(['iptables-restore', '-n'],
+                       process_input=mock.ANY,
+                       root_helper=self.root_helper),
+             RuntimeError()),
+        ] + self._full_sync_calls()
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.iptables.apply()
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.apply()
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+        self.assertEqual(2, self.iptables.stats['full_syncs'])
+
+    def test_apply_periodic_full_sync(self):
+        self.config(iptables_full_sync_interval=1)
+        expected_calls_and_values = self._full_sync_calls() + [
+            (mock.call(['iptables-restore', '-n'],
+                       process_input=mock.ANY,
+                       root_helper=self.root_helper),
+             None),
+        ] + self._full_sync_calls()
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.iptables.apply()
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.apply()
+        self.iptables.ipv4['filter'].add_chain('filter2')
+        self.iptables.apply()
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
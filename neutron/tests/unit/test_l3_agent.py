@@ -14,6 +14,7 @@
 #    under the License.
 
 import copy
+import datetime
 
 import mock
 from oslo.config import cfg
@@ -26,6 +27,8 @@ from neutron.common import config as base_config
 from neutron.common import constants as l3_constants
 from neutron.common import exceptions as n_exc
 from neutron.openstack.common import processutils
+from neutron.openstack.common.rpc import common as rpc_common
+from neutron.openstack.common import timeutils
 from neutron.openstack.common import uuidutils
 from neutron.tests import base
 
@@ -33,6 +36,7 @@ from neutron.tests import base
 _uuid = uuidutils.generate_uuid
 HOSTNAME = 'myhost'
 FAKE_ID = _uuid()
+FAKE_ID_2 = _uuid()
 
 
 class TestBasicRouterOperations(base.BaseTestCase):
@@ -52,6 +56,9 @@ class TestBasicRouterOperations(base.BaseTestCase):
         self.conf.set_override('send_arp_for_ha', 1)
         self.conf.root_helper = 'sudo'
 
+        mock.patch.object(l3_agent.ExclusiveRouterProcessor,
+                          '_router_timestamps', {}).start()
+
         self.device_exists_p = mock.patch(
             'neutron.agent.linux.ip_lib.device_exists')
         self.device_exists = self.device_exists_p.start()
@@ -675,7 +682,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
             # The unexpected exception has been fixed manually
             internal_network_added.side_effect = None
 
-            # _sync_routers_task finds out that _rpc_loop failed to process the
+            # _sync_routers_task finds out that the agent failed to process the
             # router last time, it will retry in the next run.
             agent.process_router(ri)
             # We were able to add the port to ri.internal_ports
@@ -706,7 +713,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
             # The unexpected exception has been fixed manually
             internal_net_removed.side_effect = None
 
-            # _sync_routers_task finds out that _rpc_loop failed to process the
+            # _sync_routers_task finds out that the agent failed to process the
             # router last time, it will retry in the next run.
             agent.process_router(ri)
             # We were able to remove the port from ri.internal_ports
@@ -798,27 +805,27 @@ class TestBasicRouterOperations(base.BaseTestCase):
 
     def test_router_deleted(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue = mock.Mock()
         agent.router_deleted(None, FAKE_ID)
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.removed_routers)
+        self.assertEqual(1, agent._queue.add.call_count)
 
     def test_routers_updated(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue = mock.Mock()
         agent.routers_updated(None, [FAKE_ID])
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.updated_routers)
+        self.assertEqual(1, agent._queue.add.call_count)
 
     def test_removed_from_agent(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue = mock.Mock()
         agent.router_removed_from_agent(None, {'router_id': FAKE_ID})
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.removed_routers)
+        self.assertEqual(1, agent._queue.add.call_count)
 
     def test_added_to_agent(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue = mock.Mock()
         agent.router_added_to_agent(None, [FAKE_ID])
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.updated_routers)
+        self.assertEqual(1, agent._queue.add.call_count)
 
     def test_process_router_delete(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
@@ -835,8 +842,146 @@ class TestBasicRouterOperations(base.BaseTestCase):
             'gw_port': ex_gw_port}
         agent._router_added(router['id'], router)
         agent.router_deleted(None, router['id'])
-        agent._process_router_delete()
-        self.assertFalse(list(agent.removed_routers))
+        agent._process_router_update()
+        self.assertNotIn(router['id'], agent.router_info)
+        self.assertFalse(self.plugin_api.get_routers.called)
+
+    def test_process_router_update_fetches_router(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = {'id': FAKE_ID}
+        self.plugin_api.get_routers.return_value = [router]
+        agent.routers_updated(None, [FAKE_ID])
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._process_router_update()
+        self.plugin_api.get_routers.assert_called_once_with(agent.context,
+                                                            [FAKE_ID])
+        process.assert_called_once_with([router])
+
+    def test_process_router_update_coalesces_updates(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = {'id': FAKE_ID}
+        self.plugin_api.get_routers.return_value = [router]
+        # Both updates are older than the data fetched for the first one
+        agent.routers_updated(None, [FAKE_ID])
+        agent.routers_updated(None, [FAKE_ID])
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._process_router_update()
+            agent._process_router_update()
+        self.assertEqual(1, self.plugin_api.get_routers.call_count)
+        self.assertEqual(1, process.call_count)
+
+    def test_process_router_update_removes_missing_router(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_routers.return_value = []
+        agent.routers_updated(None, [FAKE_ID])
+        with mock.patch.object(agent, '_router_removed') as removed:
+            agent._process_router_update()
+        removed.assert_called_once_with(FAKE_ID)
+
+    def test_process_router_update_rpc_error(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.fullsync = False
+        self.plugin_api.get_routers.side_effect = Exception()
+        agent.routers_updated(None, [FAKE_ID])
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._process_router_update()
+        self.assertFalse(process.called)
+        self.assertTrue(agent.fullsync)
+
+    def test_sync_routers_task(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue = mock.Mock()
+        stale_id = _uuid()
+        agent.router_info[stale_id] = mock.Mock()
+        router = {'id': FAKE_ID}
+        self.plugin_api.get_changed_routers.side_effect = (
+            rpc_common.RemoteError('UnsupportedRpcVersion'))
+        self.plugin_api.get_routers.return_value = [router]
+        agent._sync_routers_task(agent.context)
+        self.assertFalse(agent.fullsync)
+        self.assertFalse(agent.use_changed_routers_rpc)
+        updates = [c[0][0] for c in agent._queue.add.call_args_list]
+        self.assertEqual([FAKE_ID, stale_id], [u.id for u in updates])
+        self.assertEqual(router, updates[0].router)
+        self.assertEqual(l3_agent.DELETE_ROUTER, updates[1].action)
+        for update in updates:
+            self.assertEqual(l3_agent.PRIORITY_SYNC_ROUTERS_TASK,
+                             update.priority)
+
+        # The server is not asked for the changed routers anymore
+        agent.fullsync = True
+        agent._sync_routers_task(agent.context)
+        self.assertEqual(1, self.plugin_api.get_changed_routers.call_count)
+        self.assertEqual(2, self.plugin_api.get_routers.call_count)
+
+    def test_sync_routers_task_changed_routers(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue = mock.Mock()
+        unchanged_id, removed_id, failed_id = _uuid(), _uuid(), _uuid()
+        for router_id in (unchanged_id, removed_id, failed_id):
+            agent.router_info[router_id] = mock.Mock()
+        agent.router_revisions = {unchanged_id: 3, removed_id: 1}
+        router = {'id': FAKE_ID, 'revision': 2}
+        self.plugin_api.get_changed_routers.return_value = {
+            'routers': [router], 'deleted_router_ids': [removed_id]}
+        agent._sync_routers_task(agent.context)
+        self.assertFalse(agent.fullsync)
+        self.assertTrue(agent.use_changed_routers_rpc)
+        self.plugin_api.get_changed_routers.assert_called_once_with(
+            agent.context,
+            {unchanged_id: 3, removed_id: 1, failed_id: None}, None)
+        self.assertFalse(self.plugin_api.get_routers.called)
+        updates = [c[0][0] for c in agent._queue.add.call_args_list]
+        self.assertEqual([FAKE_ID, removed_id], [u.id for u in updates])
+        self.assertEqual(l3_agent.DELETE_ROUTER, updates[1].action)
+        self.assertEqual({unchanged_id: 3}, agent.router_revisions)
+
+    def _test_sync_routers_task_changed_routers_error(self, exc_type):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_changed_routers.side_effect = (
+            rpc_common.RemoteError(exc_type))
+        agent._sync_routers_task(agent.context)
+        self.assertTrue(agent.fullsync)
+        self.assertIsNone(agent.use_changed_routers_rpc)
+        self.assertFalse(self.plugin_api.get_routers.called)
+
+    def test_sync_routers_task_changed_routers_error(self):
+        self._test_sync_routers_task_changed_routers_error('ValueError')
+
+    def test_sync_routers_task_changed_routers_attribute_error(self):
+        # A bug of the server method doesn't disable the incremental sync
+        self._test_sync_routers_task_changed_routers_error('AttributeError')
+
+    def test_sync_routers_task_cleans_up_with_all_routers(self):
+        self.conf.set_override('router_delete_namespaces', True)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue = mock.Mock()
+        self.plugin_api.get_routers.return_value = [{'id': FAKE_ID}]
+        with mock.patch.object(agent, '_cleanup_namespaces') as cleanup:
+            agent._sync_routers_task(agent.context)
+        cleanup.assert_called_once_with([{'id': FAKE_ID}])
+        self.assertFalse(self.plugin_api.get_changed_routers.called)
+
+    def test_process_router_update_records_revision(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = {'id': FAKE_ID, 'revision': 4}
+        agent._queue.add(l3_agent.RouterUpdate(
+            FAKE_ID, l3_agent.PRIORITY_SYNC_ROUTERS_TASK, router=router))
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._process_router_update()
+            self.assertEqual({FAKE_ID: 4}, agent.router_revisions)
+
+            # A router fetched on a notification has to be synced again
+            self.plugin_api.get_routers.return_value = [{'id': FAKE_ID}]
+            agent.routers_updated(None, [FAKE_ID])
+            agent._process_router_update()
+            self.assertEqual({}, agent.router_revisions)
+
+            agent._queue.add(l3_agent.RouterUpdate(
+                FAKE_ID, l3_agent.PRIORITY_SYNC_ROUTERS_TASK, router=router))
+            process.side_effect = Exception()
+            agent._process_router_update()
+        self.assertEqual({}, agent.router_revisions)
 
     def test_destroy_router_namespace_skips_ns_removal(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
@@ -1095,11 +1240,128 @@ class TestBasicRouterOperations(base.BaseTestCase):
                                      other_namespaces)
 
 
+class TestRouterProcessingQueue(base.BaseTestCase):
+    def setUp(self):
+        super(TestRouterProcessingQueue, self).setUp()
+        mock.patch.object(l3_agent.ExclusiveRouterProcessor,
+                          '_masters', {}).start()
+        mock.patch.object(l3_agent.ExclusiveRouterProcessor,
+                          '_router_timestamps', {}).start()
+
+    def test_router_update_priority(self):
+        now = datetime.datetime.utcnow()
+        later = now + datetime.timedelta(seconds=1)
+        rpc = l3_agent.RouterUpdate(FAKE_ID, l3_agent.PRIORITY_RPC,
+                                    timestamp=later)
+        sync = l3_agent.RouterUpdate(FAKE_ID,
+                                     l3_agent.PRIORITY_SYNC_ROUTERS_TASK,
+                                     timestamp=now)
+        older_rpc = l3_agent.RouterUpdate(FAKE_ID, l3_agent.PRIORITY_RPC,
+                                          timestamp=now)
+        self.assertEqual([older_rpc, rpc, sync],
+                         sorted([sync, rpc, older_rpc]))
+
+    def test_each_update_to_next_router(self):
+        queue = l3_agent.RouterProcessingQueue()
+        sync = l3_agent.RouterUpdate(
+            'r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK)
+        rpc = l3_agent.RouterUpdate('r2', l3_agent.PRIORITY_RPC)
+        queue.add(sync)
+        queue.add(rpc)
+        self.assertEqual([rpc],
+                         [u for rp, u in queue.each_update_to_next_router()])
+        self.assertEqual([sync],
+                         [u for rp, u in queue.each_update_to_next_router()])
+
+    def test_i_am_master(self):
+        master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        not_master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        master_2 = l3_agent.ExclusiveRouterProcessor(FAKE_ID_2)
+        not_master_2 = l3_agent.ExclusiveRouterProcessor(FAKE_ID_2)
+
+        self.assertTrue(master._i_am_master())
+        self.assertFalse(not_master._i_am_master())
+        self.assertTrue(master_2._i_am_master())
+        self.assertFalse(not_master_2._i_am_master())
+
+        master.__exit__(None, None, None)
+        master_2.__exit__(None, None, None)
+
+    def test_master(self):
+        master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        not_master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        master_2 = l3_agent.ExclusiveRouterProcessor(FAKE_ID_2)
+        not_master_2 = l3_agent.ExclusiveRouterProcessor(FAKE_ID_2)
+
+        self.assertEqual(master._master, master)
+        self.assertEqual(not_master._master, master)
+        self.assertEqual(master_2._master, master_2)
+        self.assertEqual(not_master_2._master, master_2)
+
+        master.__exit__(None, None, None)
+        master_2.__exit__(None, None, None)
+
+    def test__enter__(self):
+        self.assertFalse(FAKE_ID in l3_agent.ExclusiveRouterProcessor._masters)
+        master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        master.__enter__()
+        self.assertTrue(FAKE_ID in l3_agent.ExclusiveRouterProcessor._masters)
+        master.__exit__(None, None, None)
+
+    def test__exit__(self):
+        master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        not_master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        master.__enter__()
+        self.assertTrue(FAKE_ID in l3_agent.ExclusiveRouterProcessor._masters)
+        not_master.__enter__()
+        not_master.__exit__(None, None, None)
+        self.assertTrue(FAKE_ID in l3_agent.ExclusiveRouterProcessor._masters)
+        master.__exit__(None, None, None)
+        self.assertFalse(FAKE_ID in l3_agent.ExclusiveRouterProcessor._masters)
+
+    def test_data_fetched_since(self):
+        master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        self.assertEqual(master._get_router_data_timestamp(),
+                         datetime.datetime.min)
+
+        ts1 = datetime.datetime.utcnow() - datetime.timedelta(seconds=10)
+        ts2 = datetime.datetime.utcnow()
+
+        master.fetched_and_processed(ts2)
+        self.assertEqual(master._get_router_data_timestamp(), ts2)
+        master.fetched_and_processed(ts1)
+        self.assertEqual(master._get_router_data_timestamp(), ts2)
+
+        master.__exit__(None, None, None)
+
+    def test_updates(self):
+        master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        not_master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+
+        master.queue_update(l3_agent.RouterUpdate(FAKE_ID, 0))
+        not_master.queue_update(l3_agent.RouterUpdate(FAKE_ID, 0))
+
+        for update in not_master.updates():
+            raise Exception("Only the master should process a router")
+
+        self.assertEqual(2, len([i for i in master.updates()]))
+
+    def test_updates_discards_stale_update(self):
+        master = l3_agent.ExclusiveRouterProcessor(FAKE_ID)
+        stale = l3_agent.RouterUpdate(FAKE_ID, 0)
+        master.fetched_and_processed(timeutils.utcnow())
+        master.queue_update(stale)
+        self.assertEqual([], list(master.updates()))
+        master.__exit__(None, None, None)
+
+
 class TestL3AgentEventHandler(base.BaseTestCase):
 
     def setUp(self):
         super(TestL3AgentEventHandler, self).setUp()
         cfg.CONF.register_opts(l3_agent.L3NATAgent.OPTS)
+        agent_config.register_interface_driver_opts_helper(cfg.CONF)
+        agent_config.register_use_namespaces_opts_helper(cfg.CONF)
         cfg.CONF.set_override(
             'interface_driver', 'neutron.agent.linux.interface.NullDriver'
         )
@@ -1165,3 +1427,38 @@ class TestL3AgentEventHandler(base.BaseTestCase):
                 ])
         finally:
             self.external_process_p.start()
+
+    def test_single_metadata_proxy(self):
+        cfg.CONF.set_override('single_metadata_proxy', True)
+        with mock.patch.object(l3_agent.namespace_proxy,
+                               'MultiplexedProxyManager') as manager:
+            agent = l3_agent.L3NATAgent(HOSTNAME)
+        manager.assert_called_once_with(agent.conf,
+                                        'l3-agent-metadata-proxy', 'sudo',
+                                        cfg.CONF.metadata_port)
+        self.assertEqual(manager.return_value, agent.metadata_proxy)
+
+    def test_spawn_metadata_proxy_single(self):
+        router_id = _uuid()
+        ns = 'qrouter-' + router_id
+        self.agent.metadata_proxy = mock.Mock()
+        with mock.patch.object(l3_agent.external_process,
+                               'ProcessManager') as pm:
+            self.agent._spawn_metadata_proxy(router_id, ns)
+        # The proxy spawned in the namespace by a previous run is stopped
+        pm.assert_has_calls([mock.call(self.agent.conf, router_id, 'sudo',
+                                       ns),
+                             mock.call().disable()])
+        self.assertFalse(pm.return_value.enable.called)
+        self.agent.metadata_proxy.add.assert_called_once_with(
+            ns, router_id=router_id)
+
+    def test_destroy_metadata_proxy_single(self):
+        router_id = _uuid()
+        ns = 'qrouter-' + router_id
+        self.agent.metadata_proxy = mock.Mock()
+        with mock.patch.object(l3_agent.external_process,
+                               'ProcessManager') as pm:
+            self.agent._destroy_metadata_proxy(router_id, ns)
+        pm.return_value.disable.assert_called_once_with()
+        self.agent.metadata_proxy.remove.assert_called_once_with(ns)
@@ -30,6 +30,7 @@ from neutron.db import api as qdbapi
 from neutron.db import db_base_plugin_v2
 from neutron.db import external_net_db
 from neutron.db import l3_db
+from neutron.db import l3_rpc_base
 from neutron.db import model_base
 from neutron.extensions import external_net
 from neutron.extensions import l3
@@ -1649,6 +1650,49 @@ class L3AgentDbTestCaseBase(L3NatTestCaseMixin):
             self.assertIsNotNone(floatingips[0]['fixed_ip_address'])
             self.assertIsNotNone(floatingips[0]['router_id'])
 
+    def test_router_revision_bumped_on_changes(self):
+        ctx = context.get_admin_context()
+        with self.router() as r:
+            router_id = r['router']['id']
+            self.assertEqual({router_id: 0},
+                             self.plugin.get_router_revisions(ctx))
+            with self.port(no_delete=True) as p:
+                self._router_interface_action('add', router_id, None,
+                                              p['port']['id'])
+                self.assertEqual({router_id: 1},
+                                 self.plugin.get_router_revisions(ctx))
+                self._router_interface_action('remove', router_id, None,
+                                              p['port']['id'])
+            self._update('routers', router_id,
+                         {'router': {'name': 'renamed'}})
+            self.assertEqual({router_id: 3},
+                             self.plugin.get_router_revisions(
+                                 ctx, [router_id]))
+
+    def test_sync_changed_routers(self):
+        callbacks = l3_rpc_base.L3RpcCallbackMixin()
+        ctx = context.get_admin_context()
+        removed_id = _uuid()
+        with contextlib.nested(self.router(),
+                               self.router()) as (r1, r2):
+            r1_id = r1['router']['id']
+            r2_id = r2['router']['id']
+            result = callbacks.sync_changed_routers(
+                ctx, host='host', router_revisions={r1_id: 0,
+                                                    removed_id: 0})
+            self.assertEqual([r2_id],
+                             [r['id'] for r in result['routers']])
+            self.assertEqual(0, result['routers'][0]['revision'])
+            self.assertEqual([removed_id], result['deleted_router_ids'])
+
+            self._update('routers', r1_id, {'router': {'name': 'renamed'}})
+            result = callbacks.sync_changed_routers(
+                ctx, host='host', router_revisions={r1_id: 0, r2_id: 0})
+            self.assertEqual([(r1_id, 1)],
+                             [(r['id'], r['revision'])
+                              for r in result['routers']])
+            self.assertEqual([], result['deleted_router_ids'])
+
     def _test_notify_op_agent(self, target_func, *args):
         l3_rpc_agent_api_str = (
             'neutron.api.rpc.agentnotifiers.l3_rpc_agent_api.L3AgentNotifyAPI')
@@ -204,3 +204,52 @@ class L3AgentLeastRoutersSchedulerTestCase(L3SchedulerTestCase):
                         agent_id3 = agents[0]['id']
 
                         self.assertNotEqual(agent_id1, agent_id3)
+
+
+class L3AgentAutoScheduleTestCase(L3SchedulerTestCase):
+
+    def test_auto_schedule_routers_in_bulk(self):
+        with contextlib.nested(self.router(), self.router(),
+                               self.router()) as routers:
+            router_ids = [r['router']['id'] for r in routers]
+            with mock.patch.object(
+                self.plugin, 'get_l3_agent_candidates',
+                side_effect=self.plugin.get_l3_agent_candidates
+            ) as candidates:
+                self.assertTrue(self.plugin.auto_schedule_routers(
+                    self.adminContext, HOST, router_ids[:2]))
+                # the routers without gateway are checked only once
+                self.assertEqual(1, candidates.call_count)
+            hosted = self.plugin.list_routers_on_l3_agent(self.adminContext,
+                                                          self.agent_id1)
+            self.assertEqual(sorted(router_ids[:2]),
+                             sorted(r['id'] for r in hosted['routers']))
+
+            # Only the routers which are not hosted are scheduled
+            self.assertFalse(self.plugin.auto_schedule_routers(
+                self.adminContext, HOST, router_ids[:2]))
+            self.assertTrue(self.plugin.auto_schedule_routers(
+                self.adminContext, HOST, None))
+            hosted = self.plugin.list_routers_on_l3_agent(self.adminContext,
+                                                          self.agent_id1)
+            self.assertEqual(3, len(hosted['routers']))
+
+    def test_filter_compatible_routers(self):
+        agent = self.plugin._get_agent(self.adminContext, self.agent_id1)
+        routers = [{'id': 'r1', 'external_gateway_info': {'network_id': 'n1'}},
+                   {'id': 'r2', 'external_gateway_info': {'network_id': 'n2'}},
+                   {'id': 'r3', 'external_gateway_info': None},
+                   {'id': 'r4', 'external_gateway_info': {'network_id': 'n1'}}]
+        scheduler = self.plugin.router_scheduler
+        with mock.patch.object(
+            self.plugin, 'get_configuration_dict',
+            return_value={'gateway_external_network_id': 'n1',
+                          'handle_internal_only_routers': False}):
+            self.assertEqual(['r1', 'r4'], sorted(
+                scheduler._filter_compatible_routers(self.plugin, routers,
+                                                     agent)))
+        with mock.patch.object(
+            self.plugin, 'get_configuration_dict',
+            return_value={'use_namespaces': False, 'router_id': 'r2'}):
+            self.assertEqual(['r2'], scheduler._filter_compatible_routers(
+                self.plugin, routers, agent))
@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import os
 
 import mock
@@ -1062,6 +1063,37 @@ tag:tag1,249,%s,%s""".lstrip() % (fake_v6,
                                         mock.call(exp_opt_name, exp_opt_data)])
             mock_open.assert_called_once_with('/proc/5/cmdline', 'r')
 
+    def test_reload_allocations_unchanged(self):
+        dm = dhcp.Dnsmasq(self.conf, FakeDualNetwork(), version=float(2.59))
+        with contextlib.nested(
+            mock.patch.object(dm, '_release_unused_leases'),
+            mock.patch.object(dm, '_output_hosts_file'),
+            mock.patch.object(dm, '_output_opts_file'),
+            mock.patch.object(dhcp.Dnsmasq, 'active')
+        ) as (release, hosts, opts, active):
+            active.__get__ = mock.Mock(return_value=True)
+            dm.reload_allocations()
+            self.assertTrue(hosts.called)
+            self.assertTrue(opts.called)
+        self.assertFalse(self.execute.called)
+        self.assertFalse(self.mock_mgr.return_value.update.called)
+
+    def test_replace_conf_file(self):
+        dm = dhcp.Dnsmasq(self.conf, FakeDualNetwork(), version=float(2.59))
+        with contextlib.nested(
+            mock.patch('os.path.exists', return_value=True),
+            mock.patch('__builtin__.open')
+        ) as (exists, mock_open):
+            mock_open.return_value.__enter__ = lambda s: s
+            mock_open.return_value.__exit__ = mock.Mock()
+            mock_open.return_value.read.return_value = 'data'
+            dm._replace_conf_file('/foo/host', 'data')
+            self.assertFalse(self.safe.called)
+            self.assertFalse(dm._conf_files_changed)
+            dm._replace_conf_file('/foo/host', 'new data')
+        self.safe.assert_called_once_with('/foo/host', 'new data')
+        self.assertTrue(dm._conf_files_changed)
+
     def test_release_unused_leases(self):
         dnsmasq = dhcp.Dnsmasq(self.conf, FakeDualNetwork())
 
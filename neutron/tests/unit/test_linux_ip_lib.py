@@ -15,7 +15,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
+from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
 from neutron.common import exceptions
@@ -194,6 +197,25 @@ class TestSubProcessBase(base.BaseTestCase):
                           base._as_root,
                           [], 'link', ('list',))
 
+    def test_netlink_usable_not_configured(self):
+        self.assertFalse(ip_lib.SubProcessBase('sudo')._netlink_usable())
+
+    def _netlink_usable(self, namespace=None, euid=1000, force_root=False):
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        self.config(ip_lib_use_netlink=True, ip_lib_force_root=force_root)
+        with mock.patch('os.geteuid', return_value=euid):
+            return ip_lib.SubProcessBase('sudo', namespace)._netlink_usable()
+
+    def test_netlink_usable_root_namespace(self):
+        self.assertTrue(self._netlink_usable())
+
+    def test_netlink_usable_namespace_requires_root(self):
+        self.assertFalse(self._netlink_usable('ns'))
+        self.assertTrue(self._netlink_usable('ns', euid=0))
+
+    def test_netlink_usable_force_root(self):
+        self.assertFalse(self._netlink_usable(force_root=True))
+
 
 class TestIpWrapper(base.BaseTestCase):
     def setUp(self):
@@ -202,6 +224,29 @@ class TestIpWrapper(base.BaseTestCase):
         self.execute = self.execute_p.start()
         self.addCleanup(self.execute_p.stop)
 
+    def test_get_devices_netlink(self):
+        links = [{'name': 'lo'}, {'name': 'tap0'}]
+        with contextlib.nested(
+            mock.patch.object(ip_lib.IPWrapper, '_netlink_usable',
+                              return_value=True),
+            mock.patch.object(ip_lib.ip_netlink, 'get_links',
+                              return_value=links)
+        ) as (usable, get_links):
+            retval = ip_lib.IPWrapper('sudo', 'ns').get_devices(
+                exclude_loopback=True)
+        get_links.assert_called_once_with('ns')
+        self.assertEqual([ip_lib.IPDevice('tap0', 'sudo', 'ns')], retval)
+        self.assertFalse(self.execute.called)
+
+    def test_get_namespaces_netlink(self):
+        with contextlib.nested(
+            mock.patch.object(ip_lib, 'use_netlink', return_value=True),
+            mock.patch.object(ip_lib.ip_netlink, 'list_namespaces',
+                              return_value=['ns'])
+        ):
+            self.assertEqual(['ns'], ip_lib.IPWrapper.get_namespaces('sudo'))
+        self.assertFalse(self.execute.called)
+
     def test_get_devices(self):
         self.execute.return_value = '\n'.join(LINK_SAMPLE)
         retval = ip_lib.IPWrapper('sudo').get_devices()
@@ -459,6 +504,8 @@ class TestIPCmdBase(base.BaseTestCase):
         self.parent = mock.Mock()
         self.parent.name = 'eth0'
         self.parent.root_helper = 'sudo'
+        self.parent.use_netlink = False
+        self.parent._netlink_usable.return_value = False
 
     def _assert_call(self, options, args):
         self.parent.assert_has_calls([
@@ -548,6 +595,23 @@ class TestIpLinkCommand(TestIPCmdBase):
         self._assert_call('o', ('show', 'eth0'))
 
 
+class TestIpLinkCommandNetlink(TestIPCmdBase):
+    def setUp(self):
+        super(TestIpLinkCommandNetlink, self).setUp()
+        self.parent._netlink_usable.return_value = True
+        self.parent.namespace = 'ns'
+        self.link_cmd = ip_lib.IpLinkCommand(self.parent)
+
+    def test_attributes(self):
+        attributes = {'mtu': 1500, 'link/ether': 'cc:dd:ee:ff:ab:cd'}
+        with mock.patch.object(ip_lib.ip_netlink, 'get_link_attributes',
+                               return_value=attributes) as get_attributes:
+            self.assertEqual('cc:dd:ee:ff:ab:cd', self.link_cmd.address)
+            self.assertEqual(1500, self.link_cmd.mtu)
+        get_attributes.assert_called_with('eth0', 'ns')
+        self.assertFalse(self.parent._run.called)
+
+
 class TestIpAddrCommand(TestIPCmdBase):
     def setUp(self):
         super(TestIpAddrCommand, self).setUp()
@@ -622,6 +686,47 @@ class TestIpAddrCommand(TestIPCmdBase):
                               'global'))
 
 
+class TestIpAddrCommandNetlink(TestIPCmdBase):
+    def setUp(self):
+        super(TestIpAddrCommandNetlink, self).setUp()
+        self.parent._netlink_usable.return_value = True
+        self.parent.name = 'tap0'
+        self.parent.namespace = None
+        self.addr_cmd = ip_lib.IpAddrCommand(self.parent)
+        self.addresses = [
+            dict(cidr='172.16.77.240/24', broadcast='172.16.77.255',
+                 scope='global', ip_version=4, dynamic=False),
+            dict(cidr='10.0.0.3/24', broadcast='10.0.0.255',
+                 scope='global', ip_version=4, dynamic=True),
+            dict(cidr='2001:470:9:1224:5595:dd51:6ba2:e788/64',
+                 broadcast='::', scope='global', ip_version=6, dynamic=False),
+            dict(cidr='fe80::dfcc:aaff:feb9:76ce/64', broadcast='::',
+                 scope='link', ip_version=6, dynamic=False)]
+        self.get_addresses = mock.patch.object(
+            ip_lib.ip_netlink, 'get_addresses',
+            return_value=self.addresses).start()
+
+    def test_list(self):
+        self.assertEqual(self.addresses, self.addr_cmd.list())
+        self.get_addresses.assert_called_once_with('tap0', None)
+        self.assertFalse(self.parent._run.called)
+
+    def test_list_filtered(self):
+        self.assertEqual(self.addresses[3:], self.addr_cmd.list(scope='link'))
+        self.assertEqual(
+            [self.addresses[0], self.addresses[2]],
+            self.addr_cmd.list(scope='global', filters=['permanent']))
+        self.assertEqual(self.addresses[1:2],
+                         self.addr_cmd.list(to='10.0.0.3'))
+        self.assertFalse(self.parent._run.called)
+
+    def test_list_unsupported_filter(self):
+        self.parent._run.return_value = ''
+        self.addr_cmd.list(filters=['dynamic'])
+        self.assertFalse(self.get_addresses.called)
+        self.assertTrue(self.parent._run.called)
+
+
 class TestIpRouteCommand(TestIPCmdBase):
     def setUp(self):
         super(TestIpRouteCommand, self).setUp()
@@ -695,6 +800,43 @@ class TestIpRouteCommand(TestIPCmdBase):
         self.assertEqual(len(self.parent._run.mock_calls), 2)
 
 
+class TestIpRouteCommandNetlink(TestIPCmdBase):
+    def setUp(self):
+        super(TestIpRouteCommandNetlink, self).setUp()
+        self.parent._netlink_usable.return_value = True
+        self.parent.namespace = 'ns'
+        self.route_cmd = ip_lib.IpRouteCommand(self.parent)
+        mock.patch.object(ip_lib.ip_netlink, 'get_link',
+                          return_value={'index': 2}).start()
+        self.get_routes = mock.patch.object(ip_lib.ip_netlink,
+                                            'get_routes').start()
+
+    def _route(self, dst_len, oif, gateway=None, metric=None,
+               scope='global'):
+        return {'dst_len': dst_len, 'oif': oif, 'gateway': gateway,
+                'metric': metric, 'scope': scope}
+
+    def test_get_gateway(self):
+        self.get_routes.return_value = [
+            self._route(24, 2, scope='link'),
+            self._route(0, 1, '10.0.0.1'),
+            self._route(0, 2, '10.0.0.254', 100)]
+        self.assertEqual({'gateway': '10.0.0.254', 'metric': 100},
+                         self.route_cmd.get_gateway())
+        self.get_routes.assert_called_once_with('ns')
+        self.assertFalse(self.parent._run.called)
+
+    def test_get_gateway_scope(self):
+        self.get_routes.return_value = [self._route(0, 2, '10.0.0.254')]
+        self.assertEqual({'gateway': '10.0.0.254'},
+                         self.route_cmd.get_gateway(scope='global'))
+        self.assertIsNone(self.route_cmd.get_gateway(scope='link'))
+
+    def test_get_gateway_no_default_route(self):
+        self.get_routes.return_value = [self._route(24, 2, scope='link')]
+        self.assertIsNone(self.route_cmd.get_gateway())
+
+
 class TestIpNetnsCommand(TestIPCmdBase):
     def setUp(self):
         super(TestIpNetnsCommand, self).setUp()
@@ -711,6 +853,14 @@ class TestIpNetnsCommand(TestIPCmdBase):
             self.netns_cmd.delete('ns')
             self._assert_sudo([], ('delete', 'ns'), force_root_namespace=True)
 
+    def test_namespace_exists_netlink(self):
+        self.parent.use_netlink = True
+        with mock.patch.object(ip_lib.ip_netlink, 'namespace_exists',
+                               return_value=True) as exists:
+            self.assertTrue(self.netns_cmd.exists('ns'))
+        exists.assert_called_once_with('ns')
+        self.assertFalse(self.parent._as_root.called)
+
     def test_namespace_exists(self):
         retval = '\n'.join(NETNS_SAMPLE)
         self.parent._as_root.return_value = retval
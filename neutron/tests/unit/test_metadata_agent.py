@@ -41,6 +41,54 @@ class FakeConf(object):
     nova_metadata_ip = '9.9.9.9'
     nova_metadata_port = 8775
     metadata_proxy_shared_secret = 'secret'
+    nova_metadata_pool_size = 10
+    metadata_cache_ttl = 5
+    metadata_cache_size = 1000
+
+
+class TestInstanceCache(base.BaseTestCase):
+    def setUp(self):
+        super(TestInstanceCache, self).setUp()
+        self.time = mock.patch('time.time', return_value=100).start()
+        self.cache = agent.InstanceCache(5, 2)
+
+    def test_get_counts_hits_and_misses(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', 'value')
+        self.assertEqual('value', self.cache.get('key'))
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+
+    def test_get_expired_entry(self):
+        self.cache.set('key', 'value')
+        self.time.return_value = 105
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(1, self.cache.misses)
+
+    def test_set_evicts_least_recently_used_entry(self):
+        self.cache.set('key1', 'value1')
+        self.cache.set('key2', 'value2')
+        self.cache.get('key1')
+        self.cache.set('key3', 'value3')
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNone(self.cache.get('key2'))
+        self.assertEqual('value1', self.cache.get('key1'))
+        self.assertEqual('value3', self.cache.get('key3'))
+
+    def test_set_evicts_expired_entries_first(self):
+        self.cache.set('key1', 'value1')
+        self.time.return_value = 103
+        self.cache.set('key2', 'value2')
+        self.time.return_value = 106
+        self.cache.set('key3', 'value3')
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertEqual('value2', self.cache.get('key2'))
+
+    def test_set_disabled_cache(self):
+        cache = agent.InstanceCache(0, 2)
+        cache.set('key', 'value')
+        self.assertIsNone(cache.get('key'))
 
 
 class TestMetadataProxyHandler(base.BaseTestCase):
@@ -181,6 +229,33 @@ class TestMetadataProxyHandler(base.BaseTestCase):
             ('device_id', 'tenant_id')
         )
 
+    def test_get_instance_id_cached(self):
+        headers = {'X-Neutron-Network-ID': 'the_id',
+                   'X-Forwarded-For': '192.168.1.1'}
+        req = mock.Mock(headers=headers)
+        self.qclient.return_value.list_ports.return_value = {
+            'ports': [{'device_id': 'device_id', 'tenant_id': 'tenant_id'}]}
+        for i in range(2):
+            self.assertEqual(
+                ('device_id', 'tenant_id'),
+                self.handler._get_instance_and_tenant_id(req))
+        self.assertEqual(
+            1, self.qclient.return_value.list_ports.call_count)
+        self.assertEqual(1, self.handler.cache.hits)
+        self.assertEqual(1, self.handler.cache.misses)
+
+    def test_get_instance_id_no_match_not_cached(self):
+        headers = {'X-Neutron-Network-ID': 'the_id',
+                   'X-Forwarded-For': '192.168.1.1'}
+        req = mock.Mock(headers=headers)
+        self.qclient.return_value.list_ports.return_value = {'ports': []}
+        for i in range(2):
+            self.assertEqual(
+                (None, None),
+                self.handler._get_instance_and_tenant_id(req))
+        self.assertEqual(
+            2, self.qclient.return_value.list_ports.call_count)
+
     def test_get_instance_id_network_id_no_match(self):
         network_id = 'the_id'
         headers = {
@@ -253,6 +328,19 @@ class TestMetadataProxyHandler(base.BaseTestCase):
         self.assertIsInstance(self._proxy_request_test_helper(500),
                               webob.exc.HTTPInternalServerError)
 
+    def test_proxy_request_reuses_http_client(self):
+        hdrs = {'X-Forwarded-For': '8.8.8.8'}
+        req = mock.Mock(path_info='/the_path', query_string='', headers=hdrs,
+                        method='GET', body='')
+        req.response = mock.MagicMock(status=200)
+        with mock.patch('httplib2.Http') as mock_http:
+            mock_http.return_value.request.return_value = (
+                mock.MagicMock(status=200), 'content')
+            for i in range(2):
+                self.handler._proxy_request('the_id', 'tenant_id', req)
+        mock_http.assert_called_once_with()
+        self.assertEqual(2, mock_http.return_value.request.call_count)
+
     def test_proxy_request_other_code(self):
         with testtools.ExpectedException(Exception):
             self._proxy_request_test_helper(302)
@@ -440,3 +528,14 @@ class TestUnixDomainMetadataProxy(base.BaseTestCase):
                 state_api_inst = state_api.return_value
                 state_api_inst.report_state.assert_called_once_with(
                     proxy.context, proxy.agent_state, use_call=True)
+
+    def test_report_state_reports_cache_stats(self):
+        with mock.patch('neutron.agent.rpc.PluginReportStateAPI'):
+            with mock.patch('os.makedirs'):
+                proxy = agent.UnixDomainMetadataProxy(mock.Mock())
+                proxy.handler.cache.hits = 3
+                proxy.handler.cache.misses = 2
+                proxy._report_state()
+                self.assertEqual(
+                    {'hits': 3, 'misses': 2, 'entries': 0},
+                    proxy.agent_state['configurations']['metadata_cache'])
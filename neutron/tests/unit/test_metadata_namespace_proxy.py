@@ -16,6 +16,7 @@
 #
 # @author: Mark McClain, DreamHost
 
+import contextlib
 import socket
 
 import mock
@@ -319,6 +320,7 @@ class TestProxyDaemon(base.BaseTestCase):
                         with mock.patch.object(utils, 'cfg') as utils_cfg:
                             cfg.CONF.router_id = 'router_id'
                             cfg.CONF.network_id = None
+                            cfg.CONF.namespaces_file = None
                             cfg.CONF.metadata_port = 9697
                             cfg.CONF.pid_file = 'pidfile'
                             cfg.CONF.daemonize = True
@@ -342,6 +344,7 @@ class TestProxyDaemon(base.BaseTestCase):
                         with mock.patch.object(utils, 'cfg') as utils_cfg:
                             cfg.CONF.router_id = 'router_id'
                             cfg.CONF.network_id = None
+                            cfg.CONF.namespaces_file = None
                             cfg.CONF.metadata_port = 9697
                             cfg.CONF.pid_file = 'pidfile'
                             cfg.CONF.daemonize = False
@@ -356,3 +359,245 @@ class TestProxyDaemon(base.BaseTestCase):
                                           network_id=None),
                                 mock.call().run()]
                             )
+
+    def test_main_namespaces_file(self):
+        with contextlib.nested(
+            mock.patch.object(ns_proxy, 'MultiplexedProxyDaemon'),
+            mock.patch('eventlet.monkey_patch'),
+            mock.patch.object(ns_proxy, 'config'),
+            mock.patch.object(ns_proxy, 'cfg'),
+            mock.patch.object(utils, 'cfg')
+        ) as (daemon, eventlet, config, cfg, utils_cfg):
+            cfg.CONF.namespaces_file = '/the/namespaces'
+            cfg.CONF.metadata_port = 9697
+            cfg.CONF.pid_file = 'pidfile'
+            cfg.CONF.daemonize = True
+            utils_cfg.CONF.log_opt_values.return_value = None
+            ns_proxy.main()
+
+            daemon.assert_has_calls([
+                mock.call('pidfile', 9697, '/the/namespaces'),
+                mock.call().start()]
+            )
+
+
+class TestMultiplexedProxyDaemon(base.BaseTestCase):
+    def setUp(self):
+        super(TestMultiplexedProxyDaemon, self).setUp()
+        mock.patch('neutron.agent.linux.daemon.Pidfile').start()
+        self.pd = ns_proxy.MultiplexedProxyDaemon('pidfile', 9697,
+                                                  '/the/namespaces')
+        self.read = mock.patch.object(self.pd, '_read_namespaces').start()
+        self.open_socket = mock.patch.object(ns_proxy.ip_netlink,
+                                             'open_socket').start()
+        mock.patch.object(ns_proxy.ip_netlink, 'namespace_exists',
+                          return_value=True).start()
+        self.spawn = mock.patch('eventlet.spawn').start()
+        self.spawn.side_effect = lambda *args: mock.Mock()
+
+    def test_init(self):
+        self.assertEqual(9697, self.pd.port)
+        self.assertTrue(self.pd.reload_requested)
+        self.assertEqual('/the/namespaces', self.pd.namespaces_file)
+
+    def test_sighup_requests_reload(self):
+        self.pd.reload_requested = False
+        self.pd._handle_sighup(None, None)
+        self.assertTrue(self.pd.reload_requested)
+
+    def test_start_servers(self):
+        self.read.return_value = {'qrouter-r1': {'router_id': 'r1'},
+                                  '': {'network_id': 'n1'}}
+        self.pd.reload()
+        self.pd.start_servers()
+
+        self.open_socket.assert_has_calls([
+            mock.call(socket.AF_INET, socket.SOCK_STREAM,
+                      namespace='qrouter-r1'),
+            mock.call(socket.AF_INET, socket.SOCK_STREAM, namespace=None)],
+            any_order=True)
+        sock = self.open_socket.return_value
+        sock.bind.assert_called_with(('0.0.0.0', 9697))
+        self.assertEqual(2, self.spawn.call_count)
+        handlers = dict((h.router_id or h.network_id, h) for h in
+                        [c[0][2] for c in self.spawn.call_args_list])
+        self.assertEqual(['n1', 'r1'], sorted(handlers))
+        self.assertEqual(set(['qrouter-r1', '']), set(self.pd.servers))
+
+        # Nothing is opened again for the namespaces already served
+        self.pd.start_servers()
+        self.assertEqual(2, self.open_socket.call_count)
+
+    def test_start_servers_retries_failed_namespace(self):
+        self.read.return_value = {'qrouter-r1': {'router_id': 'r1'}}
+        self.pd.reload()
+        self.open_socket.side_effect = RuntimeError()
+        self.pd.start_servers()
+        self.assertEqual({}, self.pd.servers)
+
+        self.open_socket.side_effect = None
+        self.pd.start_servers()
+        self.assertIn('qrouter-r1', self.pd.servers)
+
+    def test_start_servers_skips_missing_namespace(self):
+        self.read.return_value = {'qrouter-r1': {'router_id': 'r1'}}
+        self.pd.reload()
+        with mock.patch.object(ns_proxy.ip_netlink, 'namespace_exists',
+                               return_value=False):
+            self.pd.start_servers()
+        self.assertFalse(self.open_socket.called)
+
+    def test_bind_failure_closes_socket(self):
+        self.read.return_value = {'qrouter-r1': {'router_id': 'r1'}}
+        self.pd.reload()
+        sock = self.open_socket.return_value
+        sock.bind.side_effect = socket.error()
+        self.pd.start_servers()
+        sock.close.assert_called_once_with()
+        self.assertEqual({}, self.pd.servers)
+
+    def test_reload_stops_removed_and_changed_namespaces(self):
+        self.read.return_value = {'qrouter-r1': {'router_id': 'r1'},
+                                  'qrouter-r2': {'router_id': 'r2'},
+                                  'qdhcp-n1': {'network_id': 'n1'}}
+        self.pd.reload()
+        self.pd.start_servers()
+        servers = dict(self.pd.servers)
+
+        self.read.return_value = {'qrouter-r1': {'router_id': 'r1'},
+                                  'qdhcp-n1': {'router_id': 'r3'}}
+        self.pd.reload()
+
+        self.assertFalse(servers['qrouter-r1'].kill.called)
+        servers['qrouter-r2'].kill.assert_called_once_with()
+        servers['qdhcp-n1'].kill.assert_called_once_with()
+        self.assertEqual(['qrouter-r1'], self.pd.servers.keys())
+
+    def test_reload_restarts_namespace_created_again(self):
+        self.read.return_value = {'qrouter-r1': {'router_id': 'r1',
+                                                 'generation': 1}}
+        self.pd.reload()
+        self.pd.start_servers()
+        server = self.pd.servers['qrouter-r1']
+
+        self.read.return_value = {'qrouter-r1': {'router_id': 'r1',
+                                                 'generation': 2}}
+        self.pd.reload()
+        server.kill.assert_called_once_with()
+        self.pd.start_servers()
+        self.assertNotEqual(server, self.pd.servers['qrouter-r1'])
+
+    def test_reload_keeps_namespaces_on_read_error(self):
+        self.read.return_value = {'qrouter-r1': {'router_id': 'r1'}}
+        self.pd.reload()
+        self.pd.start_servers()
+        self.read.return_value = None
+        self.pd.reload()
+        self.assertEqual({'qrouter-r1': {'router_id': 'r1'}},
+                         self.pd.namespaces)
+        self.assertFalse(self.pd.servers['qrouter-r1'].kill.called)
+
+
+class TestMultiplexedProxyManager(base.BaseTestCase):
+    def setUp(self):
+        super(TestMultiplexedProxyManager, self).setUp()
+        self.conf = mock.Mock(external_pids='/pids', state_path='/state')
+        self.process = mock.patch.object(
+            ns_proxy.external_process, 'ProcessManager').start().return_value
+        self.process.get_pid_file_name.return_value = '/pids/uuid.pid'
+        self.process.pid = 5
+        self.replace_file = mock.patch.object(ns_proxy.linux_utils,
+                                              'replace_file').start()
+        self.execute = mock.patch.object(ns_proxy.linux_utils,
+                                         'execute').start()
+
+    def _manager(self, namespaces=None):
+        with mock.patch('__builtin__.open') as open_:
+            if namespaces is None:
+                open_.side_effect = IOError()
+            else:
+                f = open_.return_value.__enter__.return_value
+                f.read.return_value = ns_proxy.jsonutils.dumps(namespaces)
+            manager = ns_proxy.MultiplexedProxyManager(
+                self.conf, 'uuid', 'sudo', 9697)
+        return manager
+
+    def _written(self):
+        return ns_proxy.jsonutils.loads(self.replace_file.call_args[0][1])
+
+    def test_add_spawns_daemon(self):
+        self.process.active = False
+        manager = self._manager()
+        self.assertEqual('/pids/uuid.namespaces', manager.namespaces_file)
+        manager.add('qrouter-r1', router_id='r1')
+
+        self.assertEqual({'qrouter-r1': {'router_id': 'r1', 'generation': 1}},
+                         self._written())
+        self.process.enable.assert_called_once_with(manager._get_cmd)
+        self.assertFalse(self.execute.called)
+
+    def test_add_reloads_running_daemon(self):
+        self.process.active = True
+        manager = self._manager()
+        manager.add(None, network_id='n1')
+
+        self.assertEqual({'': {'network_id': 'n1', 'generation': 1}},
+                         self._written())
+        self.execute.assert_called_once_with(['kill', '-HUP', 5], 'sudo')
+        self.assertFalse(self.process.enable.called)
+
+    def test_add_known_namespace(self):
+        self.process.active = True
+        manager = self._manager({'qrouter-r1': {'router_id': 'r1'}})
+        manager.add('qrouter-r1', router_id='r1')
+        self.assertFalse(self.replace_file.called)
+        self.assertFalse(self.execute.called)
+
+    def test_add_namespace_created_again(self):
+        self.process.active = True
+        manager = self._manager({'qrouter-r1': {'router_id': 'r1',
+                                                'generation': 3}})
+        manager.remove('qrouter-r1')
+        manager.add('qrouter-r1', router_id='r1')
+        self.assertEqual({'qrouter-r1': {'router_id': 'r1', 'generation': 4}},
+                         self._written())
+
+    def test_add_known_namespace_restarts_daemon(self):
+        self.process.active = False
+        manager = self._manager({'qrouter-r1': {'router_id': 'r1'}})
+        manager.add('qrouter-r1', router_id='r1')
+        self.assertFalse(self.replace_file.called)
+        self.process.enable.assert_called_once_with(manager._get_cmd)
+
+    def test_remove(self):
+        self.process.active = True
+        manager = self._manager({'qrouter-r1': {'router_id': 'r1'},
+                                 'qrouter-r2': {'router_id': 'r2'}})
+        manager.remove('qrouter-r1')
+        self.assertEqual({'qrouter-r2': {'router_id': 'r2'}},
+                         self._written())
+        self.execute.assert_called_once_with(['kill', '-HUP', 5], 'sudo')
+
+    def test_remove_unknown_namespace(self):
+        manager = self._manager()
+        manager.remove('qrouter-r1')
+        self.assertFalse(self.replace_file.called)
+        self.assertFalse(self.execute.called)
+
+    def test_get_cmd(self):
+        with contextlib.nested(
+            mock.patch.object(ns_proxy, 'cfg'),
+            mock.patch.object(ns_proxy.agent_conf, 'get_log_args',
+                              return_value=['--debug'])
+        ) as (cfg, get_log_args):
+            cfg.CONF.metadata_proxy_socket = '/the/socket'
+            cmd = self._manager()._get_cmd('/pids/uuid.pid')
+        get_log_args.assert_called_once_with(
+            cfg.CONF, 'neutron-ns-metadata-proxy-uuid.log')
+        self.assertEqual(['neutron-ns-metadata-proxy',
+                          '--pid_file=/pids/uuid.pid',
+                          '--metadata_proxy_socket=/the/socket',
+                          '--namespaces_file=/pids/uuid.namespaces',
+                          '--state_path=/state',
+                          '--metadata_port=9697',
+                          '--debug'], cmd)
@@ -389,6 +389,42 @@ class NeutronPolicyTestCase(base.BaseTestCase):
         self.assertRaises(exceptions.PolicyNotAuthorized, policy.enforce,
                           self.context, action, target, None)
 
+    def test_match_rule_cached_per_enforced_attributes(self):
+        action = "create_something"
+        with mock.patch.object(policy, '_build_match_rule',
+                               wraps=policy._build_match_rule) as build:
+            for sub_attr in ('x', 'y'):
+                policy.enforce(self.context, action,
+                               {'tenant_id': 'fake',
+                                'attr': {'sub_attr_1': sub_attr}})
+            self.assertEqual(1, build.call_count)
+            self.assertRaises(exceptions.PolicyNotAuthorized, policy.enforce,
+                              self.context, action,
+                              {'tenant_id': 'fake',
+                               'attr': {'sub_attr_1': 'x',
+                                        'sub_attr_2': 'y'}})
+            self.assertEqual(2, build.call_count)
+
+    def test_match_rule_cache_cleared_on_rules_reload(self):
+        policy.enforce(self.context, "get_network",
+                       {'shared': True, 'tenant_id': 'somebody_else'})
+        self.assertTrue(policy._MATCH_RULE_CACHE)
+        policy._set_rules(json.dumps({"get_network": "@"}))
+        self.assertFalse(policy._MATCH_RULE_CACHE)
+
+    def test_check_items(self):
+        targets = [{'shared': False, 'tenant_id': 'fake'},
+                   {'shared': False, 'tenant_id': 'somebody_else'},
+                   {'shared': True, 'tenant_id': 'somebody_else'}]
+        self.assertEqual([True, False, True],
+                         policy.check_items(self.context, "get_network",
+                                            targets))
+
+    def test_check_items_non_existent_action_raises(self):
+        self.assertRaises(exceptions.PolicyRuleNotFound,
+                          policy.check_items, self.context,
+                          "get_network:foo", [{}], must_exist=True)
+
     def test_enforce_regularuser_on_read(self):
         action = "get_network"
         target = {'shared': True, 'tenant_id': 'somebody_else'}
@@ -28,7 +28,9 @@ from neutron.common import config
 from neutron.common import exceptions
 from neutron import context
 from neutron.db import api as db
+from neutron.db import models_v2
 from neutron.db import quota_db
+from neutron.openstack.common import uuidutils
 from neutron import quota
 from neutron.tests import base
 from neutron.tests.unit import test_api_v2
@@ -434,3 +436,111 @@ class TestQuotaDriverLoad(base.BaseTestCase):
     def test_quota_conf_driver(self):
         self._test_quota_driver('neutron.quota.ConfDriver',
                                 'ConfDriver', True)
+
+
+class TestTrackedUsageQuotaDriver(base.BaseTestCase):
+    """Test for neutron.db.quota_db.TrackedUsageQuotaDriver."""
+
+    def setUp(self):
+        super(TestTrackedUsageQuotaDriver, self).setUp()
+        db.configure_db()
+        self.addCleanup(db.clear_db)
+        self.context = context.get_admin_context()
+        self.driver = quota_db.TrackedUsageQuotaDriver()
+        self.resources = {'network': quota.CountableResource(
+            'network', None, 'quota_network')}
+
+    def _add_network(self, tenant_id='tenant'):
+        network = models_v2.Network(id=uuidutils.generate_uuid(),
+                                    tenant_id=tenant_id)
+        with self.context.session.begin():
+            self.context.session.add(network)
+        return network
+
+    def _get_usage(self, tenant_id='tenant'):
+        return self.driver.get_usages(self.context, tenant_id,
+                                      ['network'])['network']
+
+    def test_usage_tracked_on_create_and_delete(self):
+        self._add_network()
+        reservation = self.driver.make_reservation(
+            self.context, 'tenant', self.resources, {'network': 1})
+        self.assertEqual(2, self._get_usage())
+        network = self._add_network()
+        self.assertEqual(2, self._get_usage())
+        self.driver.commit_reservation(self.context, reservation)
+        self.assertEqual(2, self._get_usage())
+        with self.context.session.begin():
+            self.context.session.delete(network)
+        self.assertEqual(1, self._get_usage())
+        self.assertEqual(0, self._get_usage('other_tenant'))
+
+    def test_reservation_consumed_by_created_resources(self):
+        reservation = self.driver.make_reservation(
+            self.context, 'tenant', self.resources, {'network': 2})
+        self._add_network()
+        self.assertEqual(2, self._get_usage())
+        self._add_network()
+        self._add_network()
+        self.assertEqual(3, self._get_usage())
+        self.driver.commit_reservation(self.context, reservation)
+        self.assertEqual(3, self._get_usage())
+
+    def test_reservation_not_consumed_by_other_session(self):
+        self.driver.make_reservation(self.context, 'tenant',
+                                     self.resources, {'network': 1})
+        other_context = context.get_admin_context()
+        network = models_v2.Network(id=uuidutils.generate_uuid(),
+                                    tenant_id='tenant')
+        with other_context.session.begin():
+            other_context.session.add(network)
+        self.assertEqual(2, self._get_usage())
+
+    def test_make_reservation_over_quota(self):
+        cfg.CONF.set_override('quota_network', 2, group='QUOTAS')
+        self._add_network()
+        reservation = self.driver.make_reservation(
+            self.context, 'tenant', self.resources, {'network': 1})
+        self.assertRaises(exceptions.OverQuota,
+                          self.driver.make_reservation, self.context,
+                          'tenant', self.resources, {'network': 1})
+        self.driver.cancel_reservation(self.context, reservation)
+        self.driver.make_reservation(self.context, 'tenant',
+                                     self.resources, {'network': 1})
+
+    def test_make_reservation_resyncs_drifted_usage(self):
+        cfg.CONF.set_override('quota_network', 2, group='QUOTAS')
+        self._add_network()
+        self.assertEqual(1, self._get_usage())
+        # The usage drifted, as if networks were deleted outside of neutron
+        quota_db._update_usage(self.context.session, 'network', 'tenant', 5)
+        with mock.patch.object(self.driver, 'resync_usages',
+                               wraps=self.driver.resync_usages) as resync:
+            self.driver.make_reservation(self.context, 'tenant',
+                                         self.resources, {'network': 1})
+        resync.assert_called_once_with(self.context, 'network', 'tenant')
+        self.assertEqual(2, self._get_usage())
+        self.assertRaises(exceptions.OverQuota,
+                          self.driver.make_reservation, self.context,
+                          'tenant', self.resources, {'network': 1})
+
+    def test_expired_reservation_released(self):
+        cfg.CONF.set_override('reservation_expiration', -1, group='QUOTAS')
+        self.driver.make_reservation(self.context, 'tenant',
+                                     self.resources, {'network': 1})
+        self.assertEqual(0, self._get_usage())
+
+    def test_usage_counted_after_bulk_delete(self):
+        self._add_network()
+        self.assertEqual(1, self._get_usage())
+        with self.context.session.begin():
+            self.context.session.query(models_v2.Network).delete()
+        self.assertEqual(0, self._get_usage())
+
+    def test_resync_usages(self):
+        self._add_network()
+        self.assertEqual(1, self._get_usage())
+        quota_db._update_usage(self.context.session, 'network', 'tenant', 5)
+        self.assertEqual(6, self._get_usage())
+        self.driver.resync_usages(self.context, 'network')
+        self.assertEqual(1, self._get_usage())
@@ -34,6 +34,7 @@ from neutron.db import securitygroups_rpc_base as sg_db_rpc
 from neutron.extensions import allowedaddresspairs as addr_pair
 from neutron.extensions import securitygroup as ext_sg
 from neutron.manager import NeutronManager
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.openstack.common.rpc import proxy
 from neutron.tests import base
 from neutron.tests.unit import test_extension_security_group as test_sg
@@ -286,6 +287,64 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                 self._delete('ports', port_id1)
                 self._delete('ports', port_id2)
 
+    def test_security_group_info_for_devices_ipv4_source_group(self):
+
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1,
+                                                   sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                rule1 = self._build_security_group_rule(
+                    sg1_id,
+                    'ingress', const.PROTO_NAME_TCP, '24',
+                    '25', remote_group_id=sg2['security_group']['id'])
+                rules = {
+                    'security_group_rules': [rule1['security_group_rule']]}
+                res = self._create_security_group_rule(self.fmt, rules)
+                self.deserialize(self.fmt, res)
+                self.assertEqual(res.status_int, webob.exc.HTTPCreated.code)
+
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id])
+                ports_rest1 = self.deserialize(self.fmt, res1)
+                port_id1 = ports_rest1['port']['id']
+                self.rpc.devices = {port_id1: ports_rest1['port']}
+                devices = [port_id1, 'no_exist_device']
+
+                res2 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg2_id])
+                ports_rest2 = self.deserialize(self.fmt, res2)
+                port_id2 = ports_rest2['port']['id']
+                ctx = context.get_admin_context()
+                info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=devices)
+                self.assertEqual([port_id1], info['devices'].keys())
+                self.assertEqual([], info['devices'][port_id1][
+                    'security_group_rules'])
+                self.assertEqual([sg1_id], info['security_groups'].keys())
+                expected = [{'direction': 'egress', 'ethertype': const.IPv4,
+                             'security_group_id': sg1_id},
+                            {'direction': 'egress', 'ethertype': const.IPv6,
+                             'security_group_id': sg1_id},
+                            {'direction': u'ingress',
+                             'protocol': const.PROTO_NAME_TCP,
+                             'ethertype': const.IPv4,
+                             'port_range_max': 25, 'port_range_min': 24,
+                             'remote_group_id': sg2_id,
+                             'security_group_id': sg1_id},
+                            ]
+                self.assertEqual(expected, info['security_groups'][sg1_id])
+                self.assertEqual(
+                    {sg2_id: {const.IPv4: [u'10.0.0.3'], const.IPv6: []}},
+                    info['sg_member_ips'])
+                self._delete('ports', port_id1)
+                self._delete('ports', port_id2)
+
     def test_security_group_rules_for_devices_ipv6_ingress(self):
         fake_prefix = test_fw.FAKE_PREFIX[const.IPv6]
         with self.network() as n:
@@ -509,6 +568,7 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         mock.patch('neutron.agent.linux.iptables_manager').start()
         self.agent.root_helper = 'sudo'
         self.agent.init_firewall(defer_refresh_firewall=defer_refresh_firewall)
+        self.agent.use_enhanced_rpc = False
         self.firewall = mock.Mock()
         firewall_object = firewall_base.FirewallDriver()
         self.firewall.defer_apply.side_effect = firewall_object.defer_apply
@@ -593,6 +653,90 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         self.firewall.assert_has_calls([])
 
 
+class SecurityGroupAgentEnhancedRpcTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(SecurityGroupAgentEnhancedRpcTestCase, self).setUp()
+        self.agent = sg_rpc.SecurityGroupAgentRpcMixin()
+        self.agent.context = None
+        mock.patch('neutron.agent.linux.iptables_manager').start()
+        self.agent.root_helper = 'sudo'
+        self.agent.init_firewall()
+        self.firewall = mock.Mock()
+        firewall_object = firewall_base.FirewallDriver()
+        self.firewall.defer_apply.side_effect = firewall_object.defer_apply
+        self.agent.firewall = self.firewall
+        self.rpc = mock.Mock()
+        self.agent.plugin_rpc = self.rpc
+        self.rpc.security_group_info_for_devices.return_value = {
+            'devices': {'fake_device': {
+                'device': 'fake_device',
+                'fixed_ips': ['10.0.0.2'],
+                'security_groups': ['fake_sgid1'],
+                'security_group_source_groups': [],
+                'security_group_rules': [{'direction': 'ingress',
+                                          'ethertype': 'IPv4',
+                                          'source_ip_prefix':
+                                          '10.0.0.10/32'}]}},
+            'security_groups': {'fake_sgid1': [
+                {'security_group_id': 'fake_sgid1',
+                 'direction': 'egress',
+                 'ethertype': 'IPv4'},
+                {'security_group_id': 'fake_sgid1',
+                 'direction': 'ingress',
+                 'ethertype': 'IPv4',
+                 'remote_group_id': 'fake_sgid2'}]},
+            'sg_member_ips': {'fake_sgid2': {
+                'IPv4': ['10.0.0.2', '10.0.0.3', '10.0.0.4'],
+                'IPv6': ['fe80::3']}}}
+
+    def _expected_device(self):
+        remote_rule = {'security_group_id': 'fake_sgid1',
+                       'direction': 'ingress',
+                       'ethertype': 'IPv4',
+                       'remote_group_id': 'fake_sgid2'}
+        return {'device': 'fake_device',
+                'fixed_ips': ['10.0.0.2'],
+                'security_groups': ['fake_sgid1'],
+                'security_group_source_groups': ['fake_sgid2'],
+                'security_group_rules': [
+                    {'direction': 'ingress',
+                     'ethertype': 'IPv4',
+                     'source_ip_prefix': '10.0.0.10/32'},
+                    {'security_group_id': 'fake_sgid1',
+                     'direction': 'egress',
+                     'ethertype': 'IPv4'},
+                    dict(remote_rule, source_ip_prefix='10.0.0.3/32'),
+                    dict(remote_rule, source_ip_prefix='10.0.0.4/32')]}
+
+    def test_prepare_devices_filter_expands_info(self):
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.rpc.security_group_info_for_devices.assert_called_once_with(
+            None, ['fake_device'])
+        self.assertFalse(self.rpc.security_group_rules_for_devices.called)
+        self.firewall.prepare_port_filter.assert_called_once_with(
+            self._expected_device())
+        self.assertTrue(self.agent.use_enhanced_rpc)
+
+    def test_prepare_devices_filter_unsupported_by_server(self):
+        self.rpc.security_group_info_for_devices.side_effect = (
+            rpc_common.RemoteError('UnsupportedRpcVersion'))
+        self.rpc.security_group_rules_for_devices.return_value = {}
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.agent.refresh_firewall(['fake_device'])
+        self.assertEqual(
+            1, self.rpc.security_group_info_for_devices.call_count)
+        self.assertEqual(
+            2, self.rpc.security_group_rules_for_devices.call_count)
+        self.assertFalse(self.agent.use_enhanced_rpc)
+
+    def test_prepare_devices_filter_remote_error(self):
+        self.rpc.security_group_info_for_devices.side_effect = (
+            rpc_common.RemoteError('ValueError'))
+        self.assertRaises(rpc_common.RemoteError,
+                          self.agent.prepare_devices_filter, ['fake_device'])
+        self.assertIsNone(self.agent.use_enhanced_rpc)
+
+
 class SecurityGroupAgentRpcWithDeferredRefreshTestCase(
     SecurityGroupAgentRpcTestCase):
 
@@ -817,6 +961,17 @@ class SecurityGroupServerRpcApiTestCase(base.BaseTestCase):
              version=sg_rpc.SG_RPC_VERSION,
              topic='fake_topic')])
 
+    def test_security_group_info_for_devices(self):
+        self.rpc.security_group_info_for_devices(None, ['fake_device'])
+        self.rpc.call.assert_has_calls(
+            [call(None,
+             {'args':
+                 {'devices': ['fake_device']},
+              'method': 'security_group_info_for_devices',
+              'namespace': None},
+             version=sg_rpc.SG_INFO_RPC_VERSION,
+             topic='fake_topic')])
+
 
 class FakeSGNotifierAPI(proxy.RpcProxy,
                         sg_rpc.SecurityGroupAgentRpcApiMixin):
@@ -1455,6 +1610,7 @@ class TestSecurityGroupAgentWithIptables(base.BaseTestCase):
 
         self.rpc = mock.Mock()
         self.agent.plugin_rpc = self.rpc
+        self.agent.use_enhanced_rpc = False
         rule1 = [{'direction': 'ingress',
                   'protocol': const.PROTO_NAME_UDP,
                   'ethertype': const.IPv4,